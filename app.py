@@ -9,8 +9,8 @@ if str(_ROOT) not in sys.path:
 import streamlit as st
 
 from config.database import init_db
+from services import basket_service, news_service
 from services.auth_service import AuthService, ensure_default_admin
-from services.chat_memory import SCOPE_REPORT_AGENT, clear as clear_chat_memory
 from utils.login_config import load_login_config
 from utils.navigation import show_sidebar
 from utils.sidebar_logo import get_sidebar_logo_base64_data_uri, get_sidebar_logo_path
@@ -33,10 +33,15 @@ st.set_page_config(
 @st.cache_resource
 def initialize_app():
     """
-    Inicializa o banco de dados e garante usuário admin padrão.
+    Inicializa o banco de dados, garante usuário admin padrão e começa a carregar as manchetes e a processar
+    as vendas novas da análise de cesta.
     """
     init_db()
     ensure_default_admin()
+    # Manchetes da análise avançada: primeira carga em segundo plano (as consultas só leem o cache)
+    news_service.atualizar_em_segundo_plano()
+    # Análise de cesta: vendas acumuladas desde a última execução (o chat só lê as contagens)
+    basket_service.atualizar_em_segundo_plano()
 
 
 def login_page():
@@ -128,8 +133,13 @@ def login_page():
                     user = AuthService.authenticate(db, username, password)
                     if user:
                         AuthService.login(user)
-                        # Atualizar análise do dia na próxima abertura do Início: limpa histórico do agente de relatórios
-                        clear_chat_memory(db, user.id, SCOPE_REPORT_AGENT)
+                        # A conversa do Agente de Relatórios é mantida; a análise do dia vem do cache
+                        # (services.daily_analysis_service) e, se estiver desatualizada, já começa a ser gerada aqui
+                        if user.role == "admin":
+                            from services import daily_analysis_service
+
+                            if daily_analysis_service.iniciar_dia(db, user.id):
+                                daily_analysis_service.atualizar_em_segundo_plano(user.id)
                         for key in ("chat_history", "agente_initial_analysis_user_id"):
                             st.session_state.pop(key, None)
                         st.success(f"Bem-vindo, {user.name}!")
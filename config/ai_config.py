@@ -2,7 +2,9 @@
 Configuração e gerenciamento de IA para o agente de relatórios.
 """
 import os
-from typing import Any, Dict, Optional
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from sqlalchemy.orm import Session
 
@@ -30,6 +32,33 @@ class AIConfigManager:
     FIXED_API_KEY = os.getenv("AI_FIXED_API_KEY", None)
     FIXED_CONFIG_ENABLED = os.getenv("AI_FIXED_CONFIG_ENABLED", "false").lower() == "true"
 
+    # Provedores de reserva, em ordem, usados quando o ativo falha ou está em pausa (ex.: "groq,ollama")
+    FALLBACK_CHAIN = [p.strip().lower() for p in os.getenv("AI_FALLBACK_CHAIN", "").split(",") if p.strip()]
+
+    # Cache da configuração ativa no processo (evita ler AIConfig a cada AIService criado).
+    # Invalidado ao salvar/excluir; o TTL cobre alterações feitas por outro processo.
+    CACHE_TTL = 60
+    _cache_lock = threading.Lock()
+    _cache: Dict[str, Tuple[float, Any]] = {}
+
+    @classmethod
+    def invalidate_cache(cls) -> None:
+        """Descarta a configuração em cache; a próxima leitura vai ao banco."""
+        with cls._cache_lock:
+            cls._cache = {}
+
+    @classmethod
+    def _cached(cls, nome: str, carregar: Callable[[], Any]) -> Any:
+        """Valor em cache por até CACHE_TTL segundos; expirado ou ausente, chama carregar()."""
+        with cls._cache_lock:
+            item = cls._cache.get(nome)
+            if item is not None and time.monotonic() - item[0] < cls.CACHE_TTL:
+                return item[1]
+        valor = carregar()
+        with cls._cache_lock:
+            cls._cache[nome] = (time.monotonic(), valor)
+        return valor
+
     @staticmethod
     def get_config(db: Session) -> Optional[AIConfig]:
         """Obtém a configuração de IA ativa."""
@@ -79,6 +108,7 @@ class AIConfigManager:
 
         db.commit()
         db.refresh(config)
+        AIConfigManager.invalidate_cache()
         return config
 
     @staticmethod
@@ -88,6 +118,7 @@ class AIConfigManager:
         if config:
             db.delete(config)
             db.commit()
+            AIConfigManager.invalidate_cache()
             return True
         return False
 
@@ -99,14 +130,53 @@ class AIConfigManager:
     @staticmethod
     def is_configured(db: Session) -> bool:
         """Verifica se há configuração de IA ativa (banco ou fixa)."""
-        config = AIConfigManager.get_config(db)
-        if config and config.api_key and config.enabled:
-            return True
-        return AIConfigManager._get_fixed_config() is not None
+        config = AIConfigManager.get_config_dict(db)
+        return bool(config and config.get("api_key") and config.get("enabled"))
+
+    @classmethod
+    def get_config_dict(cls, db: Session) -> Optional[Dict[str, Any]]:
+        """Retorna configuração ativa como dicionário (em cache no processo por até CACHE_TTL segundos)."""
+        config = cls._cached("ativa", lambda: cls._load_config_dict(db))
+        return dict(config) if config else None
+
+    @classmethod
+    def get_fallback_configs(cls, db: Session) -> List[Dict[str, Any]]:
+        """
+        Configurações dos provedores de reserva (AI_FALLBACK_CHAIN), na ordem, sem o provedor ativo.
+        Usa a configuração salva de cada provedor (mesmo inativa); Ollama sem configuração usa a URL padrão.
+        """
+        configs = cls._cached("reserva", lambda: cls._load_fallback_configs(db))
+        return [dict(c) for c in configs]
+
+    @classmethod
+    def _load_fallback_configs(cls, db: Session) -> List[Dict[str, Any]]:
+        ativa = cls._load_config_dict(db)
+        configs = []
+        for provider in cls.FALLBACK_CHAIN:
+            if ativa and ativa.get("provider") == provider:
+                continue
+            config = cls.get_config_by_provider(db, provider)
+            if config and (config.api_key or provider == "ollama"):
+                configs.append({
+                    "provider": provider,
+                    "api_key": config.api_key,
+                    "model": config.model,
+                    "base_url": config.base_url,
+                    "enabled": True,
+                })
+            elif provider == "ollama":
+                configs.append({
+                    "provider": "ollama",
+                    "api_key": "ollama",
+                    "model": cls.DEFAULT_MODELS["ollama"],
+                    "base_url": cls.DEFAULT_BASE_URLS["ollama"],
+                    "enabled": True,
+                })
+        return configs
 
     @staticmethod
-    def get_config_dict(db: Session) -> Optional[Dict[str, Any]]:
-        """Retorna configuração ativa como dicionário."""
+    def _load_config_dict(db: Session) -> Optional[Dict[str, Any]]:
+        """Lê a configuração ativa do banco (ou a fixa, por variáveis de ambiente)."""
         config = AIConfigManager.get_config(db)
         if not config:
             return AIConfigManager._get_fixed_config()
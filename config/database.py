@@ -85,6 +85,10 @@ def init_db():
         agent_prompt,
         agent_chat_memory,
         personal_agenda,
+        basket_analysis,
+        llm_cache,
+        daily_analysis,
+        question_cache,
     )
 
     Base.metadata.create_all(bind=engine)
@@ -265,3 +269,47 @@ def init_db():
                 )
                 conn.commit()
 
+
+    # Migração: nome normalizado (sem acentos, minúsculo) em contas a pagar/receber, para a busca por nome
+    # (services.name_matcher). Coluna + preenchimento das linhas antigas + índice; no PostgreSQL, também índice
+    # de trigramas (pg_trgm) para buscas por trecho, quando a extensão puder ser criada.
+    from services.name_matcher import normalizar_nome
+
+    for tabela, campo in (("accounts_payable", "fornecedor"), ("accounts_receivable", "cliente")):
+        coluna = f"{campo}_normalizado"
+        with engine.connect() as conn:
+            if DATABASE_URL.startswith("sqlite"):
+                r = conn.execute(text(f"SELECT name FROM pragma_table_info('{tabela}') WHERE name = '{coluna}'"))
+            else:
+                r = conn.execute(
+                    text(
+                        "SELECT column_name FROM information_schema.columns "
+                        f"WHERE table_name = '{tabela}' AND column_name = '{coluna}'"
+                    )
+                )
+            if r.fetchone() is None:
+                conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {coluna} VARCHAR(200)"))
+                conn.commit()
+            pendentes = conn.execute(text(f"SELECT id, {campo} FROM {tabela} WHERE {coluna} IS NULL")).fetchall()
+            if pendentes:
+                conn.execute(
+                    text(f"UPDATE {tabela} SET {coluna} = :norm WHERE id = :id"),
+                    [{"id": row[0], "norm": normalizar_nome(row[1])} for row in pendentes],
+                )
+                conn.commit()
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{tabela}_{coluna} ON {tabela} ({coluna})"))
+            conn.commit()
+        if DATABASE_URL.startswith("postgresql"):
+            with engine.connect() as conn:
+                try:
+                    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                    conn.execute(
+                        text(
+                            f"CREATE INDEX IF NOT EXISTS ix_{tabela}_{coluna}_trgm "
+                            f"ON {tabela} USING gin ({coluna} gin_trgm_ops)"
+                        )
+                    )
+                    conn.commit()
+                except Exception:
+                    # Sem permissão para a extensão: a busca segue pelo índice comum + dicionário em memória
+                    conn.rollback()
@@ -13,15 +13,26 @@ from models.agent_prompt import AgentPrompt
 KEY_ANALYZE_QUERY = "report_agent.analyze_query"
 KEY_INITIAL_ANALYSIS = "report_agent.initial_analysis"
 KEY_FORMAT_RESPONSE_ANALISE_AVANCADA = "report_agent.format_response_analise_avancada"
-KEY_FORMAT_RESPONSE_GENERIC = "report_agent.format_response_generic"
+KEY_FORMAT_RESPONSE_INSIGHT = "report_agent.format_response_insight"
+KEY_TURN_PLANNER = "report_agent.turn_planner"
 
 REPORT_AGENT_KEYS = [
     KEY_ANALYZE_QUERY,
     KEY_INITIAL_ANALYSIS,
     KEY_FORMAT_RESPONSE_ANALISE_AVANCADA,
-    KEY_FORMAT_RESPONSE_GENERIC,
+    KEY_FORMAT_RESPONSE_INSIGHT,
+    KEY_TURN_PLANNER,
 ]
 
+# Configuração (mesma tabela dos prompts): quando a IA comenta as respostas por template do chat
+KEY_NARRACAO = "report_agent.narracao"
+NARRACAO_SOB_PEDIDO = "sob_pedido"  # só quando o usuário pede análise/explicação (ou análise avançada)
+NARRACAO_SEMPRE = "sempre"  # toda consulta ganha o parágrafo de leitura da IA
+NARRACAO_OPCOES = {
+    NARRACAO_SOB_PEDIDO: "Só quando o usuário pedir análise ou explicação",
+    NARRACAO_SEMPRE: "Em toda consulta (um parágrafo curto após os números)",
+}
+
 # Chave do prompt do agente de contas (cadastro e baixa)
 KEY_ACCOUNTS_AGENT_PARSE = "accounts_agent.parse_request"
 ACCOUNTS_AGENT_KEYS = [KEY_ACCOUNTS_AGENT_PARSE]
@@ -48,7 +59,9 @@ def safe_substitute_prompt(template: str, **placeholders: Any) -> str:
     return _safe_substitute(template, **placeholders)
 
 
-# Textos padrão (fallback quando não há valor no banco)
+# Textos padrão (fallback quando não há valor no banco).
+# Trechos que mudam a cada mensagem (histórico, pergunta, dados) ficam no fim: o início fixo do prompt
+# é reaproveitado pelo cache de prompt dos provedores (ex.: OpenAI) e custa menos a cada chamada.
 DEFAULT_ANALYZE_QUERY = """Você é um assistente de relatórios de PDV (ponto de venda). O sistema tem: vendas, estoque, sessões de caixa, contas a pagar, contas a receber (fiado), produtos mais vendidos e análises avançadas (tendências, previsões, sazonalidade).
 
 **ESTRUTURA DO BANCO (para consultas SQL customizadas):**
@@ -65,15 +78,14 @@ DEFAULT_ANALYZE_QUERY = """Você é um assistente de relatórios de PDV (ponto d
 **CONTEXTO APÓS RELATÓRIO:** Use o histórico para manter o assunto (ex.: contas a pagar, vendas) e o período já mencionado ou exibido. Quando a ÚLTIMA mensagem do Assistente for um relatório (ex.: contas a pagar, vendas, listagem) que mencione um ano ou período, e a mensagem ATUAL do usuário for um esclarecimento curto de período ("ano completo", "este ano 2026", "este ano", "o ano todo", "este mês", "hoje", etc.), interprete como confirmação do período e retorne intent "consulta" com o data_type coerente ao relatório anterior (ex.: contas_pagar, resumo_periodo) e o period preenchido conforme a mensagem do usuário (ex.: "ano completo" ou "este ano 2026" → start "2026-01-01", end "2026-12-31", type "personalizado"). NUNCA retorne "esclarecer_periodo" quando o usuário acabou de especificar o período em linguagem natural.
 
 **PERÍODO AMBÍGUO — SÓ PERGUNTAR QUANDO NÃO HOUVER NENHUMA FORMA DE ENTENDER:** Use intent "esclarecer_periodo" e "clarification_message" APENAS quando (a) a pergunta for sobre faturamento/vendas/relatório, (b) NÃO houver período na mensagem atual, (c) NÃO houver no histórico nenhuma menção a período (nem do usuário nem do assistente), (d) NÃO for resposta a uma pergunta anterior do assistente. Em QUALQUER outro caso: INFIRA o período. Ex.: "faturamento" sem mais contexto → use "mes_atual" (este mês) e retorne consulta; "contas a pagar" sem período → use "mes_atual"; "quanto vendi na semana" → use "semanal". Só pergunte "De qual período?" quando for a primeira interação ou mensagem totalmente vaga e sem histórico que indique período (ex.: usuário só digitou "relatório").
-{history_block}
-Use o histórico acima para manter o assunto e o período. Quando o usuário enviar apenas um complemento de período (ex.: "ano completo", "este ano 2026"), considere-o como esclarecimento e retorne consulta com período adequado. Quando o assunto da conversa (contas a pagar, vendas, fiados) já estiver claro e só faltar período, prefira inferir "mes_atual" ou "ultimo_mes" e retornar consulta em vez de perguntar.
 
 **PERGUNTAS DE CONTINUAÇÃO (obrigatório):** Quando a mensagem atual do usuário for uma continuação do assunto anterior (ex.: "quais são?", "quais?", "lista", "mostre", "as contas a pagar", "a contas a pagar", "e as contas?", "me mostra"), NUNCA responda com intent "resposta_direta" nem com texto genérico. O usuário está pedindo a LISTA ou o RELATÓRIO do que já foi falado. Use o histórico: se o usuário ou o assistente acabou de falar de contas a pagar → intent "consulta", data_type "contas_pagar"; contas a receber → "contas_receber"; vendas/faturamento → "resumo_periodo"; produtos mais vendidos → "produtos_mais_vendidos"; etc. Para o período: INFIRA pelo histórico (ex.: "este ano", "este mês" já citados) ou use "mes_atual" como padrão. NUNCA retorne "esclarecer_periodo" em perguntas de continuação — sempre preencha um período (mes_atual ou o que o contexto indicar) e retorne consulta.
 
 Analise a pergunta do usuário e retorne APENAS um JSON válido (sem markdown, sem texto extra) com:
 {
     "intent": "consulta|resumo|relatorio|analise|esclarecer_periodo|resposta_direta",
-    "data_type": "vendas|resumo_periodo|produtos_mais_vendidos|valor_estoque|entradas_estoque|sessoes_caixa|contas_pagar|contas_receber|agenda|analise_avancada|sql",
+    "data_type": "vendas|resumo_periodo|produtos_mais_vendidos|valor_estoque|entradas_estoque|sessoes_caixa|contas_pagar|contas_receber|agenda|analise_avancada|curva_abc|produtos_juntos|sql",
+    "metricas": "null ou lista de data_types quando a pergunta pedir mais de uma coisa (o primeiro é o data_type)",
     "period": {
         "start": "YYYY-MM-DD ou null",
         "end": "YYYY-MM-DD ou null",
@@ -85,9 +97,14 @@ Analise a pergunta do usuário e retorne APENAS um JSON válido (sem markdown, s
     "output_format": "resumo|tabela|completo",
     "clarification_message": "null ou texto curto para perguntar o período ao usuário (quando intent for esclarecer_periodo)",
     "sql_query": "null ou UMA instrução SELECT (apenas quando data_type for 'sql')",
-    "resposta_direta": "null ou texto curto (OBRIGATÓRIO quando intent for resposta_direta: ex. 'Hoje é {data_hoje}.')"
+    "resposta_direta": "null ou texto curto (OBRIGATÓRIO quando intent for resposta_direta: ex. 'Hoje é {data_hoje}.')",
+    "comparison": "null|periodo_anterior|ano_anterior"
 }
 
+**Comparação entre períodos (campo "comparison"):** Use quando o usuário pedir para comparar o faturamento/vendas com outro período (ex.: "quanto vendi a mais que no ano passado", "comparado ao mês passado", "cresceu em relação à semana passada"). "ano_anterior" = mesmo período do ano anterior; "periodo_anterior" = período de mesmo tamanho imediatamente antes (mês passado, semana passada, ontem). Nesse caso use data_type "resumo_periodo" e preencha "period" com o período ATUAL (o que está sendo comparado), não com o período de referência: "quanto vendi a mais que no ano passado" → period type "personalizado" com start "YYYY-01-01" do ano de hoje e end = data de hoje, e comparison "ano_anterior"; "este mês comparado ao mês passado" → period "mes_atual" e comparison "periodo_anterior". Sem pedido de comparação, use null.
+
+**Perguntas compostas (campo "metricas"):** Quando a mesma pergunta pedir várias coisas (ex.: "faturamento, lucro e top 5 produtos deste mês comparado ao mês passado", "quanto vendi e quanto tenho em estoque", "vendas da semana e contas a pagar"), preencha "metricas" com a lista de data_types na ordem pedida (ex.: ["resumo_periodo", "produtos_mais_vendidos"]) e use o primeiro como "data_type". Faturamento, lucro, margem e ticket médio são todos "resumo_periodo" (uma métrica só). "top N produtos" → filters {"limite": N}. O período e a comparação valem para todas as métricas. Pergunta sobre uma coisa só → "metricas" null.
+
 **Quando usar data_type "sql":** Use quando a pergunta exigir uma consulta que não se encaixa nos tipos pré-definidos: listagens customizadas (ex.: "produtos com estoque abaixo do mínimo"), contagens (ex.: "quantas vendas por dia"), agrupamentos por categoria/fornecedor, consultas que combinem várias tabelas de forma específica, ou qualquer pergunta que você resolver melhor com uma única instrução SELECT. Gere "sql_query" usando APENAS as tabelas e colunas listadas no schema; uma única instrução SELECT, sem ; no final. Para perguntas que já têm tipo definido (faturamento, produtos mais vendidos, contas a pagar, etc.), prefira o data_type correspondente e deixe sql_query null.
 
 Regras para period.type (use a data de hoje {data_hoje} como referência):
@@ -114,6 +131,8 @@ Regras para data_type:
 - "contas_pagar": contas a pagar com vencimento no período
 - "contas_receber": contas a receber (vendas fiado, valores a receber de clientes) com vencimento no período
 - "agenda": compromissos/agendamentos da agenda pessoal do usuário (reuniões, eventos, lembretes). O sistema TEM acesso à agenda. Use quando o usuário perguntar: "tenho algum agendamento?", "meus compromissos", "o que tenho na agenda", "agenda", "compromissos", "o que está agendado", "próximos compromissos". Retorne intent "consulta" e data_type "agenda". Período: "hoje" para "compromissos de hoje", "semanal" ou "mes_atual" para "meus agendamentos" / "tenho algum agendamento?" (próximos 7 dias ou mês atual).
+- "curva_abc": curva ABC / Pareto de todos os produtos no período (classes A, B e C), sell-through (vendido sobre as entradas) e estoque parado (produtos com estoque e sem venda há 90 dias). Use para "curva ABC", "pareto", "quais produtos dão mais resultado", "produtos classe A", "estoque parado", "o que não vende", "produtos encalhados". Em "filters", informe "criterio": "receita" (padrão), "lucro" ou "unidades" conforme a pergunta.
+- "produtos_juntos": pares de produtos comprados juntos na mesma venda (análise de cesta: suporte, confiança e lift), calculados sobre todo o histórico. Use para "o que vende junto", "produtos comprados juntos", "quem compra X leva o quê", "combinações de produtos", "como organizar a loja".
 - "analise_avancada": previsões, tendências de vendas, sazonalidade (histórico e mercado), notícias atuais. Use quando o usuário pedir: previsão, tendência, análise avançada, sazonalidade, comportamento das vendas, projeção, como está o mercado, notícias que impactam vendas.
 
 Se a pergunta for sobre "tenho algum agendamento?", "meus compromissos", "agenda", "o que tenho agendado" -> data_type: "agenda" (NUNCA resposta_direta dizendo que não tem acesso; o sistema consulta a agenda).
@@ -131,12 +150,17 @@ Se for "previsão de vendas", "tendência", "sazonalidade", "análise avançada"
 - "quem me deve", "fiado", "quem tá me devendo", "a receber", "contas a receber", "quem deve" → data_type "contas_receber".
 - "tenho compromisso", "meus compromissos", "o que tenho na agenda", "tenho algum agendamento", "agenda", "o que tá agendado" → data_type "agenda" (NUNCA resposta_direta dizendo que não tem acesso).
 - "o que mais vendeu", "mais vendidos", "top vendas", "produtos que mais venderam" → data_type "produtos_mais_vendidos".
+- "o que vende junto", "o que as clientes levam junto", "produtos comprados juntos" → data_type "produtos_juntos".
+- "curva abc", "o que está encalhado", "estoque parado", "o que não vende", "quais produtos dão mais lucro" → data_type "curva_abc".
 - "quanto tem em estoque", "valor do estoque", "quanto tenho em estoque" → data_type "valor_estoque".
 - "caixa", "sessões de caixa", "caixa do dia" → data_type "sessoes_caixa".
 - "o que entrou no estoque", "entradas" → data_type "entradas_estoque".
 - "previsão", "tendência", "como vai ser", "notícias" → data_type "analise_avancada".
 Para qualquer dúvida entre resposta_direta e consulta, PREFIRA consulta com data_type adequado e período inferido (mes_atual ou semanal).
 
+{history_block}
+Use o histórico acima para manter o assunto e o período. Quando o usuário enviar apenas um complemento de período (ex.: "ano completo", "este ano 2026"), considere-o como esclarecimento e retorne consulta com período adequado. Quando o assunto da conversa (contas a pagar, vendas, fiados) já estiver claro e só faltar período, prefira inferir "mes_atual" ou "ultimo_mes" e retornar consulta em vez de perguntar.
+
 **Pergunta atual do usuário:** {query}
 
 Retorne APENAS o JSON."""
@@ -171,13 +195,16 @@ DEFAULT_INITIAL_ANALYSIS = """Você é um especialista em vendas e gestão de lo
 5. **### Contas a receber – fiado (próximos 15 dias)**  
    Exiba somente: (a) "contas_a_receber_em_atraso" e (b) "contas_a_receber_proximas_15_dias". Para cada: cliente, valor, vencimento, status. Se houver atraso: **⚠️ Em atraso (a cobrar):** e liste. Formato: "- **Cliente** — R$ valor — Vencimento: DD/MM/AAAA". **Não inclua links**.
 
-6. **### Compromissos pessoais (agenda – próximos 15 dias)**  
+6. **### Fluxo de caixa projetado (4 semanas)**  
+   Use "fluxo_caixa_projetado": para cada semana, contas a pagar, a receber, vendas previstas e o saldo acumulado (a partir de zero, sem saldo em caixa/banco). Se "semanas_negativas" tiver itens, destaque com **⚠️** as semanas em que as saídas acumuladas superam as entradas e sugira ações (antecipar recebimentos, negociar prazos). Se o bloco estiver vazio, omita a seção.
+
+7. **### Compromissos pessoais (agenda – próximos 15 dias)**  
    Se houver compromissos: use "agenda_hoje" para **hoje** (título, horário, descrição curta) e "agenda_proximos_15_dias" para os **próximos 15 dias** (data, título, horário). Formato de lista com -. **Não inclua links**.
 
-7. **### Pontos de atenção**  
+8. **### Pontos de atenção**  
    2 a 4 pontos (contas desta semana, fiado a cobrar, fluxo de caixa, compromissos). Use os totais e quantidades do payload quando relevante.
 
-8. **Se "proximo_virada_mes" for true:** adicione **### Insights para a semana que começa** (proxima_semana_inicio a proxima_semana_fim): virada do mês, "sazonalidade_proximo_mes", dicas.
+9. **Se "proximo_virada_mes" for true:** adicione **### Insights para a semana que começa** (proxima_semana_inicio a proxima_semana_fim): virada do mês, "sazonalidade_proximo_mes", dicas.
 
 Use ## para o título, ### para seções, listas com -, negrito para ênfase. **Não inclua links** para outras páginas. Retorne apenas o markdown da análise.
 
@@ -188,8 +215,8 @@ Retorne apenas o markdown da análise."""
 DEFAULT_FORMAT_RESPONSE_ANALISE_AVANCADA = """Você é um analista de relatórios de PDV. Com base nos dados abaixo, elabore uma **análise avançada** em português, incluindo:
 
 1. **Tendência das vendas**: comente a variação percentual do período (crescimento ou queda) e o histórico mensal.
-2. **Previsão**: com base na previsão simples (média dos últimos meses) e na sazonalidade, indique o que esperar para o próximo período.
-3. **Sazonalidade nos dados**: comente em quais dias da semana as vendas são maiores/menores e o que isso sugere.
+2. **Previsão**: use o bloco "previsao" (modelo escolhido no backtest, erro do backtest, previsões mensais com intervalos de 80% e 95% e o realizado do mês atual) e a sazonalidade para indicar o que esperar para os próximos meses. Informe a faixa provável, não só o valor central.
+3. **Sazonalidade nos dados**: comente em quais dias da semana as vendas são maiores/menores (campo "indice": 1,00 = dia médio) e o que isso sugere.
 4. **Sazonalidade do mercado**: use o texto "sazonalidade_mercado_periodo" para explicar o que é típico do período no varejo brasileiro.
 5. **Notícias atuais**: se houver "noticias_recentes", mencione brevemente como o contexto econômico pode impactar as vendas (sem inventar dados).
 
@@ -201,19 +228,18 @@ Dados: {data}
 
 Retorne a análise em markdown."""
 
-DEFAULT_FORMAT_RESPONSE_GENERIC = """Você é um assistente de relatórios de PDV. Com base nos dados abaixo, responda de forma clara e objetiva em português à pergunta do usuário.
+DEFAULT_FORMAT_RESPONSE_INSIGHT = """Você é um analista de varejo de um PDV. Os números (totais e tabela) já foram mostrados ao usuário. Escreva APENAS um parágrafo curto de leitura (2 a 4 frases): o que mais chama atenção nos dados e, se fizer sentido, uma sugestão prática.
 
 Regras:
-- Responda apenas ao que foi perguntado.
-- Use valores em R$ no padrão brasileiro (ex: R$ 1.234,56).
-- Use markdown (negrito, listas) de forma leve.
-- Seja conciso (2-4 parágrafos no máximo para o corpo da resposta).
+- Não repita listas nem tabelas; cite no máximo 3 números, em R$ no padrão brasileiro (ex: R$ 1.234,56).
+- Use só os dados agregados abaixo; não invente valores nem itens que não aparecem.
+- Sem títulos; negrito no máximo uma vez.
 
-Pergunta: {original_query}
 Tipo de dado: {query_type}
-Dados: {data}
+Pergunta: {original_query}
+Dados agregados: {data}
 
-Retorne a resposta em markdown."""
+Retorne só o parágrafo."""
 
 DEFAULT_ACCOUNTS_AGENT_PARSE = """Você é um assistente que interpreta pedidos de cadastro de **contas a pagar** (fornecedores) e **contas a receber** (clientes / vendas fiado). Seja MÁXIMO ASSERTIVO: infira pelo contexto sempre que possível; só pergunte quando for IMPOSSÍVEL entender.
 
@@ -299,22 +325,71 @@ Regras:
 
 Retorne APENAS o JSON."""
 
+DEFAULT_TURN_PLANNER = """Você é o planejador do chat de um PDV (loja de roupas femininas): vendas, estoque, caixa, contas a pagar, contas a receber (fiado), agenda pessoal e relatórios. Em UMA resposta, classifique a mensagem do usuário e extraia tudo o que o sistema precisa para atendê-la sem novas perguntas à IA.
+
+**Data de hoje:** {data_hoje}. Use-a para "hoje", "amanhã", "dia 10" (mês atual), "mês passado", "próximo mês" etc. Datas no Brasil são DD/MM/AAAA; no JSON use YYYY-MM-DD.
+
+**Estrutura do banco (para consultas SQL customizadas):**
+{DB_SCHEMA}
+
+Use o histórico para manter o assunto e o período. Se a última mensagem do Assistente fez uma pergunta (período, valor, data, nome, descrição), a mensagem atual é a resposta: preencha o campo e não pergunte de novo.
+
+**Intenções (intent):**
+- "lancamento": cadastrar conta a pagar/receber (entity "contas_pagar"/"contas_receber", action "INSERT", preencha "conta") ou compromisso (entity "agenda", action "INSERT", preencha "compromisso").
+- "consulta": pedido de dados/relatório (entity "relatorio" ou a entidade consultada, action "REPORT" ou "LIST"). Preencha data_type e period. Sem período claro, infira pelo histórico ou use "mes_atual".
+- "esclarecer_periodo": SOMENTE quando for impossível inferir o período (primeira mensagem vaga, sem histórico). Preencha "mensagem" com a pergunta curta.
+- "resposta_direta": não é pedido de dados (ex.: "que dia é hoje?" → "Hoje é {data_hoje}."). Preencha "mensagem".
+
+**data_type:** resumo_periodo (faturamento, vendas, lucro, ticket médio), produtos_mais_vendidos, valor_estoque, entradas_estoque, sessoes_caixa, contas_pagar, contas_receber (fiado, quem me deve), agenda (compromissos), curva_abc (pareto, estoque parado; filters.criterio receita|lucro|unidades), produtos_juntos (o que vende junto), analise_avancada (previsão, tendência, sazonalidade, notícias), sql (só quando nada acima serve; preencha sql_query com UM SELECT das tabelas do schema, sem ; no final).
+
+**metricas:** só em pergunta que pede várias coisas de uma vez (ex.: "faturamento, lucro e top 5 produtos do mês vs. mês passado" → ["resumo_periodo", "produtos_mais_vendidos"], filters {"limite": 5}); data_type = o primeiro da lista. Senão null.
+**period:** {"start": "YYYY-MM-DD ou null", "end": "YYYY-MM-DD ou null", "type": "hoje|semanal|mes_atual|ultimo_mes|proximo_mes|anual|geral|personalizado"}.
+**comparison:** "ano_anterior" ou "periodo_anterior" quando pedir comparação de vendas (period = período atual); senão null.
+**narrativa:** true só quando o usuário pedir explicação, análise, opinião ou dicas em texto (ex.: "analise", "por que caiu", "o que você acha", "me explica"); consultas de números/listas → false.
+
+**conta** (só em lançamento de conta; senão null): {"intent": "cadastrar|dar_baixa", "tipo": "pagar|receber", "fornecedor": "nome ou null", "cliente": "nome ou null", "descricao": "ou null", "valor": número ou null, "data_vencimento": "YYYY-MM-DD ou null", "observacao": "ou null", "bulk": null ou {"dia": 8, "mes_inicio": 1, "mes_fim": 12, "ano": 2026}, "missing": [], "clarification_questions": []}. Pagar = fornecedor (luz, aluguel); receber = cliente/fiado. "todo dia 8 de 2026" → bulk.
+**compromisso** (só em lançamento na agenda; senão null): {"titulo": "rótulo curto (1 a 4 palavras) ou null", "descricao": "ou null", "data": "YYYY-MM-DD ou null", "hora": "HH:MM ou null", "missing": [], "clarification_questions": []}.
+
+Retorne APENAS um JSON válido (sem markdown, sem texto extra):
+{
+    "intent": "consulta|lancamento|esclarecer_periodo|resposta_direta",
+    "entity": "relatorio|contas_pagar|contas_receber|agenda",
+    "action": "REPORT|LIST|INSERT|UPDATE|DELETE|OTHER",
+    "confidence": 0.0-1.0,
+    "data_type": "... ou null",
+    "metricas": null,
+    "period": {...} ou null,
+    "filters": {},
+    "comparison": null,
+    "sql_query": null,
+    "conta": null,
+    "compromisso": null,
+    "narrativa": false,
+    "mensagem": null
+}
+
+{history_block}**Mensagem atual do usuário:** {query}
+
+Retorne APENAS o JSON."""
+
 DEFAULTS: Dict[str, str] = {
     KEY_ANALYZE_QUERY: DEFAULT_ANALYZE_QUERY,
     KEY_INITIAL_ANALYSIS: DEFAULT_INITIAL_ANALYSIS,
     KEY_FORMAT_RESPONSE_ANALISE_AVANCADA: DEFAULT_FORMAT_RESPONSE_ANALISE_AVANCADA,
-    KEY_FORMAT_RESPONSE_GENERIC: DEFAULT_FORMAT_RESPONSE_GENERIC,
+    KEY_FORMAT_RESPONSE_INSIGHT: DEFAULT_FORMAT_RESPONSE_INSIGHT,
     KEY_ACCOUNTS_AGENT_PARSE: DEFAULT_ACCOUNTS_AGENT_PARSE,
     KEY_AGENDA_AGENT_PARSE: DEFAULT_AGENDA_AGENT_PARSE,
+    KEY_TURN_PLANNER: DEFAULT_TURN_PLANNER,
 }
 
 PLACEHOLDERS_HELP: Dict[str, str] = {
     KEY_ANALYZE_QUERY: "Placeholders: {DB_SCHEMA}, {data_hoje}, {history_block}, {query}",
     KEY_INITIAL_ANALYSIS: "Placeholders: {nome_hoje}, {payload}",
     KEY_FORMAT_RESPONSE_ANALISE_AVANCADA: "Placeholders: {original_query}, {data}",
-    KEY_FORMAT_RESPONSE_GENERIC: "Placeholders: {original_query}, {query_type}, {data}",
+    KEY_FORMAT_RESPONSE_INSIGHT: "Placeholders: {original_query}, {query_type}, {data} (agregados, não as linhas)",
     KEY_ACCOUNTS_AGENT_PARSE: "Placeholders: {data_hoje}, {history_block}, {message}",
     KEY_AGENDA_AGENT_PARSE: "Placeholders: {data_hoje}, {history_block}, {message}",
+    KEY_TURN_PLANNER: "Placeholders: {DB_SCHEMA}, {data_hoje}, {history_block}, {query}",
 }
 
 
@@ -1,12 +1,13 @@
 """
 MCP (Model Context Protocol) para o PDV.
-Serviços in-process: detect, extract, validate, list, format.
+Serviços in-process: detect, extract, validate, list, format; Pipeline junta as etapas de um turno de chat.
 """
 from mcp.detector import MCPDetector
 from mcp.extractor import MCPExtractor
 from mcp.validator import MCPValidator
 from mcp.lister import MCPLister
 from mcp.formatter import MCPFormatter
+from mcp.pipeline import Pipeline
 
 __all__ = [
     "MCPDetector",
@@ -14,4 +15,5 @@ __all__ = [
     "MCPValidator",
     "MCPLister",
     "MCPFormatter",
+    "Pipeline",
 ]
@@ -7,18 +7,31 @@ contas a receber, agenda pessoal e relatórios. O detector classifica a intenç
 
 Retorna action (INSERT, UPDATE, DELETE, LIST, REPORT, OTHER) e entity
 (contas_pagar, contas_receber, agenda, relatorio).
-Modo híbrido: regras primeiro; se confiança baixa ou OTHER, tenta classificação por IA.
+Ordem: classificador local (mcp.intent_classifier, microssegundos, sem rede) quando a confiança calibrada passa de
+CONFIDENCE_CLASSIFIER_THRESHOLD; senão IA. O classificador só substitui a chamada à IA: sem IA configurada, quem
+decide são as regras/padrões, como antes.
+detect_many classifica vários textos (ex.: uma fala com vários pedidos, separada por dividir_comandos) com um
+único pedido à IA por lote.
 """
-import json
 import re
-from typing import Any, Dict, Optional, Tuple
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from sqlalchemy.orm import Session
 
+from mcp import intent_classifier
+from mcp.llm_json import ler_json
 from mcp.schemas import DetectResponse
+from services.llm_cache import SITE_MCP_DETECTOR
 
 # Abaixo deste limiar ou quando action == OTHER, o detector tenta classificação por IA
 CONFIDENCE_LLM_THRESHOLD = 0.8
+# Confiança calibrada mínima do classificador local para dispensar a IA
+CONFIDENCE_CLASSIFIER_THRESHOLD = 0.9
+
+_lock = threading.Lock()
+_metricas: Dict[str, Dict[str, float]] = {}
 VALID_ENTITIES = frozenset({"contas_pagar", "contas_receber", "agenda", "relatorio"})
 VALID_ACTIONS = frozenset({"INSERT", "UPDATE", "DELETE", "LIST", "REPORT", "OTHER"})
 
@@ -53,7 +66,8 @@ class MCPDetector:
     (vendas, estoque, caixa, contas a pagar/receber, agenda, relatórios).
     Usado por Contas, Agenda e Relatórios; classifica por conteúdo quando a página
     é ausente ou para desambiguar (ex.: "tenho agendamento?" na página Início).
-    Em modo híbrido, usa IA quando as regras têm confiança baixa ou retornam OTHER.
+    O classificador local responde a maioria das mensagens; a IA só é chamada quando a confiança
+    dele fica abaixo do limiar, e as regras cobrem a falta de IA.
     """
 
     def __init__(self, db: Session):
@@ -92,33 +106,54 @@ Contexto (página atual): "{pagina}"
 Responda apenas com um JSON válido no formato: {{"entity": "...", "action": "...", "confidence": 0.0-1.0}}
 Sem texto antes ou depois do JSON."""
         content, error = ai.complete(
-            prompt, temperature=0.2, max_tokens=150, json_mode=True
+            prompt, temperature=0.2, max_tokens=150, json_mode=True, cache=SITE_MCP_DETECTOR
         )
         if error or not content:
             return None
-        content = content.strip()
-        if content.startswith("```"):
-            content = re.sub(r"^```(?:json)?\s*", "", content, flags=re.MULTILINE)
-            content = re.sub(r"```\s*$", "", content, flags=re.MULTILINE)
-        try:
-            data = json.loads(content)
-        except json.JSONDecodeError:
-            return None
-        entity = (data.get("entity") or "").strip().lower()
-        action = (data.get("action") or "").strip().upper()
-        confidence = data.get("confidence")
-        if entity not in VALID_ENTITIES or action not in VALID_ACTIONS:
-            return None
-        if isinstance(confidence, (int, float)):
-            confidence = max(0.0, min(1.0, float(confidence)))
-        else:
-            confidence = 0.8
-        return DetectResponse(
-            action=action,
-            entity=entity,
-            confidence=confidence,
-            extracted_info=None,
+        return _resposta_llm(ler_json(content))
+
+    def _detect_batch_with_llm(
+        self, texts: List[str], context: Dict[str, Any]
+    ) -> Dict[int, DetectResponse]:
+        """
+        Classifica vários textos num único pedido à IA (lista numerada, resposta {"itens": [...]}).
+        Retorna {posição: DetectResponse} só para os itens válidos; os ausentes ou inválidos ficam para a
+        chamada individual.
+        """
+        ai = self._get_ai_service()
+        if not texts or not ai.is_available():
+            return {}
+        pagina = (context.get("pagina") or "").strip()
+        numerados = "\n".join(f'{n}. "{t}"' for n, t in enumerate(texts, 1))
+        prompt = f"""Sistema PDV: vendas, estoque, caixa, contas a pagar, contas a receber, agenda pessoal e relatórios. Classifique a intenção de cada texto do usuário, independentemente dos outros.
+
+Entidades válidas: contas_pagar, contas_receber, agenda, relatorio.
+Ações válidas: INSERT, UPDATE, DELETE, LIST, REPORT, OTHER.
+
+Contexto (página atual): "{pagina}"
+Textos do usuário:
+{numerados}
+
+Responda apenas com um JSON válido no formato: {{"itens": [{{"i": 1, "entity": "...", "action": "...", "confidence": 0.0-1.0}}]}}
+Um item por texto, com "i" igual ao número do texto. Sem texto antes ou depois do JSON."""
+        content, error = ai.complete(
+            prompt, temperature=0.2, max_tokens=40 * len(texts) + 60, json_mode=True, cache=SITE_MCP_DETECTOR
         )
+        if error or not content:
+            return {}
+        data = ler_json(content)
+        itens = data.get("itens") if isinstance(data, dict) else None
+        if not isinstance(itens, list):
+            return {}
+        saida: Dict[int, DetectResponse] = {}
+        for item in itens:
+            if not isinstance(item, dict) or not isinstance(item.get("i"), int):
+                continue
+            pos = item["i"] - 1
+            res = _resposta_llm(item)
+            if res is not None and 0 <= pos < len(texts) and pos not in saida:
+                saida[pos] = res
+        return saida
 
     def _detect_by_content(
         self, text_lower: str, context: Optional[Dict[str, Any]]
@@ -153,8 +188,8 @@ Sem texto antes ou depois do JSON."""
         """
         Detecta a intenção do usuário e retorna action e entity.
         Usa contexto (página) quando presente; senão classifica por conteúdo.
-        Se a confiança das regras for baixa ou action for OTHER, tenta classificação por IA.
-        Para saber se a interpretação veio da IA, use detect_with_source().
+        Classificador local primeiro; abaixo de CONFIDENCE_CLASSIFIER_THRESHOLD, classificação por IA.
+        Para saber de onde veio a interpretação, use detect_with_source().
         """
         result, _ = self._detect_result_and_source(text, context)
         return result
@@ -163,16 +198,105 @@ Sem texto antes ou depois do JSON."""
         self, text: str, context: Optional[Dict[str, Any]] = None
     ) -> Tuple[DetectResponse, str]:
         """
-        Retorna (DetectResponse, origem) onde origem é "ia" ou "regras",
-        indicando se a classificação foi feita pela IA ou pelas regras/padrões.
+        Retorna (DetectResponse, origem) onde origem é "classificador", "ia" ou "regras",
+        indicando se a classificação foi feita pelo classificador local, pela IA ou pelas regras/padrões.
+        """
+        return self._detect_result_and_source(text, context)
+
+    def detect_many(
+        self, texts: Sequence[str], context: Optional[Dict[str, Any]] = None
+    ) -> List[DetectResponse]:
+        """
+        Detecta a intenção de vários textos de uma vez (mesma ordem de entrada e mesmo contexto).
+        Equivale a chamar detect() em cada um, mas os textos que o classificador local não resolve vão à IA
+        juntos, num pedido por lote (token_budget.lotes); só as falhas do lote caem na chamada individual.
         """
-        result, used_llm = self._detect_result_and_source(text, context)
-        return result, "ia" if used_llm else "regras"
+        return [r for r, _ in self.detect_many_with_source(texts, context)]
+
+    def detect_many_with_source(
+        self, texts: Sequence[str], context: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[DetectResponse, str]]:
+        """Como detect_many, com a origem de cada resultado ("classificador", "ia" ou "regras")."""
+        from services import token_budget
+
+        context = context or {}
+        saida: List[Optional[Tuple[DetectResponse, str]]] = [None] * len(texts)
+        pendentes: List[int] = []
+        for i, text in enumerate(texts):
+            if not (text or "").strip():
+                saida[i] = self._detect_result_and_source(text, context)
+                continue
+            t0 = time.perf_counter()
+            result = self._detect_with_classifier(text, context)
+            if result is None:
+                pendentes.append(i)
+                continue
+            result = self._fix_receivable(result, text.lower().strip())
+            _registrar("classificador", (time.perf_counter() - t0) * 1000)
+            saida[i] = (result, "classificador")
+
+        if len(pendentes) > 1:
+            for lote in token_budget.lotes([texts[i] for i in pendentes]):
+                indices = [pendentes[j] for j in lote]
+                t0 = time.perf_counter()
+                resolvidos = self._detect_batch_with_llm([texts[i] for i in indices], context)
+                ms = (time.perf_counter() - t0) * 1000 / len(indices)
+                for pos, result in resolvidos.items():
+                    i = indices[pos]
+                    _registrar("ia", ms)
+                    saida[i] = (self._fix_receivable(result, texts[i].lower().strip()), "ia")
+
+        for i in pendentes:
+            if saida[i] is None:
+                saida[i] = self._detect_after_classifier(texts[i], context, time.perf_counter())
+        return saida
+
+    def _detect_with_classifier(self, text: str, context: Dict[str, Any]) -> Optional[DetectResponse]:
+        """
+        Classificador local (mcp.intent_classifier), no lugar da chamada à IA; None sem IA configurada (as regras
+        decidem), sem modelo, mensagem estranha ao modelo ou confiança baixa.
+        """
+        if not self._get_ai_service().is_available():
+            return None
+        modelo = intent_classifier.modelo()
+        if modelo is None:
+            return None
+        pred = modelo.prever(text, (context.get("pagina") or "").strip().lower())
+        if pred is None or pred[2] < CONFIDENCE_CLASSIFIER_THRESHOLD:
+            return None
+        entity, action, confidence = pred
+        return DetectResponse(action=action, entity=entity, confidence=round(confidence, 4), extracted_info=None)
+
+    @staticmethod
+    def _fix_receivable(result: DetectResponse, text_lower: str) -> DetectResponse:
+        """
+        "fiado" e termos de conta a receber sempre → contas_receber (resultado da IA ou do classificador).
+        Exceto "conta de N para Nome" = conta a pagar (pagar para alguém).
+        """
+        if (
+            result.entity != "contas_pagar"
+            or not KEYWORDS_CONTAS_RECEBER.search(text_lower)
+            or re.search(r"conta\s+de\s+[\d,\.]+\s+para\s+", text_lower)
+        ):
+            return result
+        # "de N para Nome" = cadastro (INSERT), não atualização
+        action_override = result.action
+        if re.search(r"de\s+[\d,\.]+\s+para\s+", text_lower):
+            action_override = "INSERT"
+        return DetectResponse(
+            action=action_override,
+            entity="contas_receber",
+            confidence=result.confidence,
+            extracted_info=result.extracted_info,
+        )
 
     def _detect_result_and_source(
         self, text: str, context: Optional[Dict[str, Any]]
-    ) -> Tuple[DetectResponse, bool]:
-        """Retorna (DetectResponse, used_llm: bool). Qualquer entrada é detectada por IA quando disponível; fallback para regras."""
+    ) -> Tuple[DetectResponse, str]:
+        """
+        Retorna (DetectResponse, origem). Com IA configurada, classificador local primeiro e, abaixo do limiar, a IA;
+        sem IA (ou se ela falhar), regras.
+        """
         text_lower = (text or "").lower().strip()
         if not text_lower:
             return DetectResponse(
@@ -180,32 +304,35 @@ Sem texto antes ou depois do JSON."""
                 entity="contas_pagar",
                 confidence=0.0,
                 extracted_info=None,
-            ), False
+            ), "regras"
 
         context = context or {}
-        # Sempre tentar IA primeiro; se retornar resultado válido, usar
-        llm_result = self._detect_with_llm(text, context)
-        if llm_result is not None:
-            # Pós-IA: "fiado" e termos de conta a receber sempre → contas_receber
-            # Exceto "conta de N para Nome" = conta a pagar (pagar para alguém)
-            if (
-                llm_result.entity == "contas_pagar"
-                and KEYWORDS_CONTAS_RECEBER.search(text_lower)
-                and not re.search(r"conta\s+de\s+[\d,\.]+\s+para\s+", text_lower)
-            ):
-                # "de N para Nome" = cadastro (INSERT), não atualização
-                action_override = llm_result.action
-                if re.search(r"de\s+[\d,\.]+\s+para\s+", text_lower):
-                    action_override = "INSERT"
-                llm_result = DetectResponse(
-                    action=action_override,
-                    entity="contas_receber",
-                    confidence=llm_result.confidence,
-                    extracted_info=llm_result.extracted_info,
-                )
-            return llm_result, True
-
-        # Fallback: regras/padrões quando IA não está configurada ou falhou
+        t0 = time.perf_counter()
+        result = self._detect_with_classifier(text, context)
+        if result is None:
+            return self._detect_after_classifier(text, context, t0)
+        result = self._fix_receivable(result, text_lower)
+        _registrar("classificador", (time.perf_counter() - t0) * 1000)
+        return result, "classificador"
+
+    def _detect_after_classifier(
+        self, text: str, context: Dict[str, Any], t0: float
+    ) -> Tuple[DetectResponse, str]:
+        """IA individual e, sem ela, regras (o classificador já não resolveu o texto)."""
+        result = self._detect_with_llm(text, context)
+        origem = "ia"
+        if result is not None:
+            result = self._fix_receivable(result, text.lower().strip())
+        else:
+            result = self.detect_by_rules(text, context)
+            origem = "regras"
+        _registrar(origem, (time.perf_counter() - t0) * 1000)
+        return result, origem
+
+    def detect_by_rules(self, text: str, context: Optional[Dict[str, Any]] = None) -> DetectResponse:
+        """Classificação só por regras/padrões (sem classificador e sem IA)."""
+        text_lower = (text or "").lower().strip()
+        context = context or {}
         pagina = (context.get("pagina") or "").strip().lower()
         if pagina == "agenda":
             result = self._detect_agenda(text_lower, context)
@@ -231,7 +358,7 @@ Sem texto antes ou depois do JSON."""
                     result = self._detect_contas(text_lower, context)
             else:
                 result = self._detect_contas(text_lower, context)
-        return result, False
+        return result
 
     def _detect_contas(
         self, text_lower: str, context: Optional[Dict[str, Any]]
@@ -425,3 +552,88 @@ Sem texto antes ou depois do JSON."""
             confidence=0.85,
             extracted_info=None,
         )
+
+
+# Verbos que abrem um novo comando numa fala com vários pedidos ("paguei a luz e recebi da Maria")
+VERBOS_COMANDO = (
+    r"paguei|pagar|pague|recebi|receber|receba|marca|marque|marcar|agenda|agende|agendar|cadastra|cadastre|"
+    r"cadastrar|registra|registre|registrar|anota|anote|anotar|lan[cç]a|lance|lan[cç]ar|adiciona|adicione|"
+    r"exclui|exclua|apaga|apague|lembra|lembre|mostra|mostre|lista|liste"
+)
+# Ponto depois de palavra curta com maiúscula ("Dr.", "Sra.", "J.") é abreviação, não fim de frase
+_NAO_ABREVIACAO = r"(?-i:(?<!\b[A-ZÀ-Ý])(?<!\b[A-ZÀ-Ý][a-zà-ÿ])(?<!\b[A-ZÀ-Ý][a-zà-ÿ]{2}))"
+_SEPARADOR_COMANDOS = re.compile(
+    rf"\s*(?:[;\n]+|,(?!\d)\s*(?:e\s+)?(?=[^\W\d_])|\s+e\s+(?=(?:{VERBOS_COMANDO})\b)"
+    rf"|{_NAO_ABREVIACAO}\.\s+(?=[^\W\d_])|\.\s+(?=(?:{VERBOS_COMANDO})\b))\s*",
+    re.IGNORECASE,
+)
+_INICIO_COMANDO = re.compile(rf"^(?:{VERBOS_COMANDO})\b", re.IGNORECASE)
+
+
+def dividir_comandos(texto: str) -> List[str]:
+    """
+    Separa uma fala com vários pedidos em comandos ("paguei a luz, recebi da Maria, marca dentista sexta" →
+    3 comandos). Quebra em ";", quebra de linha, ". " e em ", " / " e " antes de outro comando; vírgula
+    decimal ("50,90") não quebra, nem o ponto de abreviação ("Dr. Silva"), a não ser antes de verbo de comando. Um trecho após vírgula que não começa com verbo de comando continua o anterior
+    ("conta de luz, 120 reais" fica inteiro).
+    """
+    partes = [p.strip(" .,;") for p in _SEPARADOR_COMANDOS.split(texto or "")]
+    comandos: List[str] = []
+    for parte in partes:
+        if not parte:
+            continue
+        if comandos and not _INICIO_COMANDO.match(parte) and not _parece_comando(parte):
+            comandos[-1] = f"{comandos[-1]}, {parte}"
+        else:
+            comandos.append(parte)
+    return comandos
+
+
+def _parece_comando(parte: str) -> bool:
+    """Trecho que já se sustenta como pedido (conta, compromisso ou pergunta), mesmo sem verbo de comando."""
+    return bool(re.match(r"^(?:conta|fiado|quanto|quais|qual|o\s+que|tenho|minhas?|meus?|reuni[ãa]o|dentista)\b", parte, re.IGNORECASE))
+
+
+def _resposta_llm(data: Any) -> Optional[DetectResponse]:
+    """DetectResponse a partir de {"entity", "action", "confidence"}; None se entidade/ação inválidas."""
+    if not isinstance(data, dict):
+        return None
+    entity = (data.get("entity") or "").strip().lower()
+    action = (data.get("action") or "").strip().upper()
+    confidence = data.get("confidence")
+    if entity not in VALID_ENTITIES or action not in VALID_ACTIONS:
+        return None
+    if isinstance(confidence, (int, float)):
+        confidence = max(0.0, min(1.0, float(confidence)))
+    else:
+        confidence = 0.8
+    return DetectResponse(
+        action=action,
+        entity=entity,
+        confidence=confidence,
+        extracted_info=None,
+    )
+
+
+def _registrar(origem: str, ms: float) -> None:
+    """Conta uma detecção por origem ("classificador", "ia", "regras") com sua latência (ms)."""
+    with _lock:
+        m = _metricas.setdefault(origem, {"deteccoes": 0, "ms_total": 0.0})
+        m["deteccoes"] += 1
+        m["ms_total"] += float(ms)
+
+
+def estatisticas_deteccao() -> Dict[str, Any]:
+    """Detecções, proporção e latência média por origem (desde o início do processo)."""
+    with _lock:
+        total = sum(int(m["deteccoes"]) for m in _metricas.values())
+        origens = [
+            {
+                "origem": origem,
+                "deteccoes": int(m["deteccoes"]),
+                "proporcao_pct": round(m["deteccoes"] / total * 100, 1) if total else 0.0,
+                "latencia_media_ms": round(m["ms_total"] / m["deteccoes"], 3) if m["deteccoes"] else 0.0,
+            }
+            for origem, m in _metricas.items()
+        ]
+    return {"total": total, "origens": origens}
@@ -2,16 +2,25 @@
 Serviço MCP para extração de dados no PDV.
 Extrai dados por entidade: contas_pagar, contas_receber, agenda, relatorio.
 Modo híbrido: para INSERT em contas, tenta IA primeiro (melhor clareza); fallback em regex.
+extract_many junta os INSERT de contas de vários textos num único pedido à IA por lote.
 """
-import json
 import re
 from calendar import monthrange
 from datetime import date
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
 from sqlalchemy.orm import Session
 
+from mcp.llm_json import ler_json
 from mcp.schemas import ExtractResponse
+from services.llm_cache import SITE_MCP_EXTRACTOR
+
+# Palavras que seguem "contas do/da/de" sem serem nome de fornecedor/cliente
+PALAVRAS_NAO_NOME = frozenset({
+    "mes", "mês", "semana", "hoje", "ontem", "amanha", "amanhã", "ano", "dia", "periodo", "período", "janeiro",
+    "fevereiro", "marco", "março", "abril", "maio", "junho", "julho", "agosto", "setembro", "outubro", "novembro",
+    "dezembro", "pagar", "receber", "clientes", "fornecedores", "vencimento", "agora", "trimestre",
+})
 
 
 class MCPExtractor:
@@ -52,6 +61,7 @@ class MCPExtractor:
             data, missing_fields, confidence = self._extract_contas(
                 text, text_lower, action, entity
             )
+            self._resolver_nome(data, action, entity)
         elif entity == "agenda":
             data, missing_fields, confidence = self._extract_agenda(
                 text, text_lower, action
@@ -115,18 +125,19 @@ Texto do usuário: "{text}"
 Responda APENAS com um JSON válido, sem texto antes ou depois, com as chaves: "valor", "{name_field}", "data_vencimento", "descricao" (esta pode ser string vazia ou omitida).
 Exemplo: {{"valor": 100, "{name_field}": "Luz", "data_vencimento": "{hoje.year}-{hoje.month:02d}-15", "descricao": "Conta de luz"}}"""
         content, error = ai.complete(
-            prompt, temperature=0.2, max_tokens=300, json_mode=True
+            prompt, temperature=0.2, max_tokens=300, json_mode=True, cache=SITE_MCP_EXTRACTOR
         )
         if error or not content:
             return None
-        content = content.strip()
-        if content.startswith("```"):
-            content = re.sub(r"^```(?:json)?\s*", "", content, flags=re.MULTILINE)
-            content = re.sub(r"```\s*$", "", content, flags=re.MULTILINE)
-        try:
-            raw = json.loads(content)
-        except json.JSONDecodeError:
+        raw = ler_json(content)
+        if not isinstance(raw, dict):
             return None
+        return self._contas_from_ai(raw, entity, name_field)
+
+    def _contas_from_ai(
+        self, raw: Dict[str, Any], entity: str, name_field: str
+    ) -> Tuple[Dict[str, Any], List[str], float]:
+        """Dados de INSERT contas a partir do JSON da IA (name_field: chave do nome usada no prompt)."""
         data: Dict[str, Any] = {}
         missing_fields: List[str] = []
 
@@ -168,6 +179,99 @@ Exemplo: {{"valor": 100, "{name_field}": "Luz", "data_vencimento": "{hoje.year}-
         confidence = found / required if required > 0 else 0.0
         return data, missing_fields, min(1.0, confidence + 0.1)
 
+    def extract_many(
+        self, items: Sequence[Tuple[str, str, str, Optional[Dict[str, Any]]]]
+    ) -> List[ExtractResponse]:
+        """
+        Extrai vários itens (text, action, entity, context) de uma vez, na ordem de entrada.
+        Os INSERT de contas (únicos que usam IA) vão juntos num pedido por lote (token_budget.lotes);
+        os demais e as falhas do lote seguem por extract() item a item, com o mesmo resultado.
+        """
+        from services import token_budget
+
+        saida: List[Optional[ExtractResponse]] = [None] * len(items)
+        contas = [
+            i for i, (text, action, entity, _ctx) in enumerate(items)
+            if action == "INSERT" and entity in ("contas_pagar", "contas_receber") and (text or "").strip()
+        ]
+        if len(contas) > 1 and self._get_ai_service().is_available():
+            for lote in token_budget.lotes([items[i][0] for i in contas]):
+                indices = [contas[j] for j in lote]
+                resolvidos = self._extract_contas_batch_with_ai([(items[i][0].strip(), items[i][2]) for i in indices])
+                for pos, (data, missing_fields, confidence) in resolvidos.items():
+                    self._resolver_nome(data, "INSERT", items[indices[pos]][2])
+                    saida[indices[pos]] = ExtractResponse(data=data, confidence=confidence, missing_fields=missing_fields)
+        for i, (text, action, entity, context) in enumerate(items):
+            if saida[i] is None:
+                saida[i] = self.extract(text, action, entity, context)
+        return saida
+
+    def _extract_contas_batch_with_ai(
+        self, itens: List[Tuple[str, str]]
+    ) -> Dict[int, Tuple[Dict[str, Any], List[str], float]]:
+        """
+        INSERT de várias contas (texto, entidade) num único pedido à IA. Retorna {posição: (data, missing,
+        confidence)} só para os itens que vieram na resposta; os demais ficam para a chamada individual.
+        """
+        ai = self._get_ai_service()
+        hoje = date.today()
+        numerados = "\n".join(f'{n}. ({entity}) "{text}"' for n, (text, entity) in enumerate(itens, 1))
+        prompt = f"""Extraia de cada texto do usuário os dados para cadastro de uma conta (a entidade vem entre parênteses).
+Regras:
+- valor: número (obrigatório). Ex.: 100, 250.50
+- nome: fornecedor (contas_pagar) ou cliente (contas_receber), SEM incluir valor nem data. Ex.: "conta de luz 100 reais dia 15" → nome "Luz"
+- data_vencimento: data no formato YYYY-MM-DD. Se o usuário disser só "dia 15" ou "dia 8", use o mês e ano atuais (hoje é {hoje.isoformat()}).
+- descricao: opcional; pode ser "Conta de [nome]" quando fizer sentido (ex.: "Conta de luz")
+
+Textos do usuário:
+{numerados}
+
+Responda APENAS com um JSON válido, sem texto antes ou depois, no formato:
+{{"itens": [{{"i": 1, "valor": 100, "nome": "Luz", "data_vencimento": "{hoje.year}-{hoje.month:02d}-15", "descricao": "Conta de luz"}}]}}
+Um item por texto, com "i" igual ao número do texto."""
+        content, error = ai.complete(
+            prompt, temperature=0.2, max_tokens=120 * len(itens) + 60, json_mode=True, cache=SITE_MCP_EXTRACTOR
+        )
+        if error or not content:
+            return {}
+        raw = ler_json(content)
+        lista = raw.get("itens") if isinstance(raw, dict) else None
+        if not isinstance(lista, list):
+            return {}
+        saida: Dict[int, Tuple[Dict[str, Any], List[str], float]] = {}
+        for item in lista:
+            if not isinstance(item, dict) or not isinstance(item.get("i"), int):
+                continue
+            pos = item["i"] - 1
+            if 0 <= pos < len(itens) and pos not in saida:
+                data, missing_fields, confidence = self._contas_from_ai(item, itens[pos][1], "nome")
+                name_field = "fornecedor" if itens[pos][1] == "contas_pagar" else "cliente"
+                saida[pos] = (data, [name_field if f == "nome" else f for f in missing_fields], confidence)
+        return saida
+
+    def _resolver_nome(self, data: Dict[str, Any], action: str, entity: str) -> None:
+        """
+        Casa o fornecedor/cliente extraído com os nomes já cadastrados (services.name_matcher).
+        INSERT: usa a grafia cadastrada quando é o mesmo nome ("joao" -> "João"), para não duplicar o credor.
+        UPDATE (dar baixa): troca pelo nome mais parecido entre os com conta em aberto e guarda o ranking em
+        "candidatos_nome".
+        """
+        from services import name_matcher
+
+        name_field = "fornecedor" if entity == "contas_pagar" else "cliente"
+        termo = (data.get(name_field) or "").strip()
+        if not termo or action not in ("INSERT", "UPDATE"):
+            return
+        if action == "INSERT":
+            nome = name_matcher.mesmo_nome(self.db, entity, termo)
+            if nome:
+                data[name_field] = nome
+            return
+        achados = name_matcher.candidatos(self.db, entity, termo, abertas=True)
+        if achados:
+            data[name_field] = achados[0]["nome"]
+            data["candidatos_nome"] = achados
+
     def _extract_contas_insert(
         self, text_lower: str, entity: str
     ) -> Tuple[Dict[str, Any], List[str], float]:
@@ -374,6 +478,12 @@ Exemplo: {{"valor": 100, "{name_field}": "Luz", "data_vencimento": "{hoje.year}-
                 confidence = 0.8
             except (ValueError, TypeError):
                 pass
+        # "contas do João", "contas a pagar da Energisa": filtro por nome (casado depois com os nomes cadastrados)
+        nome = re.search(
+            r"contas?\s+(?:a\s+(?:pagar|receber)\s+)?(?:do|da|de|dos|das|com\s+o|com\s+a)\s+([^\W\d_]{3,})", text_lower
+        )
+        if nome and nome.group(1) not in PALAVRAS_NAO_NOME:
+            data["nome"] = nome.group(1)
         if "pendente" in text_lower or "aberta" in text_lower:
             data["status"] = "aberta"
         elif "pago" in text_lower or "pagas" in text_lower:
@@ -497,7 +607,11 @@ Exemplo: {{"valor": 100, "{name_field}": "Luz", "data_vencimento": "{hoje.year}-
         today = date.today()
 
         # data_type
-        if "venda" in text_lower or "vendas" in text_lower:
+        if re.search(r"curva\s+abc|pareto|estoque\s+parado|encalhad", text_lower):
+            data["data_type"] = "curva_abc"
+        elif re.search(r"compra(?:m|dos|das)?\s+junt|vend(?:e|em|idos|idas)\s+junt|cesta\s+de\s+compra", text_lower):
+            data["data_type"] = "produtos_juntos"
+        elif "venda" in text_lower or "vendas" in text_lower:
             data["data_type"] = "vendas"
         elif "estoque" in text_lower:
             data["data_type"] = "estoque"
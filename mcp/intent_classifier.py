@@ -0,0 +1,378 @@
+"""
+Classificador local de intenção (entity + action) para o MCPDetector, sem rede e sem dependências além do NumPy.
+Texto -> TF-IDF de n-gramas de caracteres (2 a 4) + palavras + página -> regressão logística multinomial; a confiança
+é calibrada por temperatura numa parte separada dos exemplos. Treinado com as frases de mcp/intent_training_data.py
+e mensagens reais do chat (agent_chat_memory) rotuladas pelas regras do detector; os casos de scripts/test_agentes_data.py
+ficam de fora e servem para medir o modelo. O modelo fica em data/intent_classifier.npz e é carregado uma vez por
+processo; sem arquivo, é treinado em segundo plano só com as frases de treino (até lá o detector usa a IA). Mensagens
+muito diferentes do que o modelo conhece (poucos n-gramas conhecidos) não recebem previsão: o detector segue para a IA.
+"""
+import json
+import re
+import threading
+import time
+import unicodedata
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config.database import DB_DIR
+
+ARQUIVO = DB_DIR / "intent_classifier.npz"
+NGRAMAS = (2, 3, 4)
+MAX_FEATURES = 6000
+L2 = 1e-3
+ITERACOES = 400
+PASSO = 4.0
+PARTE_CALIBRACAO = 0.2
+MIN_COBERTURA = 0.6  # fração mínima de n-gramas da mensagem que o modelo já viu
+PESO_LOGS = 0.5  # peso das mensagens do chat (rótulo fraco, vindo das regras)
+CONFIANCA_MINIMA_LOGS = 0.85
+
+# Página do chat de cada agente (mesma usada como contexto na detecção) e entidades que o agente atende:
+# rótulo das regras fora dessas entidades é descartado (ex.: "dia 15" num cadastro de conta não é agenda)
+PAGINA_DO_ESCOPO = {"report_agent": "inicio", "accounts_agent": "contas_a_pagar", "agenda_agent": "agenda"}
+ENTIDADES_DO_ESCOPO = {
+    "report_agent": {"relatorio", "contas_pagar", "contas_receber", "agenda"},
+    "accounts_agent": {"contas_pagar", "contas_receber"},
+    "agenda_agent": {"agenda"},
+}
+
+_lock = threading.RLock()
+_modelo: Optional["ClassificadorIntencao"] = None
+_carregado = False
+_treino: Optional[threading.Thread] = None  # treino inicial em andamento (sem arquivo)
+
+
+def _normalizar(texto: str) -> str:
+    """Minúsculas, sem acentos, dígitos viram 0 (valores e datas se parecem entre si) e espaços simples."""
+    t = unicodedata.normalize("NFKD", (texto or "").lower())
+    t = "".join(c for c in t if not unicodedata.combining(c))
+    t = re.sub(r"\d", "0", t)
+    t = re.sub(r"[^a-z0-9$/,.\- ]+", " ", t)
+    return " ".join(t.split())
+
+
+def _termos(texto: str, pagina: str) -> Tuple[List[str], List[str]]:
+    """(n-gramas de caracteres + palavras, termo da página) de uma mensagem."""
+    t = _normalizar(texto)
+    base = f" {t} "
+    termos = [base[i:i + n] for n in NGRAMAS for i in range(len(base) - n + 1)]
+    termos += ["w:" + p for p in t.split()]
+    return termos, ["p:" + (pagina or "").strip().lower()]
+
+
+def _rotulo(entity: str, action: str) -> str:
+    return f"{entity}|{action}"
+
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=-1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+class ClassificadorIntencao:
+    """TF-IDF (vocabulário + idf) e pesos da regressão logística; prever() em microssegundos."""
+
+    def __init__(
+        self,
+        vocab: Sequence[str],
+        idf: np.ndarray,
+        pesos: np.ndarray,
+        vies: np.ndarray,
+        rotulos: Sequence[str],
+        temperatura: float = 1.0,
+        meta: Optional[Dict[str, Any]] = None,
+    ):
+        self.vocab = list(vocab)
+        self.indice = {t: i for i, t in enumerate(self.vocab)}
+        self.idf = idf.astype(np.float32)
+        self.pesos = pesos.astype(np.float32)
+        self.vies = vies.astype(np.float32)
+        self.rotulos = list(rotulos)
+        self.temperatura = float(temperatura)
+        self.meta = meta or {}
+
+    def _vetor(self, texto: str, pagina: str) -> Tuple[np.ndarray, np.ndarray, float]:
+        """Índices e valores TF-IDF (norma L2) da mensagem e a cobertura (fração de n-gramas conhecidos)."""
+        termos, extras = _termos(texto, pagina)
+        contagem: Dict[int, int] = {}
+        conhecidos = 0
+        for t in termos + extras:
+            i = self.indice.get(t)
+            if i is not None:
+                contagem[i] = contagem.get(i, 0) + 1
+                conhecidos += t in termos
+        cobertura = conhecidos / len(termos) if termos else 0.0
+        if not contagem:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), cobertura
+        idx = np.fromiter(contagem.keys(), dtype=np.int64, count=len(contagem))
+        val = (1.0 + np.log(np.fromiter(contagem.values(), dtype=np.float32, count=len(contagem)))) * self.idf[idx]
+        return idx, val / (np.linalg.norm(val) or 1.0), cobertura
+
+    def probabilidades(self, texto: str, pagina: str = "") -> Tuple[np.ndarray, float]:
+        """Probabilidades calibradas por rótulo e a cobertura da mensagem."""
+        idx, val, cobertura = self._vetor(texto, pagina)
+        z = self.vies + val @ self.pesos[idx]
+        return _softmax(z / self.temperatura), cobertura
+
+    def prever(self, texto: str, pagina: str = "") -> Optional[Tuple[str, str, float]]:
+        """(entity, action, confiança) ou None quando a mensagem é estranha ao modelo (cobertura baixa)."""
+        if not (texto or "").strip():
+            return None
+        p, cobertura = self.probabilidades(texto, pagina)
+        if cobertura < MIN_COBERTURA:
+            return None
+        k = int(p.argmax())
+        entity, action = self.rotulos[k].split("|")
+        return entity, action, float(p[k])
+
+    def salvar(self, caminho: Path = ARQUIVO) -> None:
+        """Grava o modelo compactado (arquivo temporário + troca)."""
+        caminho = Path(caminho)
+        tmp = caminho.with_name(caminho.stem + ".tmp.npz")
+        np.savez_compressed(
+            tmp,
+            vocab=np.array(self.vocab),
+            idf=self.idf,
+            pesos=self.pesos.astype(np.float16),
+            vies=self.vies,
+            rotulos=np.array(self.rotulos),
+            temperatura=np.array(self.temperatura),
+            meta=np.array(json.dumps(self.meta, ensure_ascii=False)),
+        )
+        tmp.replace(caminho)
+
+    @classmethod
+    def carregar(cls, caminho: Path = ARQUIVO) -> "ClassificadorIntencao":
+        with np.load(caminho, allow_pickle=False) as f:
+            return cls(
+                vocab=f["vocab"].tolist(),
+                idf=f["idf"],
+                pesos=f["pesos"].astype(np.float32),
+                vies=f["vies"],
+                rotulos=f["rotulos"].tolist(),
+                temperatura=float(f["temperatura"]),
+                meta=json.loads(str(f["meta"])),
+            )
+
+
+def _matriz(
+    exemplos: Sequence[Dict[str, Any]], vocab: Optional[List[str]] = None
+) -> Tuple[np.ndarray, List[str], np.ndarray]:
+    """Matriz TF-IDF densa (linhas com norma L2), vocabulário e idf; vocab None = monta a partir dos exemplos."""
+    docs = []
+    for ex in exemplos:
+        termos, extras = _termos(ex["text"], ex.get("pagina", ""))
+        docs.append(termos + extras)
+    if vocab is None:
+        df: Dict[str, int] = {}
+        for d in docs:
+            for t in set(d):
+                df[t] = df.get(t, 0) + 1
+        vocab = sorted(df, key=lambda t: (-df[t], t))[:MAX_FEATURES]
+    indice = {t: i for i, t in enumerate(vocab)}
+    contagem = np.zeros((len(docs), len(vocab)), dtype=np.float32)
+    for r, d in enumerate(docs):
+        for t in d:
+            i = indice.get(t)
+            if i is not None:
+                contagem[r, i] += 1
+    df_arr = (contagem > 0).sum(axis=0)
+    idf = np.log((1 + len(docs)) / (1 + df_arr)) + 1.0
+    x = np.where(contagem > 0, 1.0 + np.log(np.maximum(contagem, 1.0)), 0.0) * idf
+    x /= np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+    return x.astype(np.float32), vocab, idf.astype(np.float32)
+
+
+def _ajustar(x: np.ndarray, y: np.ndarray, pesos_amostra: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Regressão logística multinomial com L2 por gradiente descendente (lote completo; problema convexo)."""
+    n, v = x.shape
+    w = np.zeros((v, k), dtype=np.float32)
+    b = np.zeros(k, dtype=np.float32)
+    alvo = np.eye(k, dtype=np.float32)[y]
+    s = (pesos_amostra / pesos_amostra.sum())[:, None].astype(np.float32)
+    for _ in range(ITERACOES):
+        erro = (_softmax(x @ w + b) - alvo) * s
+        w -= PASSO * (x.T @ erro + L2 * w)
+        b -= PASSO * erro.sum(axis=0)
+    return w, b
+
+
+def _temperatura(logits: np.ndarray, y: np.ndarray) -> float:
+    """Temperatura que minimiza a log-verossimilhança negativa na parte de calibração."""
+    melhor, melhor_nll = 1.0, float("inf")
+    for t in np.linspace(0.2, 3.0, 57):
+        p = _softmax(logits / t)[np.arange(len(y)), y]
+        nll = float(-np.log(np.maximum(p, 1e-12)).mean())
+        if nll < melhor_nll:
+            melhor, melhor_nll = float(t), nll
+    return melhor
+
+
+def _grupo(texto: str) -> str:
+    """
+    Chave que junta uma frase e suas variantes de digitação ("cadastrar"/"cadastra", "reais"/"real", acentos,
+    espaço duplo): palavras cortadas em 3 letras. Variantes ficam do mesmo lado da separação treino/calibração,
+    senão a calibração mede decoreba e a confiança sai otimista.
+    """
+    return " ".join(p[:3] for p in _normalizar(texto).split())
+
+
+def _separar(
+    y: np.ndarray, grupos: Sequence[str], parte: float, semente: int = 7
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Índices (treino, calibração): por rótulo, PARTE dos grupos de frases vai inteira para a calibração."""
+    rng = np.random.default_rng(semente)
+    treino, calib = [], []
+    for k in np.unique(y):
+        idx = np.flatnonzero(y == k)
+        do_rotulo = sorted({grupos[i] for i in idx})
+        n_calib = int(len(do_rotulo) * parte) if len(do_rotulo) >= 5 else 0
+        separados = {do_rotulo[j] for j in rng.permutation(len(do_rotulo))[:n_calib]}
+        for i in idx:
+            (calib if grupos[i] in separados else treino).append(i)
+    return np.array(sorted(treino)), np.array(sorted(calib), dtype=np.int64)
+
+
+def treinar(exemplos: Sequence[Dict[str, Any]]) -> ClassificadorIntencao:
+    """
+    Treina com exemplos {"text", "pagina", "entity", "action", "peso"?}. A temperatura é ajustada em PARTE_CALIBRACAO
+    dos exemplos (modelo treinado no restante); o modelo final usa todos os exemplos com essa temperatura.
+    meta traz acurácia e erro de calibração (ECE) medidos na parte separada.
+    """
+    t0 = time.perf_counter()
+    rotulos = sorted({_rotulo(e["entity"], e["action"]) for e in exemplos})
+    y = np.array([rotulos.index(_rotulo(e["entity"], e["action"])) for e in exemplos])
+    peso = np.array([float(e.get("peso", 1.0)) for e in exemplos], dtype=np.float32)
+    i_treino, i_calib = _separar(y, [_grupo(e["text"]) for e in exemplos], PARTE_CALIBRACAO)
+
+    meta: Dict[str, Any] = {"exemplos": len(exemplos), "rotulos": len(rotulos)}
+    temperatura = 1.0
+    if len(i_calib):
+        sub = [exemplos[i] for i in i_treino]
+        x_t, vocab_t, _ = _matriz(sub)
+        w, b = _ajustar(x_t, y[i_treino], peso[i_treino], len(rotulos))
+        x_c, _, _ = _matriz([exemplos[i] for i in i_calib], vocab_t)
+        logits = x_c @ w + b
+        temperatura = _temperatura(logits, y[i_calib])
+        p = _softmax(logits / temperatura)
+        conf, pred = p.max(axis=1), p.argmax(axis=1)
+        acerto = pred == y[i_calib]
+        ece = 0.0
+        for lo in np.linspace(0, 1, 11)[:-1]:
+            faixa = (conf > lo) & (conf <= lo + 0.1)
+            if faixa.any():
+                ece += faixa.mean() * abs(acerto[faixa].mean() - conf[faixa].mean())
+        meta.update(acuracia_calibracao=round(float(acerto.mean()), 4), ece=round(float(ece), 4))
+
+    x, vocab, idf = _matriz(exemplos)
+    w, b = _ajustar(x, y, peso, len(rotulos))
+    meta.update(
+        temperatura=round(temperatura, 3),
+        treinado_em=datetime.now().isoformat(timespec="seconds"),
+        treino_ms=round((time.perf_counter() - t0) * 1000, 1),
+    )
+    return ClassificadorIntencao(vocab, idf, w, b, rotulos, temperatura, meta)
+
+
+def exemplos_base() -> List[Dict[str, Any]]:
+    """Frases de treino de mcp.intent_training_data (os casos de teste dos agentes ficam de fora, para medir o modelo)."""
+    from mcp.intent_training_data import exemplos
+
+    return exemplos()
+
+
+def exemplos_chat(db, limite: int = 5000) -> List[Dict[str, Any]]:
+    """
+    Mensagens reais dos usuários (agent_chat_memory), rotuladas pelas regras do detector (sem IA) quando elas têm
+    confiança de pelo menos CONFIANCA_MINIMA_LOGS e a entidade é atendida pelo agente da conversa; peso PESO_LOGS
+    por ser rótulo fraco.
+    """
+    from mcp.detector import MCPDetector
+    from models.agent_chat_memory import AgentChatMessage
+
+    detector = MCPDetector(db)
+    linhas = (
+        db.query(AgentChatMessage.content, AgentChatMessage.scope)
+        .filter(AgentChatMessage.role == "user")
+        .order_by(AgentChatMessage.created_at.desc())
+        .limit(limite)
+        .all()
+    )
+    exemplos, vistos = [], set()
+    for texto, escopo in linhas:
+        texto = (texto or "").strip()
+        pagina = PAGINA_DO_ESCOPO.get(escopo, "")
+        if not texto or (texto.lower(), pagina) in vistos:
+            continue
+        vistos.add((texto.lower(), pagina))
+        det = detector.detect_by_rules(texto, {"pagina": pagina})
+        if det.action == "OTHER" or det.confidence < CONFIANCA_MINIMA_LOGS:
+            continue
+        if det.entity not in ENTIDADES_DO_ESCOPO.get(escopo, ()):
+            continue
+        exemplos.append({"text": texto, "pagina": pagina, "entity": det.entity, "action": det.action, "peso": PESO_LOGS})
+    return exemplos
+
+
+def treinar_e_salvar(db=None, caminho: Optional[Path] = None) -> ClassificadorIntencao:
+    """Treina com as frases de treino (+ mensagens do chat, se db) e grava o arquivo; o processo passa a usar o novo."""
+    global _modelo, _carregado
+    exemplos = exemplos_base()
+    if db is not None:
+        conhecidos = {(e["text"].lower(), e["pagina"]) for e in exemplos}
+        exemplos += [e for e in exemplos_chat(db) if (e["text"].lower(), e["pagina"]) not in conhecidos]
+    modelo = treinar(exemplos)
+    with _lock:
+        modelo.salvar(caminho or ARQUIVO)
+        _modelo, _carregado = modelo, True
+    return modelo
+
+
+def _treinar_em_segundo_plano() -> None:
+    """Treino inicial (sem arquivo) fora da requisição; se falhar, o processo segue sem classificador."""
+    global _modelo, _carregado, _treino
+    try:
+        treinar_e_salvar()
+    except Exception:
+        with _lock:
+            _modelo, _carregado = None, True
+    finally:
+        with _lock:
+            _treino = None
+
+
+def modelo() -> Optional[ClassificadorIntencao]:
+    """
+    Modelo do processo, lido de ARQUIVO uma vez (sob _lock). Sem arquivo, dispara um único treino em segundo plano
+    e devolve None até ele terminar (segundos): a mensagem segue para a IA em vez de esperar o treino.
+    Para ter o classificador desde a primeira mensagem, rode scripts/train_intent_classifier.py.
+    """
+    global _modelo, _carregado, _treino
+    if _carregado:
+        return _modelo
+    with _lock:
+        if _carregado:
+            return _modelo
+        if ARQUIVO.exists():
+            try:
+                _modelo = ClassificadorIntencao.carregar(ARQUIVO)
+            except Exception:
+                _modelo = None
+            _carregado = True
+            return _modelo
+        if _treino is None:
+            _treino = threading.Thread(target=_treinar_em_segundo_plano, name="treino-intencao", daemon=True)
+            _treino.start()
+    return None
+
+
+def resetar() -> None:
+    """Esquece o modelo carregado (o arquivo é relido na próxima consulta)."""
+    global _modelo, _carregado
+    with _lock:
+        _modelo, _carregado = None, False
@@ -0,0 +1,156 @@
+"""
+Frases de treino do classificador local de intenção (mcp.intent_classifier).
+Separadas dos casos de teste (scripts/test_agentes_data.py), que ficam de fora do treino e medem o classificador:
+aqui as frases são montadas por modelos (verbo + assunto + valor + data) com variações de escrita (sem acento,
+abreviações, espaço duplo), em quantidade fixa por rótulo e com semente fixa (o mesmo treino a cada execução).
+"""
+import random
+from typing import Any, Dict, List, Sequence, Tuple
+
+SEMENTE = 46
+POR_ROTULO = 160
+
+_VALORES = ["150 reais", "R$ 89,90", "valor 230", "1.200,00", "75 real", "R$ 42", "valor de 310", "60,50"]
+_VENCIMENTOS = ["dia 12", "vencimento 05/04", "vence dia 28", "pra dia 3", "vencendo 22/07", "no dia 9", ""]
+_NOMES = ["Ana", "Rita", "Paulo", "Beatriz", "Jorge", "Fernanda", "Sandra", "Marcos", "Dona Cida", "Léo", "Tiago"]
+_HORAS = ["às 10h", "15:30", "9h", "as 16h", "de manhã", "à tarde", ""]
+_QUANDO = ["amanhã", "sexta", "dia 22", "dia 03/05", "segunda que vem", "quinta-feira", "semana que vem"]
+_PERIODOS = [
+    "hoje", "ontem", "da semana passada", "deste mês", "do mês passado", "em abril", "de 2025", "nos últimos 30 dias",
+    "do trimestre", "desta semana", "",
+]
+
+# (modelo, página, entity, action): {v} valor, {d} vencimento, {n} nome, {h} hora, {q} quando, {p} período
+_MODELOS: List[Tuple[List[str], str, str, str]] = [
+    ([
+        "{verbo} conta de energia {v} {d}", "{verbo} boleto do aluguel {v} {d}", "{verbo} conta do condomínio {v} {d}",
+        "{verbo} fatura do cartão {v} {d}", "{verbo} conta de internet {v} {d}", "{verbo} parcela do empréstimo {v} {d}",
+        "{verbo} imposto DAS {v} {d}", "{verbo} boleto da fornecedora Malhas Sul {v} {d}",
+        "{verbo} conta do contador {v} {d}", "{verbo} despesa com frete {v} {d}", "boleto de {v} da Têxtil Norte {d}",
+        "{verbo} conta a pagar {v} {d}", "{verbo} pagamento ao fornecedor Jeans & Cia {v} {d}",
+    ], "contas_a_pagar", "contas_pagar", "INSERT"),
+    ([
+        "{verbo} fiado da {n} {v} {d}", "{n} ficou devendo {v} {d}", "vendi fiado pra {n} {v}",
+        "{verbo} venda fiada para {n} {v} {d}", "pendura {v} na conta da {n}", "{verbo} a receber de {n} {v} {d}",
+        "{n} vai pagar {v} {d}", "cliente {n} levou {v} fiado", "{verbo} valor a receber {v} da cliente {n}",
+        "{verbo} fiado {n} {v}", "{n} deve {v} {d}",
+    ], "contas_a_pagar", "contas_receber", "INSERT"),
+    ([
+        "{verbo2} reunião com fornecedor {q} {h}", "{verbo2} dentista {q} {h}", "{verbo2} médico {q} {h}",
+        "{verbo2} entrega de mercadoria {q} {h}", "{verbo2} visita do representante {q} {h}",
+        "{verbo2} corte de cabelo {q} {h}", "lembrete: ligar para o contador {q} {h}",
+        "{verbo2} aniversário da Júlia {q}", "{verbo2} consulta {q} {h}", "{verbo2} compromisso {q} {h}",
+        "{verbo2} vistoria da loja {q} {h}", "{verbo2} evento de lançamento {q} {h}",
+    ], "agenda", "agenda", "INSERT"),
+    ([
+        "quanto vendi {p}", "faturamento {p}", "total de vendas {p}", "lucro {p}", "ticket médio {p}",
+        "quanto a loja faturou {p}", "resumo das vendas {p}", "relatório de vendas {p}", "vendas {p}",
+        "produtos que mais saíram {p}", "ranking de produtos {p}", "peças mais vendidas {p}", "curva abc {p}",
+        "quanto tenho em estoque", "valor do estoque", "quanto vale meu estoque", "entradas de estoque {p}",
+        "mercadoria que entrou {p}", "sessões de caixa {p}", "fechamento do caixa {p}", "movimento do caixa {p}",
+        "previsão de vendas", "tendência das vendas", "como devo vender no próximo mês", "análise das vendas {p}",
+        "compare as vendas {p} com o mês anterior", "produtos comprados juntos", "o que vende junto",
+        "qual dia da semana vende mais", "como estão as vendas {p}",
+    ], "inicio", "relatorio", "REPORT"),
+    ([
+        "contas a pagar {p}", "o que tenho para pagar {p}", "boletos vencendo {p}", "contas vencidas",
+        "quais contas a pagar estão atrasadas", "lista de despesas em aberto", "quanto devo aos fornecedores",
+        "mostrar contas a pagar", "contas pendentes {p}", "tem boleto para pagar {p}",
+    ], "inicio", "contas_pagar", "LIST"),
+    ([
+        "quem está me devendo", "fiados em aberto", "contas a receber {p}", "quanto tenho para receber {p}",
+        "clientes com fiado atrasado", "lista de fiados", "quanto os clientes me devem", "recebimentos previstos {p}",
+        "mostrar contas a receber", "fiados que vencem {p}",
+    ], "inicio", "contas_receber", "LIST"),
+    ([
+        "meus compromissos {q}", "o que tenho marcado {q}", "tenho algum compromisso {q}", "agenda {q}",
+        "tem reunião {q}", "quais eventos {q}", "mostrar minha agenda", "o que tenho na agenda {q}",
+        "listar compromissos da semana", "tenho algo agendado {q}",
+    ], "inicio", "agenda", "LIST"),
+]
+
+_VERBOS = ["", "registre", "registrar", "cadastre", "cadastrar", "anota", "lançar", "adicionar", "nova", "inclui"]
+_VERBOS_AGENDA = ["", "agendar", "marcar", "marca", "agenda", "cadastrar", "anota na agenda", "novo evento:", "lembrar de"]
+
+# Frases para ações e páginas que os modelos acima não cobrem: (texto, página, entity, action)
+EXEMPLOS_SEMENTE: List[Tuple[str, str, str, str]] = [
+    ("paguei a conta de luz", "contas_a_pagar", "contas_pagar", "UPDATE"),
+    ("marcar como paga a conta de água", "contas_a_pagar", "contas_pagar", "UPDATE"),
+    ("dar baixa em conta a pagar do aluguel", "contas_a_pagar", "contas_pagar", "UPDATE"),
+    ("quitei o boleto do condomínio", "contas_a_pagar", "contas_pagar", "UPDATE"),
+    ("editar conta id 12", "contas_a_pagar", "contas_pagar", "UPDATE"),
+    ("alterar valor da conta 5", "contas_a_pagar", "contas_pagar", "UPDATE"),
+    ("recebi de joão", "contas_a_pagar", "contas_receber", "UPDATE"),
+    ("marcar como recebida a conta da maria", "contas_a_pagar", "contas_receber", "UPDATE"),
+    ("dar baixa em conta a receber do pedro", "contas_a_pagar", "contas_receber", "UPDATE"),
+    ("a rita pagou o fiado", "contas_a_pagar", "contas_receber", "UPDATE"),
+    ("excluir conta id 3", "contas_a_pagar", "contas_pagar", "DELETE"),
+    ("apagar conta de luz", "contas_a_pagar", "contas_pagar", "DELETE"),
+    ("remover a conta 8", "contas_a_pagar", "contas_pagar", "DELETE"),
+    ("deletar conta a receber id 4", "contas_a_pagar", "contas_receber", "DELETE"),
+    ("listar contas a pagar", "contas_a_pagar", "contas_pagar", "LIST"),
+    ("mostrar contas vencidas", "contas_a_pagar", "contas_pagar", "LIST"),
+    ("quais contas estão pendentes", "contas_a_pagar", "contas_pagar", "LIST"),
+    ("minhas contas a receber", "contas_a_pagar", "contas_receber", "LIST"),
+    ("quem me deve", "contas_a_pagar", "contas_receber", "LIST"),
+    ("listar compromissos", "agenda", "agenda", "LIST"),
+    ("ver minha agenda", "agenda", "agenda", "LIST"),
+    ("mostrar eventos da semana", "agenda", "agenda", "LIST"),
+    ("cancelar a reunião de amanhã", "agenda", "agenda", "DELETE"),
+    ("desmarcar o dentista", "agenda", "agenda", "DELETE"),
+    ("oi", "inicio", "relatorio", "OTHER"),
+    ("bom dia", "inicio", "relatorio", "OTHER"),
+    ("boa tarde", "inicio", "relatorio", "OTHER"),
+    ("obrigado", "inicio", "relatorio", "OTHER"),
+    ("valeu", "inicio", "relatorio", "OTHER"),
+    ("tudo bem?", "inicio", "relatorio", "OTHER"),
+]
+
+_SEM_ACENTO = str.maketrans("áàâãéêíóôõúçÁÀÂÃÉÊÍÓÔÕÚÇ", "aaaaeeioooucAAAAEEIOOOUC")
+
+
+def _variar(texto: str, rng: random.Random) -> str:
+    """Variação de escrita: sem acento, minúsculas, "reais"/"real", espaço duplo (como se digita no chat)."""
+    if rng.random() < 0.4:
+        texto = texto.translate(_SEM_ACENTO)
+    if rng.random() < 0.3:
+        texto = texto.lower()
+    if rng.random() < 0.2:
+        texto = texto.replace("reais", "real")
+    if rng.random() < 0.15 and " " in texto:
+        i = texto.index(" ")
+        texto = texto[:i] + "  " + texto[i + 1:]
+    return " ".join(texto.split()) if rng.random() < 0.85 else texto.strip()
+
+
+def _preencher(modelo: str, rng: random.Random) -> str:
+    return modelo.format(
+        verbo=rng.choice(_VERBOS), verbo2=rng.choice(_VERBOS_AGENDA), v=rng.choice(_VALORES),
+        d=rng.choice(_VENCIMENTOS), n=rng.choice(_NOMES), h=rng.choice(_HORAS), q=rng.choice(_QUANDO),
+        p=rng.choice(_PERIODOS),
+    ).strip()
+
+
+def exemplos(por_rotulo: int = POR_ROTULO, semente: int = SEMENTE) -> List[Dict[str, Any]]:
+    """Exemplos {"text", "pagina", "entity", "action"}: até por_rotulo frases distintas por modelo, mais as sementes."""
+    rng = random.Random(semente)
+    saida: List[Dict[str, Any]] = []
+    for modelos, pagina, entity, action in _MODELOS:
+        vistos = set()
+        for _ in range(por_rotulo * 4):
+            if len(vistos) >= por_rotulo:
+                break
+            texto = _variar(_preencher(rng.choice(modelos), rng), rng)
+            if texto.lower() in vistos:
+                continue
+            vistos.add(texto.lower())
+            saida.append({"text": texto, "pagina": pagina, "entity": entity, "action": action})
+    for texto, pagina, entity, action in EXEMPLOS_SEMENTE:
+        saida.append({"text": texto, "pagina": pagina, "entity": entity, "action": action})
+    return saida
+
+
+def sem_sobreposicao(treino: Sequence[Dict[str, Any]], casos: Sequence[str]) -> List[Dict[str, Any]]:
+    """Exemplos de treino cujo texto (minúsculo, espaços simples) não é um dos casos de avaliação."""
+    chaves = {" ".join(c.lower().split()) for c in casos}
+    return [e for e in treino if " ".join(e["text"].lower().split()) not in chaves]
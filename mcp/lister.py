@@ -23,10 +23,19 @@ class MCPLister:
         data_inicial: Optional[date] = None,
         data_final: Optional[date] = None,
         status: Optional[str] = None,
+        nome: Optional[str] = None,
     ) -> ListResponse:
         """
         Lista contas (contas_pagar ou contas_receber) com filtros.
+        nome: fornecedor/cliente aproximado ("joao" acha "João"), casado com os nomes cadastrados
+        (services.name_matcher).
         """
+        filtro_nome = None
+        if nome and entity in ("contas_pagar", "contas_receber"):
+            from services import name_matcher
+            filtro_nome = name_matcher.filtro_nome(self.db, entity, nome)
+            if filtro_nome is None:
+                return ListResponse(items=[], total=0, total_valor=0.0)
         if entity == "contas_pagar":
             from models.account_payable import AccountPayable
             q = self.db.query(AccountPayable)
@@ -36,6 +45,8 @@ class MCPLister:
                 q = q.filter(AccountPayable.data_vencimento <= data_final)
             if status:
                 q = q.filter(AccountPayable.status == status)
+            if filtro_nome is not None:
+                q = q.filter(filtro_nome)
             rows = q.order_by(AccountPayable.data_vencimento.desc()).all()
             items = []
             total_valor = 0.0
@@ -65,6 +76,8 @@ class MCPLister:
                 q = q.filter(AccountReceivable.data_vencimento <= data_final)
             if status:
                 q = q.filter(AccountReceivable.status == status)
+            if filtro_nome is not None:
+                q = q.filter(filtro_nome)
             rows = q.order_by(AccountReceivable.data_vencimento.desc()).all()
             items = []
             total_valor = 0.0
@@ -0,0 +1,18 @@
+"""
+Leitura do JSON devolvido pela IA nas etapas do MCP (detector e extractor).
+"""
+import json
+import re
+from typing import Any
+
+
+def ler_json(content: str) -> Any:
+    """JSON da resposta da IA (tolera cerca ```json); None se inválido."""
+    content = (content or "").strip()
+    if content.startswith("```"):
+        content = re.sub(r"^```(?:json)?\s*", "", content, flags=re.MULTILINE)
+        content = re.sub(r"```\s*$", "", content, flags=re.MULTILINE)
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        return None
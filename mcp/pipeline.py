@@ -0,0 +1,177 @@
+"""
+Pipeline MCP de um turno de chat: detect → extract → validate → format com serviços compartilhados.
+Criado uma vez por mensagem do usuário (página ou agente) e repassado aos agentes: um único AIService
+(uma leitura da configuração de IA), detector/extrator/validador/formatador criados uma vez e ligados a esse
+AIService, detecção e extração guardadas por texto (a mesma mensagem não é classificada duas vezes no turno)
+e tempo gasto em cada etapa.
+"""
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from mcp.detector import MCPDetector
+from mcp.extractor import MCPExtractor
+from mcp.formatter import MCPFormatter
+from mcp.lister import MCPLister
+from mcp.schemas import DetectResponse, ExtractResponse, FormatConfirmationResponse, ValidateResponse
+from mcp.validator import MCPValidator
+
+ETAPAS = ("detect", "extract", "validate", "format")
+
+
+class Pipeline:
+    """
+    Serviços MCP e resultados de um turno. Uso: `pipe = Pipeline(db)`, depois `AccountsAgentService(db, pipe)`,
+    `pipe.detect(texto, ctx)` etc.; `pipe.tempos` tem os ms por etapa e `pipe.reaproveitados` quantas chamadas
+    foram atendidas pelo que já tinha sido calculado no turno.
+    """
+
+    def __init__(self, db: Session, ai_service=None):
+        self.db = db
+        self._ai_service = ai_service
+        self._servicos: Dict[str, Any] = {}
+        self._deteccoes: Dict[Tuple[str, str], Tuple[DetectResponse, str]] = {}
+        self._extracoes: Dict[Tuple[str, str, str, str], ExtractResponse] = {}
+        self.tempos: Dict[str, float] = {}
+        self.reaproveitados = 0
+
+    # --- Serviços compartilhados ---
+    @property
+    def ai(self):
+        """AIService do turno (configuração lida uma vez)."""
+        if self._ai_service is None:
+            from services.ai_service import AIService
+            self._ai_service = AIService(self.db)
+        return self._ai_service
+
+    @property
+    def config(self) -> Optional[Dict[str, Any]]:
+        """Configuração de IA lida no início do turno."""
+        return self.ai.config
+
+    def _servico(self, nome: str, classe):
+        servico = self._servicos.get(nome)
+        if servico is None:
+            servico = classe(self.db)
+            if hasattr(servico, "_ai_service"):
+                servico._ai_service = self.ai
+            self._servicos[nome] = servico
+        return servico
+
+    @property
+    def detector(self) -> MCPDetector:
+        return self._servico("detector", MCPDetector)
+
+    @property
+    def extractor(self) -> MCPExtractor:
+        return self._servico("extractor", MCPExtractor)
+
+    @property
+    def validator(self) -> MCPValidator:
+        return self._servico("validator", MCPValidator)
+
+    @property
+    def formatter(self) -> MCPFormatter:
+        return self._servico("formatter", MCPFormatter)
+
+    @property
+    def lister(self) -> MCPLister:
+        return self._servico("lister", MCPLister)
+
+    def _medir(self, etapa: str, t0: float) -> None:
+        self.tempos[etapa] = self.tempos.get(etapa, 0.0) + (time.perf_counter() - t0) * 1000
+
+    @staticmethod
+    def _chave(text: str, context: Optional[Dict[str, Any]]) -> Tuple[str, str]:
+        return (text or "").strip(), ((context or {}).get("pagina") or "").strip().lower()
+
+    # --- Etapas ---
+    def detect_with_source(
+        self, text: str, context: Optional[Dict[str, Any]] = None
+    ) -> Tuple[DetectResponse, str]:
+        """(DetectResponse, origem) do texto; no mesmo turno, o mesmo texto e página não são detectados de novo."""
+        chave = self._chave(text, context)
+        if chave in self._deteccoes:
+            self.reaproveitados += 1
+            return self._deteccoes[chave]
+        t0 = time.perf_counter()
+        resultado = self.detector.detect_with_source(text, context)
+        self._medir("detect", t0)
+        self._deteccoes[chave] = resultado
+        return resultado
+
+    def detect(self, text: str, context: Optional[Dict[str, Any]] = None) -> DetectResponse:
+        return self.detect_with_source(text, context)[0]
+
+    def detect_many(self, texts: List[str], context: Optional[Dict[str, Any]] = None) -> List[DetectResponse]:
+        """Detecção em lote (MCPDetector.detect_many) dos textos ainda não detectados no turno."""
+        novos = [t for t in dict.fromkeys(texts) if self._chave(t, context) not in self._deteccoes]
+        if novos:
+            t0 = time.perf_counter()
+            for text, resultado in zip(novos, self.detector.detect_many_with_source(novos, context)):
+                self._deteccoes[self._chave(text, context)] = resultado
+            self._medir("detect", t0)
+        return [self._deteccoes[self._chave(t, context)][0] for t in texts]
+
+    def definir_deteccao(
+        self, text: str, context: Optional[Dict[str, Any]], deteccao: DetectResponse, origem: str = "externa"
+    ) -> None:
+        """Registra uma detecção feita fora do pipeline (planejador de turno, lote da fala) para as etapas seguintes."""
+        self._deteccoes[self._chave(text, context)] = (deteccao, origem)
+
+    def extract(
+        self, text: str, action: str, entity: str, context: Optional[Dict[str, Any]] = None
+    ) -> ExtractResponse:
+        """Extração do texto; repetida no turno com os mesmos argumentos, devolve uma cópia da primeira."""
+        chave = (*self._chave(text, context), action, entity)
+        if chave in self._extracoes:
+            self.reaproveitados += 1
+            return self._extracoes[chave].model_copy(deep=True)
+        t0 = time.perf_counter()
+        resultado = self.extractor.extract(text, action, entity, context)
+        self._medir("extract", t0)
+        self._extracoes[chave] = resultado.model_copy(deep=True)
+        return resultado
+
+    def validate(self, data: Dict[str, Any], action: str, entity: str) -> ValidateResponse:
+        t0 = time.perf_counter()
+        resultado = self.validator.validate(data, action, entity)
+        self._medir("validate", t0)
+        return resultado
+
+    def format(
+        self,
+        action: str,
+        data: Dict[str, Any],
+        old_data: Optional[Dict[str, Any]] = None,
+        entity: str = "contas_pagar",
+    ) -> FormatConfirmationResponse:
+        t0 = time.perf_counter()
+        resultado = self.formatter.format(action, data, old_data, entity)
+        self._medir("format", t0)
+        return resultado
+
+    def executar(self, text: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        detect → extract → validate → format do texto. Validação e formatação só para INSERT/UPDATE/DELETE.
+        Retorna {"deteccao", "origem", "extracao", "validacao", "confirmacao", "tempos_ms"} (None nas etapas puladas).
+        """
+        det, origem = self.detect_with_source(text, context)
+        ext = self.extract(text, det.action, det.entity, context)
+        val = fmt = None
+        if det.action in ("INSERT", "UPDATE", "DELETE"):
+            val = self.validate(ext.data, det.action, det.entity)
+            fmt = self.format(det.action, ext.data, None, det.entity)
+        return {
+            "deteccao": det,
+            "origem": origem,
+            "extracao": ext,
+            "validacao": val,
+            "confirmacao": fmt,
+            "tempos_ms": self.tempos_ms(),
+        }
+
+    def tempos_ms(self) -> Dict[str, float]:
+        """Tempo (ms) gasto em cada etapa no turno, na ordem do pipeline."""
+        return {etapa: round(self.tempos[etapa], 2) for etapa in ETAPAS if etapa in self.tempos}
@@ -59,14 +59,31 @@ class ValidateRequest(BaseModel):
     )
 
 
+class ValidationCode(BaseModel):
+    """Problema de validação estruturado (código + campo), base das mensagens de erro e de aviso."""
+    codigo: str = Field(
+        ...,
+        description="obrigatorio, tamanho_maximo, maior_que_zero, numero_invalido, data_invalida, hora_invalida, "
+        "id_ou_nome, id_nao_positivo, id_nao_inteiro, data_passada",
+    )
+    campo: Optional[str] = Field(None, description="Campo afetado (valor, data_vencimento, fornecedor...)")
+    limite: Optional[int] = Field(None, description="Limite do campo (tamanho_maximo)")
+
+
 class ValidateResponse(BaseModel):
     """Response da validação."""
     valid: bool = Field(..., description="Se os dados são válidos")
     errors: List[str] = Field(default_factory=list, description="Lista de erros")
     warnings: List[str] = Field(default_factory=list, description="Lista de avisos")
+    codes: List[ValidationCode] = Field(default_factory=list, description="Erros estruturados")
+    warning_codes: List[ValidationCode] = Field(default_factory=list, description="Avisos estruturados")
+    message: Optional[str] = Field(
+        None,
+        description="Frase em português montada a partir dos códigos de erro (sem IA)",
+    )
     message_ia: Optional[str] = Field(
         None,
-        description="Mensagem em linguagem natural gerada por IA (clareza das validações)",
+        description="Mensagem gerada por IA (só com MCP_VALIDACAO_IA=true)",
     )
 
 
@@ -105,3 +122,38 @@ class FormatConfirmationResponse(BaseModel):
     """Response da formatação de confirmação."""
     message: str = Field(..., description="Mensagem formatada em Markdown")
     preview: Dict[str, Any] = Field(..., description="Preview dos dados")
+
+
+class TurnPlan(BaseModel):
+    """
+    Plano de um turno do chat (planejador de turno): uma única resposta da IA com intenção, entidade,
+    campos extraídos, período e SQL opcional.
+    """
+    intent: str = Field(
+        ...,
+        description="Intenção: consulta, lancamento, esclarecer_periodo, resposta_direta",
+    )
+    action: str = Field(..., description="Ação: INSERT, UPDATE, DELETE, LIST, REPORT, OTHER")
+    entity: str = Field(
+        ...,
+        description="Entidade: contas_pagar, contas_receber, agenda, relatorio",
+    )
+    confidence: float = Field(0.8, description="Confiança do plano (0-1)")
+    data_type: Optional[str] = Field(None, description="Tipo de consulta (mesmos valores de analyze_query)")
+    metricas: Optional[List[str]] = Field(
+        None, description="Tipos de consulta de uma pergunta composta (data_type é o primeiro da lista)"
+    )
+    period: Optional[Dict[str, Any]] = Field(None, description="Período: start, end, type")
+    filters: Optional[Dict[str, Any]] = Field(None, description="Filtros da consulta")
+    comparison: Optional[str] = Field(None, description="Comparação: periodo_anterior, ano_anterior")
+    sql_query: Optional[str] = Field(None, description="SELECT único quando data_type for sql")
+    conta: Optional[Dict[str, Any]] = Field(
+        None, description="Campos da conta (formato do agente de contas) quando for lançamento de conta"
+    )
+    compromisso: Optional[Dict[str, Any]] = Field(
+        None, description="Campos do compromisso (formato do agente de agenda) quando for lançamento na agenda"
+    )
+    narrativa: bool = Field(False, description="Se o usuário pediu texto analítico/explicativo (formatação pela IA)")
+    mensagem: Optional[str] = Field(
+        None, description="Pergunta de período (esclarecer_periodo) ou resposta curta (resposta_direta)"
+    )
@@ -1,20 +1,112 @@
 """
 Serviço MCP para validação de dados no PDV.
 Valida por entidade: contas_pagar, contas_receber, agenda.
-Quando há erros, pode usar IA para gerar mensagem clara (message_ia).
+Cada problema vira um código estruturado (ValidationCode); um frasário monta a partir deles a mensagem para o
+usuário ("Faltam o valor e a data de vencimento."), sem chamada de rede. A mensagem por IA (message_ia) só é
+pedida com MCP_VALIDACAO_IA=true.
 """
+import os
+import re
 from datetime import date
 from typing import Any, Dict, List, Optional, Tuple
 
 from sqlalchemy.orm import Session
 
-from mcp.schemas import ValidateResponse
+from mcp.schemas import ValidateResponse, ValidationCode
+from services.llm_cache import SITE_MCP_VALIDATOR
+
+# Mensagem de erro reescrita pela IA (uma chamada por validação com erro); desligada por padrão
+MENSAGEM_IA = os.getenv("MCP_VALIDACAO_IA", "false").lower() == "true"
+
+# Texto técnico de cada código (lista errors/warnings, mantida como antes)
+TEXTOS_TECNICOS = {
+    "obrigatorio": "Campo obrigatório: {campo}",
+    "tamanho_maximo": "{campo} deve ter no máximo {limite} caracteres",
+    "maior_que_zero": "{campo} deve ser maior que zero",
+    "numero_invalido": "{campo} deve ser um número válido",
+    "data_invalida": "{campo} deve ser uma data válida (YYYY-MM-DD)",
+    "hora_invalida": "{campo} deve estar no formato HH:MM",
+    "id_ou_nome": "Informe o id da conta ou o nome (fornecedor/cliente) para dar baixa",
+    "id_nao_positivo": "{campo} deve ser um número positivo",
+    "id_nao_inteiro": "{campo} deve ser um número inteiro válido",
+    "data_passada": "{campo} está no passado",
+}
+
+# Frasário: campo -> (artigo, nome falado)
+NOMES_CAMPOS = {
+    "valor": ("o", "valor"),
+    "data_vencimento": ("a", "data de vencimento"),
+    "fornecedor": ("o", "fornecedor"),
+    "cliente": ("o", "cliente"),
+    "titulo": ("o", "título"),
+    "data": ("a", "data"),
+    "hora": ("a", "hora"),
+    "descricao": ("a", "descrição"),
+    "observacao": ("a", "observação"),
+    "id": ("o", "número da conta"),
+}
+
+# Frase de cada código para um campo; {campo} vem com artigo ("o valor") e a frase começa maiúscula depois
+FRASES = {
+    "tamanho_maximo": "{campo} pode ter no máximo {limite} caracteres",
+    "maior_que_zero": "{campo} precisa ser maior que zero",
+    "numero_invalido": "{campo} precisa ser um número (ex.: 150,90)",
+    "data_invalida": "{campo} não é uma data válida (ex.: 15/03/2026)",
+    "hora_invalida": "{campo} precisa estar no formato HH:MM (ex.: 14:30)",
+    "id_ou_nome": "informe o número da conta ou o nome do fornecedor/cliente para dar baixa",
+    "id_nao_positivo": "{campo} precisa ser maior que zero",
+    "id_nao_inteiro": "{campo} precisa ser um número inteiro",
+    "data_passada": "{campo} já passou",
+}
+
+
+def _campo_falado(campo: Optional[str]) -> str:
+    artigo, nome = NOMES_CAMPOS.get(campo or "", ("o", (campo or "campo").replace("_", " ")))
+    return f"{artigo} {nome}"
+
+
+def _enumerar(itens: List[str]) -> str:
+    """["o valor", "a data"] -> "o valor e a data"; três ou mais com vírgulas."""
+    if len(itens) <= 1:
+        return "".join(itens)
+    return ", ".join(itens[:-1]) + " e " + itens[-1]
+
+
+def _frase(texto: str) -> str:
+    return texto[:1].upper() + texto[1:] + "."
+
+
+def texto_tecnico(codigo: ValidationCode) -> str:
+    """Texto técnico do código (o mesmo que a lista errors sempre trouxe)."""
+    return TEXTOS_TECNICOS.get(codigo.codigo, codigo.codigo).format(campo=codigo.campo or "", limite=codigo.limite)
+
+
+def compor_mensagem(codigos: List[ValidationCode], avisos: Optional[List[ValidationCode]] = None) -> Optional[str]:
+    """
+    Frase em português para os códigos de erro (e avisos, no fim): campos faltando são juntados numa frase só
+    ("Faltam o valor e a data de vencimento."), os demais problemas vêm um por frase, na ordem da validação.
+    None quando não há nada a dizer.
+    """
+    frases: List[str] = []
+    faltando = [_campo_falado(c.campo) for c in codigos if c.codigo == "obrigatorio"]
+    if faltando:
+        verbo = "Falta" if len(faltando) == 1 else "Faltam"
+        frases.append(f"{verbo} {_enumerar(faltando)}.")
+    for c in list(codigos) + list(avisos or []):
+        if c.codigo == "obrigatorio":
+            continue
+        modelo = FRASES.get(c.codigo)
+        if modelo is None:
+            frases.append(_frase(texto_tecnico(c)))
+        else:
+            frases.append(_frase(modelo.format(campo=_campo_falado(c.campo), limite=c.limite)))
+    return " ".join(frases) or None
 
 
 class MCPValidator:
     """
     Valida dados antes de salvar (INSERT/UPDATE/DELETE).
-    Com IA configurada, gera message_ia em linguagem natural quando há erros (clareza).
+    Quando há erros, message traz a frase do frasário; com MCP_VALIDACAO_IA=true, message_ia traz a versão da IA.
     """
 
     def __init__(self, db: Session):
@@ -45,7 +137,7 @@ Avisos: {warnings}
 
 Escreva UMA frase curta e amigável em português explicando o que o usuário precisa corrigir. Não repita a lista; resuma. Ex.: "Faltam o valor e a data de vencimento." ou "O valor precisa ser maior que zero e a data deve estar no formato correto."
 Responda só com essa frase, sem aspas nem prefixos."""
-        content, _ = ai.complete(prompt, temperature=0.2, max_tokens=120, json_mode=False)
+        content, _ = ai.complete(prompt, temperature=0.2, max_tokens=120, json_mode=False, cache=SITE_MCP_VALIDATOR)
         if not content or not content.strip():
             return None
         return content.strip()
@@ -55,133 +147,126 @@ Responda só com essa frase, sem aspas nem prefixos."""
     ) -> ValidateResponse:
         """
         Valida dados conforme action e entity.
-        Se houver erros e IA disponível, preenche message_ia com explicação clara.
+        Se houver erros, preenche message com a frase do frasário (e message_ia, se MCP_VALIDACAO_IA=true).
         """
-        errors: List[str] = []
-        warnings: List[str] = []
-
         if entity in ("contas_pagar", "contas_receber"):
-            errors, warnings = self._validate_contas(data, action, entity)
+            codes, warning_codes = self._validate_contas(data, action, entity)
         elif entity == "agenda":
-            errors, warnings = self._validate_agenda(data, action)
+            codes, warning_codes = self._validate_agenda(data, action)
         else:
-            errors, warnings = self._validate_contas(
+            codes, warning_codes = self._validate_contas(
                 data, action, "contas_pagar"
             )
 
+        errors = [texto_tecnico(c) for c in codes]
+        warnings = [texto_tecnico(c) for c in warning_codes]
+        message: Optional[str] = None
         message_ia: Optional[str] = None
-        if not errors:
-            message_ia = None
-        else:
-            message_ia = self._message_errors_with_ai(
-                errors, warnings, action, entity
-            )
+        if codes:
+            message = compor_mensagem(codes)
+            if MENSAGEM_IA:
+                message_ia = self._message_errors_with_ai(
+                    errors, warnings, action, entity
+                )
 
         return ValidateResponse(
-            valid=len(errors) == 0,
+            valid=len(codes) == 0,
             errors=errors,
             warnings=warnings,
+            codes=codes,
+            warning_codes=warning_codes,
+            message=message,
             message_ia=message_ia,
         )
 
+    @staticmethod
+    def _validate_id(data: Dict[str, Any], codes: List[ValidationCode]) -> None:
+        try:
+            if int(data["id"]) <= 0:
+                codes.append(ValidationCode(codigo="id_nao_positivo", campo="id"))
+        except (ValueError, TypeError):
+            codes.append(ValidationCode(codigo="id_nao_inteiro", campo="id"))
+
+    @staticmethod
+    def _validate_data(
+        data: Dict[str, Any], campo: str, codes: List[ValidationCode], warning_codes: List[ValidationCode]
+    ) -> None:
+        try:
+            d = data[campo]
+            if isinstance(d, str):
+                d = date.fromisoformat(d)
+            if d < date.today():
+                warning_codes.append(ValidationCode(codigo="data_passada", campo=campo))
+        except (ValueError, TypeError):
+            codes.append(ValidationCode(codigo="data_invalida", campo=campo))
+
     def _validate_contas(
         self, data: Dict[str, Any], action: str, entity: str
-    ) -> Tuple[List[str], List[str]]:
+    ) -> Tuple[List[ValidationCode], List[ValidationCode]]:
         """Valida dados de contas a pagar/receber."""
-        errors: List[str] = []
-        warnings: List[str] = []
+        codes: List[ValidationCode] = []
+        warning_codes: List[ValidationCode] = []
 
         if action == "INSERT":
             name_field = "fornecedor" if entity == "contas_pagar" else "cliente"
             if name_field not in data or not str(data.get(name_field, "")).strip():
-                errors.append(f"Campo obrigatório: {name_field}")
+                codes.append(ValidationCode(codigo="obrigatorio", campo=name_field))
             elif len(str(data[name_field]).strip()) > 200:
-                errors.append(f"{name_field} deve ter no máximo 200 caracteres")
+                codes.append(ValidationCode(codigo="tamanho_maximo", campo=name_field, limite=200))
 
             if "valor" not in data:
-                errors.append("Campo obrigatório: valor")
+                codes.append(ValidationCode(codigo="obrigatorio", campo="valor"))
             else:
                 try:
-                    v = float(data["valor"])
-                    if v <= 0:
-                        errors.append("valor deve ser maior que zero")
+                    if float(data["valor"]) <= 0:
+                        codes.append(ValidationCode(codigo="maior_que_zero", campo="valor"))
                 except (ValueError, TypeError):
-                    errors.append("valor deve ser um número válido")
+                    codes.append(ValidationCode(codigo="numero_invalido", campo="valor"))
 
             if "data_vencimento" not in data:
-                errors.append("Campo obrigatório: data_vencimento")
+                codes.append(ValidationCode(codigo="obrigatorio", campo="data_vencimento"))
             else:
-                try:
-                    d = data["data_vencimento"]
-                    if isinstance(d, str):
-                        d = date.fromisoformat(d)
-                    if d < date.today():
-                        warnings.append("data_vencimento está no passado")
-                except (ValueError, TypeError):
-                    errors.append(
-                        "data_vencimento deve ser uma data válida (YYYY-MM-DD)"
-                    )
+                self._validate_data(data, "data_vencimento", codes, warning_codes)
 
-            if "descricao" in data and data["descricao"]:
-                if len(str(data["descricao"])) > 255:
-                    errors.append("descricao deve ter no máximo 255 caracteres")
-            if "observacao" in data and data["observacao"]:
-                if len(str(data["observacao"])) > 255:
-                    errors.append("observacao deve ter no máximo 255 caracteres")
+            for campo in ("descricao", "observacao"):
+                if data.get(campo) and len(str(data[campo])) > 255:
+                    codes.append(ValidationCode(codigo="tamanho_maximo", campo=campo, limite=255))
 
         elif action == "UPDATE":
             if data.get("id") is None and not data.get("fornecedor") and not data.get("cliente"):
-                errors.append("Informe o id da conta ou o nome (fornecedor/cliente) para dar baixa")
+                codes.append(ValidationCode(codigo="id_ou_nome"))
             if "id" in data and data["id"]:
-                try:
-                    if int(data["id"]) <= 0:
-                        errors.append("id deve ser um número positivo")
-                except (ValueError, TypeError):
-                    errors.append("id deve ser um número inteiro válido")
+                self._validate_id(data, codes)
 
         elif action == "DELETE":
             if "id" not in data or data.get("id") is None:
-                errors.append("Campo obrigatório: id")
+                codes.append(ValidationCode(codigo="obrigatorio", campo="id"))
             else:
-                try:
-                    if int(data["id"]) <= 0:
-                        errors.append("id deve ser um número positivo")
-                except (ValueError, TypeError):
-                    errors.append("id deve ser um número inteiro válido")
+                self._validate_id(data, codes)
 
-        return errors, warnings
+        return codes, warning_codes
 
     def _validate_agenda(
         self, data: Dict[str, Any], action: str
-    ) -> Tuple[List[str], List[str]]:
+    ) -> Tuple[List[ValidationCode], List[ValidationCode]]:
         """Valida dados de agenda."""
-        errors: List[str] = []
-        warnings: List[str] = []
+        codes: List[ValidationCode] = []
+        warning_codes: List[ValidationCode] = []
 
         if action == "INSERT":
             if "titulo" not in data or not str(data.get("titulo", "")).strip():
-                errors.append("Campo obrigatório: titulo")
+                codes.append(ValidationCode(codigo="obrigatorio", campo="titulo"))
             elif len(str(data["titulo"]).strip()) > 200:
-                errors.append("titulo deve ter no máximo 200 caracteres")
+                codes.append(ValidationCode(codigo="tamanho_maximo", campo="titulo", limite=200))
 
             if "data" not in data:
-                errors.append("Campo obrigatório: data")
+                codes.append(ValidationCode(codigo="obrigatorio", campo="data"))
             else:
-                try:
-                    d = data["data"]
-                    if isinstance(d, str):
-                        d = date.fromisoformat(d)
-                    if d < date.today():
-                        warnings.append("data está no passado")
-                except (ValueError, TypeError):
-                    errors.append("data deve ser uma data válida (YYYY-MM-DD)")
+                self._validate_data(data, "data", codes, warning_codes)
 
-            if "descricao" in data and data["descricao"]:
-                if len(str(data["descricao"])) > 500:
-                    errors.append("descricao deve ter no máximo 500 caracteres")
-            if "hora" in data and data["hora"]:
-                import re
-                if not re.match(r"^\d{1,2}:\d{2}$", str(data["hora"])):
-                    errors.append("hora deve estar no formato HH:MM")
+            if data.get("descricao") and len(str(data["descricao"])) > 500:
+                codes.append(ValidationCode(codigo="tamanho_maximo", campo="descricao", limite=500))
+            if data.get("hora") and not re.match(r"^\d{1,2}:\d{2}$", str(data["hora"])):
+                codes.append(ValidationCode(codigo="hora_invalida", campo="hora"))
 
-        return errors, warnings
+        return codes, warning_codes
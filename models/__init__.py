@@ -12,3 +12,6 @@ from .agent_prompt import AgentPrompt  # noqa: F401
 from .agent_chat_memory import AgentChatMessage  # noqa: F401
 from .personal_agenda import PersonalAgenda  # noqa: F401
 from .user_cart import UserCartItem  # noqa: F401
+from .basket_analysis import BasketAnalysisState, ProductBasketCount, ProductPairCount  # noqa: F401
+from .llm_cache import LLMCacheEntry, LLMCacheStat  # noqa: F401
+from .question_cache import QuestionCacheEntry  # noqa: F401
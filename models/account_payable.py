@@ -1,8 +1,10 @@
 from datetime import datetime, date
 
 from sqlalchemy import Boolean, Column, Date, DateTime, Float, Integer, String
+from sqlalchemy.orm import validates
 
 from config.database import Base
+from services.name_matcher import normalizar_nome
 
 
 class AccountPayable(Base):
@@ -15,6 +17,8 @@ class AccountPayable(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     fornecedor = Column(String(200), nullable=False)
+    # Nome sem acentos/minúsculo para busca indexada (services.name_matcher); mantido por _normalizar_fornecedor
+    fornecedor_normalizado = Column(String(200), nullable=True, index=True)
     descricao = Column(String(255), nullable=True)
     data_vencimento = Column(Date, nullable=False)
     data_pagamento = Column(Date, nullable=True)
@@ -26,6 +30,11 @@ class AccountPayable(Base):
         DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
     )
 
+    @validates("fornecedor")
+    def _normalizar_fornecedor(self, key, value):
+        self.fornecedor_normalizado = normalizar_nome(value)
+        return value
+
     def update_status(self):
         """
         Atualiza o status com base em data_pagamento e data_vencimento.
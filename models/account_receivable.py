@@ -4,8 +4,10 @@ Contas a receber (vendas fiado / clientes que devem).
 from datetime import date, datetime
 
 from sqlalchemy import Column, Date, DateTime, Float, Integer, String
+from sqlalchemy.orm import validates
 
 from config.database import Base
+from services.name_matcher import normalizar_nome
 
 
 class AccountReceivable(Base):
@@ -18,6 +20,8 @@ class AccountReceivable(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     cliente = Column(String(200), nullable=False)
+    # Nome sem acentos/minúsculo para busca indexada (services.name_matcher); mantido por _normalizar_cliente
+    cliente_normalizado = Column(String(200), nullable=True, index=True)
     descricao = Column(String(255), nullable=True)
     data_vencimento = Column(Date, nullable=False)
     data_recebimento = Column(Date, nullable=True)
@@ -29,6 +33,11 @@ class AccountReceivable(Base):
         DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
     )
 
+    @validates("cliente")
+    def _normalizar_cliente(self, key, value):
+        self.cliente_normalizado = normalizar_nome(value)
+        return value
+
     def update_status(self):
         """Atualiza o status com base em data_recebimento e data_vencimento."""
         hoje = date.today()
@@ -0,0 +1,53 @@
+"""
+Análise de cesta (market basket): contagens acumuladas de produtos e pares de produtos por venda.
+Atualizadas de forma incremental a partir do último id de venda processado.
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer
+
+from config.database import Base
+
+
+class BasketAnalysisState(Base):
+    """
+    Estado do processamento incremental (linha única): último sale_id processado e total de cestas (vendas).
+    """
+
+    __tablename__ = "basket_analysis_state"
+
+    id = Column(Integer, primary_key=True)
+    last_sale_id = Column(Integer, nullable=False, default=0)
+    total_cestas = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class ProductBasketCount(Base):
+    """
+    Número de cestas (vendas) em que o produto aparece.
+    """
+
+    __tablename__ = "product_basket_counts"
+
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    cestas = Column(Integer, nullable=False, default=0)
+
+
+class ProductPairCount(Base):
+    """
+    Número de cestas em que o par de produtos aparece junto (product_a_id < product_b_id).
+    """
+
+    __tablename__ = "product_pair_counts"
+
+    product_a_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    product_b_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    cestas = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_product_pair_counts_b", "product_b_id"),
+        Index("ix_product_pair_counts_cestas", "cestas"),
+    )
+
+    def __repr__(self):
+        return f"<ProductPairCount({self.product_a_id}, {self.product_b_id}, cestas={self.cestas})>"
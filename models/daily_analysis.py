@@ -0,0 +1,29 @@
+"""
+Análise do dia (Agente de Relatórios) já gerada, por usuário e data, com a versão dos dados usada.
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, Date, DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
+
+from config.database import Base
+
+
+class DailyAnalysis(Base):
+    """
+    Texto da análise do dia de um usuário. Vale enquanto a data for a mesma e a versão dos dados
+    (services.llm_cache.versao_dados: vendas, contas, agenda etc.) não mudar.
+    """
+
+    __tablename__ = "daily_analysis"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    dia = Column(Date, nullable=False)
+    data_version = Column(String(64), nullable=False)
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (UniqueConstraint("user_id", "dia", name="uq_daily_analysis_user_dia"),)
+
+    def __repr__(self):
+        return f"<DailyAnalysis(user_id={self.user_id}, dia={self.dia}, data_version='{self.data_version}')>"
@@ -0,0 +1,44 @@
+"""
+Cache persistente de respostas da IA (compartilhado por todos os agentes) e contadores de acerto/erro por ponto de chamada.
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, String, Text
+
+from config.database import Base
+
+
+class LLMCacheEntry(Base):
+    """
+    Resposta da IA para um prompt. A chave é o hash de (provedor, modelo, temperatura, parâmetros, prompt normalizado
+    e, quando o prompt embute dados do banco, a versão dos dados).
+    """
+
+    __tablename__ = "llm_cache"
+
+    key = Column(String(64), primary_key=True)
+    call_site = Column(String(50), nullable=False, index=True)  # "report_agent.analyze_query", "mcp.detector", etc.
+    provider = Column(String(50), nullable=False)
+    model = Column(String(100), nullable=True)
+    data_version = Column(String(64), nullable=True)
+    response = Column(Text, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<LLMCacheEntry(call_site='{self.call_site}', provider='{self.provider}', hits={self.hits})>"
+
+
+class LLMCacheStat(Base):
+    """
+    Contadores de acertos e faltas do cache por ponto de chamada.
+    """
+
+    __tablename__ = "llm_cache_stats"
+
+    call_site = Column(String(50), primary_key=True)
+    hits = Column(Integer, nullable=False, default=0)
+    misses = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
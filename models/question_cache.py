@@ -0,0 +1,28 @@
+"""
+Cache de perguntas do Agente de Relatórios: pergunta normalizada -> última análise validada (intenção, assunto, período).
+"""
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, String, Text
+
+from config.database import Base
+
+
+class QuestionCacheEntry(Base):
+    """
+    Análise reaproveitável de uma pergunta. A chave é a pergunta normalizada (services.question_cache.normalizar:
+    sem acentos, sem palavras vazias, sinônimos, números e datas canônicos, palavras em ordem alfabética).
+    O período é guardado de forma relativa e recalculado para a data do dia a cada uso.
+    """
+
+    __tablename__ = "question_cache"
+
+    chave = Column(String(255), primary_key=True)
+    exemplo = Column(String(255), nullable=False)  # última pergunta original que gerou/atualizou a entrada
+    analysis = Column(Text, nullable=False)  # JSON: intent, data_type, period, filters, comparison, metricas
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    last_used_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<QuestionCacheEntry(chave='{self.chave}', hits={self.hits})>"
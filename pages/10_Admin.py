@@ -11,22 +11,28 @@ import streamlit as st
 from sqlalchemy import select
 
 from config.ai_config import AIConfigManager
-from mcp import MCPDetector, MCPExtractor, MCPFormatter, MCPLister, MCPValidator
+from mcp import Pipeline, intent_classifier
+from mcp.detector import CONFIDENCE_CLASSIFIER_THRESHOLD, estatisticas_deteccao
 from config.database import SessionLocal
 from config.prompt_config import (
     ACCOUNTS_AGENT_KEYS,
     AGENDA_AGENT_KEYS,
     DEFAULTS,
+    KEY_NARRACAO,
+    NARRACAO_OPCOES,
+    NARRACAO_SOB_PEDIDO,
     PLACEHOLDERS_HELP,
     PromptConfigManager,
     REPORT_AGENT_KEYS,
 )
 from models.user import User
+from services import llm_cache, llm_resilience, question_cache, token_budget
 from services.ai_service import AIService
 from services.auth_service import AuthService
 from services.accounts_agent_service import AccountsAgentService
 from services.agenda_agent_service import AgendaAgentService
-from services.report_agent_service import ReportAgentService
+from services.report_agent_service import ReportAgentService, tempos_coleta_analise
+from services.report_router import estatisticas_rotas
 from utils.formatters import format_currency
 from utils.navigation import show_sidebar
 from utils.login_config import load_login_config, save_login_config
@@ -357,6 +363,40 @@ try:
             )
             st.info("MCP ativo para Contas, Agenda e Relatórios. Nenhuma configuração adicional necessária.")
 
+            with st.expander("Classificador local de intenção (detector)", expanded=False):
+                st.caption(
+                    "Com IA configurada, o detector consulta antes um classificador local (n-gramas de caracteres + "
+                    "regressão logística), treinado com as frases de mcp/intent_training_data.py e as mensagens do "
+                    f"chat. Com confiança a partir de {CONFIDENCE_CLASSIFIER_THRESHOLD:.0%} a IA não é chamada; sem IA, "
+                    "quem decide são as regras. Contagem desde o último reinício do app."
+                )
+                modelo_intencao = intent_classifier.modelo()
+                if modelo_intencao is not None:
+                    meta = modelo_intencao.meta
+                    st.caption(
+                        f"Modelo treinado em {meta.get('treinado_em', '?')} com {meta.get('exemplos', 0)} exemplos · "
+                        f"acurácia em frases não vistas: {meta.get('acuracia_calibracao', 0):.1%} · "
+                        f"erro de calibração (ECE): {meta.get('ece', 0):.3f}"
+                    )
+                deteccoes = estatisticas_deteccao()
+                if deteccoes["total"]:
+                    st.dataframe(
+                        pd.DataFrame(deteccoes["origens"]).rename(
+                            columns={
+                                "origem": "Origem",
+                                "deteccoes": "Detecções",
+                                "proporcao_pct": "Proporção (%)",
+                                "latencia_media_ms": "Latência média (ms)",
+                            }
+                        ),
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+                if st.button("Treinar novamente (frases de treino + chat)", key="btn_treinar_classificador"):
+                    with st.spinner("Treinando..."):
+                        novo = intent_classifier.treinar_e_salvar(db)
+                    st.success(f"Classificador treinado com {novo.meta['exemplos']} exemplos.")
+
             with st.expander("Testar MCP — entradas e saídas para validação", expanded=False):
                 st.caption(
                     "Digite uma mensagem e escolha o contexto (página). O pipeline MCP será executado e as entradas/saídas de cada etapa serão exibidas. "
@@ -377,32 +417,31 @@ try:
                         formatted_response = None
                         try:
                             from datetime import date as date_type
-                            detector = MCPDetector(db)
-                            det, interpretacao_origem = detector.detect_with_source(mcp_msg.strip(), context)
+                            pipeline = Pipeline(db)
+                            det, interpretacao_origem = pipeline.detect_with_source(mcp_msg.strip(), context)
                             st.markdown("#### 1. Detector")
                             if interpretacao_origem == "ia":
-                                st.success("**Interpretação pela IA:** a mensagem foi classificada pelo modelo de linguagem (confiança das regras era baixa ou resultado era OTHER).")
+                                st.success("**Interpretação pela IA:** a mensagem foi classificada pelo modelo de linguagem (confiança do classificador local era baixa).")
+                            elif interpretacao_origem == "classificador":
+                                st.caption("Interpretação pelo **classificador local** (sem chamada à IA).")
                             else:
                                 st.caption("Interpretação por **regras/padrões** (detecção por palavras-chave e contexto).")
                             st.json({"entrada": {"text": mcp_msg.strip(), "context": context}, "saida": {"action": det.action, "entity": det.entity, "confidence": det.confidence, "extracted_info": det.extracted_info, "interpretacao": interpretacao_origem}})
 
-                            extractor = MCPExtractor(db)
-                            ext = extractor.extract(mcp_msg.strip(), det.action, det.entity, context)
+                            ext = pipeline.extract(mcp_msg.strip(), det.action, det.entity, context)
                             st.markdown("#### 2. Extractor")
                             st.json({"entrada": {"text": mcp_msg.strip(), "action": det.action, "entity": det.entity, "context": context}, "saida": {"data": ext.data, "confidence": ext.confidence, "missing_fields": ext.missing_fields}})
 
                             if det.action in ("INSERT", "UPDATE", "DELETE"):
-                                validator = MCPValidator(db)
-                                val = validator.validate(ext.data, det.action, det.entity)
+                                val = pipeline.validate(ext.data, det.action, det.entity)
                                 st.markdown("#### 3. Validator")
-                                st.json({"entrada": {"data": ext.data, "action": det.action, "entity": det.entity}, "saida": {"valid": val.valid, "errors": val.errors, "warnings": val.warnings, "message_ia": getattr(val, "message_ia", None)}})
-                                formatter = MCPFormatter(db)
-                                fmt = formatter.format(det.action, ext.data, None, det.entity)
+                                st.json({"entrada": {"data": ext.data, "action": det.action, "entity": det.entity}, "saida": {"valid": val.valid, "codes": [c.model_dump(exclude_none=True) for c in val.codes], "errors": val.errors, "warnings": val.warnings, "message": val.message, "message_ia": val.message_ia}})
+                                fmt = pipeline.format(det.action, ext.data, None, det.entity)
                                 st.markdown("#### 4. Formatter")
                                 st.json({"entrada": {"action": det.action, "data": ext.data, "entity": det.entity}, "saida": {"message": fmt.message, "preview": fmt.preview}})
                                 formatted_response = fmt.message
                             elif det.action == "LIST" and det.entity in ("contas_pagar", "contas_receber"):
-                                lister = MCPLister(db)
+                                lister = pipeline.lister
                                 filt = ext.data
                                 di = filt.get("data_inicial")
                                 df = filt.get("data_final")
@@ -410,9 +449,9 @@ try:
                                     di = date_type.fromisoformat(di) if di else None
                                 if isinstance(df, str):
                                     df = date_type.fromisoformat(df) if df else None
-                                lst = lister.list_accounts(det.entity, di, df, filt.get("status"))
+                                lst = lister.list_accounts(det.entity, di, df, filt.get("status"), filt.get("nome"))
                                 st.markdown("#### 3. Lister")
-                                st.json({"entrada": {"entity": det.entity, "data_inicial": str(di) if di else None, "data_final": str(df) if df else None, "status": filt.get("status")}, "saida": {"total": lst.total, "total_valor": lst.total_valor, "items_count": len(lst.items)}})
+                                st.json({"entrada": {"entity": det.entity, "data_inicial": str(di) if di else None, "data_final": str(df) if df else None, "status": filt.get("status"), "nome": filt.get("nome")}, "saida": {"total": lst.total, "total_valor": lst.total_valor, "items_count": len(lst.items)}})
                                 tit = "Contas a pagar" if det.entity == "contas_pagar" else "Contas a receber"
                                 linhas = [f"**{tit}** ({lst.total} itens, total {format_currency(lst.total_valor or 0)})\n"]
                                 for i, it in enumerate(lst.items[:20], 1):
@@ -442,9 +481,17 @@ try:
                                 if df < di:
                                     df = di
                                 query_analysis = {"data_type": data_type, "period": {"start": di, "end": df, "type": "personalizado"}, "user_id": None}
-                                report_agent = ReportAgentService(db)
+                                report_agent = ReportAgentService(db, pipeline)
                                 query_result = report_agent.execute_query(db, query_analysis)
                                 formatted_response = report_agent.format_response(query_result, query_analysis, mcp_msg.strip())
+                            st.caption("Tempo por etapa do pipeline (ms):")
+                            st.dataframe(
+                                pd.DataFrame(
+                                    [{"etapa": e, "ms": ms} for e, ms in pipeline.tempos_ms().items()]
+                                ).rename(columns={"etapa": "Etapa", "ms": "Tempo (ms)"}),
+                                use_container_width=True,
+                                hide_index=True,
+                            )
                             if formatted_response is not None:
                                 st.markdown("---")
                                 st.markdown("#### Resposta formatada (como na conversa)")
@@ -573,6 +620,193 @@ try:
         else:
             st.caption("Nenhuma configuração cadastrada.")
 
+        with st.expander("Cache de respostas da IA"):
+            st.caption(
+                "Respostas repetidas (mesmo provedor, modelo, temperatura e prompt) são reaproveitadas sem nova chamada à API. "
+                "Respostas que usam dados do banco são descartadas quando vendas, contas ou agenda mudam."
+            )
+            stats = llm_cache.estatisticas(db)
+            if stats:
+                st.dataframe(
+                    pd.DataFrame(stats).rename(
+                        columns={
+                            "call_site": "Ponto de chamada",
+                            "hits": "Acertos",
+                            "misses": "Faltas",
+                            "taxa_acerto": "Taxa de acerto (%)",
+                            "entradas": "Entradas válidas",
+                        }
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+            else:
+                st.caption("Nenhuma chamada registrada ainda.")
+            if st.button("Limpar cache", key="btn_limpar_llm_cache"):
+                n = llm_cache.limpar(db, zerar_contadores=True)
+                st.success(f"{n} resposta(s) removida(s) do cache.")
+                st.rerun()
+
+        with st.expander("Rotas do Agente de Relatórios (regras x cache x planejador x IA)"):
+            st.caption(
+                "Perguntas frequentes (faturamento, mais vendidos, estoque, contas, agenda) com período claro são "
+                "respondidas por regras, sem chamar a IA; perguntas já analisadas (mesmo com outras palavras) usam o "
+                "cache de perguntas; as demais passam pelo planejador de turno (uma chamada) ou, sem plano válido, "
+                "pelo fluxo completo da IA. Contagem desde o último reinício do app."
+            )
+            rotas = estatisticas_rotas()
+            if rotas["total"]:
+                st.dataframe(
+                    pd.DataFrame(rotas["rotas"]).rename(
+                        columns={
+                            "rota": "Rota",
+                            "mensagens": "Mensagens",
+                            "proporcao_pct": "Proporção (%)",
+                            "latencia_media_ms": "Latência média (ms)",
+                        }
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+            else:
+                st.caption("Nenhuma mensagem registrada ainda.")
+
+        with st.expander("Cache de perguntas do Agente de Relatórios"):
+            st.caption(
+                "Perguntas normalizadas (sem acentos, palavras vazias e variações como \"vendi\"/\"faturamento\") "
+                "apontam para a última análise validada; o período é recalculado para o dia de hoje. "
+                "Acertos e faltas desde o último reinício do app."
+            )
+            qc = question_cache.estatisticas(db)
+            st.caption(
+                f"Acertos: {qc['acertos']} · Faltas: {qc['faltas']} · Taxa de acerto: {qc['taxa_acerto']:.1f}% · "
+                f"Entradas: {qc['entradas']}"
+            )
+            principais = question_cache.principais(db)
+            if principais:
+                st.dataframe(
+                    pd.DataFrame(principais).rename(
+                        columns={
+                            "chave": "Chave",
+                            "exemplo": "Última pergunta",
+                            "data_type": "Assunto",
+                            "periodo": "Período",
+                            "hits": "Acertos",
+                        }
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+            if st.button("Limpar cache de perguntas", key="btn_limpar_question_cache"):
+                n = question_cache.limpar(db)
+                st.success(f"{n} pergunta(s) removida(s) do cache.")
+                st.rerun()
+
+        with st.expander("Análise do dia: tempo de coleta dos dados"):
+            st.caption(
+                "A coleta da análise do dia roda as consultas independentes (vendas, contas, agenda, fluxo de caixa) "
+                "em paralelo, cada uma com sua conexão; o total fica perto da etapa mais lenta."
+            )
+            coleta = tempos_coleta_analise()
+            if coleta:
+                st.caption(f"Última coleta: {coleta['quando']} — {coleta['total_ms']:.0f} ms no total.")
+                if coleta.get("falhas"):
+                    st.caption(f"Etapas com erro (análise não guardada): {', '.join(coleta['falhas'])}.")
+                st.dataframe(
+                    pd.DataFrame(
+                        [{"etapa": nome, "ms": ms} for nome, ms in coleta["etapas"].items()]
+                    ).rename(columns={"etapa": "Etapa", "ms": "Tempo (ms)"}),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+            else:
+                st.caption("Nenhuma coleta desde o último reinício do app.")
+
+        with st.expander("Resiliência da IA (prazos, disjuntor e reserva)"):
+            cadeia = AIConfigManager.FALLBACK_CHAIN
+            st.caption(
+                f"Cada chamada tem prazo de {llm_resilience.PRAZO_PADRAO:.0f}s (até {llm_resilience.PRAZO_TENTATIVA:.0f}s "
+                f"por tentativa). Após {llm_resilience.FALHAS_PARA_ABRIR} falhas seguidas o provedor fica em pausa por "
+                f"{llm_resilience.PAUSA_CIRCUITO:.0f}s e os agentes usam as respostas por regras. "
+                + (
+                    f"Provedores de reserva: {' → '.join(p.upper() for p in cadeia)}."
+                    if cadeia
+                    else "Sem provedores de reserva (defina AI_FALLBACK_CHAIN, ex.: groq,ollama)."
+                )
+            )
+            circuitos = llm_resilience.estado_circuitos()
+            if circuitos:
+                st.dataframe(
+                    pd.DataFrame(circuitos).rename(
+                        columns={
+                            "provedor": "Provedor",
+                            "falhas_seguidas": "Falhas seguidas",
+                            "aberto": "Em pausa",
+                            "pausa_restante_s": "Pausa restante (s)",
+                        }
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+            eventos = llm_resilience.eventos_recentes()
+            if eventos:
+                st.dataframe(
+                    pd.DataFrame(eventos).rename(
+                        columns={
+                            "quando": "Quando",
+                            "provedor": "Provedor",
+                            "evento": "Decisão",
+                            "ponto": "Ponto de chamada",
+                            "detalhe": "Detalhe",
+                        }
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+            else:
+                st.caption("Nenhuma falha ou fallback registrado desde o último reinício do app.")
+            if st.button("Fechar circuitos e limpar registro", key="btn_reset_resiliencia"):
+                llm_resilience.resetar()
+                st.rerun()
+
+        with st.expander("Tokens por chamada à IA (estimativa)"):
+            st.caption(
+                "Tokens estimados (~4 caracteres por token) do prompt e da resposta de cada chamada ao provedor, "
+                "sem contar acertos de cache. Listas longas dos dados vão resumidas (primeiros itens + totais) e o "
+                "histórico da conversa entra até "
+                f"{token_budget.ORCAMENTO_HISTORICO} tokens. Contagem desde o último reinício do app."
+            )
+            tokens = token_budget.estatisticas()
+            if tokens:
+                st.dataframe(
+                    pd.DataFrame(tokens).rename(
+                        columns={
+                            "ponto": "Ponto de chamada",
+                            "chamadas": "Chamadas",
+                            "media_prompt": "Prompt médio (tokens)",
+                            "media_resposta": "Resposta média (tokens)",
+                            "maior_prompt": "Maior prompt (tokens)",
+                        }
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+                st.dataframe(
+                    pd.DataFrame(token_budget.chamadas_recentes(20)).rename(
+                        columns={
+                            "quando": "Quando",
+                            "ponto": "Ponto de chamada",
+                            "provedor": "Provedor",
+                            "tokens_prompt": "Prompt (tokens)",
+                            "tokens_resposta": "Resposta (tokens)",
+                        }
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+            else:
+                st.caption("Nenhuma chamada registrada ainda.")
+
     st.markdown("---")
     with st.expander("Prompts do Agente de Relatórios"):
         st.caption(
@@ -584,8 +818,23 @@ try:
             "report_agent.analyze_query": "Análise da pergunta (analyze_query)",
             "report_agent.initial_analysis": "Análise do dia (initial_analysis)",
             "report_agent.format_response_analise_avancada": "Formatação: análise avançada",
-            "report_agent.format_response_generic": "Formatação: resposta genérica",
+            "report_agent.format_response_insight": "Leitura da IA após a resposta por template",
+            "report_agent.turn_planner": "Planejador de turno (uma chamada por mensagem)",
         }
+        narracao_atual = PromptConfigManager.get(db, KEY_NARRACAO) or NARRACAO_SOB_PEDIDO
+        opcoes_narracao = list(NARRACAO_OPCOES)
+        narracao = st.selectbox(
+            "Leitura da IA nas respostas do chat",
+            options=opcoes_narracao,
+            index=opcoes_narracao.index(narracao_atual) if narracao_atual in opcoes_narracao else 0,
+            format_func=NARRACAO_OPCOES.get,
+            help="As consultas são respondidas por template (números e tabelas, sem IA). "
+            "Aqui se define quando a IA acrescenta um parágrafo curto de leitura, calculado só dos totais.",
+            key="narracao_relatorios",
+        )
+        if narracao != narracao_atual:
+            PromptConfigManager.set(db, KEY_NARRACAO, narracao)
+            st.success("Configuração salva.")
         for key in REPORT_AGENT_KEYS:
             with st.expander(prompt_labels.get(key, key)):
                 current = PromptConfigManager.get_or_default(db, key, DEFAULTS[key])
@@ -683,7 +932,7 @@ try:
         if submit_day:
             try:
                 svc = ReportAgentService(db)
-                markdown = svc.get_initial_analysis(db)
+                markdown = st.write_stream(svc.get_initial_analysis_stream(db))
                 st.session_state.prompt_test_history.append({
                     "role": "assistant",
                     "content": markdown,
@@ -753,7 +1002,8 @@ try:
                     })
                     st.rerun()
 
-                response_text = svc.format_response(query_result, query_analysis, user_text)
+                st.markdown("**Agente**")
+                response_text = st.write_stream(svc.format_response_stream(query_result, query_analysis, user_text))
                 table_data = None
                 data = query_result.get("data", {})
                 qt = query_result.get("type", "")
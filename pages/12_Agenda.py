@@ -11,6 +11,7 @@ from sqlalchemy import select
 
 from config.database import init_db, SessionLocal
 from models.personal_agenda import PersonalAgenda
+from mcp import Pipeline
 from services.agenda_agent_service import AgendaAgentService
 from services.auth_service import AuthService
 from services.chat_memory import SCOPE_AGENDA_AGENT, add_message, clear, get_messages
@@ -164,7 +165,8 @@ try:
             try:
                 if current_user_id is not None:
                     add_message(db_ag, current_user_id, SCOPE_AGENDA_AGENT, "user", query_ag, None)
-                agent = AgendaAgentService(db_ag)
+                # Um pipeline MCP por mensagem: mesma IA/configuração e nenhuma etapa repetida no turno
+                agent = AgendaAgentService(db_ag, Pipeline(db_ag))
                 with st.spinner("Interpretando pedido..."):
                     # Histórico para contexto: mensagens anteriores (role + content)
                     history_ag = [
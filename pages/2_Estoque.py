@@ -12,6 +12,7 @@ from config.database import SessionLocal
 from models.product import Product
 from models.product_category import ProductCategory
 from services.auth_service import AuthService
+from services.report_service import ABC_DIAS_SEM_VENDA, classes_abc_por_produto
 from utils.formatters import format_currency
 from utils.navigation import show_sidebar
 
@@ -83,6 +84,7 @@ try:
         valor_estoque_venda = 0.0
 
         valor_lucro_total = 0.0
+        classes_abc = classes_abc_por_produto(db)
         for p in produtos:
             estoque = float(p.estoque_atual or 0)
             estoque_min = float(p.estoque_minimo or 0)
@@ -107,7 +109,7 @@ try:
             }
             linhas.append(linha)
             if p.estoque_minimo is not None and p.estoque_atual <= p.estoque_minimo:
-                baixo.append(linha)
+                baixo.append({**linha, "Curva ABC": classes_abc.get(p.id, "C")})
 
         col1, col2, col3, col4, col5 = st.columns(5)
         with col1:
@@ -124,7 +126,11 @@ try:
         if baixo:
             st.markdown("---")
             st.subheader("⚠️ Produtos com estoque baixo")
-            st.caption("Estes produtos estão com quantidade igual ou abaixo do mínimo definido.")
+            st.caption(
+                "Estes produtos estão com quantidade igual ou abaixo do mínimo definido. "
+                f"Ordenados pela curva ABC de receita dos últimos {ABC_DIAS_SEM_VENDA} dias (repor primeiro os da classe A)."
+            )
+            baixo.sort(key=lambda linha: linha["Curva ABC"])
             st.dataframe(baixo, use_container_width=True, hide_index=True)
             st.markdown("---")
 
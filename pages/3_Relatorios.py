@@ -18,6 +18,16 @@ from models.product import Product
 from models.sale import Sale, SaleItem
 from models.stock_entry import StockEntry
 from services.auth_service import AuthService
+from services.basket_service import atualizar_cestas, pares_frequentes, reprocessar_cestas
+from services.forecast_service import previsao_vendas
+from services.report_service import (
+    ABC_CRITERIOS,
+    ABC_DIAS_SEM_VENDA,
+    COMPARACOES,
+    curva_abc,
+    resumo_abc,
+    resumo_periodo,
+)
 from utils.formatters import format_currency, format_date
 from utils.navigation import show_sidebar
 
@@ -59,10 +69,13 @@ with col2:
 RELATORIOS = [
     "Resumo do período",
     "Evolução de vendas",
+    "Previsão de vendas",
     "Vendas por faixa horária",
     "Valor de estoque",
     "Entradas de estoque",
     "Produtos mais vendidos",
+    "Curva ABC",
+    "Produtos comprados juntos",
     "Sessões de caixa",
 ]
 relatorio = st.selectbox(
@@ -86,40 +99,84 @@ config_plotly = {"displayModeBar": False, "responsive": True}
 
 try:
     if relatorio == "Resumo do período":
-        vendas_query = (
-            db.query(
-                func.coalesce(func.sum(Sale.total_vendido), 0.0),
-                func.coalesce(func.sum(Sale.total_lucro), 0.0),
-                func.coalesce(func.sum(Sale.total_pecas), 0),
+        col_comp, _ = st.columns([1, 2])
+        with col_comp:
+            comparacao = st.selectbox(
+                "Comparar com",
+                options=list(COMPARACOES.keys()),
+                format_func=lambda x: COMPARACOES[x],
+                help="Período anterior = mesmo número de dias imediatamente antes; ano anterior = mesmas datas no ano passado.",
+            )
+        resumo = resumo_periodo(db, data_inicio, data_fim, comparacao)
+        comp = resumo.get("comparacao")
+        deltas = comp["deltas"] if comp else {}
+
+        def _delta(metrica: str, moeda: bool = False):
+            """Texto do delta para st.metric (absoluto e %), ou None sem comparação."""
+            if metrica not in deltas:
+                return None
+            d = deltas[metrica]
+            if moeda:
+                absoluto = ("+" if d["abs"] >= 0 else "-") + format_currency(abs(d["abs"]))
+            else:
+                absoluto = f"{d['abs']:+.0f}"
+            return f"{absoluto} ({d['pct']:+.1f}%)" if d["pct"] is not None else absoluto
+
+        if comp:
+            st.caption(
+                f"Comparado com {COMPARACOES[comp['modo']].lower()}: "
+                f"{format_date(date.fromisoformat(comp['start_date']))} a {format_date(date.fromisoformat(comp['end_date']))}"
             )
-            .filter(Sale.data_venda >= data_inicio)
-            .filter(Sale.data_venda <= data_fim)
-            .filter(Sale.status != "cancelada")
-        )
-        total_vendido, total_lucro, total_pecas = vendas_query.one()
-        num_vendas = (
-            db.query(func.count(Sale.id))
-            .filter(Sale.data_venda >= data_inicio)
-            .filter(Sale.data_venda <= data_fim)
-            .filter(Sale.status != "cancelada")
-            .scalar()
-        )
-        margem = (total_lucro / total_vendido * 100) if total_vendido > 0 else 0.0
-        ticket_medio = (total_vendido / num_vendas) if num_vendas and num_vendas > 0 else 0.0
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Total vendido", format_currency(total_vendido))
+            st.metric("Total vendido", format_currency(resumo["total_vendido"]), _delta("total_vendido", moeda=True))
         with col2:
-            st.metric("Total de lucro", format_currency(total_lucro))
+            st.metric("Total de lucro", format_currency(resumo["total_lucro"]), _delta("total_lucro", moeda=True))
         with col3:
-            st.metric("Margem (%)", f"{margem:.2f}")
+            st.metric(
+                "Margem (%)",
+                f"{resumo['margem']:.2f}",
+                f"{deltas['margem']['abs']:+.2f} p.p." if "margem" in deltas else None,
+            )
         with col4:
-            st.metric("Peças vendidas", int(total_pecas))
+            st.metric("Peças vendidas", int(resumo["total_pecas"]), _delta("total_pecas"))
         col5, col6 = st.columns(2)
         with col5:
-            st.metric("Nº de vendas", num_vendas or 0)
+            st.metric("Nº de vendas", resumo["num_vendas"], _delta("num_vendas"))
         with col6:
-            st.metric("Ticket médio", format_currency(ticket_medio))
+            st.metric("Ticket médio", format_currency(resumo["ticket_medio"]), _delta("ticket_medio", moeda=True))
+        if comp:
+            rotulos = {
+                "total_vendido": "Faturamento",
+                "total_lucro": "Lucro",
+                "margem": "Margem (%)",
+                "total_pecas": "Peças vendidas",
+                "num_vendas": "Nº de vendas",
+                "ticket_medio": "Ticket médio",
+            }
+            df_comp = pd.DataFrame(
+                [
+                    {
+                        "Indicador": rotulo,
+                        "Período": resumo[m],
+                        "Comparação": comp[m],
+                        "Variação": deltas[m]["abs"],
+                        "Variação (%)": deltas[m]["pct"],
+                    }
+                    for m, rotulo in rotulos.items()
+                ]
+            )
+            st.dataframe(
+                df_comp,
+                use_container_width=True,
+                hide_index=True,
+                column_config={
+                    "Período": st.column_config.NumberColumn(format="%.2f"),
+                    "Comparação": st.column_config.NumberColumn(format="%.2f"),
+                    "Variação": st.column_config.NumberColumn(format="%+.2f"),
+                    "Variação (%)": st.column_config.NumberColumn(format="%+.1f%%"),
+                },
+            )
 
     elif relatorio == "Evolução de vendas":
         rows = (
@@ -174,6 +231,121 @@ try:
             )
             st.plotly_chart(fig, use_container_width=True, config=config_plotly)
 
+    elif relatorio == "Previsão de vendas":
+        st.caption(
+            "Previsão de faturamento mensal a partir do histórico (independe dos filtros de data). "
+            "O modelo é escolhido pelo menor erro no backtest dos últimos meses."
+        )
+        prev = previsao_vendas(db, horizonte=3)
+        if not prev["previsoes"]:
+            st.info("Histórico insuficiente para previsão (é preciso ao menos um mês completo de vendas).")
+        else:
+            mes_atual = prev["mes_atual"]
+            col_p1, col_p2, col_p3 = st.columns(3)
+            with col_p1:
+                st.metric("Modelo", prev["modelo_nome"])
+            with col_p2:
+                st.metric(
+                    "Previsão do mês atual",
+                    format_currency(mes_atual["previsto"] or 0),
+                    f"realizado até hoje: {format_currency(mes_atual['realizado'])}",
+                    delta_color="off",
+                )
+            with col_p3:
+                if len(prev["previsoes"]) > 1:
+                    st.metric("Previsão do próximo mês", format_currency(prev["previsoes"][1]["previsto"]))
+
+            hist = [h for h in prev["historico_mensal"] if h["mes"] < mes_atual["mes"]]
+            fig = go.Figure()
+            fig.add_trace(
+                go.Scatter(
+                    x=[h["mes_ano"] for h in hist],
+                    y=[h["total_vendido"] for h in hist],
+                    name="Realizado",
+                    mode="lines+markers",
+                    line=dict(width=2),
+                )
+            )
+            x_prev = [p["mes_ano"] for p in prev["previsoes"]]
+            fig.add_trace(
+                go.Scatter(
+                    x=x_prev + x_prev[::-1],
+                    y=[p["intervalo_95"][1] for p in prev["previsoes"]] + [p["intervalo_95"][0] for p in prev["previsoes"]][::-1],
+                    fill="toself",
+                    fillcolor="rgba(99,110,250,0.12)",
+                    line=dict(width=0),
+                    name="Intervalo 95%",
+                    hoverinfo="skip",
+                )
+            )
+            fig.add_trace(
+                go.Scatter(
+                    x=x_prev + x_prev[::-1],
+                    y=[p["intervalo_80"][1] for p in prev["previsoes"]] + [p["intervalo_80"][0] for p in prev["previsoes"]][::-1],
+                    fill="toself",
+                    fillcolor="rgba(99,110,250,0.25)",
+                    line=dict(width=0),
+                    name="Intervalo 80%",
+                    hoverinfo="skip",
+                )
+            )
+            fig.add_trace(
+                go.Scatter(
+                    x=x_prev,
+                    y=[p["previsto"] for p in prev["previsoes"]],
+                    name="Previsão",
+                    mode="lines+markers",
+                    line=dict(width=2, dash="dash"),
+                )
+            )
+            fig.update_layout(**layout_plotly, yaxis_title="Faturamento (R$)", xaxis_tickangle=-45)
+            st.plotly_chart(fig, use_container_width=True, config=config_plotly)
+
+            st.dataframe(
+                pd.DataFrame(
+                    [
+                        {
+                            "Mês": p["mes_ano"],
+                            "Previsão": format_currency(p["previsto"]),
+                            "Intervalo 80%": f"{format_currency(p['intervalo_80'][0])} a {format_currency(p['intervalo_80'][1])}",
+                            "Intervalo 95%": f"{format_currency(p['intervalo_95'][0])} a {format_currency(p['intervalo_95'][1])}",
+                        }
+                        for p in prev["previsoes"]
+                    ]
+                ),
+                use_container_width=True,
+                hide_index=True,
+            )
+
+            col_bt, col_wd = st.columns(2)
+            with col_bt:
+                st.markdown("**Backtest (erro de 1 mês à frente)**")
+                if prev["backtest"]:
+                    st.dataframe(
+                        pd.DataFrame(
+                            [
+                                {
+                                    "Modelo": b["nome"],
+                                    "Erro médio (R$)": format_currency(b["mae"]),
+                                    "Erro médio (%)": f"{b['mape']:.1f}%" if b["mape"] is not None else "—",
+                                    "Meses testados": b["pontos"],
+                                }
+                                for b in prev["backtest"]
+                            ]
+                        ),
+                        use_container_width=True,
+                        hide_index=True,
+                    )
+                else:
+                    st.caption("Histórico curto demais para backtest.")
+            with col_wd:
+                st.markdown("**Perfil por dia da semana** (média diária, último ano)")
+                df_wd = pd.DataFrame(prev["perfil_dia_semana"])
+                fig_wd = px.bar(df_wd, x="dia", y="media", labels=dict(dia="Dia", media="Média (R$)"), text_auto=".0f")
+                fig_wd.update_traces(marker_line=dict(width=0))
+                fig_wd.update_layout(**{**layout_plotly, "showlegend": False})
+                st.plotly_chart(fig_wd, use_container_width=True, config=config_plotly)
+
     elif relatorio == "Vendas por faixa horária":
         sales = (
             db.query(Sale.created_at, Sale.total_vendido)
@@ -327,6 +499,143 @@ try:
             df_display["Lucro"] = df_display["Lucro"].apply(format_currency)
             st.dataframe(df_display, use_container_width=True, hide_index=True)
 
+    elif relatorio == "Curva ABC":
+        col_c1, col_c2 = st.columns(2)
+        with col_c1:
+            criterio = st.selectbox(
+                "Classificar por",
+                options=list(ABC_CRITERIOS.keys()),
+                format_func=lambda x: ABC_CRITERIOS[x],
+                key="abc_criterio",
+            )
+        with col_c2:
+            dias_sem_venda = st.number_input(
+                "Estoque parado: dias sem venda",
+                min_value=7,
+                max_value=730,
+                value=ABC_DIAS_SEM_VENDA,
+                step=1,
+                key="abc_dias_sem_venda",
+            )
+        df_abc = curva_abc(db, data_inicio, data_fim, int(dias_sem_venda))
+        if df_abc.empty:
+            st.info("Nenhum produto cadastrado.")
+        else:
+            classe_col = f"classe_{criterio}"
+            resumo_cls = resumo_abc(df_abc, criterio)
+            cols_cls = st.columns(3)
+            for col, c in zip(cols_cls, resumo_cls):
+                with col:
+                    valor_txt = f"{c['valor']:.0f} un." if criterio == "unidades" else format_currency(c["valor"])
+                    st.metric(f"Classe {c['classe']} ({c['itens']} produtos)", valor_txt, f"{c['participacao']:.1f}% do total", delta_color="off")
+
+            df_pareto = df_abc[df_abc[criterio] > 0].sort_values(criterio, ascending=False).head(50)
+            if not df_pareto.empty:
+                fig = go.Figure()
+                fig.add_trace(go.Bar(x=df_pareto["nome"], y=df_pareto[criterio], name=ABC_CRITERIOS[criterio]))
+                fig.add_trace(
+                    go.Scatter(
+                        x=df_pareto["nome"],
+                        y=df_pareto[f"acum_{criterio}"] * 100,
+                        name="% acumulado",
+                        mode="lines+markers",
+                        yaxis="y2",
+                    )
+                )
+                fig.update_layout(
+                    **layout_plotly,
+                    xaxis_tickangle=-45,
+                    yaxis2=dict(overlaying="y", side="right", range=[0, 105], title="% acumulado"),
+                )
+                st.plotly_chart(fig, use_container_width=True, config=config_plotly)
+
+            df_display = df_abc.sort_values(criterio, ascending=False)
+            df_display = pd.DataFrame(
+                {
+                    "Classe": df_display[classe_col],
+                    "Código": df_display["codigo"],
+                    "Nome": df_display["nome"],
+                    "Unidades": df_display["unidades"],
+                    "Receita": df_display["receita"].apply(format_currency),
+                    "Lucro": df_display["lucro"].apply(format_currency),
+                    "Participação (%)": (df_display[f"part_{criterio}"] * 100).round(2),
+                    "Acumulado (%)": (df_display[f"acum_{criterio}"] * 100).round(2),
+                    "Entradas": df_display["entradas"],
+                    "Sell-through (%)": df_display["sell_through"].round(1),
+                    "Estoque": df_display["estoque_atual"],
+                }
+            )
+            st.dataframe(df_display, use_container_width=True, hide_index=True)
+
+            parados = df_abc[df_abc["estoque_parado"]].sort_values("valor_estoque_custo", ascending=False)
+            st.markdown("---")
+            st.subheader("Estoque parado")
+            st.caption(f"Produtos com estoque e sem venda há mais de {int(dias_sem_venda)} dias.")
+            if parados.empty:
+                st.info("Nenhum produto parado.")
+            else:
+                st.metric(
+                    f"{len(parados)} produtos parados (valor a custo)",
+                    format_currency(float(parados["valor_estoque_custo"].sum())),
+                )
+                st.dataframe(
+                    pd.DataFrame(
+                        {
+                            "Código": parados["codigo"],
+                            "Nome": parados["nome"],
+                            "Estoque": parados["estoque_atual"],
+                            "Última venda": parados["ultima_venda"].apply(lambda d: format_date(d) if isinstance(d, date) else "Nunca"),
+                            "Valor a custo": parados["valor_estoque_custo"].apply(format_currency),
+                        }
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+
+    elif relatorio == "Produtos comprados juntos":
+        st.caption(
+            "Pares de produtos que saem na mesma venda (todo o histórico). "
+            "Suporte = % das vendas com o par; confiança = % das vendas de um produto que levaram o outro; "
+            "lift > 1 = compram juntos mais do que o acaso explicaria. Período dos filtros não se aplica."
+        )
+        col_b1, col_b2, col_b3 = st.columns([1, 1, 1])
+        with col_b1:
+            ordenar_por = st.selectbox(
+                "Ordenar por",
+                options=["lift", "suporte", "confianca"],
+                format_func=lambda x: {"lift": "Lift", "suporte": "Suporte", "confianca": "Confiança"}[x],
+                key="cesta_ordem",
+            )
+        with col_b2:
+            min_cestas = st.number_input("Mínimo de vendas juntos", min_value=1, value=2, step=1, key="cesta_min")
+        with col_b3:
+            st.write("")
+            if st.button("Reprocessar tudo", key="cesta_reprocessar", help="Recalcula desde a primeira venda (ex.: após cancelamentos)."):
+                with st.spinner("Reprocessando vendas..."):
+                    reprocessar_cestas(db)
+        with st.spinner("Atualizando com as vendas novas..."):
+            atualizar_cestas(db)
+        res_cesta = pares_frequentes(db, limite=50, min_cestas=int(min_cestas), ordenar_por=ordenar_por)
+        st.metric("Vendas analisadas", res_cesta["total_cestas"])
+        if not res_cesta["pares"]:
+            st.info("Nenhum par de produtos vendido junto com a frequência mínima.")
+        else:
+            df_cesta = pd.DataFrame(
+                [
+                    {
+                        "Produto A": f"{p['produto_a']} ({p['codigo_a']})",
+                        "Produto B": f"{p['produto_b']} ({p['codigo_b']})",
+                        "Vendas juntos": p["cestas"],
+                        "Suporte (%)": round(p["suporte"] * 100, 2),
+                        "Confiança A→B (%)": round(p["confianca_a_b"] * 100, 1),
+                        "Confiança B→A (%)": round(p["confianca_b_a"] * 100, 1),
+                        "Lift": round(p["lift"], 2),
+                    }
+                    for p in res_cesta["pares"]
+                ]
+            )
+            st.dataframe(df_cesta, use_container_width=True, hide_index=True)
+
     else:  # Sessões de caixa
         sessoes = (
             db.query(CashSession)
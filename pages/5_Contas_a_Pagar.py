@@ -6,14 +6,18 @@ _ROOT = Path(__file__).resolve().parents[1]
 if str(_ROOT) not in sys.path:
     sys.path.insert(0, str(_ROOT))
 
+import pandas as pd
+import plotly.graph_objects as go
 import streamlit as st
 from sqlalchemy import select
 
 from config.database import SessionLocal
 from models.account_payable import AccountPayable
 from models.account_receivable import AccountReceivable
+from mcp import Pipeline
 from services.accounts_agent_service import AccountsAgentService
 from services.auth_service import AuthService
+from services.cashflow_service import SEMANAS_PADRAO, projecao_fluxo_caixa
 from services.chat_memory import SCOPE_ACCOUNTS_AGENT, add_message, clear, get_messages
 from services.speech_to_text_service import transcribe_audio
 from utils.formatters import format_currency, format_date
@@ -58,16 +62,17 @@ db = SessionLocal()
 qp = st.query_params
 filtro_atraso = (qp.get("filtro") == "atraso") or st.session_state.pop("contas_filtro_atraso", False)
 tab_receber_primeiro = (qp.get("tab") == "receber") or st.session_state.pop("contas_tab_receber", False)
-tabs_labels = ["📋 Agente", "Contas a Pagar", "Contas a Receber", "📈 Relatórios"]
+tabs_labels = ["📋 Agente", "Contas a Pagar", "Contas a Receber", "📈 Relatórios", "💰 Fluxo de caixa"]
 if tab_receber_primeiro:
-    tabs_labels = ["Contas a Receber", "📋 Agente", "Contas a Pagar", "📈 Relatórios"]
+    tabs_labels = ["Contas a Receber", "📋 Agente", "Contas a Pagar", "📈 Relatórios", "💰 Fluxo de caixa"]
 elif filtro_atraso:
-    tabs_labels = ["Contas a Pagar", "📋 Agente", "Contas a Receber", "📈 Relatórios"]
+    tabs_labels = ["Contas a Pagar", "📋 Agente", "Contas a Receber", "📈 Relatórios", "💰 Fluxo de caixa"]
 tab_handles = st.tabs(tabs_labels)
 tab_agente = next((tab_handles[i] for i, l in enumerate(tabs_labels) if l == "📋 Agente"), tab_handles[0])
 tab_pagar = next((tab_handles[i] for i, l in enumerate(tabs_labels) if l == "Contas a Pagar"), tab_handles[1])
 tab_receber = next((tab_handles[i] for i, l in enumerate(tabs_labels) if l == "Contas a Receber"), tab_handles[2])
 tab_relatorios = next((tab_handles[i] for i, l in enumerate(tabs_labels) if l == "📈 Relatórios"), tab_handles[3])
+tab_fluxo = next((tab_handles[i] for i, l in enumerate(tabs_labels) if l == "💰 Fluxo de caixa"), tab_handles[4])
 
 try:
     with tab_pagar:
@@ -494,7 +499,8 @@ try:
             try:
                 if current_user_id is not None:
                     add_message(db_ag, current_user_id, SCOPE_ACCOUNTS_AGENT, "user", query_ag, None)
-                agent = AccountsAgentService(db_ag)
+                # Um pipeline MCP por mensagem: mesma IA/configuração e nenhuma etapa repetida no turno
+                agent = AccountsAgentService(db_ag, Pipeline(db_ag))
                 with st.spinner("Interpretando pedido..."):
                     # Histórico para contexto: mensagens anteriores (role + content)
                     history_ag = [
@@ -655,5 +661,108 @@ try:
                 st.metric("Total recebidas", format_currency(total_recebidas_r))
             st.dataframe(linhas_receber, use_container_width=True, hide_index=True)
 
+    with tab_fluxo:
+        st.caption(
+            "Projeção do caixa a partir de hoje: contas a pagar e a receber em aberto (por vencimento) "
+            "e vendas previstas pelo histórico. Contas a pagar em atraso entram no dia de hoje."
+        )
+        col_saldo, col_sem, col_opts = st.columns([1, 1, 1])
+        with col_saldo:
+            saldo_inicial = st.number_input(
+                "Saldo atual (caixa + banco)", value=0.0, step=100.0, key="fluxo_saldo_inicial",
+                help="Ponto de partida do saldo projetado.",
+            )
+        with col_sem:
+            semanas = st.slider("Semanas", min_value=2, max_value=26, value=SEMANAS_PADRAO, key="fluxo_semanas")
+        with col_opts:
+            incluir_vendas = st.checkbox("Incluir vendas previstas", value=True, key="fluxo_vendas")
+            incluir_receber_atrasado = st.checkbox(
+                "Contar fiado em atraso como recebido hoje", value=False, key="fluxo_receber_atrasado"
+            )
+        projecao = projecao_fluxo_caixa(
+            db,
+            semanas=semanas,
+            saldo_inicial=saldo_inicial,
+            incluir_vendas=incluir_vendas,
+            incluir_receber_atrasado=incluir_receber_atrasado,
+        )
+        col_f1, col_f2, col_f3, col_f4 = st.columns(4)
+        with col_f1:
+            st.metric("A pagar no período", format_currency(projecao["total_pagar"]))
+        with col_f2:
+            st.metric("A receber no período", format_currency(projecao["total_receber"]))
+        with col_f3:
+            st.metric("Vendas previstas", format_currency(projecao["total_vendas_previstas"]))
+        with col_f4:
+            st.metric(
+                "Saldo ao final",
+                format_currency(projecao["saldo_final"]),
+                f"mínimo: {format_currency(projecao['saldo_minimo'])}",
+                delta_color="off",
+            )
+        if projecao["pagar_atrasado"] or projecao["receber_atrasado"]:
+            st.caption(
+                f"Em atraso: {format_currency(projecao['pagar_atrasado'])} a pagar (já incluído hoje) · "
+                f"{format_currency(projecao['receber_atrasado'])} a receber"
+                + (" (incluído hoje)." if incluir_receber_atrasado else " (fora da projeção).")
+            )
+        if projecao["semanas_negativas"]:
+            st.warning(
+                "⚠️ Saldo negativo projetado nas semanas: "
+                + "; ".join(
+                    f"{s['inicio']} a {s['fim']} (mínimo {format_currency(s['saldo_minimo'])})"
+                    for s in projecao["semanas_negativas"]
+                )
+            )
+        else:
+            st.success("Nenhuma semana com saldo negativo no período projetado.")
+
+        diario = projecao["diario"]
+        fig = go.Figure()
+        fig.add_trace(go.Bar(x=diario["data"], y=diario["entradas"], name="Entradas", marker_color="#2ca02c"))
+        fig.add_trace(go.Bar(x=diario["data"], y=-diario["saidas"], name="Saídas", marker_color="#d62728"))
+        fig.add_trace(go.Scatter(x=diario["data"], y=diario["saldo"], name="Saldo", mode="lines", line=dict(width=2)))
+        fig.add_hline(y=0, line_width=1, line_dash="dot")
+        fig.update_layout(
+            barmode="relative",
+            height=380,
+            margin=dict(l=10, r=10, t=30, b=10),
+            legend=dict(orientation="h", yanchor="bottom", y=1.02),
+            yaxis_title="R$",
+        )
+        st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
+
+        semanal = projecao["semanal"]
+        st.subheader("Por semana")
+        st.dataframe(
+            pd.DataFrame(
+                {
+                    "Semana": [f"{format_date(i)} a {format_date(f)}" for i, f in zip(semanal["inicio"], semanal["fim"])],
+                    "A pagar": semanal["pagar"].map(format_currency),
+                    "A receber": semanal["receber"].map(format_currency),
+                    "Vendas previstas": semanal["vendas_previstas"].map(format_currency),
+                    "Saldo final": semanal["saldo_final"].map(format_currency),
+                    "Saldo mínimo": semanal["saldo_minimo"].map(format_currency),
+                    "Alerta": semanal["negativo"].map(lambda n: "⚠️ negativo" if n else ""),
+                }
+            ),
+            use_container_width=True,
+            hide_index=True,
+        )
+        with st.expander("Detalhe por dia"):
+            st.dataframe(
+                pd.DataFrame(
+                    {
+                        "Data": diario["data"].map(format_date),
+                        "A pagar": diario["pagar"].map(format_currency),
+                        "A receber": diario["receber"].map(format_currency),
+                        "Vendas previstas": diario["vendas_previstas"].map(format_currency),
+                        "Saldo": diario["saldo"].map(format_currency),
+                    }
+                ),
+                use_container_width=True,
+                hide_index=True,
+            )
+
 finally:
     db.close()
@@ -15,6 +15,7 @@ from datetime import date as date_type
 import streamlit as st
 
 from config.database import SessionLocal
+from mcp import Pipeline
 from services.accounts_agent_service import AccountsAgentService
 from services.auth_service import AuthService
 from services.chat_memory import SCOPE_ACCOUNTS_AGENT, add_message, clear, get_messages
@@ -171,7 +172,8 @@ if query:
     try:
         if current_user_id is not None:
             add_message(db, current_user_id, SCOPE_ACCOUNTS_AGENT, "user", query, None)
-        agent = AccountsAgentService(db)
+        # Um pipeline MCP por mensagem: mesma IA/configuração e nenhuma etapa repetida no turno
+        agent = AccountsAgentService(db, Pipeline(db))
         with st.spinner("Interpretando pedido..."):
             # Histórico para contexto: mensagens anteriores (role + content)
             history = [
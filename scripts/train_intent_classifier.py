@@ -0,0 +1,37 @@
+"""
+Treina o classificador local de intenção do detector MCP (mcp.intent_classifier) com as frases de
+mcp/intent_training_data.py e as mensagens do chat (agent_chat_memory) e grava data/intent_classifier.npz.
+Uso: python scripts/train_intent_classifier.py [--sem-chat]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parents[1]
+if str(_ROOT) not in sys.path:
+    sys.path.insert(0, str(_ROOT))
+
+from config.database import SessionLocal, init_db
+from mcp import intent_classifier
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Treina o classificador local de intenção do detector MCP.")
+    parser.add_argument("--sem-chat", action="store_true", help="usar só as frases de treino (sem mensagens do chat)")
+    args = parser.parse_args()
+    init_db()
+    db = None if args.sem_chat else SessionLocal()
+    try:
+        modelo = intent_classifier.treinar_e_salvar(db)
+    finally:
+        if db is not None:
+            db.close()
+    meta = modelo.meta
+    print(f"Modelo gravado em {intent_classifier.ARQUIVO} ({intent_classifier.ARQUIVO.stat().st_size / 1024:.0f} KB)")
+    print(f"Exemplos: {meta['exemplos']} · rótulos: {meta['rotulos']} · temperatura: {meta['temperatura']}")
+    print(f"Acurácia em frases não vistas: {meta.get('acuracia_calibracao', 0):.1%} · ECE: {meta.get('ece', 0):.3f}")
+    print(f"Treino: {meta['treino_ms']:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,6 @@ from calendar import monthrange
 from datetime import date
 from typing import Any, Dict, List, Optional
 
-from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from config.prompt_config import (
@@ -18,10 +17,11 @@ from config.prompt_config import (
     PromptConfigManager,
     safe_substitute_prompt,
 )
-from mcp import MCPDetector, MCPExtractor, MCPFormatter, MCPValidator
+from mcp import Pipeline
 from models.account_payable import AccountPayable
 from models.account_receivable import AccountReceivable
-from services.ai_service import AIService
+from services import name_matcher, token_budget
+from services.llm_cache import SITE_ACCOUNTS_PARSE
 
 
 # Data de hoje para o prompt (referência)
@@ -149,9 +149,11 @@ class AccountsAgentService:
     Retorna need_info (perguntas), confirm (resumo para confirmar) ou done/error.
     """
 
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, pipeline: Optional[Pipeline] = None):
         self.db = db
-        self.ai_service = AIService(db)
+        # Pipeline MCP do turno (compartilhado com a página e os outros agentes); o AIService é o dele
+        self.pipeline = pipeline or Pipeline(db)
+        self.ai_service = self.pipeline.ai
 
     def is_available(self) -> bool:
         return self.ai_service.is_available()
@@ -175,8 +177,6 @@ class AccountsAgentService:
                 "records": [],
                 "baixa": None,
             }
-        term_like = f"%{term}%"
-        term_lower = term.lower()
         valor_pedido = None
         try:
             v = parsed.get("valor")
@@ -185,20 +185,26 @@ class AccountsAgentService:
         except (TypeError, ValueError):
             pass
 
-        if tipo == "pagar":
-            q = (
+        # Nomes parecidos (sem acento, com erro de digitação) entre os de contas em aberto, no dicionário em
+        # memória; as contas vêm pelo índice do nome normalizado
+        entity = "contas_pagar" if tipo == "pagar" else "contas_receber"
+        achados = name_matcher.candidatos(self.db, entity, term, abertas=True)
+        scores = {a["normalizado"]: a["score"] for a in achados}
+        contas = []
+        if tipo == "pagar" and scores:
+            contas = (
                 self.db.query(AccountPayable)
                 .filter(AccountPayable.data_pagamento.is_(None))
-                .filter(func.lower(AccountPayable.fornecedor).like(term_like.lower()))
+                .filter(AccountPayable.fornecedor_normalizado.in_(list(scores)))
+                .all()
             )
-            contas = q.all()
-        else:
-            q = (
+        elif scores:
+            contas = (
                 self.db.query(AccountReceivable)
                 .filter(AccountReceivable.data_recebimento.is_(None))
-                .filter(func.lower(AccountReceivable.cliente).like(term_like.lower()))
+                .filter(AccountReceivable.cliente_normalizado.in_(list(scores)))
+                .all()
             )
-            contas = q.all()
         if not contas:
             return {
                 "status": "error",
@@ -209,16 +215,7 @@ class AccountsAgentService:
             }
 
         def score(c):
-            nome = (c.fornecedor if tipo == "pagar" else c.cliente).lower()
-            s = 0
-            if nome == term_lower:
-                s += 100
-            elif nome.startswith(term_lower) or term_lower.startswith(nome):
-                s += 60
-            elif term_lower in nome:
-                s += 40
-            else:
-                s += 10
+            s = scores.get(c.fornecedor_normalizado if tipo == "pagar" else c.cliente_normalizado, 0.0)
             if valor_pedido is not None and abs(float(c.valor) - valor_pedido) < 0.01:
                 s += 50
             return s
@@ -241,7 +238,7 @@ class AccountsAgentService:
             "message": msg,
             "questions": [],
             "records": [],
-            "baixa": {"tipo": tipo, "id": c.id, "label": label},
+            "baixa": {"tipo": tipo, "id": c.id, "label": label, "candidatos": achados},
         }
 
     def _apply_conversation_context_fallback(
@@ -346,6 +343,7 @@ class AccountsAgentService:
         message: str,
         context: Dict[str, Any] | None = None,
         conversation_history: Optional[List[Dict[str, Any]]] = None,
+        plano: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
         """
         Interpreta a mensagem do usuário e retorna:
@@ -354,8 +352,12 @@ class AccountsAgentService:
         - records: lista de {tipo, fornecedor?, cliente?, descricao, valor, data_vencimento} quando confirm
         - message: texto para exibir ao usuário
         conversation_history: últimas mensagens (role + content) para manter contexto (mín. 5 conversas).
+        plano: campos da conta já extraídos pelo planejador de turno (mesmo formato do JSON do prompt do agente);
+        quando informado, não há detecção/extração nem nova chamada à IA.
         """
         context = context or {}
+        if plano is not None:
+            return self._resultado_parsed(dict(plano), message, context, conversation_history)
         data_hoje = _hoje()
 
         # --- Resposta às perguntas "Preciso de mais algumas informações": manter contexto (registre fiado → 80 reais → Willian) ---
@@ -390,11 +392,9 @@ class AccountsAgentService:
                         pass
                     else:
                         ctx = context or {}
-                        detector = MCPDetector(self.db)
-                        det = detector.detect(intent_msg, ctx)
+                        det = self.pipeline.detect(intent_msg, ctx)
                         if det.entity in ("contas_pagar", "contas_receber") and det.action == "INSERT":
-                            extractor = MCPExtractor(self.db)
-                            ext = extractor.extract(intent_msg, "INSERT", det.entity, ctx)
+                            ext = self.pipeline.extract(intent_msg, "INSERT", det.entity, ctx)
                             data = dict(ext.data)
                             data["tipo"] = "pagar" if det.entity == "contas_pagar" else "receber"
                             missing_order = list(ext.missing_fields)
@@ -527,7 +527,7 @@ class AccountsAgentService:
                                     "questions": [],
                                     "records": [],
                                 }
-                            val = MCPValidator(self.db).validate(
+                            val = self.pipeline.validate(
                                 {
                                     "fornecedor": (data.get("fornecedor") or "").strip(),
                                     "cliente": (data.get("cliente") or "").strip(),
@@ -539,7 +539,7 @@ class AccountsAgentService:
                                 det.entity,
                             )
                             if not val.valid:
-                                msg = getattr(val, "message_ia", None) or "\n".join(val.errors)
+                                msg = val.message_ia or val.message or "\n".join(val.errors)
                                 return {"status": "error", "message": msg, "questions": [], "records": []}
                             tipo = data["tipo"]
                             fornecedor = (data.get("fornecedor") or "").strip() or ""
@@ -575,11 +575,9 @@ class AccountsAgentService:
                             break
                     if prev_user and len(prev_user) > 10:
                         ctx = context or {}
-                        detector = MCPDetector(self.db)
-                        det = detector.detect(prev_user, ctx)
+                        det = self.pipeline.detect(prev_user, ctx)
                         if det.entity in ("contas_pagar", "contas_receber") and det.action == "INSERT":
-                            extractor = MCPExtractor(self.db)
-                            ext = extractor.extract(prev_user, "INSERT", det.entity, ctx)
+                            ext = self.pipeline.extract(prev_user, "INSERT", det.entity, ctx)
                             data = dict(ext.data)
                             if (data.get("fornecedor") or data.get("cliente")) and (data.get("valor") or 0):
                                 data_venc, bulk = _parse_data_vencimento_resposta(message)
@@ -614,7 +612,7 @@ class AccountsAgentService:
                                             "data_vencimento": data_venc or date.today().isoformat(),
                                             "observacao": (data.get("observacao") or "").strip() or None,
                                         }]
-                                    val = MCPValidator(self.db).validate(
+                                    val = self.pipeline.validate(
                                         {"fornecedor": fornecedor, "cliente": cliente, "valor": valor, "data_vencimento": records[0]["data_vencimento"], "descricao": descricao},
                                         "INSERT", det.entity,
                                     )
@@ -691,11 +689,9 @@ class AccountsAgentService:
                             answers_so_far.append((conversation_history[j].get("content") or "").strip())
                 if intent_msg and len(intent_msg) > 2:
                     ctx = context or {}
-                    detector = MCPDetector(self.db)
-                    det = detector.detect(intent_msg, ctx)
+                    det = self.pipeline.detect(intent_msg, ctx)
                     if det.entity in ("contas_pagar", "contas_receber") and det.action == "INSERT":
-                        extractor = MCPExtractor(self.db)
-                        ext = extractor.extract(intent_msg, "INSERT", det.entity, ctx)
+                        ext = self.pipeline.extract(intent_msg, "INSERT", det.entity, ctx)
                         data = dict(ext.data)
                         data["tipo"] = "pagar" if det.entity == "contas_pagar" else "receber"
                         missing_order = list(ext.missing_fields)
@@ -750,7 +746,7 @@ class AccountsAgentService:
                             records = [{"tipo": tipo, "fornecedor": fornecedor, "cliente": cliente, "descricao": descricao, "valor": valor, "data_vencimento": d.isoformat(), "observacao": (data.get("observacao") or "").strip() or None} for d in datas]
                         else:
                             records = [{"tipo": tipo, "fornecedor": fornecedor, "cliente": cliente, "descricao": descricao, "valor": valor, "data_vencimento": data_venc, "observacao": (data.get("observacao") or "").strip() or None}]
-                        val = MCPValidator(self.db).validate({"fornecedor": fornecedor, "cliente": cliente, "valor": valor, "data_vencimento": records[0]["data_vencimento"], "descricao": descricao}, "INSERT", det.entity)
+                        val = self.pipeline.validate({"fornecedor": fornecedor, "cliente": cliente, "valor": valor, "data_vencimento": records[0]["data_vencimento"], "descricao": descricao}, "INSERT", det.entity)
                         if val.valid:
                             n = len(records)
                             desc_label = descricao or "—"
@@ -765,8 +761,7 @@ class AccountsAgentService:
 
         # --- MCP: tentar detect + extract + validate + format primeiro ---
         try:
-            detector = MCPDetector(self.db)
-            det = detector.detect(message, context)
+            det = self.pipeline.detect(message, context)
             entity = det.entity
             action = det.action
 
@@ -776,8 +771,7 @@ class AccountsAgentService:
                 and entity in ("contas_pagar", "contas_receber")
                 and (det.extracted_info or {}).get("subtype") == "baixa"
             ):
-                extractor = MCPExtractor(self.db)
-                ext = extractor.extract(message, "UPDATE", entity, context)
+                ext = self.pipeline.extract(message, "UPDATE", entity, context)
                 parsed_baixa = dict(ext.data)
                 parsed_baixa["tipo"] = "pagar" if entity == "contas_pagar" else "receber"
                 self._apply_conversation_context_fallback(
@@ -793,8 +787,7 @@ class AccountsAgentService:
                 and entity in ("contas_pagar", "contas_receber")
                 and det.confidence >= 0.5
             ):
-                extractor = MCPExtractor(self.db)
-                ext = extractor.extract(message, "INSERT", entity, context)
+                ext = self.pipeline.extract(message, "INSERT", entity, context)
                 data = dict(ext.data)
                 data["tipo"] = "pagar" if entity == "contas_pagar" else "receber"
                 data["missing"] = list(ext.missing_fields)
@@ -842,9 +835,9 @@ class AccountsAgentService:
                         "questions": [],
                         "records": [],
                     }
-                val = MCPValidator(self.db).validate(data, "INSERT", entity)
+                val = self.pipeline.validate(data, "INSERT", entity)
                 if not val.valid:
-                    msg = getattr(val, "message_ia", None) or "\n".join(val.errors)
+                    msg = val.message_ia or val.message or "\n".join(val.errors)
                     return {
                         "status": "error",
                         "message": msg,
@@ -877,7 +870,7 @@ class AccountsAgentService:
                     msg = f"**{n} contas a pagar:** {r0['fornecedor']} — {desc_label} — {self._fmt_currency(r0['valor'])} — vencimentos: {self._fmt_date(records[0]['data_vencimento'])} a {self._fmt_date(records[-1]['data_vencimento'])}" if tipo == "pagar" else f"**{n} contas a receber:** {r0['cliente']} — {desc_label} — {self._fmt_currency(r0['valor'])} — vencimentos: {self._fmt_date(records[0]['data_vencimento'])} a {self._fmt_date(records[-1]['data_vencimento'])}"
                     msg += "\n\n**Confirma o cadastro?**"
                     return {"status": "confirm", "message": msg, "questions": [], "records": records}
-                fmt = MCPFormatter(self.db).format("INSERT", data, None, entity)
+                fmt = self.pipeline.format("INSERT", data, None, entity)
                 data_venc_str = data.get("data_vencimento") or date.today().isoformat()
                 if not isinstance(data_venc_str, str):
                     data_venc_str = date.today().isoformat()
@@ -901,18 +894,9 @@ class AccountsAgentService:
 
         # --- Fallback: fluxo original com IA ---
         history_block = ""
-        if conversation_history:
-            recent = conversation_history[-10:]
-            lines = []
-            for m in recent:
-                role = (m.get("role") or "user").strip().lower()
-                content = (m.get("content") or "").strip()
-                if not content:
-                    continue
-                label = "Usuário" if role == "user" else "Assistente"
-                lines.append(f"{label}: {content[:500]}{'...' if len(content) > 500 else ''}")
-            if lines:
-                history_block = "\n\n**Histórico recente da conversa (use para manter o contexto até finalizar o cadastro/baixa):**\n" + "\n".join(lines) + "\n\n"
+        lines = token_budget.linhas_historico(conversation_history, max_mensagens=10)
+        if lines:
+            history_block = "\n\n**Histórico recente da conversa (use para manter o contexto até finalizar o cadastro/baixa):**\n" + "\n".join(lines) + "\n\n"
 
         template = PromptConfigManager.get_or_default(
             self.db, KEY_ACCOUNTS_AGENT_PARSE,
@@ -934,49 +918,28 @@ class AccountsAgentService:
             }
 
         try:
-            client, error = self.ai_service._get_client()
+            result_text, error = self.ai_service.complete(
+                prompt, temperature=0.2, max_tokens=None, json_mode=True, cache=SITE_ACCOUNTS_PARSE
+            )
             if error:
                 return {"status": "error", "message": error, "questions": [], "records": []}
 
-            config = self.ai_service.config
-            provider = config["provider"]
-            model = config.get("model", "")
-
-            if provider == "openai":
-                r = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.2,
-                    response_format={"type": "json_object"},
-                )
-                result_text = r.choices[0].message.content
-            elif provider == "gemini":
-                r = client.generate_content(prompt)
-                result_text = r.text
-            elif provider == "groq":
-                r = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.2,
-                    response_format={"type": "json_object"},
-                )
-                result_text = r.choices[0].message.content
-            elif provider == "ollama":
-                r = client.chat(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    options={"temperature": 0.2},
-                )
-                result_text = r.get("message", {}).get("content", "")
-            else:
-                return {"status": "error", "message": f"Provedor {provider} não suportado.", "questions": [], "records": []}
-
             parsed = _parse_ai_response(result_text)
         except json.JSONDecodeError as e:
             return {"status": "error", "message": f"Erro ao interpretar resposta: {str(e)}", "questions": [], "records": []}
         except Exception as e:
             return {"status": "error", "message": str(e), "questions": [], "records": []}
 
+        return self._resultado_parsed(parsed, message, context, conversation_history)
+
+    def _resultado_parsed(
+        self,
+        parsed: Dict[str, Any],
+        message: str,
+        context: Dict[str, Any],
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """Monta need_info/confirm a partir do JSON interpretado (pela IA do agente ou pelo planejador de turno)."""
         # Fallback: usar a resposta atual do usuário como preenchimento quando a última mensagem do assistente foi uma pergunta (evita loop)
         self._apply_conversation_context_fallback(parsed, message, conversation_history)
 
@@ -14,9 +14,10 @@ from config.prompt_config import (
     PromptConfigManager,
     safe_substitute_prompt,
 )
-from mcp import MCPDetector, MCPExtractor, MCPFormatter, MCPValidator
+from mcp import Pipeline
 from models.personal_agenda import PersonalAgenda
-from services.ai_service import AIService
+from services import token_budget
+from services.llm_cache import SITE_AGENDA_PARSE
 
 
 def _hoje() -> str:
@@ -38,9 +39,11 @@ class AgendaAgentService:
     Retorna need_info (perguntas), confirm (resumo para confirmar) ou error.
     """
 
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, pipeline: Optional[Pipeline] = None):
         self.db = db
-        self.ai_service = AIService(db)
+        # Pipeline MCP do turno (compartilhado com a página e os outros agentes); o AIService é o dele
+        self.pipeline = pipeline or Pipeline(db)
+        self.ai_service = self.pipeline.ai
 
     def is_available(self) -> bool:
         return self.ai_service.is_available()
@@ -49,13 +52,18 @@ class AgendaAgentService:
         self,
         message: str,
         conversation_history: Optional[List[Dict[str, Any]]] = None,
+        plano: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
         """
         Interpreta a mensagem e retorna:
         - status: "need_info" | "confirm" | "error"
         - message: texto para exibir
         - record: dict com titulo, descricao, data, hora (quando status == "confirm")
+        plano: campos do compromisso já extraídos pelo planejador de turno (mesmo formato do JSON do prompt do agente);
+        quando informado, não há detecção/extração nem nova chamada à IA.
         """
+        if plano is not None:
+            return self._resultado_parsed(dict(plano), message, conversation_history)
         SUGESTAO_DESCRICAO_PREFIX = "**Sugestão de descrição:**"
         # --- Resposta à pergunta de descrição opcional: manter contexto, sem novas voltas ---
         if conversation_history and len(conversation_history) >= 1:
@@ -71,14 +79,12 @@ class AgendaAgentService:
                             break
                     if prev_user and len(prev_user) > 5:
                         ctx_agenda = {"pagina": "agenda"}
-                        detector = MCPDetector(self.db)
-                        det = detector.detect(prev_user, ctx_agenda)
+                        det = self.pipeline.detect(prev_user, ctx_agenda)
                         if det.entity == "agenda" and det.action == "INSERT":
-                            extractor = MCPExtractor(self.db)
-                            ext = extractor.extract(prev_user, "INSERT", "agenda", ctx_agenda)
+                            ext = self.pipeline.extract(prev_user, "INSERT", "agenda", ctx_agenda)
                             data = dict(ext.data)
                             if not ext.missing_fields and data.get("titulo") and data.get("data"):
-                                val = MCPValidator(self.db).validate(data, "INSERT", "agenda")
+                                val = self.pipeline.validate(data, "INSERT", "agenda")
                                 if val.valid:
                                     user_reply = (message or "").strip()
                                     confirmar_desc = user_reply.lower() in ("sim", "confirmar", "confirmo", "ok", "okay", "pode ser", "isso", "quero")
@@ -98,17 +104,15 @@ class AgendaAgentService:
                                         "data": data_str,
                                         "hora": (data.get("hora") or "").strip() or None,
                                     }
-                                    fmt = MCPFormatter(self.db).format("INSERT", record, None, "agenda")
+                                    fmt = self.pipeline.format("INSERT", record, None, "agenda")
                                     return {"status": "confirm", "message": fmt.message, "record": record}
 
         # --- MCP: tentar detect + extract + validate + format (contexto agenda) ---
         try:
             ctx_agenda = {"pagina": "agenda"}
-            detector = MCPDetector(self.db)
-            det = detector.detect(message, ctx_agenda)
+            det = self.pipeline.detect(message, ctx_agenda)
             if det.entity == "agenda" and det.action == "INSERT" and det.confidence >= 0.5:
-                extractor = MCPExtractor(self.db)
-                ext = extractor.extract(message, "INSERT", "agenda", ctx_agenda)
+                ext = self.pipeline.extract(message, "INSERT", "agenda", ctx_agenda)
                 data = dict(ext.data)
                 if ext.missing_fields:
                     _q = {
@@ -121,9 +125,9 @@ class AgendaAgentService:
                         "message": "**Preciso de mais informações:**\n\n" + "\n".join(f"- {q}" for q in questions),
                         "record": None,
                     }
-                val = MCPValidator(self.db).validate(data, "INSERT", "agenda")
+                val = self.pipeline.validate(data, "INSERT", "agenda")
                 if not val.valid:
-                    msg = getattr(val, "message_ia", None) or "\n".join(val.errors)
+                    msg = val.message_ia or val.message or "\n".join(val.errors)
                     return {
                         "status": "error",
                         "message": msg,
@@ -139,7 +143,7 @@ class AgendaAgentService:
                         "message": f"**Sugestão de descrição:** {sugestao}.\n\nConfirma ou envie outra (opcional — **não** para sem descrição).",
                         "record": None,
                     }
-                fmt = MCPFormatter(self.db).format("INSERT", data, None, "agenda")
+                fmt = self.pipeline.format("INSERT", data, None, "agenda")
                 data_str = data.get("data") or date.today().isoformat()
                 if hasattr(data_str, "isoformat"):
                     data_str = data_str.isoformat()
@@ -155,18 +159,9 @@ class AgendaAgentService:
 
         data_hoje = _hoje()
         history_block = ""
-        if conversation_history:
-            recent = conversation_history[-10:]
-            lines = []
-            for m in recent:
-                role = (m.get("role") or "user").strip().lower()
-                content = (m.get("content") or "").strip()
-                if not content:
-                    continue
-                label = "Usuário" if role == "user" else "Assistente"
-                lines.append(f"{label}: {content[:500]}{'...' if len(content) > 500 else ''}")
-            if lines:
-                history_block = "\n\n**Histórico recente (use para manter o contexto):**\n" + "\n".join(lines) + "\n\n"
+        lines = token_budget.linhas_historico(conversation_history, max_mensagens=10)
+        if lines:
+            history_block = "\n\n**Histórico recente (use para manter o contexto):**\n" + "\n".join(lines) + "\n\n"
 
         template = PromptConfigManager.get_or_default(
             self.db,
@@ -188,37 +183,11 @@ class AgendaAgentService:
             }
 
         try:
-            client, error = self.ai_service._get_client()
+            result_text, error = self.ai_service.complete(
+                prompt, temperature=0.2, max_tokens=None, json_mode=True, cache=SITE_AGENDA_PARSE
+            )
             if error:
                 return {"status": "error", "message": error, "record": None}
-            config = self.ai_service.config
-            provider = config["provider"]
-            model = config.get("model", "")
-            result_text = ""
-            if provider == "openai":
-                r = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.2,
-                    response_format={"type": "json_object"},
-                )
-                result_text = r.choices[0].message.content or ""
-            elif provider == "gemini":
-                r = client.generate_content(prompt)
-                result_text = r.text or ""
-            elif provider == "groq":
-                r = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.2,
-                    response_format={"type": "json_object"},
-                )
-                result_text = r.choices[0].message.content or ""
-            elif provider == "ollama":
-                r = client.chat(model=model, messages=[{"role": "user", "content": prompt}], options={"temperature": 0.2})
-                result_text = r.get("message", {}).get("content", "") or ""
-            else:
-                return {"status": "error", "message": f"Provedor {provider} não suportado.", "record": None}
 
             parsed = _parse_ai_response(result_text)
         except json.JSONDecodeError as e:
@@ -226,6 +195,15 @@ class AgendaAgentService:
         except Exception as e:
             return {"status": "error", "message": str(e), "record": None}
 
+        return self._resultado_parsed(parsed, message, conversation_history)
+
+    def _resultado_parsed(
+        self,
+        parsed: Dict[str, Any],
+        message: str,
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """Monta need_info/confirm a partir do JSON interpretado (pela IA do agente ou pelo planejador de turno)."""
         self._apply_conversation_context_fallback(parsed, message, conversation_history)
 
         titulo = (parsed.get("titulo") or "").strip() or None
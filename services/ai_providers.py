@@ -0,0 +1,182 @@
+"""
+Camada de provedores de IA: um adaptador por tipo de API com a mesma interface chat(...) e um registro
+de clientes por processo, por (provedor, chave, URL base). Reaproveitar o cliente mantém o pool de
+conexões HTTP (keep-alive) entre chamadas, páginas e sessões em vez de abrir conexões novas a cada
+AIService criado. As novas tentativas dos SDKs ficam desligadas (max_retries=0): quem decide repetir é
+services.llm_resilience, dentro do prazo da chamada.
+"""
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+MODELOS_PADRAO = {
+    "openai": "gpt-4o-mini",
+    "gemini": "gemini-1.5-flash",
+    "groq": "llama-3.3-70b-versatile",
+    "ollama": "llama3.2",
+}
+OLLAMA_URL_PADRAO = "http://localhost:11434"
+
+Mensagens = List[Dict[str, str]]
+Resposta = Union[Optional[str], Iterator[str]]
+
+
+class ProviderAdapter(ABC):
+    """Interface comum: chat(...) devolve o texto completo ou, com stream=True, um gerador de trechos."""
+
+    provider = ""
+
+    def __init__(self, client):
+        self.client = client
+
+    @abstractmethod
+    def chat(
+        self,
+        model: str,
+        messages: Mensagens,
+        temperature: float = 0.3,
+        max_tokens: Optional[int] = 300,
+        json_mode: bool = False,
+        stream: bool = False,
+        timeout: Optional[float] = None,
+    ) -> Resposta:
+        ...
+
+
+class OpenAICompatAdapter(ProviderAdapter):
+    """OpenAI, Groq e Ollama (endpoint /v1 compatível com OpenAI): chat.completions.create."""
+
+    def __init__(self, client, provider: str):
+        super().__init__(client)
+        self.provider = provider
+
+    def chat(self, model, messages, temperature=0.3, max_tokens=300, json_mode=False, stream=False, timeout=None):
+        kwargs: Dict[str, Any] = {"model": model, "messages": messages, "temperature": temperature}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+        if json_mode and self.provider in ("openai", "groq"):
+            kwargs["response_format"] = {"type": "json_object"}
+        if stream:
+            r = self.client.chat.completions.create(stream=True, **kwargs)
+            return (c.choices[0].delta.content or "" for c in r if c.choices)
+        r = self.client.chat.completions.create(**kwargs)
+        return (r.choices[0].message.content or "").strip() or None
+
+
+class GeminiAdapter(ProviderAdapter):
+    """Google Gemini (google-generativeai): generate_content com o histórico convertido para o formato do Gemini."""
+
+    provider = "gemini"
+
+    def __init__(self, genai, api_key: str):
+        super().__init__(genai)
+        self._api_key = api_key
+        self._modelos: Dict[str, Any] = {}
+
+    def _modelo(self, model: str):
+        if model not in self._modelos:
+            self.client.configure(api_key=self._api_key)
+            self._modelos[model] = self.client.GenerativeModel(model)
+        return self._modelos[model]
+
+    @staticmethod
+    def _conteudos(messages: Mensagens) -> List[Dict[str, Any]]:
+        """system vai junto da primeira mensagem do usuário; assistant vira "model"."""
+        sistema = "\n\n".join(m["content"] for m in messages if m.get("role") == "system")
+        conteudos = []
+        for m in messages:
+            if m.get("role") == "system":
+                continue
+            texto = m.get("content") or ""
+            if sistema and not conteudos:
+                texto = sistema + "\n\n" + texto
+            conteudos.append({"role": "model" if m.get("role") == "assistant" else "user", "parts": [texto]})
+        return conteudos or [{"role": "user", "parts": [sistema]}]
+
+    def chat(self, model, messages, temperature=0.3, max_tokens=300, json_mode=False, stream=False, timeout=None):
+        config: Dict[str, Any] = {"temperature": temperature}
+        if max_tokens is not None:
+            config["max_output_tokens"] = max_tokens
+        if json_mode:
+            config["response_mime_type"] = "application/json"
+        r = self._modelo(model).generate_content(
+            self._conteudos(messages),
+            generation_config=config,
+            stream=stream,
+            request_options={"timeout": timeout} if timeout is not None else None,
+        )
+        if stream:
+            return (c.text or "" for c in r)
+        return (r.text or "").strip() or None
+
+
+# --- Registro de clientes por processo ---
+_lock = threading.Lock()
+_adaptadores: Dict[Tuple[str, str, str], ProviderAdapter] = {}
+
+
+def _url_ollama(base_url: Optional[str]) -> str:
+    url = (base_url or OLLAMA_URL_PADRAO).rstrip("/")
+    return url if url.endswith("/v1") else url + "/v1"
+
+
+def _criar(provider: str, api_key: str, base_url: Optional[str]) -> Tuple[Optional[ProviderAdapter], Optional[str]]:
+    if provider in ("openai", "ollama"):
+        try:
+            from openai import OpenAI
+        except ImportError:
+            return None, "Biblioteca 'openai' não instalada. Execute: pip install openai"
+        if provider == "ollama":
+            return OpenAICompatAdapter(
+                OpenAI(api_key=api_key or "ollama", base_url=_url_ollama(base_url), max_retries=0), "ollama"
+            ), None
+        return OpenAICompatAdapter(OpenAI(api_key=api_key, max_retries=0), "openai"), None
+    if provider == "groq":
+        try:
+            from groq import Groq
+        except ImportError:
+            return None, "Biblioteca 'groq' não instalada. Execute: pip install groq"
+        return OpenAICompatAdapter(Groq(api_key=api_key, max_retries=0), "groq"), None
+    if provider == "gemini":
+        try:
+            import google.generativeai as genai
+        except ImportError:
+            return None, "Biblioteca 'google-generativeai' não instalada. Execute: pip install google-generativeai"
+        return GeminiAdapter(genai, api_key), None
+    return None, f"Provedor '{provider}' não suportado"
+
+
+def obter_adaptador(
+    provider: str, api_key: Optional[str], base_url: Optional[str] = None
+) -> Tuple[Optional[ProviderAdapter], Optional[str]]:
+    """
+    Adaptador (com cliente) do provedor, reaproveitado no processo para a mesma chave e URL.
+    Ao trocar a chave ou a URL de um provedor, o cliente anterior é descartado.
+    Retorna (adaptador, error_message).
+    """
+    api_key = (api_key or "").strip()
+    if provider != "ollama" and not api_key:
+        return None, f"Chave de API não configurada para {provider}"
+    chave = (provider, api_key, (base_url or "").strip() if provider == "ollama" else "")
+    with _lock:
+        adaptador = _adaptadores.get(chave)
+        if adaptador is not None:
+            return adaptador, None
+        try:
+            adaptador, err = _criar(provider, api_key, base_url)
+        except Exception as e:
+            return None, f"Erro ao inicializar cliente de IA ({provider}): {str(e)}"
+        if adaptador is None:
+            return None, err
+        for antiga in [k for k in _adaptadores if k[0] == provider]:
+            del _adaptadores[antiga]
+        _adaptadores[chave] = adaptador
+        return adaptador, None
+
+
+def limpar_clientes() -> None:
+    """Descarta todos os clientes (ex.: após alterar a configuração de IA no Admin)."""
+    with _lock:
+        _adaptadores.clear()
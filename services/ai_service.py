@@ -1,17 +1,21 @@
 """
 Serviço de IA para o agente de relatórios (análise de pergunta e formatação de resposta).
 """
-from typing import Optional, Tuple
+import json
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 from sqlalchemy.orm import Session
 
 from config.ai_config import AIConfigManager
+from services import llm_cache, llm_resilience, token_budget
+from services.ai_providers import MODELOS_PADRAO, obter_adaptador
 
 
 class AIService:
     """
     Serviço mínimo para chamadas à API de IA (OpenAI, Gemini, Groq, Ollama).
-    Usado pelo agente de relatórios para analyze_query e format_response.
+    Todas as chamadas passam por chat(); o cliente de cada provedor é compartilhado no processo
+    (services.ai_providers) e a configuração vem do cache do AIConfigManager.
     """
 
     def __init__(self, db: Session):
@@ -25,165 +29,213 @@ class AIService:
 
     def _get_client(self):
         """
-        Retorna o cliente da API de IA conforme o provedor configurado.
-        Retorna (client, error_message); error_message é None em caso de sucesso.
-        Para Gemini, client é um GenerativeModel (usa generate_content).
+        Retorna o adaptador do provedor configurado (services.ai_providers), com o cliente reaproveitado no processo.
+        Retorna (adaptador, error_message); error_message é None em caso de sucesso.
         """
         if not self.config:
             return None, "Configuração de IA não encontrada"
-
         if self._client is not None:
             return self._client, None
-
-        provider = self.config["provider"]
-        api_key = (self.config.get("api_key") or "").strip()
-
-        if provider != "ollama" and not api_key:
-            return None, f"Chave de API não configurada para {provider}"
-
-        try:
-            if provider == "openai":
-                try:
-                    from openai import OpenAI
-                except ImportError:
-                    return None, "Biblioteca 'openai' não instalada. Execute: pip install openai"
-                self._client = OpenAI(api_key=api_key)
-                return self._client, None
-
-            if provider == "gemini":
-                try:
-                    import google.generativeai as genai
-                except ImportError:
-                    return None, "Biblioteca 'google-generativeai' não instalada. Execute: pip install google-generativeai"
-                genai.configure(api_key=api_key)
-                model_name = self.config.get("model", "gemini-1.5-flash")
-                self._client = genai.GenerativeModel(model_name)
-                return self._client, None
-
-            if provider == "ollama":
-                try:
-                    from openai import OpenAI
-                except ImportError:
-                    return None, "Biblioteca 'openai' não instalada. Execute: pip install openai"
-                base_url = self.config.get("base_url", "http://localhost:11434") or "http://localhost:11434"
-                if not base_url.rstrip("/").endswith("/v1"):
-                    base_url = base_url.rstrip("/") + "/v1"
-                self._client = OpenAI(api_key="ollama", base_url=base_url)
-                return self._client, None
-
-            if provider == "groq":
-                try:
-                    from groq import Groq
-                except ImportError:
-                    return None, "Biblioteca 'groq' não instalada. Execute: pip install groq"
-                self._client = Groq(api_key=api_key)
-                return self._client, None
-
-            return None, f"Provedor '{provider}' não suportado"
-
-        except Exception as e:
-            return None, f"Erro ao inicializar cliente de IA ({provider}): {str(e)}"
+        adaptador, err = obter_adaptador(
+            self.config["provider"], self.config.get("api_key"), self.config.get("base_url")
+        )
+        if adaptador is not None:
+            self._client = adaptador
+        return adaptador, err
 
     def test_connection(self):
         """
         Testa a conexão com a API (chamada mínima).
         Retorna (success: bool, message: str).
         """
-        client, error = self._get_client()
+        adaptador, error = self._get_client()
         if error:
             return False, error
-        provider = self.config["provider"]
-        model = self.config.get("model", "")
+        _, model = self._provider_model()
         try:
-            if provider == "openai":
-                client.chat.completions.create(
-                    model=model or "gpt-4o-mini",
-                    messages=[{"role": "user", "content": "Diga apenas OK"}],
-                    max_tokens=5,
-                )
-            elif provider == "gemini":
-                client.generate_content("Diga apenas OK")
-            elif provider == "groq":
-                client.chat.completions.create(
-                    model=model or "llama-3.3-70b-versatile",
-                    messages=[{"role": "user", "content": "Diga apenas OK"}],
-                    max_tokens=5,
-                )
-            elif provider == "ollama":
-                client.chat(
-                    model=model or "llama3.2",
-                    messages=[{"role": "user", "content": "Diga apenas OK"}],
-                    options={"num_predict": 5},
-                )
-            else:
-                return False, f"Provedor {provider} não suportado"
-            return True, "Conexão com a API realizada com sucesso."
+            # Direto no provedor configurado: sem novas tentativas, disjuntor nem provedores de reserva
+            adaptador.chat(
+                model, [{"role": "user", "content": "Diga apenas OK"}], max_tokens=5,
+                timeout=llm_resilience.PRAZO_TENTATIVA,
+            )
         except Exception as e:
             return False, str(e)
+        return True, "Conexão com a API realizada com sucesso."
+
+    def _provider_model(self) -> Tuple[str, str]:
+        """(provedor, modelo) da configuração; sem modelo configurado, o padrão de cada provedor."""
+        provider = self.config["provider"]
+        return provider, self.config.get("model", "") or MODELOS_PADRAO.get(provider, "")
+
+    def _cache_lookup(
+        self,
+        cache: Optional[str],
+        provider: str,
+        model: str,
+        prompt: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        json_mode: bool,
+        depende_dados: bool,
+    ) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """Consulta o cache persistente. Retorna (chave, versão dos dados, resposta em cache ou None)."""
+        if not cache:
+            return None, None, None
+        try:
+            data_version = llm_cache.versao_dados(self.db) if depende_dados else None
+            key = llm_cache.chave_cache(
+                provider, model, temperature, prompt,
+                extra={"max_tokens": max_tokens, "json": json_mode},
+                data_version=data_version,
+            )
+            return key, data_version, llm_cache.obter(key, cache)
+        except Exception:
+            return None, None, None
+
+    def _cadeia(self, adaptador, provider: str, model: str) -> Iterator[Tuple[str, str, object]]:
+        """(provedor, modelo, adaptador) na ordem de tentativa: o ativo e depois os de reserva (AI_FALLBACK_CHAIN)."""
+        yield provider, model, adaptador
+        for cfg in AIConfigManager.get_fallback_configs(self.db):
+            adapt, err = obter_adaptador(cfg["provider"], cfg.get("api_key"), cfg.get("base_url"))
+            if err:
+                llm_resilience.registrar_evento(cfg["provider"], "indisponivel", err)
+            yield cfg["provider"], cfg.get("model") or MODELOS_PADRAO.get(cfg["provider"], ""), adapt
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.3,
+        max_tokens: Optional[int] = 300,
+        json_mode: bool = False,
+        stream: bool = False,
+        cache: Optional[str] = None,
+        depende_dados: bool = False,
+        prazo: Optional[float] = None,
+    ) -> Tuple[Optional[Union[str, Iterator[str]]], Optional[str]]:
+        """
+        Ponto único de chamada à IA: mensagens no formato [{"role": "system"|"user"|"assistant", "content": ...}].
+        Retorna (content, error): content é o texto (ou, com stream=True, um gerador de trechos para st.write_stream);
+        em falha content é None e error é a mensagem.
+        json_mode=True usa o modo JSON nativo onde existe (OpenAI, Groq, Gemini); no Ollama o prompt já deve pedir JSON.
+        max_tokens=None não limita a resposta.
+        cache: nome do ponto de chamada (ex.: llm_cache.SITE_ANALYZE_QUERY) para usar o cache persistente;
+        depende_dados=True inclui a versão dos dados na chave (prompts que embutem dados do banco).
+        Com stream, a requisição é feita antes de retornar (erros de conexão/autenticação vêm em error), um acerto
+        de cache devolve a resposta inteira de uma vez e o texto completo é gravado ao fim do stream.
+        prazo: segundos para a chamada inteira (padrão llm_resilience.PRAZO_PADRAO). Erros transitórios são
+        repetidos dentro do prazo; se o provedor falhar ou estiver em pausa (disjuntor), tenta os provedores de
+        reserva (AI_FALLBACK_CHAIN) e, sem nenhum, retorna o erro para o chamador usar seu fallback.
+        Os tokens estimados do prompt e da resposta de cada chamada ao provedor vão para services.token_budget.
+        """
+        adaptador, err = self._get_client()
+        if err:
+            return None, err
+        provider, model = self._provider_model()
+        # Uma única mensagem do usuário usa o próprio texto na chave (mesma chave de antes do chat)
+        if len(messages) == 1 and messages[0].get("role") == "user":
+            texto_chave = messages[0].get("content") or ""
+        else:
+            texto_chave = json.dumps(messages, ensure_ascii=False, sort_keys=True)
+        key, data_version, hit = self._cache_lookup(
+            cache, provider, model, texto_chave, temperature, max_tokens, json_mode, depende_dados
+        )
+        if hit is not None:
+            return (iter([hit]) if stream else hit), None
+
+        limite = llm_resilience.Prazo(prazo)
+        erros = []
+        for i, (prov, mod, adapt) in enumerate(self._cadeia(adaptador, provider, model)):
+            if adapt is None:
+                continue
+            resposta, erro = llm_resilience.executar(
+                prov,
+                lambda t, a=adapt, m=mod: a.chat(
+                    m, messages, temperature=temperature, max_tokens=max_tokens,
+                    json_mode=json_mode, stream=stream, timeout=t,
+                ),
+                limite,
+                ponto=cache,
+            )
+            if erro is None:
+                if i > 0:
+                    llm_resilience.registrar_evento(prov, "fallback", f"respondeu no lugar de {provider}", cache)
+                    # Resposta de reserva não vai para o cache: volta a valer o provedor principal quando ele se recuperar
+                    key = None
+                break
+            erros.append((prov, erro))
+        else:
+            detalhe = "; ".join(f"{p}: {e}" for p, e in erros)
+            llm_resilience.registrar_evento(provider, "sem_resposta", detalhe, cache)
+            return None, erros[0][1] if erros else "Nenhum provedor de IA disponível"
+        tokens_prompt = sum(token_budget.estimar_tokens(m.get("content")) for m in messages)
+        if not stream:
+            token_budget.registrar_chamada(cache, prov, tokens_prompt, token_budget.estimar_tokens(resposta))
+            if resposta and key:
+                llm_cache.salvar(key, cache, prov, mod, resposta, data_version=data_version)
+            return resposta, None
+
+        def _gerar() -> Iterator[str]:
+            recebido = []
+            try:
+                for parte in resposta:
+                    if parte:
+                        recebido.append(parte)
+                        yield parte
+            except Exception:
+                # Conexão interrompida no meio: mantém o que já foi exibido, sem gravar no cache
+                token_budget.registrar_chamada(cache, prov, tokens_prompt, token_budget.estimar_tokens("".join(recebido)))
+                return
+            texto = "".join(recebido).strip()
+            token_budget.registrar_chamada(cache, prov, tokens_prompt, token_budget.estimar_tokens(texto))
+            if texto and key:
+                llm_cache.salvar(key, cache, prov, mod, texto, data_version=data_version)
+
+        return _gerar(), None
 
     def complete(
         self,
         prompt: str,
         temperature: float = 0.3,
-        max_tokens: int = 300,
+        max_tokens: Optional[int] = 300,
         json_mode: bool = False,
+        cache: Optional[str] = None,
+        depende_dados: bool = False,
+        prazo: Optional[float] = None,
     ) -> Tuple[Optional[str], Optional[str]]:
         """
-        Envia um prompt e retorna o texto da resposta.
+        Envia um prompt (uma mensagem do usuário) e retorna o texto da resposta. Atalho para chat(); mesmos parâmetros.
         Retorna (content, error): em sucesso content é o texto e error é None;
         em falha content é None e error é a mensagem.
-        Para json_mode=True, usa response_format onde suportado (OpenAI, Groq);
-        para Gemini/Ollama o prompt já deve pedir JSON.
         """
-        client, err = self._get_client()
-        if err:
-            return None, err
-        if not self.config:
-            return None, "Configuração de IA não encontrada"
-        provider = self.config["provider"]
-        model = self.config.get("model", "") or (
-            "gpt-4o-mini" if provider == "openai"
-            else "gemini-1.5-flash" if provider == "gemini"
-            else "llama-3.3-70b-versatile" if provider == "groq"
-            else "llama3.2"
+        return self.chat(
+            [{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            json_mode=json_mode,
+            cache=cache,
+            depende_dados=depende_dados,
+            prazo=prazo,
+        )
+
+    def complete_stream(
+        self,
+        prompt: str,
+        temperature: float = 0.3,
+        max_tokens: Optional[int] = 300,
+        cache: Optional[str] = None,
+        depende_dados: bool = False,
+        prazo: Optional[float] = None,
+    ) -> Tuple[Optional[Iterator[str]], Optional[str]]:
+        """
+        Como complete(), mas a resposta chega em partes (streaming) à medida que o provedor gera o texto.
+        Retorna (partes, error): partes é um gerador de trechos de texto (para st.write_stream) ou None em falha.
+        """
+        return self.chat(
+            [{"role": "user", "content": prompt}],
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            cache=cache,
+            depende_dados=depende_dados,
+            prazo=prazo,
         )
-        try:
-            if provider == "openai":
-                kwargs = {
-                    "model": model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                }
-                if json_mode:
-                    kwargs["response_format"] = {"type": "json_object"}
-                r = client.chat.completions.create(**kwargs)
-                content = (r.choices[0].message.content or "").strip()
-                return (content or None, None)
-            if provider == "gemini":
-                r = client.generate_content(prompt)
-                content = (r.text or "").strip()
-                return (content or None, None)
-            if provider == "groq":
-                kwargs = {
-                    "model": model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": temperature,
-                    "max_tokens": max_tokens,
-                }
-                if json_mode:
-                    kwargs["response_format"] = {"type": "json_object"}
-                r = client.chat.completions.create(**kwargs)
-                content = (r.choices[0].message.content or "").strip()
-                return (content or None, None)
-            if provider == "ollama":
-                r = client.chat(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    options={"temperature": temperature, "num_predict": max_tokens},
-                )
-                content = (r.get("message", {}).get("content") or "").strip()
-                return (content or None, None)
-            return None, f"Provedor '{provider}' não suportado"
-        except Exception as e:
-            return None, str(e)
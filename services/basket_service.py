@@ -0,0 +1,281 @@
+"""
+Análise de cesta (produtos comprados juntos): matriz esparsa de coocorrência a partir de sale_items
+agrupados por sale_id, com suporte, confiança e lift dos pares.
+As contagens ficam em tabelas próprias e são atualizadas de forma incremental (último sale_id processado),
+uma atualização por vez (trava no processo + linha de estado relida com FOR UPDATE dentro da transação) e só com
+vendas gravadas há mais de MARGEM_SEGUNDOS: uma venda de id menor que ainda não tinha sido confirmada quando uma de
+id maior foi processada não fica para trás. A atualização roda em segundo plano (início do app e consultas do chat).
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Float, case, cast, or_
+from sqlalchemy.orm import Session, aliased
+
+from config.database import SessionLocal, engine
+from models.basket_analysis import BasketAnalysisState, ProductBasketCount, ProductPairCount
+from models.product import Product
+from models.sale import Sale, SaleItem
+
+LOTE_VENDAS = 5000
+# Vendas mais novas que isto ficam para a próxima atualização (transações de venda ainda abertas)
+MARGEM_SEGUNDOS = 120
+_IN_CHUNK = 500
+
+_lock = threading.RLock()  # uma atualização/reprocessamento por vez no processo
+_lock_fundo = threading.Lock()
+_atualizando = False
+
+
+def _ensure_tables():
+    """Cria as tabelas da análise de cesta se não existirem (ex.: app rodando antes do modelo ser adicionado)."""
+    for model in (BasketAnalysisState, ProductBasketCount, ProductPairCount):
+        model.__table__.create(engine, checkfirst=True)
+
+
+def _get_state(db: Session, travar: bool = False) -> BasketAnalysisState:
+    """
+    Retorna (ou cria) a linha única de estado do processamento. travar: relê a linha do banco com FOR UPDATE
+    (outra sessão que esteja atualizando espera o commit desta).
+    """
+    q = db.query(BasketAnalysisState).filter(BasketAnalysisState.id == 1)
+    if travar:
+        q = q.populate_existing().with_for_update()
+    state = q.first()
+    if state is None:
+        state = BasketAnalysisState(id=1, last_sale_id=0, total_cestas=0)
+        db.add(state)
+        db.flush()
+    return state
+
+
+def _contar_coocorrencias(
+    sale_ids: np.ndarray, product_ids: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Conta cestas por produto e por par de produtos.
+    Usa matriz esparsa cesta × produto (scipy.sparse) e X.T @ X; sem scipy, faz a junção da cesta com ela mesma em pandas.
+    Retorna (produtos, cestas_por_produto, par_a, par_b, cestas_por_par), com par_a < par_b.
+    """
+    cestas, b_idx = np.unique(sale_ids, return_inverse=True)
+    produtos, p_idx = np.unique(product_ids, return_inverse=True)
+    try:
+        from scipy import sparse
+    except ImportError:
+        sparse = None
+
+    if sparse is not None:
+        x = sparse.csr_matrix(
+            (np.ones(len(b_idx), dtype=np.int32), (b_idx, p_idx)),
+            shape=(len(cestas), len(produtos)),
+        )
+        x.sum_duplicates()
+        x.data[:] = 1  # presença do produto na cesta (ignora linhas repetidas do mesmo produto)
+        por_produto = np.asarray(x.sum(axis=0)).ravel().astype(np.int64)
+        co = sparse.triu(x.T @ x, k=1).tocoo()
+        return produtos, por_produto, produtos[co.row], produtos[co.col], co.data.astype(np.int64)
+
+    df = pd.DataFrame({"b": b_idx, "p": p_idx}).drop_duplicates()
+    por_produto = np.bincount(df["p"].to_numpy(), minlength=len(produtos)).astype(np.int64)
+    pares = df.merge(df, on="b", suffixes=("_a", "_b"))
+    pares = pares[pares["p_a"] < pares["p_b"]]
+    agrupado = pares.groupby(["p_a", "p_b"]).size()
+    a = agrupado.index.get_level_values(0).to_numpy()
+    b = agrupado.index.get_level_values(1).to_numpy()
+    return produtos, por_produto, produtos[a], produtos[b], agrupado.to_numpy().astype(np.int64)
+
+
+def _somar_contagens_produto(db: Session, produtos: np.ndarray, contagens: np.ndarray) -> None:
+    """Soma as contagens do lote às contagens acumuladas por produto."""
+    novos = dict(zip(produtos.tolist(), contagens.tolist()))
+    ids = list(novos)
+    for i in range(0, len(ids), _IN_CHUNK):
+        chunk = ids[i:i + _IN_CHUNK]
+        for row in db.query(ProductBasketCount).filter(ProductBasketCount.product_id.in_(chunk)):
+            row.cestas += novos.pop(row.product_id)
+    db.add_all([ProductBasketCount(product_id=pid, cestas=n) for pid, n in novos.items()])
+
+
+def _somar_contagens_pares(db: Session, par_a: np.ndarray, par_b: np.ndarray, contagens: np.ndarray) -> None:
+    """Soma as contagens do lote às contagens acumuladas por par (busca os pares existentes por product_a_id)."""
+    novos = dict(zip(zip(par_a.tolist(), par_b.tolist()), contagens.tolist()))
+    a_ids = sorted(set(par_a.tolist()))
+    for i in range(0, len(a_ids), _IN_CHUNK):
+        chunk = a_ids[i:i + _IN_CHUNK]
+        for row in db.query(ProductPairCount).filter(ProductPairCount.product_a_id.in_(chunk)):
+            key = (row.product_a_id, row.product_b_id)
+            if key in novos:
+                row.cestas += novos.pop(key)
+    db.add_all([ProductPairCount(product_a_id=a, product_b_id=b, cestas=n) for (a, b), n in novos.items()])
+
+
+def atualizar_cestas(
+    db: Session,
+    lote: int = LOTE_VENDAS,
+    max_lotes: Optional[int] = None,
+    margem_segundos: float = MARGEM_SEGUNDOS,
+) -> Dict[str, Any]:
+    """
+    Processa as vendas concluídas com id maior que o último processado, em lotes de `lote` vendas
+    (um commit por lote). Vendas canceladas depois de processadas continuam contadas até um reprocessamento.
+    O lote para na primeira venda gravada há menos de margem_segundos (pode haver id menor ainda sem commit).
+    Uma atualização por vez: trava no processo e linha de estado relida com FOR UPDATE a cada lote.
+    Retorna {"vendas_processadas", "last_sale_id", "total_cestas"}.
+    """
+    _ensure_tables()
+    with _lock:
+        return _atualizar(db, lote, max_lotes, margem_segundos)
+
+
+def _atualizar(db: Session, lote: int, max_lotes: Optional[int], margem_segundos: float) -> Dict[str, Any]:
+    processadas = 0
+    lotes = 0
+    state = _get_state(db, travar=True)
+    while max_lotes is None or lotes < max_lotes:
+        corte = datetime.utcnow() - timedelta(seconds=margem_segundos)
+        ids = []
+        for sale_id, criada_em in (
+            db.query(Sale.id, Sale.created_at)
+            .filter(Sale.id > state.last_sale_id)
+            .order_by(Sale.id)
+            .limit(lote)
+            .all()
+        ):
+            if criada_em is not None and criada_em > corte:
+                break
+            ids.append(sale_id)
+        if not ids:
+            break
+        ultimo = ids[-1]
+        itens = (
+            db.query(SaleItem.sale_id, SaleItem.product_id)
+            .join(Sale, Sale.id == SaleItem.sale_id)
+            .filter(Sale.id > state.last_sale_id)
+            .filter(Sale.id <= ultimo)
+            .filter(Sale.status != "cancelada")
+            .all()
+        )
+        if itens:
+            arr = np.asarray(itens, dtype=np.int64)
+            produtos, por_produto, par_a, par_b, por_par = _contar_coocorrencias(arr[:, 0], arr[:, 1])
+            _somar_contagens_produto(db, produtos, por_produto)
+            if len(por_par):
+                _somar_contagens_pares(db, par_a, par_b, por_par)
+            state.total_cestas += int(len(np.unique(arr[:, 0])))
+        state.last_sale_id = ultimo
+        db.commit()
+        processadas += len(ids)
+        lotes += 1
+        state = _get_state(db, travar=True)
+    db.commit()
+    return {
+        "vendas_processadas": processadas,
+        "last_sale_id": state.last_sale_id,
+        "total_cestas": state.total_cestas,
+    }
+
+
+def reprocessar_cestas(db: Session, margem_segundos: float = MARGEM_SEGUNDOS) -> Dict[str, Any]:
+    """Apaga as contagens e reprocessa todas as vendas (ex.: após cancelamentos)."""
+    _ensure_tables()
+    with _lock:
+        state = _get_state(db, travar=True)
+        db.query(ProductPairCount).delete(synchronize_session=False)
+        db.query(ProductBasketCount).delete(synchronize_session=False)
+        state.last_sale_id = 0
+        state.total_cestas = 0
+        db.commit()
+        return _atualizar(db, LOTE_VENDAS, None, margem_segundos)
+
+
+def atualizar_em_segundo_plano() -> bool:
+    """Dispara atualizar_cestas() numa thread com sessão própria, se nenhuma estiver rodando. Retorna True se iniciou."""
+    global _atualizando
+    with _lock_fundo:
+        if _atualizando:
+            return False
+        _atualizando = True
+
+    def _rodar():
+        global _atualizando
+        db = SessionLocal()
+        try:
+            atualizar_cestas(db)
+        except Exception:
+            db.rollback()
+        finally:
+            db.close()
+            with _lock_fundo:
+                _atualizando = False
+
+    threading.Thread(target=_rodar, name="cestas", daemon=True).start()
+    return True
+
+
+def pares_frequentes(
+    db: Session,
+    limite: int = 20,
+    min_cestas: int = 2,
+    product_id: Optional[int] = None,
+    ordenar_por: str = "lift",
+) -> Dict[str, Any]:
+    """
+    Pares de produtos comprados juntos com suporte, confiança (A→B e B→A) e lift, calculados no banco
+    a partir das contagens acumuladas. ordenar_por: "lift", "suporte" ou "confianca".
+    product_id: restringe aos pares que contêm o produto.
+    """
+    _ensure_tables()
+    state = _get_state(db)
+    total = int(state.total_cestas or 0)
+    resultado: Dict[str, Any] = {
+        "total_cestas": total,
+        "last_sale_id": state.last_sale_id,
+        "pares": [],
+    }
+    if total == 0:
+        return resultado
+
+    ca = aliased(ProductBasketCount)
+    cb = aliased(ProductBasketCount)
+    pa = aliased(Product)
+    pb = aliased(Product)
+    juntos = cast(ProductPairCount.cestas, Float)
+    suporte = juntos / total
+    conf_ab = juntos / ca.cestas
+    conf_ba = juntos / cb.cestas
+    lift = juntos * total / (cast(ca.cestas, Float) * cb.cestas)
+    confianca = case((conf_ab >= conf_ba, conf_ab), else_=conf_ba)
+    ordem = {"suporte": suporte, "confianca": confianca}.get(ordenar_por, lift)
+
+    q = (
+        db.query(
+            pa.codigo, pa.nome, pb.codigo, pb.nome, ProductPairCount.cestas,
+            suporte, conf_ab, conf_ba, lift,
+        )
+        .join(ca, ca.product_id == ProductPairCount.product_a_id)
+        .join(cb, cb.product_id == ProductPairCount.product_b_id)
+        .join(pa, pa.id == ProductPairCount.product_a_id)
+        .join(pb, pb.id == ProductPairCount.product_b_id)
+        .filter(ProductPairCount.cestas >= min_cestas)
+    )
+    if product_id is not None:
+        q = q.filter(or_(ProductPairCount.product_a_id == product_id, ProductPairCount.product_b_id == product_id))
+    rows = q.order_by(ordem.desc(), ProductPairCount.cestas.desc()).limit(limite).all()
+    resultado["pares"] = [
+        {
+            "codigo_a": r[0],
+            "produto_a": r[1],
+            "codigo_b": r[2],
+            "produto_b": r[3],
+            "cestas": int(r[4]),
+            "suporte": float(r[5] or 0),
+            "confianca_a_b": float(r[6] or 0),
+            "confianca_b_a": float(r[7] or 0),
+            "lift": float(r[8] or 0),
+        }
+        for r in rows
+    ]
+    return resultado
@@ -0,0 +1,152 @@
+"""
+Projeção de fluxo de caixa: contas a pagar e a receber em aberto (agregadas por vencimento no banco)
+mais as vendas esperadas da previsão, com saldo acumulado dia a dia e resumo por semana.
+"""
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.account_payable import AccountPayable
+from models.account_receivable import AccountReceivable
+from services.forecast_service import vendas_diarias_previstas
+
+SEMANAS_PADRAO = 8
+
+
+def _abertas_por_vencimento(
+    db: Session, model, coluna_baixa, hoje: date, fim: date, incluir_atrasadas: bool = True
+) -> pd.Series:
+    """
+    Soma das contas em aberto (sem data de baixa) por data de vencimento, até `fim`.
+    Vencidas antes de hoje entram em um único valor na data de hoje (ou ficam de fora se incluir_atrasadas=False).
+    """
+    q = (
+        db.query(model.data_vencimento, func.coalesce(func.sum(model.valor), 0.0))
+        .filter(coluna_baixa.is_(None))
+        .filter(model.data_vencimento <= fim)
+    )
+    if not incluir_atrasadas:
+        q = q.filter(model.data_vencimento >= hoje)
+    rows = q.group_by(model.data_vencimento).all()
+    if not rows:
+        return pd.Series(dtype=float)
+    datas = pd.to_datetime([d for d, _ in rows])
+    datas = datas.where(datas >= pd.Timestamp(hoje), pd.Timestamp(hoje))
+    return pd.Series([float(v) for _, v in rows], index=datas).groupby(level=0).sum()
+
+
+def _total_atrasado(db: Session, model, coluna_baixa, hoje: date) -> float:
+    """Total das contas em aberto vencidas antes de hoje."""
+    total = (
+        db.query(func.coalesce(func.sum(model.valor), 0.0))
+        .filter(coluna_baixa.is_(None))
+        .filter(model.data_vencimento < hoje)
+        .scalar()
+    )
+    return float(total or 0)
+
+
+def projecao_fluxo_caixa(
+    db: Session,
+    semanas: int = SEMANAS_PADRAO,
+    saldo_inicial: float = 0.0,
+    incluir_vendas: bool = True,
+    incluir_receber_atrasado: bool = False,
+    hoje: Optional[date] = None,
+) -> Dict[str, Any]:
+    """
+    Posição de caixa projetada de hoje até o fim da `semanas`-ésima semana (contando a atual).
+    Saídas: contas a pagar em aberto (as atrasadas entram hoje). Entradas: contas a receber em aberto
+    (as atrasadas só entram se incluir_receber_atrasado) e, se incluir_vendas, as vendas previstas por dia.
+    Retorna {"diario": DataFrame, "semanal": DataFrame, "semanas_negativas": [...], totais...}.
+    Colunas do diário: data, pagar, receber, vendas_previstas, entradas, saidas, liquido, saldo.
+    Colunas do semanal: inicio, fim, pagar, receber, vendas_previstas, liquido, saldo_final, saldo_minimo, negativo.
+    """
+    hoje = hoje or date.today()
+    # Semanas de segunda a domingo; a primeira vai de hoje ao domingo da semana atual
+    fim = hoje + timedelta(days=6 - hoje.weekday() + 7 * (max(1, semanas) - 1))
+    dias = pd.date_range(hoje, fim, freq="D")
+
+    pagar = _abertas_por_vencimento(db, AccountPayable, AccountPayable.data_pagamento, hoje, fim)
+    receber = _abertas_por_vencimento(
+        db, AccountReceivable, AccountReceivable.data_recebimento, hoje, fim, incluir_receber_atrasado
+    )
+
+    diario = pd.DataFrame(index=dias)
+    diario["pagar"] = pagar.reindex(dias, fill_value=0.0)
+    diario["receber"] = receber.reindex(dias, fill_value=0.0)
+    if incluir_vendas:
+        vendas = vendas_diarias_previstas(db, hoje, fim)
+        diario["vendas_previstas"] = np.asarray(vendas.reindex(dias.date).fillna(0.0), dtype=float)
+    else:
+        diario["vendas_previstas"] = 0.0
+    diario["entradas"] = diario["receber"] + diario["vendas_previstas"]
+    diario["saidas"] = diario["pagar"]
+    diario["liquido"] = diario["entradas"] - diario["saidas"]
+    diario["saldo"] = float(saldo_inicial) + diario["liquido"].cumsum()
+    diario = diario.round(2)
+
+    grupos = diario.groupby(dias.to_period("W-SUN"))
+    semanal = pd.DataFrame(
+        {
+            "pagar": grupos["pagar"].sum(),
+            "receber": grupos["receber"].sum(),
+            "vendas_previstas": grupos["vendas_previstas"].sum(),
+            "liquido": grupos["liquido"].sum(),
+            "saldo_final": grupos["saldo"].last(),
+            "saldo_minimo": grupos["saldo"].min(),
+        }
+    )
+    semanal.insert(0, "fim", [p.end_time.date() for p in semanal.index])
+    semanal.insert(0, "inicio", [max(p.start_time.date(), hoje) for p in semanal.index])
+    semanal["negativo"] = semanal["saldo_minimo"] < 0
+    semanal = semanal.reset_index(drop=True).round(2)
+
+    diario.insert(0, "data", dias.date)
+    diario = diario.reset_index(drop=True)
+
+    semanas_negativas: List[Dict[str, Any]] = [
+        {
+            "inicio": r.inicio.strftime("%d/%m/%Y"),
+            "fim": r.fim.strftime("%d/%m/%Y"),
+            "saldo_minimo": float(r.saldo_minimo),
+            "saldo_final": float(r.saldo_final),
+        }
+        for r in semanal[semanal["negativo"]].itertuples()
+    ]
+    return {
+        "hoje": hoje,
+        "fim": fim,
+        "saldo_inicial": round(float(saldo_inicial), 2),
+        "incluir_vendas": incluir_vendas,
+        "diario": diario,
+        "semanal": semanal,
+        "semanas_negativas": semanas_negativas,
+        "total_pagar": round(float(diario["pagar"].sum()), 2),
+        "total_receber": round(float(diario["receber"].sum()), 2),
+        "total_vendas_previstas": round(float(diario["vendas_previstas"].sum()), 2),
+        "pagar_atrasado": round(_total_atrasado(db, AccountPayable, AccountPayable.data_pagamento, hoje), 2),
+        "receber_atrasado": round(_total_atrasado(db, AccountReceivable, AccountReceivable.data_recebimento, hoje), 2),
+        "saldo_final": round(float(diario["saldo"].iloc[-1]), 2) if len(diario) else round(float(saldo_inicial), 2),
+        "saldo_minimo": round(float(diario["saldo"].min()), 2) if len(diario) else round(float(saldo_inicial), 2),
+    }
+
+
+def resumo_semanal_payload(projecao: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Semanas da projeção em formato serializável (datas dd/mm/aaaa), para o payload dos agentes."""
+    return [
+        {
+            "inicio": r.inicio.strftime("%d/%m/%Y"),
+            "fim": r.fim.strftime("%d/%m/%Y"),
+            "pagar": float(r.pagar),
+            "receber": float(r.receber),
+            "vendas_previstas": float(r.vendas_previstas),
+            "saldo_final": float(r.saldo_final),
+            "negativo": bool(r.negativo),
+        }
+        for r in projecao["semanal"].itertuples()
+    ]
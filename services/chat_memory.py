@@ -3,9 +3,11 @@ Serviço único de persistência do histórico de chat dos agentes (por scope).
 Formato extra_json: report_agent = orient="split" do pandas; accounts_agent = {"records": [...]}.
 """
 import json
+from datetime import datetime
 from typing import Any, Dict, List, Optional
 
 import pandas as pd
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from config.database import engine
@@ -144,6 +146,16 @@ def get_messages_for_agent(
     return [{"role": r.role, "content": r.content or ""} for r in rows]
 
 
+def ultima_mensagem_em(db: Session, user_id: int, scope: str) -> Optional[datetime]:
+    """Data/hora (UTC) da mensagem mais recente do usuário no scope; None sem histórico."""
+    _ensure_table()
+    return (
+        db.query(func.max(AgentChatMessage.created_at))
+        .filter(AgentChatMessage.user_id == user_id, AgentChatMessage.scope == scope)
+        .scalar()
+    )
+
+
 def clear(db: Session, user_id: int, scope: str) -> int:
     """Remove todas as mensagens do usuário naquele scope. Retorna quantidade apagada."""
     _ensure_table()
@@ -0,0 +1,150 @@
+"""
+Análise do dia do Agente de Relatórios guardada por (usuário, data) junto com a versão dos dados
+(services.llm_cache.versao_dados). Logout/login, outra aba ou refresh exibem o texto guardado na hora;
+uma nova análise só é gerada quando vendas, contas ou agenda mudaram, quando o dia vira ou quando o
+usuário pede "Atualizar análise do dia". A geração pode rodar em segundo plano (ex.: logo após o login).
+"""
+import threading
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+
+from config.database import SessionLocal, engine
+from models.daily_analysis import DailyAnalysis
+from services.chat_memory import SCOPE_REPORT_AGENT, clear, ultima_mensagem_em
+from services.llm_cache import versao_dados
+from services.report_agent_service import ReportAgentService
+
+ESPERA_SEGUNDO_PLANO = 30.0  # máximo que a tela espera uma geração já em andamento (s)
+
+_tabela_ok = False
+_lock = threading.Lock()
+_em_andamento: Dict[int, threading.Event] = {}
+
+
+def _ensure_table():
+    """Cria a tabela daily_analysis se não existir (ex.: app rodando antes do modelo ser adicionado)."""
+    global _tabela_ok
+    if not _tabela_ok:
+        DailyAnalysis.__table__.create(engine, checkfirst=True)
+        _tabela_ok = True
+
+
+def obter(db: Session, user_id: int) -> Optional[str]:
+    """Análise de hoje do usuário, se os dados não mudaram desde que foi gerada; senão None."""
+    _ensure_table()
+    row = (
+        db.query(DailyAnalysis)
+        .filter(DailyAnalysis.user_id == user_id, DailyAnalysis.dia == date.today())
+        .first()
+    )
+    if row is None or row.data_version != versao_dados(db):
+        return None
+    return row.content
+
+
+def salvar(user_id: int, content: str, data_version: str) -> None:
+    """Grava (ou substitui) a análise de hoje e descarta as de dias anteriores (sessão própria)."""
+    if not content:
+        return
+    db = SessionLocal()
+    try:
+        _ensure_table()
+        hoje = date.today()
+        db.query(DailyAnalysis).filter(
+            DailyAnalysis.user_id == user_id, DailyAnalysis.dia < hoje
+        ).delete(synchronize_session=False)
+        row = db.query(DailyAnalysis).filter(DailyAnalysis.user_id == user_id, DailyAnalysis.dia == hoje).first()
+        if row is None:
+            row = DailyAnalysis(user_id=user_id, dia=hoje)
+            db.add(row)
+        row.data_version = data_version
+        row.content = content
+        row.created_at = datetime.utcnow()
+        db.commit()
+    except Exception:
+        db.rollback()
+    finally:
+        db.close()
+
+
+def invalidar(db: Session, user_id: int) -> None:
+    """Descarta a análise guardada do usuário (próxima abertura gera de novo)."""
+    _ensure_table()
+    db.query(DailyAnalysis).filter(DailyAnalysis.user_id == user_id).delete(synchronize_session=False)
+    db.commit()
+
+
+def gerar_stream(db: Session, user_id: int) -> Iterator[str]:
+    """
+    Gera a análise em partes (ReportAgentService.get_initial_analysis_stream, para st.write_stream) e guarda o
+    texto completo ao fim, com a versão dos dados lida antes da coleta. Sem IA configurada o texto por regras
+    não é guardado, para que a análise da IA apareça assim que ela estiver disponível; com alguma etapa da coleta
+    com erro também não (um erro passageiro do banco não vira "nenhuma venda hoje" até o fim do dia).
+    """
+    versao = versao_dados(db)
+    agent = ReportAgentService(db)
+    partes: List[str] = []
+    for parte in agent.get_initial_analysis_stream(db, user_id=user_id):
+        partes.append(parte)
+        yield parte
+    texto = "".join(partes).strip()
+    if texto and agent.ai_service.is_available() and not agent.etapas_com_erro:
+        salvar(user_id, texto, versao)
+
+
+def iniciar_dia(db: Session, user_id: int) -> bool:
+    """
+    Apaga a conversa do Agente de Relatórios quando a última mensagem é de um dia anterior (o dia recomeça
+    com a análise do dia). Retorna True quando não há conversa de hoje, ou seja, a análise do dia será exibida.
+    """
+    ultima = ultima_mensagem_em(db, user_id, SCOPE_REPORT_AGENT)
+    if ultima is None:
+        return True
+    # created_at é gravado em UTC; a virada do dia segue o horário local
+    if (ultima + (datetime.now() - datetime.utcnow())).date() < date.today():
+        clear(db, user_id, SCOPE_REPORT_AGENT)
+        return True
+    return False
+
+
+def atualizar_em_segundo_plano(user_id: int) -> bool:
+    """
+    Gera e guarda a análise do usuário numa thread com sessão própria, se a guardada estiver ausente ou
+    desatualizada. Uma geração por usuário de cada vez. Retorna True se a thread foi iniciada.
+    """
+    with _lock:
+        if user_id in _em_andamento:
+            return False
+        evento = _em_andamento[user_id] = threading.Event()
+
+    def _rodar():
+        db = SessionLocal()
+        try:
+            if obter(db, user_id) is None:
+                for _ in gerar_stream(db, user_id):
+                    pass
+        except Exception:
+            pass  # a tela gera a análise ao abrir
+        finally:
+            db.close()
+            with _lock:
+                _em_andamento.pop(user_id, None)
+            evento.set()
+
+    threading.Thread(target=_rodar, name=f"analise-do-dia-{user_id}", daemon=True).start()
+    return True
+
+
+def em_andamento(user_id: int) -> bool:
+    with _lock:
+        return user_id in _em_andamento
+
+
+def aguardar(user_id: int, timeout: float = ESPERA_SEGUNDO_PLANO) -> None:
+    """Espera a geração em segundo plano do usuário terminar (se houver), por até timeout segundos."""
+    with _lock:
+        evento = _em_andamento.get(user_id)
+    if evento is not None:
+        evento.wait(timeout)
@@ -0,0 +1,327 @@
+"""
+Previsão de vendas da loja: agregados mensais e diários lidos do banco (GROUP BY), modelos em NumPy
+(média móvel, sazonal ingênuo e Holt-Winters aditivo), backtest em meses retidos para escolher o melhor
+modelo e intervalos de previsão. Resultado em cache por dia.
+"""
+from datetime import date, timedelta
+from itertools import product as _grid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.sale import Sale
+
+MESES_HISTORICO = 36
+DIAS_PERFIL = 364
+MESES_BACKTEST = 6
+SAZONALIDADE = 12
+MESES_NOMES = ["jan", "fev", "mar", "abr", "mai", "jun", "jul", "ago", "set", "out", "nov", "dez"]
+DIAS_SEMANA = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
+MODELOS_NOMES = {
+    "media_movel": "Média móvel (3 meses)",
+    "sazonal_ingenuo": "Sazonal ingênuo (mesmo mês do ano anterior)",
+    "holt_winters": "Holt-Winters aditivo",
+    "holt": "Holt (tendência, sem sazonalidade)",
+}
+# Quantis da normal para os intervalos de 80% e 95%
+_Z80 = 1.2816
+_Z95 = 1.96
+
+_cache: Dict[date, Dict[str, Any]] = {}
+
+
+# --- Agregados (SQL) ---
+
+def serie_mensal(db: Session, ate: date, meses: int = MESES_HISTORICO) -> pd.DataFrame:
+    """
+    Totais mensais (faturamento, lucro, nº de vendas) dos últimos `meses` até `ate`, com meses sem venda zerados.
+    Índice: pd.Period mensal.
+    """
+    inicio = (ate.replace(day=1) - relativedelta(months=meses - 1))
+    ano = func.extract("year", Sale.data_venda)
+    mes = func.extract("month", Sale.data_venda)
+    rows = (
+        db.query(
+            ano.label("ano"),
+            mes.label("mes"),
+            func.coalesce(func.sum(Sale.total_vendido), 0.0),
+            func.coalesce(func.sum(Sale.total_lucro), 0.0),
+            func.count(Sale.id),
+        )
+        .filter(Sale.data_venda >= inicio)
+        .filter(Sale.data_venda <= ate)
+        .filter(Sale.status != "cancelada")
+        .group_by(ano, mes)
+        .all()
+    )
+    idx = pd.period_range(inicio, ate, freq="M")
+    df = pd.DataFrame(0.0, index=idx, columns=["total_vendido", "lucro", "num_vendas"])
+    for a, m, total, lucro, n in rows:
+        p = pd.Period(year=int(a), month=int(m), freq="M")
+        if p in df.index:
+            df.loc[p] = [float(total or 0), float(lucro or 0), float(n or 0)]
+    return df
+
+
+def serie_diaria(db: Session, ate: date, dias: int = DIAS_PERFIL) -> pd.DataFrame:
+    """Totais diários (faturamento e nº de vendas) dos últimos `dias` até `ate`, com dias sem venda zerados."""
+    inicio = ate - timedelta(days=dias - 1)
+    rows = (
+        db.query(
+            Sale.data_venda,
+            func.coalesce(func.sum(Sale.total_vendido), 0.0),
+            func.count(Sale.id),
+        )
+        .filter(Sale.data_venda >= inicio)
+        .filter(Sale.data_venda <= ate)
+        .filter(Sale.status != "cancelada")
+        .group_by(Sale.data_venda)
+        .all()
+    )
+    idx = pd.date_range(inicio, ate, freq="D")
+    df = pd.DataFrame(0.0, index=idx, columns=["total_vendido", "num_vendas"])
+    if rows:
+        valores = pd.DataFrame(rows, columns=["data", "total_vendido", "num_vendas"])
+        valores.index = pd.to_datetime(valores.pop("data"))
+        df.update(valores.astype(float))
+    return df
+
+
+# --- Modelos (NumPy) ---
+
+def _media_movel(y: np.ndarray, h: int, k: int = 3) -> np.ndarray:
+    """Média dos últimos k pontos, repetida no horizonte."""
+    return np.full(h, float(np.mean(y[-k:])) if len(y) else 0.0)
+
+
+def _sazonal_ingenuo(y: np.ndarray, h: int, m: int = SAZONALIDADE) -> np.ndarray:
+    """Repete o valor do mesmo mês da temporada anterior."""
+    return np.array([y[len(y) - m + (i % m)] for i in range(h)], dtype=float)
+
+
+def _holt(y: np.ndarray, alpha: float, beta: float) -> Tuple[float, float, float]:
+    """Suavização exponencial dupla (nível + tendência); retorna (nível, tendência, SSE de um passo)."""
+    nivel, tend = y[0], (y[1] - y[0]) if len(y) > 1 else 0.0
+    sse = 0.0
+    for t in range(1, len(y)):
+        prev = nivel + tend
+        sse += (y[t] - prev) ** 2
+        novo = alpha * y[t] + (1 - alpha) * prev
+        tend = beta * (novo - nivel) + (1 - beta) * tend
+        nivel = novo
+    return nivel, tend, sse
+
+
+def _holt_winters(
+    y: np.ndarray, alpha: float, beta: float, gamma: float, m: int = SAZONALIDADE
+) -> Tuple[float, float, np.ndarray, float]:
+    """Holt-Winters aditivo; retorna (nível, tendência, sazonais da última temporada, SSE de um passo)."""
+    nivel = float(np.mean(y[:m]))
+    tend = float((np.mean(y[m:2 * m]) - np.mean(y[:m])) / m)
+    saz = list(y[:m] - nivel)
+    sse = 0.0
+    for t in range(m, len(y)):
+        s = saz[t - m]
+        prev = nivel + tend + s
+        sse += (y[t] - prev) ** 2
+        novo = alpha * (y[t] - s) + (1 - alpha) * (nivel + tend)
+        tend = beta * (novo - nivel) + (1 - beta) * tend
+        saz.append(gamma * (y[t] - novo) + (1 - gamma) * s)
+        nivel = novo
+    return nivel, tend, np.array(saz[-m:]), sse
+
+
+_ALPHAS = (0.2, 0.4, 0.6, 0.8)
+_BETAS = (0.05, 0.15, 0.3)
+_GAMMAS = (0.1, 0.3, 0.5)
+
+
+def _prever_holt(y: np.ndarray, h: int) -> np.ndarray:
+    """Holt com parâmetros escolhidos por grade (menor SSE)."""
+    melhor = min((_holt(y, a, b) + (a, b) for a, b in _grid(_ALPHAS, _BETAS)), key=lambda r: r[2])
+    nivel, tend = melhor[0], melhor[1]
+    return nivel + tend * np.arange(1, h + 1)
+
+
+def _prever_holt_winters(y: np.ndarray, h: int, m: int = SAZONALIDADE) -> np.ndarray:
+    """Holt-Winters aditivo com parâmetros escolhidos por grade (menor SSE)."""
+    melhor = min(
+        (_holt_winters(y, a, b, g, m) for a, b, g in _grid(_ALPHAS, _BETAS, _GAMMAS)),
+        key=lambda r: r[3],
+    )
+    nivel, tend, saz = melhor[0], melhor[1], melhor[2]
+    passos = np.arange(1, h + 1)
+    return nivel + tend * passos + saz[(passos - 1) % m]
+
+
+def _modelos_disponiveis(n: int) -> Dict[str, Callable[[np.ndarray, int], np.ndarray]]:
+    """Modelos aplicáveis ao tamanho da série (sazonais exigem uma/duas temporadas completas)."""
+    modelos: Dict[str, Callable[[np.ndarray, int], np.ndarray]] = {}
+    if n >= 1:
+        modelos["media_movel"] = _media_movel
+    if n >= SAZONALIDADE:
+        modelos["sazonal_ingenuo"] = _sazonal_ingenuo
+    if n >= 2 * SAZONALIDADE:
+        modelos["holt_winters"] = _prever_holt_winters
+    elif n >= 4:
+        modelos["holt"] = _prever_holt
+    return modelos
+
+
+def backtest(y: np.ndarray, n_teste: int = MESES_BACKTEST) -> List[Dict[str, Any]]:
+    """
+    Backtest com origem móvel: para cada um dos últimos n_teste meses, ajusta cada modelo só com os meses
+    anteriores e prevê um passo à frente. Retorna MAE, MAPE e RMSE por modelo (ordenado pelo MAE).
+    """
+    resultados = []
+    n = len(y)
+    for nome in _modelos_disponiveis(n):
+        erros = []
+        reais = []
+        for t in range(max(1, n - n_teste), n):
+            fn = _modelos_disponiveis(t).get(nome)
+            if fn is None:
+                continue
+            erros.append(float(fn(y[:t], 1)[0] - y[t]))
+            reais.append(float(y[t]))
+        if not erros:
+            continue
+        e = np.array(erros)
+        r = np.array(reais)
+        nz = r > 0
+        resultados.append({
+            "modelo": nome,
+            "nome": MODELOS_NOMES[nome],
+            "mae": float(np.mean(np.abs(e))),
+            "mape": float(np.mean(np.abs(e[nz]) / r[nz]) * 100) if nz.any() else None,
+            "rmse": float(np.sqrt(np.mean(e ** 2))),
+            "pontos": int(len(e)),
+        })
+    # Modelos avaliados em menos de 2 meses ficam atrás (erro pouco confiável)
+    resultados.sort(key=lambda r: (r["pontos"] < 2, r["mae"]))
+    return resultados
+
+
+def perfil_dia_semana(diario: pd.DataFrame) -> List[Dict[str, Any]]:
+    """Média de faturamento por dia da semana e índice relativo à média diária (1.0 = dia médio)."""
+    wd = diario.index.dayofweek
+    agrupado = diario.groupby(wd).agg(total=("total_vendido", "sum"), media=("total_vendido", "mean"), vendas=("num_vendas", "sum"))
+    agrupado = agrupado.reindex(range(7), fill_value=0.0)
+    media_geral = float(diario["total_vendido"].mean()) if len(diario) else 0.0
+    return [
+        {
+            "dia": DIAS_SEMANA[i],
+            "total": round(float(agrupado.loc[i, "total"]), 2),
+            "vendas": int(agrupado.loc[i, "vendas"]),
+            "media": round(float(agrupado.loc[i, "media"]), 2),
+            "indice": round(float(agrupado.loc[i, "media"]) / media_geral, 3) if media_geral > 0 else 1.0,
+        }
+        for i in range(7)
+    ]
+
+
+def _mes_label(p: pd.Period) -> str:
+    return f"{MESES_NOMES[p.month - 1]}/{p.year}"
+
+
+def previsao_vendas(db: Session, horizonte: int = 3, hoje: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Previsão de faturamento mensal: ajusta os modelos nos meses completos, escolhe o de menor erro no backtest
+    e prevê `horizonte` meses a partir do mês atual (o mês atual traz também o realizado até hoje).
+    Intervalos de 80% e 95% a partir do RMSE do backtest, ampliados com o horizonte.
+    """
+    hoje = hoje or date.today()
+    hit = _cache.get(hoje)
+    if hit is not None and hit.get("horizonte", 0) >= horizonte:
+        return hit
+    _cache.clear()
+
+    mensal = serie_mensal(db, hoje)
+    diario = serie_diaria(db, hoje - timedelta(days=1))
+    mes_atual = pd.Period(hoje, freq="M")
+    completos = mensal[mensal.index < mes_atual]
+    # Descarta meses iniciais sem venda (loja ainda sem histórico)
+    nz = np.flatnonzero(completos["total_vendido"].to_numpy() > 0)
+    if len(nz):
+        completos = completos.iloc[nz[0]:]
+    else:
+        completos = completos.iloc[0:0]
+    y = completos["total_vendido"].to_numpy(dtype=float)
+
+    avaliacao = backtest(y) if len(y) >= 2 else []
+    modelos = _modelos_disponiveis(len(y))
+    escolhido = avaliacao[0]["modelo"] if avaliacao else ("media_movel" if modelos else None)
+    previsoes = []
+    if escolhido:
+        pontos = np.clip(modelos[escolhido](y, horizonte), 0, None)
+        rmse = avaliacao[0]["rmse"] if avaliacao else float(np.std(y)) if len(y) > 1 else float(y[-1] if len(y) else 0)
+        for i, valor in enumerate(pontos.tolist()):
+            p = mes_atual + i
+            largura = float(rmse * np.sqrt(i + 1))
+            previsoes.append({
+                "mes": str(p),
+                "mes_ano": _mes_label(p),
+                "previsto": round(float(valor), 2),
+                "intervalo_80": [round(max(0.0, valor - _Z80 * largura), 2), round(valor + _Z80 * largura, 2)],
+                "intervalo_95": [round(max(0.0, valor - _Z95 * largura), 2), round(valor + _Z95 * largura, 2)],
+            })
+
+    realizado_mes = float(mensal.loc[mes_atual, "total_vendido"]) if mes_atual in mensal.index else 0.0
+    resultado = {
+        "gerado_em": hoje.isoformat(),
+        "horizonte": horizonte,
+        "modelo": escolhido,
+        "modelo_nome": MODELOS_NOMES.get(escolhido, "Sem histórico suficiente") if escolhido else "Sem histórico suficiente",
+        "backtest": avaliacao,
+        "meses_historico": int(len(y)),
+        "historico_mensal": [
+            {
+                "mes": str(p),
+                "mes_ano": _mes_label(p),
+                "total_vendido": round(float(r.total_vendido), 2),
+                "lucro": round(float(r.lucro), 2),
+                "num_vendas": int(r.num_vendas),
+            }
+            for p, r in mensal.iterrows()
+        ],
+        "previsoes": previsoes,
+        "mes_atual": {
+            "mes": str(mes_atual),
+            "realizado": round(realizado_mes, 2),
+            "previsto": previsoes[0]["previsto"] if previsoes else None,
+            "dias_decorridos": hoje.day,
+            "dias_no_mes": mes_atual.days_in_month,
+        },
+        "perfil_dia_semana": perfil_dia_semana(diario),
+        "media_diaria_recente": round(float(diario["total_vendido"].tail(28).mean()), 2) if len(diario) else 0.0,
+    }
+    _cache[hoje] = resultado
+    return resultado
+
+
+def vendas_diarias_previstas(db: Session, start_date: date, end_date: date) -> pd.Series:
+    """
+    Vendas esperadas por dia entre start_date e end_date: previsão do mês distribuída pelos dias
+    conforme o perfil por dia da semana. Meses além do horizonte usam a última previsão disponível.
+    """
+    dias = pd.date_range(start_date, end_date, freq="D")
+    if len(dias) == 0:
+        return pd.Series(dtype=float)
+    meses = dias.to_period("M")
+    horizonte = max(1, (meses.max() - pd.Period(date.today(), freq="M")).n + 1)
+    prev = previsao_vendas(db, horizonte=horizonte)
+    por_mes = {p["mes"]: p["previsto"] for p in prev["previsoes"]}
+    fallback = prev["previsoes"][-1]["previsto"] if prev["previsoes"] else prev["media_diaria_recente"] * 30
+    indice = np.array([d["indice"] for d in prev["perfil_dia_semana"]], dtype=float)
+    if not np.isfinite(indice).all() or indice.sum() <= 0:
+        indice = np.ones(7)
+    total_mes = np.array([por_mes.get(str(p), fallback) for p in meses], dtype=float)
+    # Peso do dia = índice do dia da semana / soma dos índices dos dias do mês
+    todos_dias = pd.date_range(meses.min().start_time, meses.max().end_time.normalize(), freq="D")
+    soma_mes = pd.Series(indice[todos_dias.dayofweek], index=todos_dias).groupby(todos_dias.to_period("M")).sum()
+    pesos = indice[dias.dayofweek] / soma_mes.reindex(meses).to_numpy()
+    return pd.Series(total_mes * pesos, index=dias.date)
@@ -41,6 +41,9 @@ SIGN_DISPLAY = {
     "peixes": "Peixes",
 }
 
+# Prazo (s) do resumo pela IA, exibido na página Início
+PRAZO_RESUMO_IA = 8.0
+
 
 def fetch_horoscope_from_web(signo: str) -> Tuple[Optional[str], Optional[str]]:
     """
@@ -83,40 +86,6 @@ def _extract_text_from_html(html: str) -> str:
     return text.strip()
 
 
-def _call_ai(client, provider: str, model: str, prompt: str, max_tokens: int = 500) -> Optional[str]:
-    """Chama a IA com o prompt e retorna o texto gerado."""
-    try:
-        if provider == "openai":
-            r = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.5,
-                max_tokens=max_tokens,
-            )
-            return (r.choices[0].message.content or "").strip()
-        if provider == "gemini":
-            r = client.generate_content(prompt)
-            return (r.text or "").strip()
-        if provider == "groq":
-            r = client.chat.completions.create(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.5,
-                max_tokens=max_tokens,
-            )
-            return (r.choices[0].message.content or "").strip()
-        if provider == "ollama":
-            r = client.chat(
-                model=model,
-                messages=[{"role": "user", "content": prompt}],
-                options={"temperature": 0.5, "num_predict": max_tokens},
-            )
-            return (r.get("message", {}).get("content") or "").strip()
-    except Exception:
-        pass
-    return None
-
-
 def get_horoscope_for_user(db: Session, user_id: int, signo: Optional[str]) -> dict:
     """
     Retorna o horóscopo para exibir na tela inicial.
@@ -142,20 +111,19 @@ def get_horoscope_for_user(db: Session, user_id: int, signo: Optional[str]) -> d
     try:
         from config.ai_config import AIConfigManager
         from services.ai_service import AIService
+        from services.llm_cache import SITE_HOROSCOPE
 
         if AIConfigManager.is_configured(db):
             ai = AIService(db)
-            client, err = ai._get_client()
-            if not err and client:
-                config = ai.config
-                provider = config["provider"]
-                model = config.get("model", "")
-                prompt = (
-                    f"Resuma em 2 a 4 frases curtas e motivadoras o horóscopo do dia (ou da semana) "
-                    f"para o signo de {sign_name}. Use tom positivo e pessoal. "
-                    f"Texto de referência:\n\n{raw[:2500]}"
-                )
-                summary_text = _call_ai(client, provider, model, prompt, max_tokens=300)
+            prompt = (
+                f"Resuma em 2 a 4 frases curtas e motivadoras o horóscopo do dia (ou da semana) "
+                f"para o signo de {sign_name}. Use tom positivo e pessoal. "
+                f"Texto de referência:\n\n{raw[:2500]}"
+            )
+            # Prazo curto: a página Início não espera a IA; sem resposta, mostra o trecho original
+            summary_text, _ = ai.complete(
+                prompt, temperature=0.5, max_tokens=300, cache=SITE_HOROSCOPE, prazo=PRAZO_RESUMO_IA
+            )
     except Exception:
         pass
 
@@ -0,0 +1,312 @@
+"""
+Cache persistente das respostas da IA, compartilhado por todos os agentes.
+Chave: hash de (provedor, modelo, temperatura, parâmetros da chamada, prompt normalizado) e, para prompts que
+embutem dados do banco, a versão dos dados (qualquer venda, conta ou compromisso novo/alterado invalida a entrada).
+Cada ponto de chamada tem seu TTL; o total de entradas é limitado (remove as menos usadas recentemente).
+Acertos e faltas são contados em memória e gravados em LLMCacheStat a cada FLUSH_SEGUNDOS (e ao ler as
+estatísticas): uma falta não escreve no banco.
+"""
+import atexit
+import hashlib
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config.database import SessionLocal, engine
+from models.account_payable import AccountPayable
+from models.account_receivable import AccountReceivable
+from models.cash_session import CashSession
+from models.llm_cache import LLMCacheEntry, LLMCacheStat
+from models.personal_agenda import PersonalAgenda
+from models.product import Product
+from models.sale import Sale
+from models.stock_entry import StockEntry
+
+# Pontos de chamada
+SITE_ANALYZE_QUERY = "report_agent.analyze_query"
+SITE_FORMAT_RESPONSE = "report_agent.format_response"
+SITE_INITIAL_ANALYSIS = "report_agent.initial_analysis"
+SITE_ACCOUNTS_PARSE = "accounts_agent.parse_request"
+SITE_AGENDA_PARSE = "agenda_agent.parse_request"
+SITE_MCP_DETECTOR = "mcp.detector"
+SITE_MCP_EXTRACTOR = "mcp.extractor"
+SITE_MCP_VALIDATOR = "mcp.validator"
+SITE_HOROSCOPE = "horoscope"
+SITE_TURN_PLANNER = "report_agent.turn_planner"
+
+# TTL por ponto de chamada (segundos)
+TTL_POR_SITE: Dict[str, int] = {
+    SITE_ANALYZE_QUERY: 24 * 3600,
+    SITE_FORMAT_RESPONSE: 6 * 3600,
+    SITE_INITIAL_ANALYSIS: 6 * 3600,
+    SITE_ACCOUNTS_PARSE: 24 * 3600,
+    SITE_AGENDA_PARSE: 24 * 3600,
+    SITE_MCP_DETECTOR: 7 * 24 * 3600,
+    SITE_MCP_EXTRACTOR: 7 * 24 * 3600,
+    SITE_MCP_VALIDATOR: 7 * 24 * 3600,
+    SITE_HOROSCOPE: 24 * 3600,
+    SITE_TURN_PLANNER: 24 * 3600,
+}
+TTL_PADRAO = 3600
+MAX_ENTRADAS = 2000
+FLUSH_SEGUNDOS = 30
+
+_RE_ESPACOS = re.compile(r"[ \t]+")
+_RE_LINHAS = re.compile(r"\n{3,}")
+_tabelas_ok = False
+
+# Contadores ainda não gravados: call_site -> [acertos, faltas]
+_lock = threading.Lock()
+_pendentes: Dict[str, List[int]] = {}
+_ultimo_flush = time.monotonic()
+
+
+def _ensure_tables():
+    """Cria as tabelas do cache se não existirem (ex.: app rodando antes do modelo ser adicionado)."""
+    global _tabelas_ok
+    if _tabelas_ok:
+        return
+    for model in (LLMCacheEntry, LLMCacheStat):
+        model.__table__.create(engine, checkfirst=True)
+    _tabelas_ok = True
+
+
+def normalizar_prompt(prompt: str) -> str:
+    """Normaliza espaços e quebras de linha para que prompts equivalentes gerem a mesma chave."""
+    linhas = [_RE_ESPACOS.sub(" ", ln).strip() for ln in (prompt or "").replace("\r\n", "\n").split("\n")]
+    return _RE_LINHAS.sub("\n\n", "\n".join(linhas)).strip()
+
+
+def chave_cache(
+    provider: str,
+    model: str,
+    temperature: float,
+    prompt: str,
+    extra: Optional[Dict[str, Any]] = None,
+    data_version: Optional[str] = None,
+) -> str:
+    """Hash SHA-256 da combinação provedor/modelo/temperatura/parâmetros/prompt normalizado/versão dos dados."""
+    base = json.dumps(
+        {
+            "p": provider,
+            "m": model or "",
+            "t": round(float(temperature), 3),
+            "x": extra or {},
+            "v": data_version or "",
+            "q": normalizar_prompt(prompt),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+
+def versao_dados(db: Session) -> str:
+    """
+    Assinatura barata do estado dos dados usados nos prompts: últimos ids e contagens de vendas, entradas de estoque,
+    caixas e a última alteração de produtos, contas e agenda. Muda sempre que algo relevante é criado, alterado ou excluído.
+    """
+    row = db.query(
+        db.query(func.max(Sale.id)).scalar_subquery(),
+        db.query(func.count(Sale.id)).filter(Sale.status == "cancelada").scalar_subquery(),
+        db.query(func.max(StockEntry.id)).scalar_subquery(),
+        db.query(func.max(CashSession.id)).scalar_subquery(),
+        db.query(func.max(Product.updated_at)).scalar_subquery(),
+        db.query(func.count(AccountPayable.id)).scalar_subquery(),
+        db.query(func.max(AccountPayable.updated_at)).scalar_subquery(),
+        db.query(func.count(AccountReceivable.id)).scalar_subquery(),
+        db.query(func.max(AccountReceivable.updated_at)).scalar_subquery(),
+        db.query(func.count(PersonalAgenda.id)).scalar_subquery(),
+        db.query(func.max(PersonalAgenda.updated_at)).scalar_subquery(),
+    ).one()
+    return hashlib.sha256(repr(tuple(row)).encode("utf-8")).hexdigest()[:16]
+
+
+def _contar(call_site: str, acerto: bool) -> bool:
+    """Soma o acerto ou a falta em memória; True quando já passou FLUSH_SEGUNDOS desde a última gravação."""
+    with _lock:
+        par = _pendentes.setdefault(call_site, [0, 0])
+        par[0 if acerto else 1] += 1
+        return time.monotonic() - _ultimo_flush >= FLUSH_SEGUNDOS
+
+
+def _retirar_pendentes() -> Dict[str, List[int]]:
+    global _ultimo_flush
+    with _lock:
+        pendentes = dict(_pendentes)
+        _pendentes.clear()
+        _ultimo_flush = time.monotonic()
+    return pendentes
+
+
+def _devolver_pendentes(pendentes: Dict[str, List[int]]) -> None:
+    """Gravação falhou: os contadores voltam para a próxima tentativa."""
+    with _lock:
+        for call_site, (hits, misses) in pendentes.items():
+            par = _pendentes.setdefault(call_site, [0, 0])
+            par[0] += hits
+            par[1] += misses
+
+
+def _gravar_contadores(db: Session, pendentes: Dict[str, List[int]]) -> None:
+    """Soma os contadores pendentes em LLMCacheStat (sem commit)."""
+    for call_site, (hits, misses) in pendentes.items():
+        stat = db.query(LLMCacheStat).filter(LLMCacheStat.call_site == call_site).first()
+        if stat is None:
+            stat = LLMCacheStat(call_site=call_site, hits=0, misses=0)
+            db.add(stat)
+        stat.hits += hits
+        stat.misses += misses
+
+
+def descarregar_contadores() -> None:
+    """Grava os contadores pendentes (sessão própria); chamado pelas estatísticas e ao encerrar o processo."""
+    pendentes = _retirar_pendentes()
+    if not pendentes:
+        return
+    db = SessionLocal()
+    try:
+        _ensure_tables()
+        _gravar_contadores(db, pendentes)
+        db.commit()
+    except Exception:
+        db.rollback()
+        _devolver_pendentes(pendentes)
+    finally:
+        db.close()
+
+
+atexit.register(descarregar_contadores)
+
+
+def obter(key: str, call_site: str) -> Optional[str]:
+    """
+    Retorna a resposta em cache (ou None) e conta o acerto/falta em memória. Só há escrita no banco num acerto
+    (uso da entrada, para a remoção das menos usadas) ou quando é hora de gravar os contadores pendentes.
+    Usa sessão própria para não confirmar (commit) alterações pendentes da sessão do chamador.
+    """
+    db = SessionLocal()
+    pendentes: Dict[str, List[int]] = {}
+    try:
+        _ensure_tables()
+        agora = datetime.utcnow()
+        entry = db.query(LLMCacheEntry).filter(LLMCacheEntry.key == key).first()
+        resposta = None
+        if entry is not None and entry.expires_at > agora:
+            entry.hits += 1
+            entry.last_used_at = agora
+            resposta = entry.response
+        if _contar(call_site, resposta is not None):
+            pendentes = _retirar_pendentes()
+            _gravar_contadores(db, pendentes)
+        if resposta is not None or pendentes:
+            db.commit()
+        return resposta
+    except Exception:
+        db.rollback()
+        _devolver_pendentes(pendentes)
+        return None
+    finally:
+        db.close()
+
+
+def salvar(
+    key: str,
+    call_site: str,
+    provider: str,
+    model: str,
+    response: str,
+    data_version: Optional[str] = None,
+    ttl: Optional[int] = None,
+) -> None:
+    """Grava (ou substitui) a resposta e aplica o limite de tamanho do cache (sessão própria, como em obter)."""
+    if not response:
+        return
+    db = SessionLocal()
+    try:
+        _ensure_tables()
+        agora = datetime.utcnow()
+        ttl = ttl if ttl is not None else TTL_POR_SITE.get(call_site, TTL_PADRAO)
+        entry = db.query(LLMCacheEntry).filter(LLMCacheEntry.key == key).first()
+        if entry is None:
+            entry = LLMCacheEntry(key=key, hits=0)
+            db.add(entry)
+        entry.call_site = call_site
+        entry.provider = provider
+        entry.model = model or None
+        entry.data_version = data_version
+        entry.response = response
+        entry.created_at = agora
+        entry.last_used_at = agora
+        entry.expires_at = agora + timedelta(seconds=ttl)
+        db.flush()
+        _evict(db, agora)
+        db.commit()
+    except Exception:
+        db.rollback()
+    finally:
+        db.close()
+
+
+def _evict(db: Session, agora: datetime) -> None:
+    """Remove as entradas expiradas e, acima de MAX_ENTRADAS, as menos usadas recentemente."""
+    db.query(LLMCacheEntry).filter(LLMCacheEntry.expires_at <= agora).delete(synchronize_session=False)
+    excesso = db.query(func.count(LLMCacheEntry.key)).scalar() - MAX_ENTRADAS
+    if excesso > 0:
+        antigas = [
+            k for (k,) in db.query(LLMCacheEntry.key).order_by(LLMCacheEntry.last_used_at).limit(excesso).all()
+        ]
+        db.query(LLMCacheEntry).filter(LLMCacheEntry.key.in_(antigas)).delete(synchronize_session=False)
+
+
+def estatisticas(db: Session) -> List[Dict[str, Any]]:
+    """Acertos, faltas, taxa de acerto e entradas válidas por ponto de chamada (contadores pendentes gravados antes)."""
+    descarregar_contadores()
+    _ensure_tables()
+    agora = datetime.utcnow()
+    entradas = dict(
+        db.query(LLMCacheEntry.call_site, func.count(LLMCacheEntry.key))
+        .filter(LLMCacheEntry.expires_at > agora)
+        .group_by(LLMCacheEntry.call_site)
+        .all()
+    )
+    resultado = []
+    for stat in db.query(LLMCacheStat).order_by(LLMCacheStat.call_site).all():
+        total = stat.hits + stat.misses
+        resultado.append(
+            {
+                "call_site": stat.call_site,
+                "hits": stat.hits,
+                "misses": stat.misses,
+                "taxa_acerto": round(stat.hits / total * 100, 1) if total else 0.0,
+                "entradas": int(entradas.get(stat.call_site, 0)),
+            }
+        )
+    return resultado
+
+
+def limpar(db: Session, call_site: Optional[str] = None, zerar_contadores: bool = False) -> int:
+    """Apaga as entradas (de um ponto de chamada ou todas). Retorna quantas foram removidas."""
+    _ensure_tables()
+    q = db.query(LLMCacheEntry)
+    if call_site:
+        q = q.filter(LLMCacheEntry.call_site == call_site)
+    n = q.delete(synchronize_session=False)
+    if zerar_contadores:
+        with _lock:
+            if call_site:
+                _pendentes.pop(call_site, None)
+            else:
+                _pendentes.clear()
+        qs = db.query(LLMCacheStat)
+        if call_site:
+            qs = qs.filter(LLMCacheStat.call_site == call_site)
+        qs.delete(synchronize_session=False)
+    db.commit()
+    return n
@@ -0,0 +1,188 @@
+"""
+Resiliência das chamadas à IA: prazo total por chamada, novas tentativas com espera aleatória (jitter) só para
+erros transitórios (timeout, conexão, 429, 5xx), disjuntor (circuit breaker) por provedor e registro das decisões
+de fallback. Com o disjuntor aberto o provedor é pulado durante a pausa e o chamador cai direto no próximo
+provedor da cadeia ou no seu fallback por regras (ex.: _initial_analysis_fallback).
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+PRAZO_PADRAO = float(os.getenv("AI_TIMEOUT", "20"))  # prazo total da chamada, somando tentativas e reservas (s)
+PRAZO_TENTATIVA = float(os.getenv("AI_TIMEOUT_TENTATIVA", "10"))  # limite de cada tentativa (s)
+PRAZO_MINIMO = 1.0  # abaixo disso não vale iniciar outra tentativa
+MAX_TENTATIVAS = 3
+ESPERA_BASE = 0.5
+ESPERA_MAX = 4.0
+FALHAS_PARA_ABRIR = 3
+PAUSA_CIRCUITO = 60.0
+MAX_EVENTOS = 200
+
+_STATUS_TRANSITORIOS = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+# Erros da própria requisição (prompt/parâmetros): não indicam provedor fora do ar
+_STATUS_DA_REQUISICAO = {400, 404, 413, 422}
+_NOMES_TRANSITORIOS = (
+    "Timeout", "Connection", "RateLimit", "InternalServer", "ServiceUnavailable",
+    "DeadlineExceeded", "ResourceExhausted", "Unavailable", "TooManyRequests",
+)
+
+
+class Prazo:
+    """Orçamento de tempo de uma chamada (todas as tentativas e provedores de reserva)."""
+
+    def __init__(self, segundos: Optional[float] = None):
+        self.fim = time.monotonic() + (segundos if segundos is not None else PRAZO_PADRAO)
+
+    def restante(self) -> float:
+        return max(0.0, self.fim - time.monotonic())
+
+
+def _status(e: Exception) -> Optional[int]:
+    for valor in (getattr(e, "status_code", None), getattr(getattr(e, "response", None), "status_code", None), getattr(e, "code", None)):
+        if isinstance(valor, int):
+            return valor
+    return None
+
+
+def erro_transitorio(e: Exception) -> bool:
+    """True para falhas que podem passar numa nova tentativa (timeout, conexão, limite de taxa, erro 5xx)."""
+    status = _status(e)
+    if status is not None:
+        return status in _STATUS_TRANSITORIOS
+    if isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    return any(n in cls.__name__ for cls in type(e).__mro__ for n in _NOMES_TRANSITORIOS)
+
+
+def _descricao(e: Exception) -> str:
+    status = _status(e)
+    texto = str(e) or type(e).__name__
+    return f"{type(e).__name__} ({status}): {texto}" if status else f"{type(e).__name__}: {texto}"
+
+
+# --- Registro das decisões ---
+_lock = threading.Lock()
+_eventos: Deque[Dict[str, Any]] = deque(maxlen=MAX_EVENTOS)
+
+
+def registrar_evento(provedor: str, evento: str, detalhe: str = "", ponto: Optional[str] = None) -> None:
+    """Guarda uma decisão (nova_tentativa, falha, circuito_aberto, pulado, fallback, sem_resposta) para consulta no Admin."""
+    with _lock:
+        _eventos.append({
+            "quando": datetime.now().strftime("%d/%m %H:%M:%S"),
+            "provedor": provedor,
+            "evento": evento,
+            "ponto": ponto or "",
+            "detalhe": (detalhe or "")[:200],
+        })
+
+
+def eventos_recentes(limite: int = 50) -> List[Dict[str, Any]]:
+    """Últimas decisões registradas, da mais recente para a mais antiga."""
+    with _lock:
+        return list(_eventos)[::-1][:limite]
+
+
+# --- Disjuntor por provedor ---
+_circuitos: Dict[str, Dict[str, float]] = {}
+
+
+def permite(provedor: str) -> bool:
+    """
+    False enquanto o circuito do provedor está aberto (em pausa). Vencida a pausa, libera uma única chamada
+    de teste (meio-aberto) e mantém os demais pulando até ela terminar.
+    """
+    agora = time.monotonic()
+    with _lock:
+        c = _circuitos.get(provedor)
+        if not c or c["falhas"] < FALHAS_PARA_ABRIR:
+            return True
+        if c["aberto_ate"] > agora:
+            return False
+        c["aberto_ate"] = agora + PAUSA_CIRCUITO
+        return True
+
+
+def _sucesso(provedor: str) -> None:
+    with _lock:
+        _circuitos.pop(provedor, None)
+
+
+def _falha(provedor: str, ponto: Optional[str]) -> None:
+    with _lock:
+        c = _circuitos.setdefault(provedor, {"falhas": 0, "aberto_ate": 0.0})
+        c["falhas"] += 1
+        abriu = c["falhas"] >= FALHAS_PARA_ABRIR
+        if abriu:
+            c["aberto_ate"] = time.monotonic() + PAUSA_CIRCUITO
+    if abriu:
+        registrar_evento(provedor, "circuito_aberto", f"pausa de {int(PAUSA_CIRCUITO)}s após falhas seguidas", ponto)
+
+
+def estado_circuitos() -> List[Dict[str, Any]]:
+    """Falhas seguidas e segundos restantes de pausa por provedor."""
+    agora = time.monotonic()
+    with _lock:
+        return [
+            {
+                "provedor": p,
+                "falhas_seguidas": int(c["falhas"]),
+                "aberto": c["falhas"] >= FALHAS_PARA_ABRIR and c["aberto_ate"] > agora,
+                "pausa_restante_s": round(max(0.0, c["aberto_ate"] - agora), 1),
+            }
+            for p, c in sorted(_circuitos.items())
+        ]
+
+
+def resetar() -> None:
+    """Fecha todos os circuitos e limpa o registro (ex.: após trocar a configuração de IA)."""
+    with _lock:
+        _circuitos.clear()
+        _eventos.clear()
+
+
+def executar(
+    provedor: str,
+    chamada: Callable[[float], Any],
+    prazo: Prazo,
+    ponto: Optional[str] = None,
+) -> Tuple[Any, Optional[str]]:
+    """
+    Executa chamada(timeout) no provedor respeitando o disjuntor e o prazo: cada tentativa recebe o tempo
+    restante (até PRAZO_TENTATIVA); erros transitórios são repetidos com espera exponencial aleatória.
+    Retorna (resultado, error).
+    """
+    if not permite(provedor):
+        registrar_evento(provedor, "pulado", "circuito aberto", ponto)
+        return None, f"Provedor {provedor} em pausa após falhas seguidas"
+    erro = "prazo esgotado"
+    conta_falha = True
+    for tentativa in range(MAX_TENTATIVAS):
+        restante = prazo.restante()
+        if restante < PRAZO_MINIMO:
+            break
+        try:
+            resultado = chamada(min(restante, PRAZO_TENTATIVA))
+        except Exception as e:
+            erro = _descricao(e)
+            conta_falha = _status(e) not in _STATUS_DA_REQUISICAO
+            if not erro_transitorio(e) or tentativa == MAX_TENTATIVAS - 1:
+                break
+            espera = random.uniform(0, min(ESPERA_MAX, ESPERA_BASE * 2 ** tentativa))
+            if prazo.restante() - espera < PRAZO_MINIMO:
+                break
+            registrar_evento(provedor, "nova_tentativa", f"{erro} (espera {espera:.1f}s)", ponto)
+            time.sleep(espera)
+            continue
+        _sucesso(provedor)
+        return resultado, None
+    registrar_evento(provedor, "falha", erro, ponto)
+    if conta_falha:
+        _falha(provedor, ponto)
+    else:
+        _sucesso(provedor)
+    return None, erro
@@ -0,0 +1,172 @@
+"""
+Busca aproximada de nomes de fornecedores (contas a pagar) e clientes (contas a receber).
+1. Cada conta guarda o nome normalizado (sem acentos, minúsculo, só letras/números) numa coluna indexada
+   (fornecedor_normalizado / cliente_normalizado), mantida pelo próprio modelo.
+2. Um dicionário em memória por entidade (nome normalizado -> nome exibido; outro só com os nomes de contas em
+   aberto, para dar baixa) é recarregado só quando a tabela muda (contagem + último updated_at), e o casamento
+   aproximado roda sobre ele: rapidfuzz quando instalado, senão
+   difflib (mesma escala 0-100). "Joao" acha "João", "Mria" acha "Maria", "energia" acha "Energia Elétrica".
+3. As contas dos nomes escolhidos são buscadas por igualdade (IN) na coluna normalizada, usando o índice.
+"""
+import re
+import threading
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+# Pontuação mínima (0-100) para um nome entrar nos candidatos
+SCORE_MINIMO = 75.0
+# Acima disto o nome digitado é tratado como o mesmo nome já cadastrado (acento, maiúscula, erro de digitação)
+SCORE_MESMO_NOME = 92.0
+MAX_CANDIDATOS = 5
+
+_lock = threading.Lock()
+_indices: Dict[str, Dict[str, Any]] = {}
+
+
+def normalizar_nome(nome: Optional[str]) -> str:
+    """Nome sem acentos, minúsculo, com pontuação trocada por espaço e espaços simples ("João  S." -> "joao s")."""
+    t = unicodedata.normalize("NFKD", (nome or "").lower())
+    t = "".join(c for c in t if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", t).split())
+
+
+def _rapidfuzz():
+    """Módulos do rapidfuzz (fuzz, process) ou None quando não instalado."""
+    try:
+        from rapidfuzz import fuzz, process
+    except ImportError:
+        return None
+    return fuzz, process
+
+
+def _similaridade_python(termo: str, nome: str) -> float:
+    """
+    Similaridade 0-100 sem dependências: o maior entre a razão do difflib no nome inteiro, na melhor janela
+    de palavras do nome com o tamanho do termo (parcial, com desconto) e a contenção do termo no nome.
+    """
+    if not termo or not nome:
+        return 0.0
+    if termo == nome:
+        return 100.0
+    melhor = SequenceMatcher(None, termo, nome).ratio()
+    palavras_t, palavras_n = termo.split(), nome.split()
+    n = len(palavras_t)
+    if n < len(palavras_n):
+        parcial = max(
+            SequenceMatcher(None, termo, " ".join(palavras_n[i:i + n])).ratio()
+            for i in range(len(palavras_n) - n + 1)
+        )
+        melhor = max(melhor, parcial * 0.9)
+    if termo in nome:
+        melhor = max(melhor, 0.8 + 0.1 * len(termo) / len(nome))
+    return round(melhor * 100, 1)
+
+
+def similaridade(termo: str, nome: str) -> float:
+    """Similaridade 0-100 entre dois nomes (normalizados aqui); rapidfuzz (WRatio) quando instalado."""
+    termo, nome = normalizar_nome(termo), normalizar_nome(nome)
+    rf = _rapidfuzz()
+    if rf is not None:
+        return round(float(rf[0].WRatio(termo, nome)), 1)
+    return _similaridade_python(termo, nome)
+
+
+def _modelo(entity: str):
+    """(modelo, coluna do nome, coluna normalizada, data de quitação) da entidade."""
+    if entity == "contas_pagar":
+        from models.account_payable import AccountPayable
+        return (
+            AccountPayable, AccountPayable.fornecedor, AccountPayable.fornecedor_normalizado,
+            AccountPayable.data_pagamento,
+        )
+    if entity == "contas_receber":
+        from models.account_receivable import AccountReceivable
+        return (
+            AccountReceivable, AccountReceivable.cliente, AccountReceivable.cliente_normalizado,
+            AccountReceivable.data_recebimento,
+        )
+    raise ValueError(f"Entidade sem nomes: {entity}")
+
+
+def _dicionario(db: Session, entity: str, abertas: bool = False) -> Dict[str, str]:
+    """
+    Nome normalizado -> nome exibido (o mais recente), recarregado só quando a tabela muda.
+    abertas: só nomes com alguma conta ainda não paga/recebida.
+    """
+    modelo, coluna, normalizada, quitacao = _modelo(entity)
+    chave = f"{entity}:abertas" if abertas else entity
+    assinatura: Tuple[Any, ...] = tuple(db.query(func.count(modelo.id), func.max(modelo.updated_at)).one())
+    with _lock:
+        atual = _indices.get(chave)
+        if atual is not None and atual["assinatura"] == assinatura:
+            return atual["nomes"]
+    consulta = db.query(coluna, normalizada)
+    if abertas:
+        consulta = consulta.filter(quitacao.is_(None))
+    nomes: Dict[str, str] = {}
+    for nome, norm in consulta.order_by(modelo.updated_at).all():
+        norm = norm or normalizar_nome(nome)
+        if norm:
+            nomes[norm] = nome
+    with _lock:
+        _indices[chave] = {"assinatura": assinatura, "nomes": nomes}
+    return nomes
+
+
+def candidatos(
+    db: Session,
+    entity: str,
+    termo: str,
+    limite: int = MAX_CANDIDATOS,
+    minimo: float = SCORE_MINIMO,
+    abertas: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Nomes cadastrados parecidos com o termo, do mais ao menos parecido:
+    [{"nome": exibido, "normalizado": ..., "score": 0-100}], só os com score >= minimo.
+    abertas: ranqueia só os nomes com conta em aberto (dar baixa), para que contas já quitadas de nomes
+    parecidos não ocupem as vagas do limite.
+    """
+    alvo = normalizar_nome(termo)
+    if not alvo:
+        return []
+    nomes = _dicionario(db, entity, abertas)
+    if not nomes:
+        return []
+    rf = _rapidfuzz()
+    if rf is not None:
+        fuzz, process = rf
+        achados = [(norm, float(score)) for norm, score, _ in process.extract(
+            alvo, list(nomes), scorer=fuzz.WRatio, limit=limite, score_cutoff=minimo
+        )]
+    else:
+        achados = [(norm, _similaridade_python(alvo, norm)) for norm in nomes]
+        achados = sorted((a for a in achados if a[1] >= minimo), key=lambda a: -a[1])[:limite]
+    return [{"nome": nomes[norm], "normalizado": norm, "score": round(score, 1)} for norm, score in achados]
+
+
+def mesmo_nome(db: Session, entity: str, termo: str) -> Optional[str]:
+    """Nome já cadastrado equivalente ao termo (score >= SCORE_MESMO_NOME), para não duplicar "Joao" e "João"."""
+    achados = candidatos(db, entity, termo, limite=1, minimo=SCORE_MESMO_NOME)
+    return achados[0]["nome"] if achados else None
+
+
+def filtro_nome(db: Session, entity: str, termo: str, minimo: float = SCORE_MINIMO):
+    """
+    Condição SQLAlchemy para filtrar as contas pelos nomes parecidos com o termo (IN na coluna normalizada,
+    indexada), ou None quando nenhum nome cadastrado se parece com o termo.
+    """
+    achados = candidatos(db, entity, termo, limite=MAX_CANDIDATOS, minimo=minimo)
+    if not achados:
+        return None
+    return _modelo(entity)[2].in_([a["normalizado"] for a in achados])
+
+
+def resetar() -> None:
+    """Descarta os dicionários em memória (recarregados na próxima busca)."""
+    with _lock:
+        _indices.clear()
@@ -0,0 +1,190 @@
+"""
+Manchetes de economia/varejo (RSS) para a análise avançada do Agente de Relatórios.
+As consultas só leem o cache (memória + arquivo em data/); quando ele passa do TTL, a atualização roda em
+segundo plano: os feeds são buscados em paralelo com prazo total e GET condicional (ETag / If-Modified-Since),
+de modo que um feed lento ou fora do ar nunca segura a resposta ao usuário.
+"""
+import json
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from config.database import DB_DIR
+
+FEEDS = [
+    "https://rss.uol.com.br/feed/economia.xml",
+    "https://feeds.folha.uol.com.br/mercado/rss091.xml",
+]
+CACHE_PATH = DB_DIR / "noticias_cache.json"
+TTL = int(os.getenv("NEWS_TTL", "1800"))  # segundos até o cache de um feed ser considerado velho
+PRAZO_TOTAL = 6.0  # prazo da atualização de todos os feeds juntos (s)
+ESPERA_APOS_FALHA = 300  # feed que falhou só é tentado de novo depois disso (s)
+MAX_ITENS_FEED = 10
+USER_AGENT = "Mozilla/5.0 (compatible; PDV-Bot/1.0)"
+
+_lock = threading.Lock()
+_cache: Optional[Dict[str, Dict[str, Any]]] = None
+_atualizando = False
+
+
+def _carregar() -> Dict[str, Dict[str, Any]]:
+    """Cache por URL: {"items", "etag", "last_modified", "fetched_at"}; lido do arquivo na primeira vez."""
+    global _cache
+    if _cache is None:
+        try:
+            _cache = json.loads(Path(CACHE_PATH).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def _gravar(cache: Dict[str, Dict[str, Any]]) -> None:
+    """Grava o cache no arquivo (arquivo temporário + troca, para nunca deixar JSON pela metade)."""
+    caminho = Path(CACHE_PATH)
+    tmp = caminho.with_suffix(".tmp")
+    try:
+        tmp.write_text(json.dumps(cache, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, caminho)
+    except OSError:
+        pass
+
+
+def _parse(xml: str, limit: int = MAX_ITENS_FEED) -> List[Dict[str, str]]:
+    """Itens (título e link) de um RSS."""
+    root = ET.fromstring(xml)
+    items = []
+    for item in (root.findall(".//item") or root.findall(".//{*}item"))[:limit]:
+        title = item.find("title")
+        link = item.find("link")
+        if title is not None and title.text:
+            items.append({
+                "title": title.text.strip(),
+                "link": link.text.strip() if link is not None and link.text else "",
+            })
+    return items
+
+
+def _buscar(url: str, anterior: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """
+    Busca um feed com GET condicional. 304 (não mudou) mantém os itens e renova fetched_at;
+    200 traz itens novos e os validadores (ETag / Last-Modified) para a próxima vez.
+    """
+    headers = {"User-Agent": USER_AGENT}
+    if anterior.get("etag"):
+        headers["If-None-Match"] = anterior["etag"]
+    if anterior.get("last_modified"):
+        headers["If-Modified-Since"] = anterior["last_modified"]
+    try:
+        with urlopen(Request(url, headers=headers), timeout=timeout) as resp:
+            corpo = resp.read().decode("utf-8", errors="replace")
+            etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+    except HTTPError as e:
+        if e.code == 304 and anterior.get("items") is not None:
+            return {**anterior, "fetched_at": time.time()}
+        raise
+    return {
+        "items": _parse(corpo),
+        "etag": etag,
+        "last_modified": last_modified,
+        "fetched_at": time.time(),
+    }
+
+
+def _vencido(entrada: Optional[Dict[str, Any]], agora: float) -> bool:
+    """True quando o feed passou do TTL (e não falhou há pouco: aí espera ESPERA_APOS_FALHA)."""
+    if not entrada:
+        return True
+    if agora - float(entrada.get("falhou_em") or 0) < ESPERA_APOS_FALHA:
+        return False
+    return agora - float(entrada.get("fetched_at") or 0) >= TTL
+
+
+def atualizar(prazo: float = PRAZO_TOTAL, forcar: bool = False) -> int:
+    """
+    Busca em paralelo os feeds vencidos (ou todos, com forcar) e espera no máximo `prazo` segundos no total;
+    feeds que não responderam a tempo ou falharam mantêm o que já estava em cache.
+    Retorna quantos feeds foram atualizados.
+    """
+    with _lock:
+        cache = dict(_carregar())
+    agora = time.time()
+    pendentes = [url for url in FEEDS if forcar or _vencido(cache.get(url), agora)]
+    if not pendentes:
+        return 0
+    pool = ThreadPoolExecutor(max_workers=len(pendentes))
+    try:
+        futuros = {pool.submit(_buscar, url, cache.get(url) or {}, prazo): url for url in pendentes}
+        prontos, _ = wait(futuros, timeout=prazo)
+    finally:
+        # Não espera os atrasados: eles terminam (ou estouram o timeout) sozinhos e o resultado é descartado
+        pool.shutdown(wait=False)
+    novos = {}
+    for f in prontos:
+        try:
+            novos[futuros[f]] = f.result()
+        except Exception:
+            continue
+    with _lock:
+        atual = _carregar()
+        for url in pendentes:
+            if url in novos:
+                atual[url] = novos[url]
+            else:
+                atual[url] = {**(atual.get(url) or {}), "falhou_em": agora}
+        _gravar(atual)
+    return len(novos)
+
+
+def atualizar_em_segundo_plano(forcar: bool = False) -> bool:
+    """Dispara atualizar() numa thread, se nenhuma estiver rodando. Retorna True se iniciou."""
+    global _atualizando
+    with _lock:
+        if _atualizando:
+            return False
+        _atualizando = True
+
+    def _rodar():
+        global _atualizando
+        try:
+            atualizar(forcar=forcar)
+        except Exception:
+            pass
+        finally:
+            with _lock:
+                _atualizando = False
+
+    threading.Thread(target=_rodar, name="noticias", daemon=True).start()
+    return True
+
+
+def manchetes(limit: int = 5) -> List[Dict[str, str]]:
+    """
+    Manchetes do cache, na ordem dos feeds e sem repetição, sem acessar a rede. Se algum feed estiver
+    vencido, agenda a atualização em segundo plano (a próxima consulta já recebe as novas).
+    """
+    agora = time.time()
+    with _lock:
+        cache = _carregar()
+        vencido = any(_vencido(cache.get(url), agora) for url in FEEDS)
+        itens, vistos = [], set()
+        for url in FEEDS:
+            for item in (cache.get(url) or {}).get("items") or []:
+                if item["title"] not in vistos:
+                    vistos.add(item["title"])
+                    itens.append(item)
+    if vencido:
+        atualizar_em_segundo_plano()
+    return itens[:limit]
+
+
+def resetar() -> None:
+    """Esquece o cache em memória (o arquivo é relido na próxima consulta)."""
+    global _cache
+    with _lock:
+        _cache = None
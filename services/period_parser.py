@@ -0,0 +1,485 @@
+"""
+Interpretador determinístico de expressões de período em português (pt-BR), sem IA.
+Entende "hoje", "ontem", "últimos 90 dias", "semana passada", "mês retrasado", "1º trimestre de 2025",
+"segundo semestre", "primeira quinzena de março", "de 10/03 a 15/04", "10 de março", "janeiro de 2025",
+"desde o carnaval", "na sexta", "2025" etc., com ou sem acentos e com pequenos erros de digitação.
+Retorna datas de início e fim (inclusive) ou None quando não há período ou há mais de um sem ligação entre eles.
+"""
+import difflib
+import re
+import unicodedata
+from calendar import monthrange
+from datetime import date, timedelta
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dateutil.relativedelta import relativedelta
+
+DATA_GERAL = date(2000, 1, 1)
+
+MESES = {
+    "janeiro": 1, "fevereiro": 2, "marco": 3, "abril": 4, "maio": 5, "junho": 6,
+    "julho": 7, "agosto": 8, "setembro": 9, "outubro": 10, "novembro": 11, "dezembro": 12,
+}
+_MESES_ABREV = {nome[:3]: n for nome, n in MESES.items()}
+DIAS_SEMANA = {"segunda": 0, "terca": 1, "quarta": 2, "quinta": 3, "sexta": 4, "sabado": 5, "domingo": 6}
+_NUMEROS = {
+    "um": 1, "uma": 1, "dois": 2, "duas": 2, "tres": 3, "quatro": 4, "cinco": 5, "seis": 6, "sete": 7,
+    "oito": 8, "nove": 9, "dez": 10, "onze": 11, "doze": 12, "quinze": 15, "vinte": 20, "trinta": 30,
+    "quarenta": 40, "sessenta": 60, "noventa": 90, "cem": 100, "cento e oitenta": 180,
+}
+_ORDINAIS = {"primeiro": 1, "primeira": 1, "segundo": 2, "segunda": 2, "terceiro": 3, "terceira": 3, "quarto": 4, "quarta": 4}
+
+# Palavras que podem ser corrigidas por aproximação ("semna" -> "semana", "fevreiro" -> "fevereiro")
+_ALVOS_CORRECAO = sorted(
+    {m for m in MESES if len(m) >= 5}
+    | set(DIAS_SEMANA)
+    | {"semana", "semanas", "passada", "passado", "passados", "passadas", "retrasada", "retrasado", "ultimos", "ultimas",
+       "ultimo", "ultima", "trimestre", "semestre", "quinzena", "primeiro", "primeira", "segundo", "terceiro",
+       "terceira", "carnaval", "pascoa", "anteontem", "amanha", "desde", "anterior", "corrente", "proximo", "proxima"}
+)
+# Palavras comuns nas perguntas que nunca devem ser "corrigidas" para um termo de período
+_NAO_CORRIGIR = {
+    "quanto", "quantos", "quantas", "quais", "vendas", "vendi", "vendeu", "venda", "contas", "conta", "pagar", "receber",
+    "estoque", "produtos", "produto", "lucro", "total", "fiado", "fiados", "agenda", "resumo", "mostre", "mostra",
+    "quero", "saber", "semanal", "mensal", "compras", "caixa", "entrada", "entradas", "sessoes", "cliente", "clientes",
+    "faturamento", "faturei", "ticket", "medio", "pagos", "pagas", "pago", "paga", "abertas", "aberto", "vencidas",
+    "primeiros", "terceiros", "quartos", "passar", "sexto", "setimo", "outros", "outras", "tenho", "temos", "teste",
+    "maior", "dominio", "passos", "marcado", "marcada", "atrasado", "atrasada", "atrasados", "atrasadas",
+} | set(_NUMEROS)
+
+_MES = r"(" + "|".join(MESES) + r")"
+_ANO = r"((?:19|20)\d{2})"
+_MES_OU_ABREV = r"(" + "|".join(list(MESES) + list(_MESES_ABREV)) + r")"
+_NUM = r"(\d{1,4}|" + "|".join(sorted(_NUMEROS, key=len, reverse=True)) + r")"
+_ORD = r"(?:(\d)\s*[oa]?|(primeir[oa]|segund[oa]|terceir[oa]|quart[oa]))"
+# "este", "neste", "deste", "esse", "nesse", "desse", "do", "no" (e femininos)
+_ESTE = r"(?:(?:d|n)?(?:est|ess)[eao]|d[eoa]|n[oa])"
+_DIA_SEMANA = r"(segunda|terca|quarta|quinta|sexta|sabado|domingo)(?:[\s-]*feira)?"
+_RE_DIA_SEMANA = re.compile(r"^" + _DIA_SEMANA + r"$")
+
+# Ligações entre dois períodos que formam um intervalo ("de X a Y", "entre X e Y", "desde X até Y")
+_RE_LIGACAO_INTERVALO = re.compile(r"^\s*(?:a|ate|ao|a\s+o|-)\s*$")
+_RE_LIGACAO_ENTRE = re.compile(r"^\s*e\s*$")
+_RE_ANTES_ENTRE = re.compile(r"\bentre\s*$")
+# Palavras que podem acompanhar uma resposta que é só um período ("pode ser do mês passado", "quero de 2025")
+_PALAVRAS_VAZIAS = {
+    "a", "o", "as", "os", "de", "do", "da", "dos", "das", "no", "na", "nos", "nas", "em", "e", "entre", "desde", "ate",
+    "ao", "dia", "periodo", "pode", "ser", "quero", "queria", "ok", "sim", "entao", "por", "favor", "pf", "pfv",
+    "referente", "relativo", "pra", "para", "partir", "todo", "toda", "inteiro", "inteira", "completo", "completa",
+}
+# Trechos que só fazem sentido a partir de hoje ("ontem", "últimos 30 dias", "semana passada", "este mês")
+_RE_RELATIVO = re.compile(
+    r"\b(?:hoje|ontem|anteontem|amanha|atras|ha|ultim[oa]s?|passad[oa]s?|retrasad[oa]|anterior|proxim[oa]|vem|atual"
+    r"|corrente|semanal|mensal|(?:d|n)?(?:est|ess)[eao])\b"
+)
+# Recorte de um período que o interpretador não resolve ("primeira semana de março", "início de abril", "10 primeiros
+# dias de"): sem ele a resposta seria o período inteiro; com ele não há período único (a IA decide)
+_RE_RECORTE = re.compile(
+    r"\b(?:(?:primeir|segund|terceir|quart|quint|ultim|penultim)[oa]s?\s+(?:\d+\s+|" + "|".join(_NUMEROS) + r"\s+)?"
+    r"(?:semanas?|dias?|quinzenas?)|(?:\d+|" + "|".join(_NUMEROS) + r")\s+(?:primeir|ultim)[oa]s?\s+(?:semanas?|dias?)|"
+    r"semana\s+\d|inicio|comeco|fim|final|meados|metade)\s+(?:de|do|da)\s*$"
+)
+# Ano solto só como período quando vem depois de uma palavra de período ("em 2025", "de 2025") ou sozinho ("2025"),
+# não depois de outra palavra ("produto 2025", "código 2025")
+_RE_ANTES_ANO = re.compile(r"(?:^|\b(?:em|de|do|no|ate|a|ao|e|desde|entre)\s+)$")
+_RE_ANTES_DESDE = re.compile(r"\b(?:desde|a\s+partir\s+d[eoa]s?|depois\s+d[eoa]s?)\s*(?:o|a|os|as|dia|do\s+dia)?\s*$")
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sem acentos, "1º" -> "1o" e só letras, dígitos, "/" e "-" (demais caracteres viram espaço)."""
+    t = unicodedata.normalize("NFKD", (texto or "").lower().replace("°", "o"))
+    t = "".join(c for c in t if not unicodedata.combining(c))
+    t = re.sub(r"[^a-z0-9/\-]+", " ", t)
+    return " ".join(t.split())
+
+
+@lru_cache(maxsize=4096)
+def _corrigir_palavra(palavra: str) -> str:
+    """Troca a palavra pelo termo de período mais parecido (mesma inicial), se houver um bem próximo."""
+    if len(palavra) < 5 or not palavra.isalpha() or palavra in _NAO_CORRIGIR or palavra in _ALVOS_CORRECAO:
+        return palavra
+    alvos = [a for a in _ALVOS_CORRECAO if a[0] == palavra[0]]
+    proximas = difflib.get_close_matches(palavra, alvos, n=1, cutoff=0.85)
+    return proximas[0] if proximas else palavra
+
+
+def _corrigir(texto: str) -> str:
+    """Aplica a correção aproximada palavra a palavra."""
+    return " ".join(_corrigir_palavra(p) for p in texto.split())
+
+
+def _numero(valor: str) -> Optional[int]:
+    """"90" ou "noventa" -> 90."""
+    if valor is None:
+        return None
+    if valor.isdigit():
+        return int(valor)
+    return _NUMEROS.get(valor)
+
+
+def _ordinal(digito: Optional[str], palavra: Optional[str]) -> Optional[int]:
+    """"1"/"primeiro" -> 1."""
+    if digito:
+        return int(digito)
+    return _ORDINAIS.get(palavra or "")
+
+
+def _ano(valor: Optional[str], hoje: date) -> int:
+    """Ano com 2 ou 4 dígitos; sem ano, o atual."""
+    if not valor:
+        return hoje.year
+    n = int(valor)
+    return 2000 + n if n < 100 else n
+
+
+def _fim_mes(ano: int, mes: int) -> date:
+    return date(ano, mes, monthrange(ano, mes)[1])
+
+
+def _pascoa(ano: int) -> date:
+    """Domingo de Páscoa (algoritmo de Meeus/Jones/Butcher)."""
+    a, b, c = ano % 19, ano // 100, ano % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes = (h + l - 7 * m + 114) // 31
+    dia = ((h + l - 7 * m + 114) % 31) + 1
+    return date(ano, mes, dia)
+
+
+def _n_esimo_dia_semana(ano: int, mes: int, dia_semana: int, n: int) -> date:
+    """n-ésimo dia da semana do mês (0 = segunda)."""
+    primeiro = date(ano, mes, 1)
+    return primeiro + timedelta(days=(dia_semana - primeiro.weekday()) % 7 + 7 * (n - 1))
+
+
+# Datas comemorativas: nome -> função(ano) -> (início, fim)
+_FERIADOS: Dict[str, Callable[[int], Tuple[date, date]]] = {
+    "carnaval": lambda a: (_pascoa(a) - timedelta(days=50), _pascoa(a) - timedelta(days=47)),
+    "pascoa": lambda a: (_pascoa(a) - timedelta(days=2), _pascoa(a)),
+    "natal": lambda a: (date(a, 12, 25), date(a, 12, 25)),
+    "ano novo": lambda a: (date(a, 1, 1), date(a, 1, 1)),
+    "reveillon": lambda a: (date(a, 12, 31), date(a, 12, 31)),
+    "dia das maes": lambda a: (_n_esimo_dia_semana(a, 5, 6, 2),) * 2,
+    "dia dos pais": lambda a: (_n_esimo_dia_semana(a, 8, 6, 2),) * 2,
+    "dia dos namorados": lambda a: (date(a, 6, 12), date(a, 6, 12)),
+    "dia das criancas": lambda a: (date(a, 10, 12), date(a, 10, 12)),
+    "black friday": lambda a: (_n_esimo_dia_semana(a, 11, 3, 4) + timedelta(days=1),) * 2,
+}
+
+Periodo = Tuple[date, date, str]
+
+
+def _semana(hoje: date, deslocamento: int) -> Periodo:
+    """Semana de segunda a domingo; deslocamento 0 = atual (até hoje), -1 = passada, +1 = próxima."""
+    inicio = hoje - timedelta(days=hoje.weekday()) + timedelta(weeks=deslocamento)
+    if deslocamento == 0:
+        return inicio, hoje, "semana_atual"
+    return inicio, inicio + timedelta(days=6), "semana"
+
+
+def _mes(hoje: date, deslocamento: int) -> Periodo:
+    """Mês relativo ao atual; o atual vai até hoje."""
+    inicio = hoje.replace(day=1) + relativedelta(months=deslocamento)
+    if deslocamento == 0:
+        return inicio, hoje, "mes_atual"
+    return inicio, _fim_mes(inicio.year, inicio.month), "proximo_mes" if deslocamento == 1 else "mes_especifico"
+
+
+def _ano_relativo(hoje: date, deslocamento: int) -> Periodo:
+    ano = hoje.year + deslocamento
+    if deslocamento == 0:
+        return date(ano, 1, 1), hoje, "ano_atual"
+    return date(ano, 1, 1), date(ano, 12, 31), "anual"
+
+
+def _bloco(hoje: date, meses: int, deslocamento: int) -> Periodo:
+    """Trimestre (meses=3) ou semestre (meses=6) relativo ao atual; o atual vai até hoje."""
+    inicio = date(hoje.year, (hoje.month - 1) // meses * meses + 1, 1) + relativedelta(months=meses * deslocamento)
+    fim = inicio + relativedelta(months=meses) - timedelta(days=1)
+    tipo = "trimestre" if meses == 3 else "semestre"
+    return inicio, hoje if deslocamento == 0 else fim, tipo
+
+
+def _bloco_ordinal(m: "re.Match[str]", hoje: date, meses: int) -> Optional[Periodo]:
+    n = _ordinal(m.group(1), m.group(2))
+    if not n or n > 12 // meses:
+        return None
+    ano = _ano(m.group(3), hoje)
+    inicio = date(ano, (n - 1) * meses + 1, 1)
+    return inicio, inicio + relativedelta(months=meses) - timedelta(days=1), "trimestre" if meses == 3 else "semestre"
+
+
+def _ultimos(m: "re.Match[str]", hoje: date) -> Optional[Periodo]:
+    n = _numero(m.group(1))
+    unidade = m.group(2)
+    if not n:
+        return None
+    if unidade.startswith("dia"):
+        inicio = hoje - timedelta(days=n - 1)
+    elif unidade.startswith("semana"):
+        inicio = hoje - timedelta(weeks=n) + timedelta(days=1)
+    elif unidade.startswith("mes"):
+        inicio = hoje - relativedelta(months=n) + timedelta(days=1)
+    else:
+        inicio = hoje - relativedelta(years=n) + timedelta(days=1)
+    return inicio, hoje, "ultimos_dias"
+
+
+def _dias_atras(m: "re.Match[str]", hoje: date) -> Optional[Periodo]:
+    """"3 dias atrás" / "há 3 dias": o dia em si."""
+    n = _numero(m.group(1) or m.group(2))
+    if n is None:
+        return None
+    d = hoje - timedelta(days=n)
+    return d, d, "dia"
+
+
+def _data(dia: int, mes: int, ano: int) -> Optional[Periodo]:
+    try:
+        d = date(ano, mes, dia)
+    except ValueError:
+        return None
+    return d, d, "dia"
+
+
+def _mes_nomeado(m: "re.Match[str]", hoje: date) -> Optional[Periodo]:
+    mes = MESES[m.group(1)]
+    ano = _ano(m.group(2), hoje)
+    return date(ano, mes, 1), _fim_mes(ano, mes), "mes_especifico"
+
+
+def _intervalo_dias_mes(m: "re.Match[str]", hoje: date) -> Optional[Periodo]:
+    """"de 10 a 15 de março (de 2025)"."""
+    mes, ano = MESES[m.group(3)], _ano(m.group(4), hoje)
+    ini, fim = _data(int(m.group(1)), mes, ano), _data(int(m.group(2)), mes, ano)
+    if not ini or not fim or fim[0] < ini[0]:
+        return None
+    return ini[0], fim[0], "personalizado"
+
+
+def _quinzena(m: "re.Match[str]", hoje: date) -> Optional[Periodo]:
+    """Primeira (1 a 15) ou segunda (16 ao fim) quinzena do mês citado ou do atual."""
+    n = 1 if (m.group(1) == "primeir" or m.group(2) == "1") else 2
+    mes = MESES[m.group(3)] if m.group(3) else hoje.month
+    ano = _ano(m.group(4), hoje)
+    if n == 1:
+        return date(ano, mes, 1), date(ano, mes, 15), "quinzena"
+    return date(ano, mes, 16), _fim_mes(ano, mes), "quinzena"
+
+
+def _mes_nomeado_num(mes: int, ano: int) -> Optional[Periodo]:
+    if not 1 <= mes <= 12:
+        return None
+    return date(ano, mes, 1), _fim_mes(ano, mes), "mes_especifico"
+
+
+def _mes_qualquer(nome: str) -> int:
+    """Número do mês pelo nome completo ou abreviado ("marco", "mar")."""
+    return MESES.get(nome) or _MESES_ABREV[nome]
+
+
+def _intervalo_meses(m: "re.Match[str]", hoje: date) -> Optional[Periodo]:
+    """"de mar a jun", "de jan até março de 2025": meses inteiros; o ano citado vale para o fim do intervalo."""
+    ini_mes, fim_mes = _mes_qualquer(m.group(1)), _mes_qualquer(m.group(2))
+    ano = _ano(m.group(3), hoje)
+    ano_inicio = ano - 1 if ini_mes > fim_mes else ano
+    return date(ano_inicio, ini_mes, 1), _fim_mes(ano, fim_mes), "personalizado"
+
+
+def _feriado(m: "re.Match[str]", hoje: date) -> Optional[Periodo]:
+    """Data comemorativa do ano informado ou, sem ano, a ocorrência mais recente (já iniciada)."""
+    fn = _FERIADOS[m.group(1)]
+    if m.group(2):
+        inicio, fim = fn(int(m.group(2)))
+    else:
+        inicio, fim = fn(hoje.year)
+        if inicio > hoje:
+            inicio, fim = fn(hoje.year - 1)
+    return inicio, fim, "feriado"
+
+
+def _dia_semana(m: "re.Match[str]", hoje: date) -> Optional[Periodo]:
+    """Ocorrência mais recente do dia da semana (hoje inclusive; "passada" exclui hoje)."""
+    alvo = DIAS_SEMANA[m.group(1)]
+    atras = (hoje.weekday() - alvo) % 7
+    if atras == 0 and m.group(2):
+        atras = 7
+    d = hoje - timedelta(days=atras)
+    return d, d, "dia"
+
+
+def _ano_solto(m: "re.Match[str]", hoje: date) -> Optional[Periodo]:
+    """"ano de 2025", "em 2025" ou só "2025"; None para um número depois de outra palavra ("produto 2025")."""
+    if not m.group(0).startswith("ano") and not _RE_ANTES_ANO.search(m.string[:m.start()]):
+        return None
+    ano = int(m.group(1))
+    return date(ano, 1, 1), date(ano, 12, 31), "anual"
+
+
+def _fim_de_semana(hoje: date) -> Periodo:
+    """Sábado e domingo mais recentes (o atual, se hoje for sábado ou domingo)."""
+    sabado = hoje - timedelta(days=(hoje.weekday() - 5) % 7)
+    return sabado, sabado + timedelta(days=1), "personalizado"
+
+
+def _intervalo_dias_semana(inicio: int, fim: int, hoje: date) -> Tuple[date, date]:
+    """"de segunda a sexta": a ocorrência completa mais recente (termina hoje ou antes, na semana atual ou na passada)."""
+    final = hoje - timedelta(days=(hoje.weekday() - fim) % 7)
+    return final - timedelta(days=(fim - inicio) % 7), final
+
+
+# Padrões em ordem de prioridade: os mais específicos primeiro. Um trecho já reconhecido não é reconhecido de novo.
+_PADROES: List[Tuple["re.Pattern[str]", Callable[["re.Match[str]", date], Optional[Periodo]]]] = [
+    (re.compile(r"\b(desde sempre|desde o inicio|todo o periodo|periodo todo|todo o historico|historico completo)\b"),
+     lambda m, h: (DATA_GERAL, h, "geral")),
+    (re.compile(r"\b(\d{1,2})\s*(?:a|ate|ao|e|-)\s*(\d{1,2})\s+de\s+" + _MES + r"(?:\s+(?:de\s+)?" + _ANO + r")?\b"),
+     _intervalo_dias_mes),
+    (re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b"),
+     lambda m, h: _data(int(m.group(3)), int(m.group(2)), int(m.group(1)))),
+    (re.compile(r"(?<![\d/])(\d{1,2})/(\d{1,2})(?:/(\d{4}|\d{2}))?(?![\d/])"),
+     lambda m, h: _data(int(m.group(1)), int(m.group(2)), _ano(m.group(3), h))),
+    (re.compile(r"\b(\d{1,2})\s+de\s+" + _MES + r"(?:\s+(?:de\s+)?" + _ANO + r")?\b"),
+     lambda m, h: _data(int(m.group(1)), MESES[m.group(2)], _ano(m.group(3), h))),
+    (re.compile(r"\b(?:(primeir|segund)a|(1|2)\s*a?)\s+quinzena(?:\s+(?:de|do\s+mes\s+de)\s+" + _MES + r")?(?:\s+(?:de\s+)?" + _ANO + r")?\b"),
+     _quinzena),
+    (re.compile(r"\b" + _ORD + r"\s*tri(?:mestre)?(?:\s+(?:de|do\s+ano\s+de)?\s*" + _ANO + r")?\b"),
+     lambda m, h: _bloco_ordinal(m, h, 3)),
+    (re.compile(r"\b" + _ORD + r"\s*semestre(?:\s+(?:de|do\s+ano\s+de)?\s*" + _ANO + r")?\b"),
+     lambda m, h: _bloco_ordinal(m, h, 6)),
+    (re.compile(r"\b(?:n?os\s+|n?as\s+)?(?:ultim[oa]s|passad[oa]s)\s+" + _NUM + r"\s+(dias?|semanas?|mes(?:es)?|anos?)\b"),
+     _ultimos),
+    (re.compile(r"\b(?:ha\s+)?" + _NUM + r"\s+dias?\s+atras\b|\bha\s+" + _NUM + r"\s+dias?\b"), _dias_atras),
+    (re.compile(r"\b(" + "|".join(_FERIADOS) + r")(?:\s+(?:de\s+)?" + _ANO + r")?\b"), _feriado),
+    (re.compile(r"\b(?:ultimo\s+)?fim\s+de\s+semana(?:\s+passado)?\b"), lambda m, h: _fim_de_semana(h)),
+    (re.compile(r"\bdepois\s+de\s+amanha\b"), lambda m, h: (h + timedelta(days=2), h + timedelta(days=2), "dia")),
+    (re.compile(r"\banteontem\b"), lambda m, h: (h - timedelta(days=2), h - timedelta(days=2), "dia")),
+    (re.compile(r"\bontem\b"), lambda m, h: (h - timedelta(days=1), h - timedelta(days=1), "dia")),
+    (re.compile(r"\bhoje\b"), lambda m, h: (h, h, "hoje")),
+    (re.compile(r"\bamanha\b"), lambda m, h: (h + timedelta(days=1), h + timedelta(days=1), "dia")),
+    (re.compile(r"\bsemana\s+retrasada\b"), lambda m, h: _semana(h, -2)),
+    (re.compile(r"\b(?:semana\s+passada|ultima\s+semana|semana\s+anterior)\b"), lambda m, h: _semana(h, -1)),
+    (re.compile(r"\b(?:proxima\s+semana|semana\s+que\s+vem)\b"), lambda m, h: _semana(h, 1)),
+    (re.compile(r"\b(?:" + _ESTE + r"\s+semana|semana\s+atual|semanal)\b"), lambda m, h: _semana(h, 0)),
+    (re.compile(r"\bmes\s+retrasado\b"), lambda m, h: _mes(h, -2)),
+    (re.compile(r"\b(?:mes\s+passado|ultimo\s+mes|mes\s+anterior)\b"), lambda m, h: _mes(h, -1)),
+    (re.compile(r"\b(?:proximo\s+mes|mes\s+que\s+vem)\b"), lambda m, h: _mes(h, 1)),
+    (re.compile(r"\b(?:" + _ESTE + r"\s+mes|mes\s+atual|mes\s+corrente|mensal)\b(?!\s+(?:de\s+)?" + _MES + r")"),
+     lambda m, h: _mes(h, 0)),
+    (re.compile(r"\btrimestre\s+(?:passado|anterior)|ultimo\s+trimestre\b"), lambda m, h: _bloco(h, 3, -1)),
+    (re.compile(r"\b(?:" + _ESTE + r"\s+trimestre|trimestre\s+atual)\b"), lambda m, h: _bloco(h, 3, 0)),
+    (re.compile(r"\bsemestre\s+(?:passado|anterior)|ultimo\s+semestre\b"), lambda m, h: _bloco(h, 6, -1)),
+    (re.compile(r"\b(?:" + _ESTE + r"\s+semestre|semestre\s+atual)\b"), lambda m, h: _bloco(h, 6, 0)),
+    (re.compile(r"\bano\s+retrasado\b"), lambda m, h: _ano_relativo(h, -2)),
+    (re.compile(r"\b(?:ano\s+passado|ultimo\s+ano|ano\s+anterior)\b"), lambda m, h: _ano_relativo(h, -1)),
+    (re.compile(r"\b(?:proximo\s+ano|ano\s+que\s+vem)\b"), lambda m, h: _ano_relativo(h, 1)),
+    (re.compile(r"\b(?:" + _ESTE + r"\s+ano|ano\s+atual|ano\s+corrente)\b(?!\s+(?:de\s+)?\d)"),
+     lambda m, h: _ano_relativo(h, 0)),
+    (re.compile(r"\b" + _MES_OU_ABREV + r"\s*(?:a|ate|ao|-)\s*" + _MES_OU_ABREV + r"(?:\s*(?:de|/)?\s*" + _ANO + r")?\b"),
+     _intervalo_meses),
+    (re.compile(r"(?<![\d/])(\d{1,2})/(\d{4})\b"),
+     lambda m, h: _mes_nomeado_num(int(m.group(1)), int(m.group(2)))),
+    (re.compile(r"\b(jan|fev|mar|abr|mai|jun|jul|ago|set|out|nov|dez)/(\d{2}|\d{4})\b"),
+     lambda m, h: _mes_nomeado_num(_MESES_ABREV[m.group(1)], _ano(m.group(2), h))),
+    (re.compile(r"\b" + _MES + r"(?:\s*(?:de|/)?\s*" + _ANO + r")?\b"), _mes_nomeado),
+    (re.compile(r"\b(?:ano\s+(?:de\s+)?)?" + _ANO + r"\b"), _ano_solto),
+    (re.compile(r"\bdia\s+(\d{1,2})\b"), lambda m, h: _data(int(m.group(1)), h.month, h.year)),
+    (re.compile(r"\b" + _DIA_SEMANA + r"(?!\s+(?:quinzena|semana|trimestre|semestre))(\s+passad[ao])?\b"), _dia_semana),
+]
+
+
+def _encontrar(texto: str, hoje: date) -> List[Tuple[int, int, Periodo]]:
+    """Todos os períodos citados, em ordem de posição no texto, sem trechos sobrepostos."""
+    achados: List[Tuple[int, int, Periodo]] = []
+    for rx, fn in _PADROES:
+        for m in rx.finditer(texto):
+            if any(m.start() < fim and ini < m.end() for ini, fim, _ in achados):
+                continue
+            periodo = fn(m, hoje)
+            if periodo:
+                achados.append((m.start(), m.end(), periodo))
+    return sorted(achados, key=lambda a: a[0])
+
+
+@lru_cache(maxsize=2048)
+def _interpretar(texto: str, hoje: date) -> Tuple[Optional[Tuple[date, date, str, str]], int]:
+    """(período, quantidade de períodos citados) para o texto já normalizado."""
+    achados = _encontrar(texto, hoje)
+    if not achados:
+        return None, 0
+    if any(_RE_RECORTE.search(texto[:ini]) for ini, _, _ in achados):
+        return None, len(achados)
+    if len(achados) == 1:
+        ini, fim, (inicio, final, tipo) = achados[0]
+        if _RE_ANTES_DESDE.search(texto[:ini]):
+            return (inicio, hoje, "desde", texto[ini:fim]), 1
+        return (inicio, final, tipo, texto[ini:fim]), 1
+    if len(achados) == 2:
+        (i1, f1, p1), (i2, f2, p2) = achados
+        ligacao = texto[f1:i2]
+        if _RE_LIGACAO_INTERVALO.match(ligacao) or (_RE_LIGACAO_ENTRE.match(ligacao) and _RE_ANTES_ENTRE.search(texto[:i1])):
+            dias_semana = [_RE_DIA_SEMANA.match(texto[i:f]) for i, f in ((i1, f1), (i2, f2))]
+            if all(dias_semana):
+                inicio, final = _intervalo_dias_semana(*(DIAS_SEMANA[d.group(1)] for d in dias_semana), hoje)
+                return (inicio, final, "personalizado", texto[i1:f2]), 1
+            inicio, final = p1[0], p2[1]
+            # "de 10/12 a 15/01" sem ano: o início é do ano anterior (só datas e meses; dias da semana já resolvidos)
+            if inicio > final and p1[2] in ("dia", "mes_especifico") and not re.search(r"\d{4}", texto[i1:f1]):
+                inicio = inicio - relativedelta(years=1)
+            if inicio <= final:
+                return (inicio, final, "personalizado", texto[i1:f2]), 1
+    return None, len(achados)
+
+
+def interpretar_periodo(texto: str, hoje: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """
+    Interpreta o período citado no texto. Retorna {"start": date, "end": date, "type": str, "trecho": str}
+    (mesmo formato de _process_period, mais o trecho reconhecido) ou None quando não há período
+    ou há mais de um período sem ligação de intervalo entre eles ("hoje e ontem").
+    """
+    hoje = hoje or date.today()
+    resultado, _ = _interpretar(_corrigir(normalizar(texto)), hoje)
+    if resultado is None:
+        return None
+    inicio, fim, tipo, trecho = resultado
+    return {"start": inicio, "end": fim, "type": tipo, "trecho": trecho}
+
+
+def so_periodo(texto: str, hoje: Optional[date] = None) -> bool:
+    """True se o texto é só um período (mais palavras de ligação), como a resposta a "De qual período?"."""
+    texto_norm = _corrigir(normalizar(texto))
+    resultado, _ = _interpretar(texto_norm, hoje or date.today())
+    if resultado is None:
+        return False
+    resto = texto_norm.replace(resultado[3], " ").split()
+    return all(p in _PALAVRAS_VAZIAS for p in resto)
+
+
+def fora_do_periodo(texto: str, hoje: Optional[date] = None) -> List[str]:
+    """Palavras do texto (normalizado, com a correção aproximada) fora dos trechos de período citados."""
+    texto_norm = _corrigir(normalizar(texto))
+    for ini, fim, _ in reversed(_encontrar(texto_norm, hoje or date.today())):
+        texto_norm = texto_norm[:ini] + " " + texto_norm[fim:]
+    return texto_norm.split()
+
+
+def cita_periodo(texto: str, hoje: Optional[date] = None) -> bool:
+    """True se o texto cita algum período (mesmo que ambíguo, como "hoje e ontem")."""
+    _, n = _interpretar(_corrigir(normalizar(texto)), hoje or date.today())
+    return n > 0
+
+
+def periodo_relativo(texto: str, hoje: Optional[date] = None) -> bool:
+    """
+    True se o texto cita período e todos os citados são relativos a hoje ("ontem", "últimos 30 dias",
+    "semana passada", "este mês comparado ao ano anterior"); False com um período nomeado ("março",
+    "de mar a jun", "1º trimestre", "natal", "dia 15") ou sem período.
+    """
+    texto_norm = _corrigir(normalizar(texto))
+    achados = _encontrar(texto_norm, hoje or date.today())
+    return bool(achados) and all(_RE_RELATIVO.search(texto_norm[ini:fim]) for ini, fim, _ in achados)
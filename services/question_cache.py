@@ -0,0 +1,308 @@
+"""
+Cache de perguntas do Agente de Relatórios, na frente da análise pela IA (analyze_query / planejador de turno).
+A mesma pergunta com outras palavras ("quanto vendi hoje?", "vendas de hoje", "faturamento hoje") vira a mesma chave:
+minúsculas, sem acentos, sem palavras vazias, sinônimos unificados, números e datas em forma canônica e palavras em
+ordem alfabética. A chave aponta para a última análise validada (consulta executada sem erro); o período é guardado
+de forma relativa (tipo ou deslocamento em dias) e recalculado para a data do dia por _process_period quando a
+pergunta não cita período ou cita só períodos relativos a hoje; com datas ou ano na pergunta, em datas absolutas.
+Perguntas com período nomeado sem ano ("março", "de mar a jun", "natal") não entram no cache.
+"""
+import json
+import re
+import threading
+import unicodedata
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from config.database import SessionLocal, engine
+from models.question_cache import QuestionCacheEntry
+from services.period_parser import DIAS_SEMANA, MESES, cita_periodo, periodo_relativo
+
+MAX_ENTRADAS = 1000
+MAX_PALAVRAS = 12  # perguntas longas quase nunca se repetem: não entram no cache
+
+# Períodos que _process_period sempre calcula a partir da data de hoje
+TIPOS_RELATIVOS = frozenset({"hoje", "mes_atual", "proximo_mes", "semanal", "geral", "ultimo_mes", "mensal"})
+# Assuntos que o cache guarda (SQL livre, respostas diretas e pedidos de período ficam de fora)
+TIPOS_CACHEAVEIS = frozenset({
+    "resumo_periodo", "produtos_mais_vendidos", "curva_abc", "produtos_juntos", "valor_estoque", "entradas_estoque",
+    "sessoes_caixa", "contas_pagar", "contas_receber", "agenda", "analise_avancada",
+})
+CAMPOS = ("intent", "data_type", "filters", "comparison", "metricas", "narrativa")
+
+PALAVRAS_VAZIAS = frozenset({
+    "a", "o", "as", "os", "ao", "aos", "um", "uma", "uns", "umas", "de", "do", "da", "dos", "das", "d", "em", "no", "na",
+    "nos", "nas", "num", "numa", "e", "ou", "para", "pra", "pro", "por", "pelo", "pela", "pelos", "pelas", "com",
+    "que", "qual", "quais", "quanto", "quantos", "quanta", "quantas", "como", "me", "mim", "eu", "meu", "meus", "minha",
+    "minhas", "nosso", "nossa", "voce", "vc", "este", "esta", "estes", "estas", "esse", "essa", "esses", "essas",
+    "deste", "desta", "desse", "dessa", "neste", "nesta", "nesse", "nessa", "isso", "isto", "ja", "ai", "la", "aqui",
+    "foi", "foram", "ser", "sao", "era", "estao", "ta", "tem", "tenho", "temos", "tive", "tivemos", "ha",
+    "houve", "quero", "queria", "gostaria", "saber", "mostre", "mostra", "mostrar", "ver", "veja", "liste",
+    "listar", "lista", "exibir", "exiba", "traga", "trazer", "informe", "diga", "dizer", "favor", "pf", "pfv", "ok",
+    "entao", "relatorio", "relatorios", "rs", "r", "reais", "real", "total",
+})
+# Formas equivalentes -> forma canônica
+SINONIMOS = {
+    "vendi": "vendas", "vendeu": "vendas", "vendemos": "vendas", "venda": "vendas", "vender": "vendas",
+    "vendido": "vendas", "faturamento": "vendas", "faturei": "vendas", "faturou": "vendas", "faturamos": "vendas",
+    "faturado": "vendas", "faturar": "vendas", "hj": "hoje", "conta": "contas", "produto": "produtos",
+    "compromisso": "compromissos", "sessao": "sessoes", "entrada": "entradas", "meses": "mes",
+    "semanas": "semana", "dias": "dia", "anos": "ano", "passada": "passado", "ultima": "ultimo", "ultimas": "ultimo",
+    "ultimos": "ultimo", "proxima": "proximo", "corrente": "atual", "vendidas": "vendidos", "vendida": "vendidos",
+}
+NUMEROS = {
+    "um": 1, "uma": 1, "dois": 2, "duas": 2, "tres": 3, "quatro": 4, "cinco": 5, "seis": 6, "sete": 7, "oito": 8,
+    "nove": 9, "dez": 10, "onze": 11, "doze": 12, "quinze": 15, "vinte": 20, "trinta": 30, "cinquenta": 50, "cem": 100,
+}
+# Palavras de período: uma chave só com elas (mais números e datas) é uma resposta de continuação, não uma pergunta
+PALAVRAS_PERIODO = frozenset({
+    "hoje", "ontem", "anteontem", "amanha", "dia", "semana", "mes", "ano", "trimestre", "semestre", "quinzena",
+    "passado", "retrasado", "anterior", "atual", "ultimo", "proximo", "desde", "ate", "entre", "agora", "semanal",
+    "mensal", "anual",
+}) | frozenset(MESES) | frozenset(DIAS_SEMANA)
+
+_RE_DATA = re.compile(r"\b(\d{1,2})[/\-.](\d{1,2})(?:[/\-.](\d{2}|\d{4}))?\b")
+_RE_VALOR = re.compile(r"\b\d{1,3}(?:\.\d{3})+(?:,\d+)?\b|\b\d+,\d+\b")
+_RE_TOKENS = re.compile(r"\d{4}-\d{2}-\d{2}|\d{2}-\d{2}|\d+(?:\.\d+)?|[a-z]+")
+_RE_TEM_DATA = re.compile(r"\b(?:\d{4}-\d{2}-\d{2}|\d{2}-\d{2}|(?:19|20)\d{2})\b")
+
+# _periodo_portavel: o período da pergunta não pode ser guardado (a entrada não é gravada)
+NAO_PORTAVEL = object()
+
+_tabela_ok = False
+_lock = threading.Lock()
+_metricas = {"acertos": 0, "faltas": 0}
+
+
+def _ensure_table():
+    """Cria a tabela question_cache se não existir (ex.: app rodando antes do modelo ser adicionado)."""
+    global _tabela_ok
+    if not _tabela_ok:
+        QuestionCacheEntry.__table__.create(engine, checkfirst=True)
+        _tabela_ok = True
+
+
+def _data_canonica(m: "re.Match[str]") -> str:
+    """dd/mm/aaaa, dd-mm-aa -> aaaa-mm-dd; dd/mm -> mm-dd (datas impossíveis ficam como estavam)."""
+    dia, mes, ano = int(m.group(1)), int(m.group(2)), m.group(3)
+    if not (1 <= dia <= 31 and 1 <= mes <= 12):
+        return m.group(0)
+    if ano is None:
+        return f" {mes:02d}-{dia:02d} "
+    ano_n = int(ano) + (2000 if len(ano) == 2 else 0)
+    return f" {ano_n:04d}-{mes:02d}-{dia:02d} "
+
+
+def _valor_canonico(m: "re.Match[str]") -> str:
+    """1.234,50 -> 1234.5; 10,00 -> 10."""
+    valor = float(m.group(0).replace(".", "").replace(",", "."))
+    return f" {int(valor)} " if valor.is_integer() else f" {valor:g} "
+
+
+def _token_canonico(token: str) -> str:
+    if token in NUMEROS:
+        return str(NUMEROS[token])
+    if token.isdigit():
+        return str(int(token)) if len(token) != 4 else token
+    return SINONIMOS.get(token, token)
+
+
+def normalizar(pergunta: str) -> str:
+    """
+    Chave da pergunta: minúsculas, sem acentos, datas e valores canônicos, números por extenso em dígitos,
+    sinônimos unificados, sem palavras vazias, sem repetição e em ordem alfabética.
+    Ex.: "Quanto vendi hoje?", "vendas de hoje" e "faturamento hoje" -> "hoje vendas".
+    """
+    t = unicodedata.normalize("NFKD", (pergunta or "").lower())
+    t = "".join(c for c in t if not unicodedata.combining(c))
+    t = _RE_DATA.sub(_data_canonica, t)
+    t = _RE_VALOR.sub(_valor_canonico, t)
+    tokens = {_token_canonico(tk) for tk in _RE_TOKENS.findall(t)}
+    return " ".join(sorted(tk for tk in tokens if tk not in PALAVRAS_VAZIAS))
+
+
+def _chave_valida(chave: str) -> bool:
+    """Chave com pelo menos um assunto (não só período/números) e dentro dos limites de tamanho."""
+    palavras = chave.split()
+    if not palavras or len(palavras) > MAX_PALAVRAS or len(chave) > 255:
+        return False
+    return any(p not in PALAVRAS_PERIODO and not p[0].isdigit() for p in palavras)
+
+
+def _periodo_portavel(
+    period: Any, pergunta: str, chave: str, com_historico: bool, hoje: date
+) -> Any:
+    """
+    Período guardado na entrada: {"type"} para os tipos relativos; datas absolutas quando a própria pergunta cita
+    data ou ano (a chave contém a data ou o ano); senão deslocamento em dias a partir de hoje. None quando o período
+    veio do histórico da conversa (não vale para a pergunta isolada). NAO_PORTAVEL quando a pergunta cita um
+    período nomeado sem ano ("março", "de mar a jun", "natal"): um deslocamento o moveria no dia seguinte.
+    """
+    if not isinstance(period, dict):
+        return None
+    cita = cita_periodo(pergunta, hoje)
+    if com_historico and not cita:
+        return None
+    tem_data = bool(_RE_TEM_DATA.search(chave))
+    if cita and not tem_data and not periodo_relativo(pergunta, hoje):
+        return NAO_PORTAVEL
+    tipo = period.get("type")
+    if tipo in TIPOS_RELATIVOS:
+        return {"type": tipo}
+    start, end = period.get("start"), period.get("end")
+    if isinstance(start, str):
+        start = datetime.strptime(start[:10], "%Y-%m-%d").date()
+    if isinstance(end, str):
+        end = datetime.strptime(end[:10], "%Y-%m-%d").date()
+    if not isinstance(start, date) or not isinstance(end, date):
+        return None
+    if tem_data:
+        return {"start": start.isoformat(), "end": end.isoformat(), "type": tipo}
+    return {"dias_inicio": (start - hoje).days, "dias_fim": (end - hoje).days, "type": tipo}
+
+
+def _periodo_do_dia(period: Optional[Dict[str, Any]], hoje: date) -> Dict[str, Any]:
+    """period_info para _process_period: deslocamentos viram datas a partir de hoje; os demais vão como estão."""
+    if not period:
+        return {}
+    if "dias_inicio" in period:
+        return {
+            "start": (hoje + timedelta(days=int(period["dias_inicio"]))).isoformat(),
+            "end": (hoje + timedelta(days=int(period["dias_fim"]))).isoformat(),
+        }
+    return dict(period)
+
+
+def _contar(acerto: bool) -> None:
+    with _lock:
+        _metricas["acertos" if acerto else "faltas"] += 1
+
+
+def obter(pergunta: str, hoje: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """
+    Análise guardada para a pergunta (mesmo formato da resposta da IA em analyze_query, com "period" pronto para
+    _process_period) ou None. Conta acerto/falta e atualiza hits da entrada (sessão própria, como em llm_cache).
+    """
+    chave = normalizar(pergunta)
+    if not _chave_valida(chave):
+        return None
+    db = SessionLocal()
+    try:
+        _ensure_table()
+        entry = db.query(QuestionCacheEntry).filter(QuestionCacheEntry.chave == chave).first()
+        analysis = None
+        if entry is not None:
+            dados = json.loads(entry.analysis)
+            analysis = {k: dados.get(k) for k in CAMPOS}
+            analysis["period"] = _periodo_do_dia(dados.get("period"), hoje or date.today())
+            analysis["resposta_direta"] = None
+            analysis["fonte"] = "cache"
+            entry.hits += 1
+            entry.last_used_at = datetime.utcnow()
+            db.commit()
+        _contar(analysis is not None)
+        return analysis
+    except Exception:
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
+
+def salvar(
+    pergunta: str,
+    analysis: Dict[str, Any],
+    com_historico: bool = False,
+    hoje: Optional[date] = None,
+) -> bool:
+    """
+    Guarda a análise validada (consulta executada sem erro) da pergunta, substituindo a anterior da mesma chave.
+    Só entram consultas de assuntos conhecidos, sem SQL livre. com_historico: a pergunta foi feita no meio de uma
+    conversa (o período só é guardado se a própria pergunta citar um). Retorna True se gravou.
+    """
+    if analysis.get("intent") != "consulta" or analysis.get("data_type") not in TIPOS_CACHEAVEIS:
+        return False
+    if analysis.get("sql_query") or analysis.get("fonte") in ("cache", "regras"):
+        return False
+    chave = normalizar(pergunta)
+    if not _chave_valida(chave):
+        return False
+    hoje = hoje or date.today()
+    dados = {k: analysis.get(k) for k in CAMPOS}
+    dados["period"] = _periodo_portavel(analysis.get("period"), pergunta, chave, com_historico, hoje)
+    if dados["period"] is NAO_PORTAVEL:
+        return False
+    db = SessionLocal()
+    try:
+        _ensure_table()
+        agora = datetime.utcnow()
+        entry = db.query(QuestionCacheEntry).filter(QuestionCacheEntry.chave == chave).first()
+        if entry is None:
+            entry = QuestionCacheEntry(chave=chave, hits=0, created_at=agora)
+            db.add(entry)
+        entry.exemplo = (pergunta or "").strip()[:255]
+        entry.analysis = json.dumps(dados, ensure_ascii=False, default=str)
+        entry.last_used_at = agora
+        db.flush()
+        _evict(db)
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        return False
+    finally:
+        db.close()
+
+
+def _evict(db: Session) -> None:
+    """Acima de MAX_ENTRADAS, remove as entradas usadas há mais tempo."""
+    excesso = db.query(func.count(QuestionCacheEntry.chave)).scalar() - MAX_ENTRADAS
+    if excesso > 0:
+        antigas = [
+            c for (c,) in db.query(QuestionCacheEntry.chave).order_by(QuestionCacheEntry.last_used_at).limit(excesso).all()
+        ]
+        db.query(QuestionCacheEntry).filter(QuestionCacheEntry.chave.in_(antigas)).delete(synchronize_session=False)
+
+
+def estatisticas(db: Session) -> Dict[str, Any]:
+    """Acertos e faltas desde o início do processo, taxa de acerto e total de entradas na tabela."""
+    _ensure_table()
+    with _lock:
+        acertos, faltas = _metricas["acertos"], _metricas["faltas"]
+    total = acertos + faltas
+    return {
+        "acertos": acertos,
+        "faltas": faltas,
+        "taxa_acerto": round(acertos / total * 100, 1) if total else 0.0,
+        "entradas": int(db.query(func.count(QuestionCacheEntry.chave)).scalar() or 0),
+    }
+
+
+def principais(db: Session, limite: int = 20) -> List[Dict[str, Any]]:
+    """Entradas mais usadas: chave, exemplo, assunto, período guardado e acertos."""
+    _ensure_table()
+    resultado = []
+    for e in db.query(QuestionCacheEntry).order_by(QuestionCacheEntry.hits.desc(), QuestionCacheEntry.chave).limit(limite):
+        dados = json.loads(e.analysis)
+        periodo = dados.get("period") or {}
+        resultado.append({
+            "chave": e.chave,
+            "exemplo": e.exemplo,
+            "data_type": dados.get("data_type"),
+            "periodo": periodo.get("type") or ("datas" if periodo else "padrão"),
+            "hits": e.hits,
+        })
+    return resultado
+
+
+def limpar(db: Session) -> int:
+    """Apaga todas as entradas e zera os contadores. Retorna quantas foram removidas."""
+    _ensure_table()
+    n = db.query(QuestionCacheEntry).delete(synchronize_session=False)
+    db.commit()
+    with _lock:
+        _metricas.update(acertos=0, faltas=0)
+    return n
@@ -5,16 +5,19 @@ Inclui análises avançadas: tendências, previsões, sazonalidade (dados + merc
 """
 import copy
 import json
+import logging
 import re
+import threading
+import time
 from calendar import monthrange
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
-from typing import Any, Dict, List, Optional
-from urllib.request import Request, urlopen
-from urllib.error import URLError
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
+import pandas as pd
 from dateutil.relativedelta import relativedelta
-from sqlalchemy import func, text
+from sqlalchemy import false, func
 from sqlalchemy.orm import Session
 
 from models.account_payable import AccountPayable
@@ -28,13 +31,38 @@ from config.prompt_config import (
     DEFAULTS,
     KEY_ANALYZE_QUERY,
     KEY_FORMAT_RESPONSE_ANALISE_AVANCADA,
-    KEY_FORMAT_RESPONSE_GENERIC,
+    KEY_FORMAT_RESPONSE_INSIGHT,
+    KEY_NARRACAO,
+    NARRACAO_SEMPRE,
     KEY_INITIAL_ANALYSIS,
+    KEY_TURN_PLANNER,
     PromptConfigManager,
     safe_substitute_prompt,
 )
-from mcp import MCPDetector, MCPExtractor
-from services.ai_service import AIService
+from mcp import Pipeline
+from mcp.schemas import TurnPlan
+from services.cashflow_service import projecao_fluxo_caixa, resumo_semanal_payload
+from services.forecast_service import previsao_vendas
+from services.llm_cache import SITE_ANALYZE_QUERY, SITE_FORMAT_RESPONSE, SITE_INITIAL_ANALYSIS, SITE_TURN_PLANNER
+from services import (
+    basket_service, name_matcher, news_service, question_cache, report_router, report_templates, sql_sandbox,
+    token_budget, turn_planner,
+)
+from services.period_parser import cita_periodo, interpretar_periodo, so_periodo
+from services.report_service import (
+    COMPARACAO_ANO_ANTERIOR,
+    COMPARACAO_PERIODO_ANTERIOR,
+    ABC_CRITERIOS,
+    ABC_DIAS_SEM_VENDA,
+    BLOCO_ESTOQUE,
+    BLOCO_RESUMO,
+    BLOCO_TOP_PRODUTOS,
+    curva_abc,
+    normalizar_comparacao,
+    painel_metricas,
+    resumo_abc,
+    resumo_periodo,
+)
 from utils.formatters import format_currency, format_date
 
 # Sazonalidade típica do varejo no Brasil por mês (contexto para a IA)
@@ -93,6 +121,194 @@ ALLOWED_SQL_TABLES = frozenset({
     "accessory_stock", "accessory_sales", "accessory_stock_entries",
 })
 
+# Tipos de consulta que podem ser pedidos juntos numa pergunta (campo "metricas" da análise)
+TIPOS_METRICA = frozenset({
+    "resumo_periodo", "produtos_mais_vendidos", "valor_estoque", "entradas_estoque", "sessoes_caixa",
+    "contas_pagar", "contas_receber", "agenda", "analise_avancada", "curva_abc", "produtos_juntos",
+})
+MAX_METRICAS = 5
+# Métricas que saem juntas de uma instrução com CTEs (report_service.painel_metricas) e o tipo do resultado
+BLOCO_DA_METRICA = {
+    "resumo_periodo": BLOCO_RESUMO,
+    "produtos_mais_vendidos": BLOCO_TOP_PRODUTOS,
+    "valor_estoque": BLOCO_ESTOQUE,
+}
+TOP_PRODUTOS_PADRAO = 10
+
+# Prazo (s) da análise inicial: passado isso, a tela mostra o resumo por regras (_initial_analysis_fallback)
+PRAZO_ANALISE_INICIAL = 15.0
+
+_RE_LINK_ESPACO = re.compile(r"\]\(\s+")
+_RE_LINK_FIM_ABERTO = re.compile(r"\](?:\(\s*)?$")
+# Comparação entre períodos ("quanto vendi a mais que no ano passado", "comparado ao mês passado")
+_RE_COMPARACAO_GATILHO = re.compile(
+    r"compar|em rela[cç][aã]o|a mais|a menos|mais (?:do )?que|menos (?:do )?que|versus|\bvs\b|"
+    r"cresc|caiu|diferen[cç]a|varia[cç][aã]o",
+    re.IGNORECASE,
+)
+# Pedido de texto analítico na pergunta ("analise", "por que caiu", "o que você acha", "dicas")
+_RE_NARRATIVA = re.compile(
+    r"\banalis[ea]\b|\banalisar\b|expli[cq]|por ?qu[eê]|o que (?:voc[eê]|vc) acha|opini|\bdicas?\b|sugest|coment",
+    re.IGNORECASE,
+)
+_RE_COMPARACAO_ANO = re.compile(
+    r"ano passado|ano anterior|mesmo per[ií]odo do ano|mesmo m[eê]s do ano",
+    re.IGNORECASE,
+)
+
+
+def _corrigir_links_stream(partes: Iterable[str]) -> Iterator[str]:
+    """
+    Remove espaços entre "](" e a URL dos links markdown ("](  /pagina" -> "](/pagina") em um texto que chega em partes.
+    Segura o fim de cada parte quando ele pode ser o começo de um "](" que continua na parte seguinte.
+    """
+    pendente = ""
+    for parte in partes:
+        texto = _RE_LINK_ESPACO.sub("](", pendente + parte)
+        m = _RE_LINK_FIM_ABERTO.search(texto)
+        corte = m.start() if m else len(texto)
+        pendente = texto[corte:]
+        if corte:
+            yield texto[:corte]
+    if pendente:
+        yield _RE_LINK_ESPACO.sub("](", pendente)
+
+
+logger = logging.getLogger(__name__)
+
+# --- Coleta da análise do dia: etapas independentes, cada uma em sessão própria e em paralelo ---
+MAX_THREADS_COLETA = 6
+_lock_coleta = threading.Lock()
+_ultima_coleta: Dict[str, Any] = {}
+
+
+def _executar_etapas(
+    db: Session, etapas: Dict[str, Callable[[Session], Any]]
+) -> Tuple[Dict[str, Any], Dict[str, float], List[str]]:
+    """
+    Roda as etapas (funções que recebem uma sessão) em paralelo, cada uma numa sessão própria do mesmo banco
+    (conexões do pool), para que as idas e voltas ao banco não se somem. SQLite em memória não compartilha
+    dados entre conexões: roda em sequência na sessão do chamador. Etapa com erro devolve None e o erro é
+    registrado no log. Retorna (resultado por etapa, ms por etapa, etapas com erro).
+    """
+    bind = db.get_bind()
+    url = getattr(bind, "url", None)
+    em_memoria = url is not None and url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+    def _rodar(
+        nome: str, etapa: Callable[[Session], Any], sessao: Optional[Session] = None
+    ) -> Tuple[Any, float, bool]:
+        t0 = time.perf_counter()
+        s = sessao or Session(bind=bind)
+        try:
+            return etapa(s), (time.perf_counter() - t0) * 1000, True
+        except Exception:
+            logger.exception("Etapa %s da coleta da análise do dia falhou", nome)
+            if sessao is not None:
+                sessao.rollback()
+            return None, (time.perf_counter() - t0) * 1000, False
+        finally:
+            if sessao is None:
+                s.close()
+
+    if em_memoria or MAX_THREADS_COLETA <= 1:
+        saidas = {nome: _rodar(nome, etapa, db) for nome, etapa in etapas.items()}
+    else:
+        with ThreadPoolExecutor(max_workers=min(MAX_THREADS_COLETA, len(etapas))) as pool:
+            futuros = {nome: pool.submit(_rodar, nome, etapa) for nome, etapa in etapas.items()}
+            saidas = {nome: f.result() for nome, f in futuros.items()}
+    return (
+        {n: r for n, (r, _, _) in saidas.items()},
+        {n: round(ms, 1) for n, (_, ms, _) in saidas.items()},
+        [n for n, (_, _, sucesso) in saidas.items() if not sucesso],
+    )
+
+
+def tempos_coleta_analise() -> Dict[str, Any]:
+    """Tempos (ms) por etapa e total da última coleta de dados da análise do dia; vazio antes da primeira."""
+    with _lock_coleta:
+        return copy.deepcopy(_ultima_coleta)
+
+
+def _vendas_por_dia(db: Session, inicio: date, fim: date) -> List[Tuple[date, float, int]]:
+    """(dia, total vendido, quantidade de vendas) por dia, somados no banco."""
+    return (
+        db.query(Sale.data_venda, func.coalesce(func.sum(Sale.total_vendido), 0.0), func.count(Sale.id))
+        .filter(Sale.data_venda >= inicio, Sale.data_venda <= fim, Sale.status != "cancelada")
+        .group_by(Sale.data_venda)
+        .all()
+    )
+
+
+def _contas_da_semana(db: Session, inicio: date, fim: date) -> Tuple[int, float, int, float]:
+    """Quantidade e total das contas a pagar e a receber em aberto que vencem na semana (uma consulta)."""
+    pagar = db.query(AccountPayable).filter(
+        AccountPayable.data_vencimento >= inicio, AccountPayable.data_vencimento <= fim, AccountPayable.status != "paga"
+    )
+    receber = db.query(AccountReceivable).filter(
+        AccountReceivable.data_vencimento >= inicio,
+        AccountReceivable.data_vencimento <= fim,
+        AccountReceivable.status != "recebida",
+    )
+    return tuple(
+        db.query(
+            pagar.with_entities(func.count(AccountPayable.id)).scalar_subquery(),
+            pagar.with_entities(func.coalesce(func.sum(AccountPayable.valor), 0.0)).scalar_subquery(),
+            receber.with_entities(func.count(AccountReceivable.id)).scalar_subquery(),
+            receber.with_entities(func.coalesce(func.sum(AccountReceivable.valor), 0.0)).scalar_subquery(),
+        ).one()
+    )
+
+
+def _contas_abertas_ate(
+    db: Session, model, coluna_nome, coluna_baixa, limite: date, hoje: date, max_itens: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Contas sem baixa com vencimento até `limite` (inclui as atrasadas), só as colunas usadas no payload.
+    O status vem do vencimento (mesma regra de update_status), sem carregar nem alterar os objetos.
+    """
+    q = (
+        db.query(coluna_nome, model.valor, model.data_vencimento)
+        .filter(coluna_baixa.is_(None), model.data_vencimento <= limite)
+        .order_by(model.data_vencimento)
+    )
+    if max_itens:
+        q = q.limit(max_itens)
+    return [
+        {
+            "nome": nome,
+            "valor": round(float(valor), 2),
+            "data_vencimento": venc.strftime("%d/%m/%Y"),
+            "status": "atrasada" if venc < hoje else "aberta",
+        }
+        for nome, valor, venc in q.all()
+    ]
+
+
+def _agenda_ate(db: Session, hoje: date, limite: date, user_id: Optional[int]) -> List[Tuple[date, Dict[str, Any]]]:
+    """(data, compromisso) de hoje até `limite`, do usuário quando informado."""
+    q = db.query(PersonalAgenda.data, PersonalAgenda.titulo, PersonalAgenda.descricao, PersonalAgenda.hora).filter(
+        PersonalAgenda.data >= hoje, PersonalAgenda.data <= limite
+    )
+    if user_id is not None:
+        q = q.filter(PersonalAgenda.user_id == user_id)
+    return [
+        (d, {"titulo": titulo, "descricao": descricao or "", "data": d.strftime("%d/%m/%Y"), "hora": hora or ""})
+        for d, titulo, descricao, hora in q.order_by(PersonalAgenda.data, PersonalAgenda.hora).limit(100).all()
+    ]
+
+
+def _fluxo_caixa_payload(db: Session, hoje: date) -> Dict[str, Any]:
+    """Fluxo de caixa projetado (4 semanas): contas em aberto + vendas previstas, saldo a partir de zero."""
+    projecao = projecao_fluxo_caixa(db, semanas=4, hoje=hoje)
+    return {
+        "semanas": resumo_semanal_payload(projecao),
+        "semanas_negativas": projecao["semanas_negativas"],
+        "saldo_minimo": projecao["saldo_minimo"],
+        "saldo_final": projecao["saldo_final"],
+        "observacao": "Saldo acumulado a partir de zero (não inclui saldo em caixa/banco).",
+    }
+
 
 class ReportAgentService:
     """
@@ -100,20 +316,29 @@ class ReportAgentService:
     Todas as consultas usam SQLAlchemy ORM; nenhum SQL gerado pela IA.
     """
 
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, pipeline: Optional[Pipeline] = None):
         self.db = db
-        self.ai_service = AIService(db)
+        # Pipeline MCP do turno (compartilhado com a página e os outros agentes); o AIService é o dele
+        self.pipeline = pipeline or Pipeline(db)
+        self.ai_service = self.pipeline.ai
+        # Etapas da última coleta da análise do dia que falharam (análise incompleta não é guardada)
+        self.etapas_com_erro: List[str] = []
 
     def analyze_query(
         self,
         query: str,
         conversation_history: Optional[List[Dict[str, Any]]] = None,
         return_debug: bool = False,
+        detection=None,
+        usar_cache: bool = True,
     ):
         """
         Analisa a pergunta em linguagem natural e retorna intent, data_type, period, etc.
         conversation_history: últimas mensagens (role + content) para manter contexto (mín. 5 conversas).
         return_debug: se True, retorna {"analysis": ..., "debug": {"raw_json", "path", "final_json"}}.
+        detection: resultado de MCPDetector.detect já calculado pelo chamador (evita detectar duas vezes); sem ele,
+        a detecção vem do pipeline do turno (self.pipeline), que também não repete o que já foi detectado.
+        usar_cache: consultar o cache de perguntas antes da IA (False quando o chamador já consultou).
         """
         if not self.ai_service.is_available():
             return {
@@ -121,16 +346,24 @@ class ReportAgentService:
                 "error": "Serviço de IA não disponível. Configure em Administração > Configuração de IA.",
             }
 
+        # Resposta ao "De qual período?" que é só um período: resolve localmente, sem nova chamada à IA
+        local = self._resposta_periodo_local(query, conversation_history)
+        if local is not None:
+            if return_debug:
+                return {
+                    "analysis": local,
+                    "debug": {"raw_json": None, "path": "Período interpretado localmente (sem IA)", "final_json": copy.deepcopy(local)},
+                }
+            return local
+
         # --- Camada leve MCP: detect + extract; na página Início buscar contas e agenda quando o usuário perguntar ---
         try:
-            detector = MCPDetector(self.db)
-            det = detector.detect(query, {"pagina": "inicio"})
-            extractor = MCPExtractor(self.db)
+            det = detection or self.pipeline.detect(query, {"pagina": "inicio"})
             today = date.today()
 
             # LIST contas a pagar / contas a receber: buscar e listar no chat
             if det.action == "LIST" and det.entity in ("contas_pagar", "contas_receber") and det.confidence >= 0.5:
-                ext = extractor.extract(query, "LIST", det.entity, None)
+                ext = self.pipeline.extract(query, "LIST", det.entity, None)
                 period_info = {}
                 if ext.data and ext.data.get("data_inicial") and ext.data.get("data_final"):
                     period_info = {"start": ext.data["data_inicial"], "end": ext.data["data_final"]}
@@ -160,7 +393,7 @@ class ReportAgentService:
 
             # REPORT relatório: extract período e data_type (vendas, estoque, contas, agenda)
             if det.action == "REPORT" and det.entity == "relatorio" and det.confidence >= 0.5:
-                ext = extractor.extract(query, "REPORT", "relatorio", None)
+                ext = self.pipeline.extract(query, "REPORT", "relatorio", None)
                 if ext.confidence >= 0.6 and ext.data:
                     data_type_raw = (ext.data.get("data_type") or "vendas").strip().lower()
                     data_type_map = {
@@ -169,6 +402,8 @@ class ReportAgentService:
                         "contas_pagar": "contas_pagar",
                         "contas_receivable": "contas_receber",
                         "agenda": "agenda",
+                        "curva_abc": "curva_abc",
+                        "produtos_juntos": "produtos_juntos",
                     }
                     data_type = data_type_map.get(data_type_raw, "resumo_periodo")
                     start_str = ext.data.get("data_inicial")
@@ -188,24 +423,20 @@ class ReportAgentService:
                         "period": period,
                         "resposta_direta": None,
                         "filters": ext.data.get("filters") or {},
+                        "comparison": self._detect_comparison(query),
                     }
         except Exception:
             pass
 
-        data_hoje = date.today().strftime("%d/%m/%Y")
-        history_block = ""
-        if conversation_history:
-            recent = conversation_history[-20:]
-            lines = []
-            for m in recent:
-                role = (m.get("role") or "user").strip().lower()
-                content = (m.get("content") or "").strip()
-                if not content:
-                    continue
-                label = "Usuário" if role == "user" else "Assistente"
-                lines.append(f"{label}: {content[:500]}{'...' if len(content) > 500 else ''}")
-            if lines:
-                history_block = "\n\n**Histórico recente da conversa (use para manter o contexto do assunto):**\n" + "\n".join(lines) + "\n\n"
+        # Cache de perguntas: a mesma pergunta com outras palavras reaproveita a última análise validada
+        cacheada = self.analise_cache(query, conversation_history) if usar_cache else None
+        if cacheada is not None:
+            if return_debug:
+                return {
+                    "analysis": cacheada,
+                    "debug": {"raw_json": None, "path": "Cache de perguntas (sem IA)", "final_json": copy.deepcopy(cacheada)},
+                }
+            return cacheada
 
         template = PromptConfigManager.get_or_default(
             self.db, KEY_ANALYZE_QUERY, DEFAULTS[KEY_ANALYZE_QUERY]
@@ -213,71 +444,27 @@ class ReportAgentService:
         prompt = safe_substitute_prompt(
             template,
             DB_SCHEMA=DB_SCHEMA,
-            data_hoje=data_hoje,
-            history_block=history_block,
+            data_hoje=date.today().strftime("%d/%m/%Y"),
+            history_block=self._bloco_historico(conversation_history),
             query=query,
         )
 
         try:
-            client, error = self.ai_service._get_client()
+            result_text, error = self.ai_service.complete(
+                prompt, temperature=0.3, max_tokens=None, json_mode=True, cache=SITE_ANALYZE_QUERY
+            )
             if error:
                 return {"intent": "error", "error": error}
 
-            config = self.ai_service.config
-            provider = config["provider"]
-            model = config.get("model", "")
-
-            if provider == "openai":
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.3,
-                    response_format={"type": "json_object"},
-                )
-                result_text = response.choices[0].message.content
-            elif provider == "gemini":
-                response = client.generate_content(prompt)
-                result_text = response.text
-            elif provider == "groq":
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.3,
-                    response_format={"type": "json_object"},
-                )
-                result_text = response.choices[0].message.content
-            elif provider == "ollama":
-                response = client.chat(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    options={"temperature": 0.3},
-                )
-                result_text = response["message"]["content"]
-            else:
-                return {"intent": "error", "error": f"Provedor {provider} não suportado"}
-
-            result_text = result_text.strip()
+            result_text = (result_text or "").strip()
             if result_text.startswith("```"):
                 result_text = re.sub(r"^```(?:json)?\s*", "", result_text, flags=re.MULTILINE)
                 result_text = re.sub(r"```\s*$", "", result_text, flags=re.MULTILINE)
             analysis = json.loads(result_text)
             raw_analysis = copy.deepcopy(analysis) if return_debug else None
-            # Fallback: se a IA insistir em "esclarecer_periodo" mas o usuário já respondeu com o período (ex.: "do ano de 2026"), forçar consulta
-            analysis, period_applied = self._apply_period_clarification_fallback(analysis, query, conversation_history)
-            # Fallback: perguntas de continuação ("quais são?", "as contas a pagar") devem usar o assunto do histórico, não resposta_direta genérica
-            analysis, ref_applied = self._apply_referential_query_fallback(analysis, query, conversation_history)
-            # Fallback: quando o usuário responde ao "De qual período?" (ex.: "este mes") mas a IA retornou data_type errado (ex.: resumo_periodo em vez de contas_receber para "fiados"), corrigir
-            analysis, dt_override_applied = self._apply_period_reply_data_type_override(analysis, query, conversation_history)
-            period_raw = analysis.get("period")
-            analysis["period"] = self._process_period(period_raw if isinstance(period_raw, dict) else {})
+            analysis, etapas = self._pos_processar_analise(analysis, query, conversation_history)
             if return_debug and raw_analysis is not None:
-                path_parts = ["Resposta da IA (JSON bruto)"]
-                if period_applied:
-                    path_parts.append("→ Fallback de período aplicado")
-                if ref_applied:
-                    path_parts.append("→ Fallback referencial aplicado")
-                if dt_override_applied:
-                    path_parts.append("→ Data_type corrigido por resposta de período")
+                path_parts = ["Resposta da IA (JSON bruto)"] + etapas
                 return {
                     "analysis": analysis,
                     "debug": {
@@ -292,108 +479,274 @@ class ReportAgentService:
         except Exception as e:
             return {"intent": "error", "error": f"Erro ao analisar pergunta: {str(e)}"}
 
-    def _apply_period_clarification_fallback(
+    @staticmethod
+    def _bloco_historico(conversation_history: Optional[List[Dict[str, Any]]]) -> str:
+        """
+        Últimas mensagens (até 20) como bloco de texto para os prompts, dentro de token_budget.ORCAMENTO_HISTORICO
+        (as mais recentes têm prioridade); vazio sem histórico.
+        """
+        lines = token_budget.linhas_historico(conversation_history, max_mensagens=20)
+        if not lines:
+            return ""
+        return "\n\n**Histórico recente da conversa (use para manter o contexto do assunto):**\n" + "\n".join(lines) + "\n\n"
+
+    def planejar_turno(
+        self,
+        query: str,
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[Optional[TurnPlan], Optional[str]]:
+        """
+        Planejador de turno: uma única chamada à IA devolve intenção, entidade, campos extraídos (conta ou
+        compromisso), período e SQL opcional, validados contra mcp.schemas.TurnPlan (ver services.turn_planner).
+        Retorna (plano, error); sem plano válido o chat segue o fluxo detect → parse/analyze → format.
+        """
+        if not self.ai_service.is_available():
+            return None, "Serviço de IA não disponível."
+        template = PromptConfigManager.get_or_default(self.db, KEY_TURN_PLANNER, DEFAULTS[KEY_TURN_PLANNER])
+        prompt = safe_substitute_prompt(
+            template,
+            DB_SCHEMA=DB_SCHEMA,
+            data_hoje=date.today().strftime("%d/%m/%Y"),
+            history_block=self._bloco_historico(conversation_history),
+            query=query,
+        )
+        content, error = self.ai_service.complete(
+            prompt, temperature=0.2, max_tokens=None, json_mode=True, cache=SITE_TURN_PLANNER
+        )
+        if error or not content:
+            return None, error or "Resposta vazia da IA."
+        return turn_planner.validar_plano(content)
+
+    def analise_do_plano(
+        self,
+        plano: TurnPlan,
+        query: str,
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """Análise no mesmo formato de analyze_query a partir do plano do turno (sem nova chamada à IA)."""
+        data_type = plano.data_type
+        if not data_type:
+            data_type = plano.entity if plano.entity in ("contas_pagar", "contas_receber", "agenda") else "resumo_periodo"
+        period_info = plano.period if isinstance(plano.period, dict) else {}
+        if data_type == "agenda" and not period_info:
+            today = date.today()
+            period_info = {"start": today.isoformat(), "end": (today + relativedelta(days=7)).isoformat()}
+        analysis = {
+            "intent": "consulta" if plano.intent == "lancamento" else plano.intent,
+            "data_type": data_type,
+            "period": period_info,
+            "filters": plano.filters or {},
+            "sql_query": plano.sql_query,
+            "comparison": plano.comparison,
+            "metricas": plano.metricas,
+            "narrativa": plano.narrativa,
+            "resposta_direta": plano.mensagem if plano.intent == "resposta_direta" else None,
+            "clarification_message": plano.mensagem if plano.intent == "esclarecer_periodo" else None,
+            "fonte": "planejador",
+        }
+        analysis, _ = self._pos_processar_analise(analysis, query, conversation_history)
+        return analysis
+
+    def _pos_processar_analise(
         self,
         analysis: Dict[str, Any],
         query: str,
-        conversation_history: Optional[List[Dict[str, Any]]],
-    ):
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[Dict[str, Any], List[str]]:
         """
-        Se a IA retornou esclarecer_periodo mas o histórico mostra que o assistente
-        perguntou o período e o usuário acabou de responder (ex.: "do ano de 2026"),
-        forçar intent consulta com data_type inferido da pergunta anterior e period preenchido.
-        Retorna (analysis, applied: bool).
+        Correções determinísticas sobre a análise vinda da IA (analyze_query ou planejador de turno): fallbacks de
+        período e de assunto, comparação e período pelo interpretador local. Retorna (analysis, etapas aplicadas).
         """
-        if analysis.get("intent") != "esclarecer_periodo":
-            return analysis, False
-        if not conversation_history or len(conversation_history) < 1:
-            return analysis, False
+        etapas: List[str] = []
+        # Fallback: se a IA insistir em "esclarecer_periodo" mas o usuário já respondeu com o período (ex.: "do ano de 2026"), forçar consulta
+        analysis, aplicado = self._apply_period_clarification_fallback(analysis, query, conversation_history)
+        if aplicado:
+            etapas.append("→ Fallback de período aplicado")
+        # Fallback: perguntas de continuação ("quais são?", "as contas a pagar") devem usar o assunto do histórico, não resposta_direta genérica
+        analysis, aplicado = self._apply_referential_query_fallback(analysis, query, conversation_history)
+        if aplicado:
+            etapas.append("→ Fallback referencial aplicado")
+        # Fallback: quando o usuário responde ao "De qual período?" (ex.: "este mes") mas a IA retornou data_type errado (ex.: resumo_periodo em vez de contas_receber para "fiados"), corrigir
+        analysis, aplicado = self._apply_period_reply_data_type_override(analysis, query, conversation_history)
+        if aplicado:
+            etapas.append("→ Data_type corrigido por resposta de período")
+        analysis["comparison"] = normalizar_comparacao(analysis.get("comparison")) or self._detect_comparison(query)
+        period_raw = analysis.get("period")
+        analysis["period"] = self._process_period(period_raw if isinstance(period_raw, dict) else {})
+        # Período citado na pergunta: datas do interpretador local (determinístico) no lugar das da IA
+        periodo_local = None
+        if analysis.get("intent") == "consulta" and not analysis.get("comparison"):
+            periodo_local = interpretar_periodo(query)
+        if periodo_local:
+            analysis["period"] = {k: periodo_local[k] for k in ("start", "end", "type")}
+            etapas.append("→ Período interpretado localmente")
+        analysis["narrativa"] = bool(analysis.get("narrativa")) or bool(_RE_NARRATIVA.search(query or ""))
+        analysis["metricas"] = self._normalizar_metricas(analysis)
+        if analysis["metricas"]:
+            etapas.append(f"→ {len(analysis['metricas'])} métricas numa consulta")
+        return analysis, etapas
 
-        last_msg = conversation_history[-1]
-        last_role = (last_msg.get("role") or "").strip().lower()
-        last_content = (last_msg.get("content") or "").strip()
-        if last_role != "assistant" or "de qual período" not in last_content.lower():
-            return analysis, False
+    @staticmethod
+    def _normalizar_metricas(analysis: Dict[str, Any]) -> Optional[List[str]]:
+        """
+        Lista de métricas de uma pergunta composta (campo "metricas": lista ou texto separado por vírgula),
+        sem repetição, só com tipos conhecidos e até MAX_METRICAS. None quando há menos de duas, quando a
+        consulta é SQL ou quando o data_type final (após os fallbacks) não está na lista: o assunto mudou.
+        """
+        bruto = analysis.get("metricas")
+        if isinstance(bruto, str):
+            bruto = bruto.split(",")
+        if not isinstance(bruto, (list, tuple)) or analysis.get("data_type") == "sql":
+            return None
+        metricas: List[str] = []
+        for m in bruto:
+            m = str(m or "").strip().lower()
+            m = "resumo_periodo" if m == "vendas" else m
+            if m in TIPOS_METRICA and m not in metricas:
+                metricas.append(m)
+        data_type = "resumo_periodo" if analysis.get("data_type") == "vendas" else analysis.get("data_type")
+        if len(metricas) < 2 or data_type not in metricas:
+            return None
+        return metricas[:MAX_METRICAS]
 
-        query_lower = (query or "").strip().lower()
-        if len(query_lower) > 120:
-            return analysis, False
+    def analise_regras(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Atalho sem IA para perguntas frequentes (ver services.report_router). Retorna a análise no mesmo formato
+        de analyze_query quando a classificação por regras tem confiança suficiente; senão None (segue para a IA).
+        """
+        rota = report_router.classificar(query)
+        if not rota or rota["confianca"] < report_router.CONFIANCA_MINIMA:
+            return None
+        return {
+            "intent": "consulta",
+            "data_type": rota["data_type"],
+            "period": self._process_period(rota["period_info"]),
+            "resposta_direta": None,
+            "filters": {},
+            "comparison": None,
+            "fonte": "regras",
+            "confianca": rota["confianca"],
+        }
 
-        # Parece resposta de período? (ano, 2026, hoje, este mês, etc.)
-        year_match = re.search(r"\b(19|20)\d{2}\b", query)
-        has_year = bool(year_match)
-        period_keywords = (
-            "ano atual" in query_lower or "este ano" in query_lower or "ano de " in query_lower
-            or "do ano" in query_lower or "o ano todo" in query_lower or "ano completo" in query_lower
-            or "hoje" in query_lower or "este mês" in query_lower or "esta semana" in query_lower
-            or query_lower.strip() in ("2026", "2025", "2024")
-        )
-        if not (has_year or period_keywords):
-            return analysis, False
+    def analise_cache(
+        self,
+        query: str,
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Análise guardada no cache de perguntas (services.question_cache) para a pergunta, com o período recalculado
+        para hoje e as mesmas correções de _pos_processar_analise; None sem entrada ou quando a mensagem depende do
+        histórico: responde ao "De qual período?" ou é uma continuação sem período próprio ("e as despesas?" depois
+        de "vendas de 2025" herda 2025 da conversa, não o período da entrada isolada). Comandos (report_router.RE_COMANDO)
+        não consultam o cache: "paguei a luz" tem a mesma chave de "paguei a luz?" e precisa chegar ao detector.
+        """
+        if report_router.RE_COMANDO.search(query or ""):
+            return None
+        if self._pediu_periodo(conversation_history):
+            return None
+        if conversation_history and not cita_periodo(query):
+            return None
+        cacheada = question_cache.obter(query)
+        if cacheada is None:
+            return None
+        analysis, _ = self._pos_processar_analise(cacheada, query, conversation_history)
+        return analysis
 
-        # Inferir data_type da última pergunta do usuário no histórico
-        data_type = "resumo_periodo"
-        for m in reversed(conversation_history):
+    @staticmethod
+    def lembrar_analise(
+        query: str,
+        query_analysis: Dict[str, Any],
+        conversation_history: Optional[List[Dict[str, Any]]] = None,
+    ) -> bool:
+        """Guarda no cache de perguntas a análise de uma consulta executada sem erro (comandos não). Retorna True se gravou."""
+        if report_router.RE_COMANDO.search(query or ""):
+            return False
+        return question_cache.salvar(query, query_analysis, com_historico=bool(conversation_history))
+
+    @staticmethod
+    def _pediu_periodo(conversation_history: Optional[List[Dict[str, Any]]]) -> bool:
+        """True se a última mensagem do histórico é o assistente perguntando "De qual período...?"."""
+        if not conversation_history:
+            return False
+        last_msg = conversation_history[-1]
+        last_role = (last_msg.get("role") or "").strip().lower()
+        last_content = (last_msg.get("content") or "").strip().lower()
+        return last_role == "assistant" and "de qual período" in last_content
+
+    @staticmethod
+    def _data_type_do_historico(conversation_history: Optional[List[Dict[str, Any]]]) -> Optional[str]:
+        """data_type inferido da última pergunta do usuário no histórico (None se não reconhecido)."""
+        for m in reversed(conversation_history or []):
             if (m.get("role") or "").strip().lower() != "user":
                 continue
             prev = (m.get("content") or "").lower()
             if "fiado" in prev or "contas a receber" in prev or "a receber" in prev:
-                data_type = "contas_receber"
-                break
+                return "contas_receber"
             if "contas a pagar" in prev:
-                data_type = "contas_pagar"
-                break
+                return "contas_pagar"
             if "produtos mais vendidos" in prev or "mais vendidos" in prev:
-                data_type = "produtos_mais_vendidos"
-                break
+                return "produtos_mais_vendidos"
             if "entradas" in prev and "estoque" in prev:
-                data_type = "entradas_estoque"
-                break
-            if "sessões" in prev or "caixa" in prev:
-                data_type = "sessoes_caixa"
-                break
+                return "entradas_estoque"
+            if "sessões" in prev or "sessoes" in prev or "caixa" in prev:
+                return "sessoes_caixa"
             if "faturamento" in prev or "quanto vendi" in prev or "vendas" in prev or "resumo" in prev:
-                data_type = "resumo_periodo"
-                break
-            break
+                return "resumo_periodo"
+            return None
+        return None
 
-        today = date.today()
-        year = today.year
-        if year_match:
-            try:
-                year = int(year_match.group(0))
-            except (ValueError, TypeError):
-                pass
+    def _resposta_periodo_local(
+        self,
+        query: str,
+        conversation_history: Optional[List[Dict[str, Any]]],
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Resposta curta ao "De qual período?" (ex.: "últimos 90 dias", "do ano de 2026", "mês retrasado"):
+        interpreta o período localmente e monta a consulta com o assunto da pergunta anterior, sem chamar a IA.
+        None se a mensagem não for só um período.
+        """
+        if not self._pediu_periodo(conversation_history) or len(query or "") > 120:
+            return None
+        periodo = interpretar_periodo(query)
+        if periodo is None or not so_periodo(query):
+            return None
+        return {
+            "intent": "consulta",
+            "data_type": self._data_type_do_historico(conversation_history) or "resumo_periodo",
+            "period": {"start": periodo["start"], "end": periodo["end"], "type": periodo["type"]},
+            "resposta_direta": None,
+            "clarification_message": None,
+            "filters": {},
+            "comparison": self._detect_comparison(query),
+            "fonte": "periodo_local",
+        }
 
-        if "hoje" in query_lower and "ano" not in query_lower and "mês" not in query_lower:
-            analysis["intent"] = "consulta"
-            analysis["data_type"] = data_type
-            analysis["period"] = {"start": today.isoformat(), "end": today.isoformat(), "type": "hoje"}
-            analysis["clarification_message"] = None
-            return analysis, True
-        if "este mês" in query_lower or "mes atual" in query_lower:
-            start = today.replace(day=1)
-            analysis["intent"] = "consulta"
-            analysis["data_type"] = data_type
-            analysis["period"] = {"start": start.isoformat(), "end": today.isoformat(), "type": "mes_atual"}
-            analysis["clarification_message"] = None
-            return analysis, True
-        if "esta semana" in query_lower:
-            start = today - relativedelta(days=6)
-            analysis["intent"] = "consulta"
-            analysis["data_type"] = data_type
-            analysis["period"] = {"start": start.isoformat(), "end": today.isoformat(), "type": "semanal"}
-            analysis["clarification_message"] = None
-            return analysis, True
+    def _apply_period_clarification_fallback(
+        self,
+        analysis: Dict[str, Any],
+        query: str,
+        conversation_history: Optional[List[Dict[str, Any]]],
+    ):
+        """
+        Se a IA retornou esclarecer_periodo mas a mensagem já cita um período reconhecido pelo
+        interpretador local (ex.: "do ano de 2026", "últimos 90 dias"), forçar intent consulta com esse
+        período; o data_type vem da pergunta anterior quando o assistente acabou de perguntar o período.
+        Retorna (analysis, applied: bool).
+        """
+        if analysis.get("intent") != "esclarecer_periodo":
+            return analysis, False
+        periodo = interpretar_periodo(query)
+        if periodo is None:
+            return analysis, False
 
-        # Ano (completo): "do ano de 2026", "2026", "ano atual", etc.
+        data_type = None
+        if self._pediu_periodo(conversation_history):
+            data_type = self._data_type_do_historico(conversation_history)
         analysis["intent"] = "consulta"
-        analysis["data_type"] = data_type
+        analysis["data_type"] = data_type or analysis.get("data_type") or "resumo_periodo"
         analysis["period"] = {
-            "start": f"{year}-01-01",
-            "end": f"{year}-12-31",
-            "type": "anual",
-            "year": str(year),
+            "start": periodo["start"].isoformat(),
+            "end": periodo["end"].isoformat(),
         }
         analysis["clarification_message"] = None
         return analysis, True
@@ -412,51 +765,11 @@ class ReportAgentService:
         """
         if analysis.get("intent") != "consulta":
             return analysis, False
-        if not conversation_history or len(conversation_history) < 1:
-            return analysis, False
-
-        last_msg = conversation_history[-1]
-        last_role = (last_msg.get("role") or "").strip().lower()
-        last_content = (last_msg.get("content") or "").strip()
-        if last_role != "assistant" or "de qual período" not in last_content.lower():
-            return analysis, False
-
-        query_lower = (query or "").strip().lower()
-        period_reply = (
-            "este mês" in query_lower or "este mes" in query_lower
-            or "esta semana" in query_lower or "hoje" in query_lower
-            or "ano atual" in query_lower or "este ano" in query_lower
-            or "o ano todo" in query_lower or re.search(r"\b(19|20)\d{2}\b", query)
-        )
-        if not period_reply:
+        if not self._pediu_periodo(conversation_history) or not cita_periodo(query):
             return analysis, False
 
         # Inferir data_type da última pergunta do usuário no histórico (antes da pergunta do assistente)
-        inferred_data_type = None
-        for m in reversed(conversation_history):
-            if (m.get("role") or "").strip().lower() != "user":
-                continue
-            prev = (m.get("content") or "").lower()
-            if "fiado" in prev or "contas a receber" in prev or "a receber" in prev:
-                inferred_data_type = "contas_receber"
-                break
-            if "contas a pagar" in prev:
-                inferred_data_type = "contas_pagar"
-                break
-            if "produtos mais vendidos" in prev or "mais vendidos" in prev:
-                inferred_data_type = "produtos_mais_vendidos"
-                break
-            if "entradas" in prev and "estoque" in prev:
-                inferred_data_type = "entradas_estoque"
-                break
-            if "sessões" in prev or "sessoes" in prev or "caixa" in prev:
-                inferred_data_type = "sessoes_caixa"
-                break
-            if "faturamento" in prev or "quanto vendi" in prev or "vendas" in prev or "resumo" in prev:
-                inferred_data_type = "resumo_periodo"
-                break
-            break
-
+        inferred_data_type = self._data_type_do_historico(conversation_history)
         if inferred_data_type is None:
             return analysis, False
         current_data_type = analysis.get("data_type") or ""
@@ -578,6 +891,16 @@ class ReportAgentService:
             analysis["period"] = {"start": today.isoformat(), "end": today.isoformat(), "type": "mes_atual", "month": None, "year": str(today.year)}
         return analysis, True
 
+    @staticmethod
+    def _detect_comparison(query: str) -> Optional[str]:
+        """Detecta pedido de comparação entre períodos; retorna o modo (ano_anterior/periodo_anterior) ou None."""
+        q = (query or "").strip()
+        if not q or not _RE_COMPARACAO_GATILHO.search(q):
+            return None
+        if _RE_COMPARACAO_ANO.search(q):
+            return COMPARACAO_ANO_ANTERIOR
+        return COMPARACAO_PERIODO_ANTERIOR
+
     def _process_period(self, period_info: Dict) -> Dict[str, Any]:
         """Converte período em datas start/end."""
         if period_info is None or not isinstance(period_info, dict):
@@ -663,44 +986,16 @@ class ReportAgentService:
         return {"start": start, "end": today, "type": "ultimo_mes"}
 
     def _execute_sql_query(self, db: Session, sql_query: str) -> Dict[str, Any]:
-        """Executa uma única instrução SELECT após validar (apenas tabelas permitidas, só leitura)."""
+        """
+        Executa uma única consulta de leitura no sandbox (services.sql_sandbox): parser SQL com a lista de tabelas
+        permitidas, transação somente leitura com prazo, custo do EXPLAIN e orçamento de linhas/bytes.
+        """
         if not sql_query or not isinstance(sql_query, str):
             return {"type": "error", "error": "Consulta SQL não fornecida."}
-        sql = sql_query.strip()
-        if not sql.upper().startswith("SELECT"):
-            return {"type": "error", "error": "Apenas consultas SELECT são permitidas."}
-        if ";" in sql:
-            return {"type": "error", "error": "Use apenas uma instrução SELECT (sem ponto e vírgula)."}
-        # Extrai nomes de tabelas (FROM e JOIN)
-        from_match = re.findall(r"\bFROM\s+(\w+)\b", sql, re.IGNORECASE)
-        join_match = re.findall(r"\bJOIN\s+(\w+)\b", sql, re.IGNORECASE)
-        tables = [t.lower() for t in from_match + join_match]
-        invalid = [t for t in tables if t not in ALLOWED_SQL_TABLES]
-        if invalid:
-            return {"type": "error", "error": f"Tabela(s) não permitida(s): {', '.join(invalid)}."}
-        try:
-            result = db.execute(text(sql))
-            rows = result.fetchall()
-            columns = list(result.keys())
-            # Converte linhas em listas (valores serializáveis para JSON/DataFrame)
-            data_rows = []
-            for row in rows:
-                data_rows.append([self._serialize_cell(c) for c in row])
-            return {
-                "type": "sql_result",
-                "data": {"columns": columns, "rows": data_rows},
-            }
-        except Exception as e:
-            return {"type": "error", "error": f"Erro ao executar consulta: {str(e)}"}
-
-    @staticmethod
-    def _serialize_cell(val: Any) -> Any:
-        """Serializa célula para JSON/DataFrame (date/datetime -> str)."""
-        if val is None:
-            return None
-        if hasattr(val, "isoformat"):
-            return val.isoformat()
-        return val
+        data, err = sql_sandbox.executar(db, sql_query, ALLOWED_SQL_TABLES)
+        if err:
+            return {"type": "error", "error": err}
+        return {"type": "sql_result", "data": data}
 
     def execute_query(self, db: Session, query_analysis: Dict) -> Dict[str, Any]:
         """Executa a consulta ao banco conforme a análise da pergunta."""
@@ -718,12 +1013,16 @@ class ReportAgentService:
             end_date = default_end
 
         user_id = query_analysis.get("user_id")
+        comparacao = normalizar_comparacao(query_analysis.get("comparison"))
         try:
+            metricas = query_analysis.get("metricas") or []
+            if len(metricas) > 1:
+                return self._query_metricas(db, query_analysis, metricas, start_date, end_date, comparacao)
             if data_type == "sql":
                 sql_query = query_analysis.get("sql_query") or ""
                 return self._execute_sql_query(db, sql_query)
             if data_type in ("vendas", "resumo_periodo"):
-                return self._query_resumo_periodo(db, start_date, end_date)
+                return self._query_resumo_periodo(db, start_date, end_date, comparacao)
             if data_type == "produtos_mais_vendidos":
                 return self._query_produtos_mais_vendidos(db, start_date, end_date)
             if data_type == "valor_estoque":
@@ -733,59 +1032,127 @@ class ReportAgentService:
             if data_type == "sessoes_caixa":
                 return self._query_sessoes_caixa(db, start_date, end_date)
             if data_type == "contas_pagar":
-                return self._query_contas_pagar(db, start_date, end_date)
+                nome = (query_analysis.get("filters") or {}).get("nome")
+                return self._query_contas_pagar(db, start_date, end_date, nome)
             if data_type == "contas_receber":
-                return self._query_contas_receber(db, start_date, end_date)
+                nome = (query_analysis.get("filters") or {}).get("nome")
+                return self._query_contas_receber(db, start_date, end_date, nome)
             if data_type == "agenda":
                 return self._query_agenda(db, user_id, start_date, end_date)
             if data_type == "analise_avancada":
                 return self._query_analise_avancada(db, start_date, end_date)
+            if data_type == "produtos_juntos":
+                return self._query_produtos_juntos(db)
+            if data_type == "curva_abc":
+                filters = query_analysis.get("filters") or {}
+                return self._query_curva_abc(db, start_date, end_date, filters.get("criterio"))
             # default
-            return self._query_resumo_periodo(db, start_date, end_date)
+            return self._query_resumo_periodo(db, start_date, end_date, comparacao)
         except Exception as e:
             return {"type": "error", "error": str(e)}
 
+    def _query_metricas(
+        self,
+        db: Session,
+        query_analysis: Dict[str, Any],
+        metricas: List[str],
+        start_date: date,
+        end_date: date,
+        comparacao: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Pergunta com várias métricas (ex.: "faturamento, lucro e top 5 produtos do mês comparado ao mês passado").
+        Resumo, top produtos e valor do estoque saem de uma única instrução com CTEs (report_service.painel_metricas);
+        as demais métricas rodam cada uma na sua consulta. Um só resultado para o formatador: "resultados" traz,
+        na ordem pedida, um resultado por métrica no mesmo formato das consultas individuais.
+        """
+        filters = query_analysis.get("filters") or {}
+        try:
+            top_n = max(1, min(50, int(filters.get("limite") or TOP_PRODUTOS_PADRAO)))
+        except (TypeError, ValueError):
+            top_n = TOP_PRODUTOS_PADRAO
+        blocos = [BLOCO_DA_METRICA[m] for m in metricas if m in BLOCO_DA_METRICA]
+        painel = painel_metricas(db, start_date, end_date, blocos, comparacao, top_n=top_n) if blocos else {}
+        resultados = []
+        for m in metricas:
+            if m in BLOCO_DA_METRICA:
+                resultados.append({"type": m, "data": painel[BLOCO_DA_METRICA[m]]})
+            else:
+                resultados.append(self.execute_query(db, {**query_analysis, "data_type": m, "metricas": None}))
+        return {
+            "type": "metricas",
+            "data": {
+                "metricas": metricas,
+                "resultados": resultados,
+                "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat(),
+            },
+        }
+
     def _query_resumo_periodo(
-        self, db: Session, start_date: date, end_date: date
+        self, db: Session, start_date: date, end_date: date, comparacao: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Totais de vendas no período (resumo do período)."""
-        vendas_query = (
-            db.query(
-                func.coalesce(func.sum(Sale.total_vendido), 0.0),
-                func.coalesce(func.sum(Sale.total_lucro), 0.0),
-                func.coalesce(func.sum(Sale.total_pecas), 0),
-            )
-            .filter(Sale.data_venda >= start_date)
-            .filter(Sale.data_venda <= end_date)
-            .filter(Sale.status != "cancelada")
-        )
-        row = vendas_query.one()
-        total_vendido = float(row[0])
-        total_lucro = float(row[1])
-        total_pecas = int(row[2] or 0)
-        num_vendas = (
-            db.query(func.count(Sale.id))
-            .filter(Sale.data_venda >= start_date)
-            .filter(Sale.data_venda <= end_date)
-            .filter(Sale.status != "cancelada")
-            .scalar()
-        ) or 0
-        margem = (total_lucro / total_vendido * 100) if total_vendido > 0 else 0.0
-        ticket_medio = (total_vendido / num_vendas) if num_vendas > 0 else 0.0
+        """Totais de vendas no período (resumo do período), opcionalmente comparado a outra janela."""
         return {
             "type": "resumo_periodo",
+            "data": resumo_periodo(db, start_date, end_date, comparacao),
+        }
+
+    def _query_curva_abc(
+        self, db: Session, start_date: date, end_date: date, criterio: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Curva ABC (Pareto) do período: resumo por classe, principais itens A e estoque parado."""
+        criterio = (criterio or "receita").strip().lower()
+        if criterio not in ABC_CRITERIOS:
+            criterio = "receita"
+        df = curva_abc(db, start_date, end_date)
+        classe_col = f"classe_{criterio}"
+        itens_a = df[df[classe_col] == "A"].sort_values(criterio, ascending=False).head(20)
+        parados = df[df["estoque_parado"]].sort_values("valor_estoque_custo", ascending=False)
+        return {
+            "type": "curva_abc",
             "data": {
-                "total_vendido": total_vendido,
-                "total_lucro": total_lucro,
-                "total_pecas": total_pecas,
-                "num_vendas": num_vendas,
-                "margem": margem,
-                "ticket_medio": ticket_medio,
+                "criterio": criterio,
                 "start_date": start_date.isoformat(),
                 "end_date": end_date.isoformat(),
+                "total_produtos": int(len(df)),
+                "classes": resumo_abc(df, criterio),
+                "itens_a": [
+                    {
+                        "codigo": r.codigo,
+                        "nome": r.nome,
+                        "unidades": float(r.unidades),
+                        "receita": float(r.receita),
+                        "lucro": float(r.lucro),
+                        "participacao_pct": float(getattr(r, f"part_{criterio}") or 0) * 100,
+                        "sell_through_pct": None if pd.isna(r.sell_through) else float(r.sell_through),
+                    }
+                    for r in itens_a.itertuples()
+                ],
+                "dias_sem_venda": ABC_DIAS_SEM_VENDA,
+                "estoque_parado_total_itens": int(len(parados)),
+                "estoque_parado_valor_custo": float(parados["valor_estoque_custo"].sum()),
+                "estoque_parado": [
+                    {
+                        "codigo": r.codigo,
+                        "nome": r.nome,
+                        "estoque_atual": float(r.estoque_atual),
+                        "ultima_venda": r.ultima_venda.isoformat() if isinstance(r.ultima_venda, date) else None,
+                        "valor_parado": float(r.valor_estoque_custo),
+                    }
+                    for r in parados.head(20).itertuples()
+                ],
             },
         }
 
+    def _query_produtos_juntos(self, db: Session, limite: int = 15) -> Dict[str, Any]:
+        """
+        Pares de produtos comprados juntos (análise de cesta) das contagens já processadas; as vendas novas são
+        processadas em segundo plano (a consulta do chat não escreve no banco).
+        """
+        basket_service.atualizar_em_segundo_plano()
+        return {"type": "produtos_juntos", "data": basket_service.pares_frequentes(db, limite=limite)}
+
     def _query_produtos_mais_vendidos(
         self, db: Session, start_date: date, end_date: date
     ) -> Dict[str, Any]:
@@ -913,16 +1280,18 @@ class ReportAgentService:
         }
 
     def _query_contas_pagar(
-        self, db: Session, start_date: date, end_date: date
+        self, db: Session, start_date: date, end_date: date, nome: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Contas a pagar com vencimento no período."""
-        contas = (
+        """Contas a pagar com vencimento no período. Com nome, só as do fornecedor parecido (services.name_matcher)."""
+        q = (
             db.query(AccountPayable)
             .filter(AccountPayable.data_vencimento >= start_date)
             .filter(AccountPayable.data_vencimento <= end_date)
-            .order_by(AccountPayable.data_vencimento)
-            .all()
         )
+        if nome:
+            filtro = name_matcher.filtro_nome(db, "contas_pagar", nome)
+            q = q.filter(filtro if filtro is not None else false())
+        contas = q.order_by(AccountPayable.data_vencimento).all()
         total_abertas = 0.0
         total_pagas = 0.0
         rows = []
@@ -951,16 +1320,21 @@ class ReportAgentService:
         }
 
     def _query_contas_receber(
-        self, db: Session, start_date: date, end_date: date
+        self, db: Session, start_date: date, end_date: date, nome: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Contas a receber (fiado) com vencimento no período."""
-        contas = (
+        """
+        Contas a receber (fiado) com vencimento no período. Com nome, só as do cliente parecido
+        (services.name_matcher).
+        """
+        q = (
             db.query(AccountReceivable)
             .filter(AccountReceivable.data_vencimento >= start_date)
             .filter(AccountReceivable.data_vencimento <= end_date)
-            .order_by(AccountReceivable.data_vencimento)
-            .all()
         )
+        if nome:
+            filtro = name_matcher.filtro_nome(db, "contas_receber", nome)
+            q = q.filter(filtro if filtro is not None else false())
+        contas = q.order_by(AccountReceivable.data_vencimento).all()
         total_abertas = 0.0
         total_recebidas = 0.0
         rows = []
@@ -1024,86 +1398,32 @@ class ReportAgentService:
         }
 
     def _fetch_news_headlines(self, limit: int = 5) -> List[Dict[str, str]]:
-        """Busca manchetes de economia/varejo em RSS para contexto da análise."""
-        urls = [
-            "https://rss.uol.com.br/feed/economia.xml",
-            "https://feeds.folha.uol.com.br/mercado/rss091.xml",
-        ]
-        headers = {"User-Agent": "Mozilla/5.0 (compatible; PDV-Bot/1.0)"}
-        for url in urls:
-            try:
-                req = Request(url, headers=headers)
-                with urlopen(req, timeout=8) as resp:
-                    xml = resp.read().decode("utf-8", errors="replace")
-                import xml.etree.ElementTree as ET
-                root = ET.fromstring(xml)
-                item_elems = root.findall(".//item") or root.findall(".//{*}item")
-                items = []
-                for item in item_elems[:limit]:
-                    title = item.find("title")
-                    link = item.find("link")
-                    if title is not None and title.text:
-                        items.append({
-                            "title": title.text.strip(),
-                            "link": link.text.strip() if link is not None and link.text else "",
-                        })
-                if items:
-                    return items
-            except Exception:
-                continue
-        return []
+        """Manchetes de economia/varejo para contexto da análise (só o cache de services.news_service, sem esperar a rede)."""
+        return news_service.manchetes(limit)
 
     def _query_analise_avancada(
         self, db: Session, start_date: date, end_date: date
     ) -> Dict[str, Any]:
         """Análise avançada: histórico mensal, tendência, previsão, sazonalidade (dados + mercado), notícias."""
         today = date.today()
-        twelve_months_ago = today - relativedelta(months=12)
-        sales = (
-            db.query(Sale.data_venda, Sale.total_vendido, Sale.total_lucro)
-            .filter(Sale.data_venda >= twelve_months_ago)
-            .filter(Sale.data_venda <= today)
-            .filter(Sale.status != "cancelada")
-            .all()
-        )
-        by_month = defaultdict(lambda: {"total": 0.0, "lucro": 0.0, "qtd": 0})
-        by_weekday = defaultdict(lambda: {"total": 0.0, "qtd": 0})
-        for d, total, lucro in sales:
-            key = (d.year, d.month)
-            by_month[key]["total"] += float(total)
-            by_month[key]["lucro"] += float(lucro)
-            by_month[key]["qtd"] += 1
-            wd = d.weekday()
-            by_weekday[wd]["total"] += float(total)
-            by_weekday[wd]["qtd"] += 1
-        meses_nomes = [
-            "jan", "fev", "mar", "abr", "mai", "jun",
-            "jul", "ago", "set", "out", "nov", "dez",
+        previsao = previsao_vendas(db)
+        # Últimos 12 meses (inclui o mês atual, parcial) com vendas, a partir do agregado mensal
+        historico_mensal = [
+            {k: h[k] for k in ("mes_ano", "total_vendido", "lucro", "num_vendas")}
+            for h in previsao["historico_mensal"][-12:]
+            if h["num_vendas"] > 0
         ]
-        historico_mensal = []
-        for (y, m), v in sorted(by_month.items()):
-            historico_mensal.append({
-                "mes_ano": f"{meses_nomes[m - 1]}/{y}",
-                "total_vendido": round(v["total"], 2),
-                "lucro": round(v["lucro"], 2),
-                "num_vendas": v["qtd"],
-            })
         if len(historico_mensal) >= 2:
             primeiro = historico_mensal[0]["total_vendido"]
             ultimo = historico_mensal[-1]["total_vendido"]
             variacao_pct = ((ultimo - primeiro) / primeiro * 100) if primeiro > 0 else 0.0
         else:
             variacao_pct = 0.0
-        if len(historico_mensal) >= 3:
-            media_ultimos_3 = sum(h["total_vendido"] for h in historico_mensal[-3:]) / 3
-            previsao_proximo_mes = round(media_ultimos_3, 2)
+        previsoes = previsao["previsoes"]
+        if len(previsoes) >= 2:
+            previsao_proximo_mes = previsoes[1]["previsto"]
         else:
             previsao_proximo_mes = historico_mensal[-1]["total_vendido"] if historico_mensal else 0.0
-        dias_semana = ["Seg", "Ter", "Qua", "Qui", "Sex", "Sáb", "Dom"]
-        sazonalidade_dia = [
-            {"dia": dias_semana[wd], "total": round(by_weekday[wd]["total"], 2), "vendas": by_weekday[wd]["qtd"]}
-            for wd in range(7)
-        ]
         mes_ref = start_date.month if start_date else today.month
         sazonalidade_mercado = SAZONALIDADE_MERCADO.get(mes_ref, "Período típico de vendas no varejo.")
         noticias = self._fetch_news_headlines(5)
@@ -1114,7 +1434,13 @@ class ReportAgentService:
                 "historico_mensal": historico_mensal,
                 "tendencia_variacao_pct": round(variacao_pct, 2),
                 "previsao_proximo_mes": previsao_proximo_mes,
-                "sazonalidade_por_dia_semana": sazonalidade_dia,
+                "previsao": {
+                    "modelo": previsao["modelo_nome"],
+                    "backtest": previsao["backtest"],
+                    "previsoes": previsoes,
+                    "mes_atual": previsao["mes_atual"],
+                },
+                "sazonalidade_por_dia_semana": previsao["perfil_dia_semana"],
                 "sazonalidade_mercado_periodo": sazonalidade_mercado,
                 "noticias_recentes": noticias,
             },
@@ -1126,91 +1452,114 @@ class ReportAgentService:
         sazonalidade do mês (mercado de roupas femininas), pontos fortes e fracos.
         Trata como especialista em vendas de roupas femininas.
         """
+        return "".join(self.get_initial_analysis_stream(db, user_id))
+
+    def get_initial_analysis_stream(self, db: Session, user_id: Optional[int] = None) -> Iterator[str]:
+        """Como get_initial_analysis, mas em partes à medida que a IA gera o texto (para st.write_stream)."""
+        payload = self._initial_analysis_payload(db, user_id)
+        if not self.ai_service.is_available():
+            yield self._initial_analysis_fallback(payload)
+            return
+        template = PromptConfigManager.get_or_default(
+            self.db, KEY_INITIAL_ANALYSIS, DEFAULTS[KEY_INITIAL_ANALYSIS]
+        )
+        # Só o texto enviado à IA é compactado; o fallback e o bloco da agenda usam o payload completo
+        payload_json, _ = token_budget.ajustar_ao_orcamento(payload, token_budget.ORCAMENTO_ANALISE_INICIAL)
+        prompt = safe_substitute_prompt(
+            template,
+            nome_hoje=payload["dia_semana_hoje"],
+            payload=payload_json,
+        )
+        partes, _ = self.ai_service.complete_stream(
+            prompt, temperature=0.6, max_tokens=900, cache=SITE_INITIAL_ANALYSIS, depende_dados=True,
+            prazo=PRAZO_ANALISE_INICIAL,
+        )
+        recebido: List[str] = []
+        for parte in _corrigir_links_stream(partes or ()):
+            recebido.append(parte)
+            yield parte
+        if not "".join(recebido).strip():
+            yield self._initial_analysis_fallback(payload)
+            return
+        agenda_block = self._format_agenda_block(payload["agenda_hoje"], payload["agenda_proximos_15_dias"])
+        if agenda_block and "Compromissos pessoais" not in "".join(recebido):
+            yield "\n\n" + agenda_block
+
+    def _initial_analysis_payload(self, db: Session, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Dados do dia enviados à IA (ou ao texto de fallback) na análise inicial.
+        As consultas são agregadas no banco e as etapas independentes rodam em paralelo (_executar_etapas);
+        os tempos por etapa ficam em tempos_coleta_analise(). Etapas com erro ficam em "dados_incompletos" e em
+        self.etapas_com_erro: os números delas não são zero de verdade e a análise não deve ser guardada.
+        """
+        t0 = time.perf_counter()
         today = date.today()
         weekday = today.weekday()
         dias_nomes = ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]
         nome_hoje = dias_nomes[weekday]
         oito_semanas_atras = today - relativedelta(weeks=8)
-        sales = (
-            db.query(Sale.data_venda, Sale.total_vendido)
-            .filter(Sale.data_venda >= oito_semanas_atras)
-            .filter(Sale.data_venda <= today)
-            .filter(Sale.status != "cancelada")
-            .all()
-        )
+        inicio_semana = today - relativedelta(days=weekday)
+        fim_semana = inicio_semana + relativedelta(days=6)
+        # Contas: somente vencimento até 15 dias à frente (ou atrasadas); agenda: hoje e próximos 7 dias
+        limite_15_dias = today + relativedelta(days=15)
+        limite_agenda = today + relativedelta(days=7)
+        r, tempos, falhas = _executar_etapas(db, {
+            "vendas_8_semanas": lambda s: _vendas_por_dia(s, oito_semanas_atras, today),
+            "contas_da_semana": lambda s: _contas_da_semana(s, inicio_semana, fim_semana),
+            "contas_a_pagar_15_dias": lambda s: _contas_abertas_ate(
+                s, AccountPayable, AccountPayable.fornecedor, AccountPayable.data_pagamento, limite_15_dias, today, 50
+            ),
+            "contas_a_receber_15_dias": lambda s: _contas_abertas_ate(
+                s, AccountReceivable, AccountReceivable.cliente, AccountReceivable.data_recebimento, limite_15_dias, today
+            ),
+            "agenda": lambda s: _agenda_ate(s, today, limite_agenda, user_id),
+            "fluxo_caixa": lambda s: _fluxo_caixa_payload(s, today),
+        })
+
         by_weekday = defaultdict(lambda: {"total": 0.0, "qtd": 0})
-        for d, total in sales:
+        for d, total, qtd in r["vendas_8_semanas"] or []:
             by_weekday[d.weekday()]["total"] += float(total)
-            by_weekday[d.weekday()]["qtd"] += 1
+            by_weekday[d.weekday()]["qtd"] += int(qtd)
         vendas_por_dia = [
             {"dia": dias_nomes[wd], "total": round(by_weekday[wd]["total"], 2), "vendas": by_weekday[wd]["qtd"]}
             for wd in range(7)
         ]
         total_hoje_historico = by_weekday[weekday]["total"]
         media_geral = sum(by_weekday[w]["total"] for w in range(7)) / 7 if any(by_weekday[w]["total"] for w in range(7)) else 0
-        inicio_semana = today - relativedelta(days=weekday)
-        fim_semana = inicio_semana + relativedelta(days=6)
-        contas_semana = (
-            db.query(AccountPayable)
-            .filter(AccountPayable.data_vencimento >= inicio_semana)
-            .filter(AccountPayable.data_vencimento <= fim_semana)
-            .filter(AccountPayable.status != "paga")
-            .all()
-        )
-        total_contas_semana = sum(c.valor for c in contas_semana)
-        contas_receber_semana = (
-            db.query(AccountReceivable)
-            .filter(AccountReceivable.data_vencimento >= inicio_semana)
-            .filter(AccountReceivable.data_vencimento <= fim_semana)
-            .filter(AccountReceivable.status != "recebida")
-            .all()
-        )
-        total_contas_receber_semana = sum(c.valor for c in contas_receber_semana)
-        # Contas a pagar em aberto: somente vencimento até 15 dias à frente (ou atrasadas)
-        limite_15_dias = today + relativedelta(days=15)
-        contas_pagar_abertas = (
-            db.query(AccountPayable)
-            .filter(AccountPayable.data_pagamento.is_(None))
-            .filter(AccountPayable.data_vencimento <= limite_15_dias)
-            .order_by(AccountPayable.data_vencimento)
-            .limit(50)
-            .all()
+        qtd_contas_semana, total_contas_semana, qtd_contas_receber_semana, total_contas_receber_semana = (
+            r["contas_da_semana"] or (0, 0.0, 0, 0.0)
         )
+        fluxo_caixa: Dict[str, Any] = r["fluxo_caixa"] or {}
+
         contas_pagar_abertas_lista = []
         contas_atrasadas_lista = []
-        for c in contas_pagar_abertas:
-            c.update_status()
-            item = {
-                "fornecedor": c.fornecedor,
-                "valor": round(float(c.valor), 2),
-                "data_vencimento": c.data_vencimento.strftime("%d/%m/%Y"),
-                "status": c.status,
-            }
+        for c in r["contas_a_pagar_15_dias"] or []:
+            item = {"fornecedor": c.pop("nome"), **c}
             contas_pagar_abertas_lista.append(item)
-            if c.status == "atrasada":
+            if item["status"] == "atrasada":
                 contas_atrasadas_lista.append(item)
-        # Contas a receber: somente atrasadas e que vencem nos próximos 15 dias
-        contas_receber_abertas = (
-            db.query(AccountReceivable)
-            .filter(AccountReceivable.data_recebimento.is_(None))
-            .filter(AccountReceivable.data_vencimento <= limite_15_dias)
-            .order_by(AccountReceivable.data_vencimento)
-            .all()
-        )
         contas_receber_atrasadas_lista = []
         contas_receber_proximas_lista = []
-        for c in contas_receber_abertas:
-            c.update_status()
-            item = {
-                "cliente": c.cliente,
-                "valor": round(float(c.valor), 2),
-                "data_vencimento": c.data_vencimento.strftime("%d/%m/%Y"),
-                "status": c.status,
-            }
-            if c.status == "atrasada":
+        for c in r["contas_a_receber_15_dias"] or []:
+            item = {"cliente": c.pop("nome"), **c}
+            if item["status"] == "atrasada":
                 contas_receber_atrasadas_lista.append(item)
             else:
                 contas_receber_proximas_lista.append(item)
+        # Em caso de erro na agenda, apenas não incluir no payload
+        agenda = r["agenda"] or []
+        agenda_hoje_lista: List[Dict[str, Any]] = [item for d, item in agenda if d == today]
+        agenda_proximos_lista: List[Dict[str, Any]] = [item for d, item in agenda if d != today]
+        self.etapas_com_erro = falhas
+        with _lock_coleta:
+            _ultima_coleta.clear()
+            _ultima_coleta.update({
+                "quando": datetime.now().strftime("%d/%m %H:%M:%S"),
+                "total_ms": round((time.perf_counter() - t0) * 1000, 1),
+                "etapas": tempos,
+                "falhas": falhas,
+            })
+
         mes_atual = today.month
         dia_do_mes = today.day
         proximo_virada_mes = dia_do_mes >= 25
@@ -1225,32 +1574,6 @@ class ReportAgentService:
                 mes_proximo, SAZONALIDADE_MERCADO.get(mes_proximo, "")
             )
 
-        # Agenda pessoal: compromissos de hoje e próximos 7 dias
-        agenda_hoje_lista: List[Dict[str, Any]] = []
-        agenda_proximos_lista: List[Dict[str, Any]] = []
-        try:
-            limite_agenda = today + relativedelta(days=7)
-            q = db.query(PersonalAgenda).filter(
-                PersonalAgenda.data >= today, PersonalAgenda.data <= limite_agenda
-            )
-            if user_id is not None:
-                q = q.filter(PersonalAgenda.user_id == user_id)
-            compromissos = q.order_by(PersonalAgenda.data, PersonalAgenda.hora).limit(100).all()
-            for c in compromissos:
-                item = {
-                    "titulo": c.titulo,
-                    "descricao": c.descricao or "",
-                    "data": c.data.strftime("%d/%m/%Y"),
-                    "hora": c.hora or "",
-                }
-                if c.data == today:
-                    agenda_hoje_lista.append(item)
-                else:
-                    agenda_proximos_lista.append(item)
-        except Exception:
-            # Em caso de erro na agenda, apenas não incluir no payload
-            agenda_hoje_lista = []
-            agenda_proximos_lista = []
         payload = {
             "data_hoje": today.strftime("%d/%m/%Y"),
             "dia_do_mes": dia_do_mes,
@@ -1263,10 +1586,11 @@ class ReportAgentService:
             "vendas_por_dia_semana_ultimas_8_semanas": vendas_por_dia,
             "total_historico_no_mesmo_dia_semana": round(total_hoje_historico, 2),
             "media_diaria_historico": round(media_geral, 2),
-            "contas_a_pagar_esta_semana": round(total_contas_semana, 2),
-            "quantidade_contas_semana": len(contas_semana),
-            "contas_a_receber_esta_semana": round(total_contas_receber_semana, 2),
-            "quantidade_contas_receber_semana": len(contas_receber_semana),
+            "contas_a_pagar_esta_semana": round(float(total_contas_semana), 2),
+            "quantidade_contas_semana": int(qtd_contas_semana),
+            "contas_a_receber_esta_semana": round(float(total_contas_receber_semana), 2),
+            "quantidade_contas_receber_semana": int(qtd_contas_receber_semana),
+            "fluxo_caixa_projetado": fluxo_caixa,
             "sazonalidade_mercado_mes": sazonalidade_geral,
             "sazonalidade_moda_feminina_mes": sazonalidade_moda,
             "inicio_semana": inicio_semana.strftime("%d/%m"),
@@ -1283,62 +1607,9 @@ class ReportAgentService:
             "link_contas_receber_proximas": "/5_Contas_a_Pagar?tab=receber".strip(),
             "link_agenda": "/12_Agenda?aba=compromissos".strip(),
         }
-        if not self.ai_service.is_available():
-            return self._initial_analysis_fallback(payload)
-        template = PromptConfigManager.get_or_default(
-            self.db, KEY_INITIAL_ANALYSIS, DEFAULTS[KEY_INITIAL_ANALYSIS]
-        )
-        payload_json = json.dumps(payload, default=str, ensure_ascii=False)
-        prompt = safe_substitute_prompt(
-            template,
-            nome_hoje=nome_hoje,
-            payload=payload_json,
-        )
-        try:
-            client, error = self.ai_service._get_client()
-            if error:
-                return self._initial_analysis_fallback(payload)
-            config = self.ai_service.config
-            provider = config["provider"]
-            model = config.get("model", "")
-            result = ""
-            if provider == "openai":
-                r = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.6,
-                    max_tokens=900,
-                )
-                result = (r.choices[0].message.content or "").strip()
-            elif provider == "gemini":
-                r = client.generate_content(prompt)
-                result = (r.text or "").strip()
-            elif provider == "groq":
-                r = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.6,
-                    max_tokens=900,
-                )
-                result = (r.choices[0].message.content or "").strip()
-            elif provider == "ollama":
-                r = client.chat(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    options={"temperature": 0.6, "num_predict": 900},
-                )
-                result = (r.get("message", {}).get("content") or "").strip()
-            if result:
-                result = re.sub(r"\]\(\s+", "](", result)
-                agenda_block = self._format_agenda_block(
-                    agenda_hoje_lista, agenda_proximos_lista
-                )
-                if agenda_block and "Compromissos pessoais" not in result:
-                    result = result + "\n\n" + agenda_block
-                return result
-        except Exception:
-            pass
-        return self._initial_analysis_fallback(payload)
+        if falhas:
+            payload["dados_incompletos"] = falhas
+        return payload
 
     def _format_agenda_block(
         self,
@@ -1366,8 +1637,15 @@ class ReportAgentService:
 
     def _initial_analysis_fallback(self, payload: Dict[str, Any]) -> str:
         """Fallback quando a IA não está disponível. Layout em MD com ##/###."""
+        aviso = ""
+        if payload.get("dados_incompletos"):
+            aviso = (
+                f"⚠️ Não foi possível ler parte dos dados ({', '.join(payload['dados_incompletos'])}); "
+                f"os valores abaixo podem estar incompletos.\n\n"
+            )
         bloco = (
             f"## Análise do dia – {payload.get('data_hoje', '')} ({payload.get('dia_semana_hoje', '')})\n\n"
+            f"{aviso}"
             f"### Tendência para hoje\n\n"
             f"No mesmo dia da semana o histórico de vendas (últimas 8 semanas) soma "
             f"{format_currency(payload.get('total_historico_no_mesmo_dia_semana', 0))}; "
@@ -1380,6 +1658,19 @@ class ReportAgentService:
             f"- **Contas a receber (fiado):** "
             f"{format_currency(payload.get('contas_a_receber_esta_semana', 0))} ({payload.get('quantidade_contas_receber_semana', 0)} títulos)\n\n"
         )
+        fluxo = payload.get("fluxo_caixa_projetado") or {}
+        if fluxo.get("semanas"):
+            bloco += "### Fluxo de caixa projetado (4 semanas)\n\n"
+            for sem in fluxo["semanas"]:
+                alerta = " ⚠️" if sem.get("negativo") else ""
+                bloco += (
+                    f"- **{sem.get('inicio', '')} a {sem.get('fim', '')}** — pagar {format_currency(sem.get('pagar', 0))}, "
+                    f"receber {format_currency(sem.get('receber', 0))}, vendas previstas {format_currency(sem.get('vendas_previstas', 0))} "
+                    f"— saldo acumulado {format_currency(sem.get('saldo_final', 0))}{alerta}\n"
+                )
+            if fluxo.get("semanas_negativas"):
+                bloco += "\n**⚠️ Atenção:** nas semanas marcadas as saídas acumuladas superam as entradas previstas.\n"
+            bloco += "\n"
         contas_abertas = payload.get("contas_a_pagar_abertas") or []
         contas_atrasadas = payload.get("contas_a_pagar_em_atraso") or []
         if contas_atrasadas or contas_abertas:
@@ -1439,223 +1730,78 @@ class ReportAgentService:
     def format_response(
         self, query_result: Dict, query_analysis: Dict, original_query: str
     ) -> str:
-        """Formata a resposta em markdown (com IA ou fallback simples)."""
-        if query_result.get("type") == "error":
-            return f"**Erro:** {query_result.get('error', 'Erro desconhecido')}"
+        """Resposta em markdown: template do tipo e, com narração ativa, o parágrafo de leitura da IA."""
+        return "".join(self.format_response_stream(query_result, query_analysis, original_query))
 
+    def format_response_stream(
+        self, query_result: Dict, query_analysis: Dict, original_query: str, com_tabela: bool = True
+    ) -> Iterator[str]:
+        """
+        Como format_response, mas em partes (para st.write_stream). Primeiro sai a resposta por template
+        (services.report_templates), na hora; com narração ativa (narracao_ativa) e IA disponível, vem em
+        seguida um parágrafo curto de leitura gerado a partir dos agregados do resultado.
+        A análise avançada, quando narrada, continua com o prompt próprio sobre os dados (já agregados).
+        """
         query_type = query_result.get("type", "")
-        # Resumo/faturamento: sempre formatação fixa para resposta clara e consistente
-        if query_type == "resumo_periodo":
-            return self._format_response_simple(query_result, query_analysis)
-
-        # Resultado de consulta SQL customizada: texto curto + tabela exibida abaixo
-        if query_type == "sql_result":
-            data = query_result.get("data", {})
-            n = len(data.get("rows") or [])
-            return f"**Resultado da consulta** ({n} linha{'s' if n != 1 else ''}). Os dados são exibidos na tabela abaixo."
-
-        if not self.ai_service.is_available():
-            return self._format_response_simple(query_result, query_analysis)
-
-        data = query_result.get("data", {})
-
-        data_json = json.dumps(data, default=str, ensure_ascii=False)
-        if query_type == "analise_avancada":
+        narrar = query_type != "error" and self.narracao_ativa(query_analysis) and self.ai_service.is_available()
+        if narrar and query_type == "analise_avancada":
+            data_json, _ = token_budget.ajustar_ao_orcamento(query_result.get("data", {}), token_budget.ORCAMENTO_DADOS)
             template = PromptConfigManager.get_or_default(
                 self.db,
                 KEY_FORMAT_RESPONSE_ANALISE_AVANCADA,
                 DEFAULTS[KEY_FORMAT_RESPONSE_ANALISE_AVANCADA],
             )
-            prompt = safe_substitute_prompt(
-                template,
-                original_query=original_query,
-                data=data_json,
-            )
-        else:
-            template = PromptConfigManager.get_or_default(
-                self.db,
-                KEY_FORMAT_RESPONSE_GENERIC,
-                DEFAULTS[KEY_FORMAT_RESPONSE_GENERIC],
-            )
-            prompt = safe_substitute_prompt(
-                template,
-                original_query=original_query,
-                query_type=query_type,
-                data=data_json,
-            )
-
-        try:
-            client, error = self.ai_service._get_client()
-            if error:
-                return self._format_response_simple(query_result, query_analysis)
-
-            config = self.ai_service.config
-            provider = config["provider"]
-            model = config.get("model", "")
-
-            if provider == "openai":
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7,
-                )
-                return response.choices[0].message.content
-            if provider == "gemini":
-                response = client.generate_content(prompt)
-                return response.text
-            if provider == "groq":
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7,
-                )
-                return response.choices[0].message.content
-            if provider == "ollama":
-                response = client.chat(
-                    model=model,
-                    messages=[{"role": "user", "content": prompt}],
-                    options={"temperature": 0.7},
-                )
-                return response["message"]["content"]
-            return self._format_response_simple(query_result, query_analysis)
-        except Exception:
-            return self._format_response_simple(query_result, query_analysis)
-
-    def _format_response_simple(self, query_result: Dict, query_analysis: Dict) -> str:
-        """Formatação simples sem IA (templates por tipo)."""
-        query_type = query_result.get("type", "")
-        data = query_result.get("data", {})
-
-        if query_type == "resumo_periodo":
-            start_iso = data.get("start_date", "")
-            end_iso = data.get("end_date", "")
-            try:
-                start_br = date.fromisoformat(start_iso).strftime("%d/%m/%Y") if start_iso else start_iso
-                end_br = date.fromisoformat(end_iso).strftime("%d/%m/%Y") if end_iso else end_iso
-            except (ValueError, TypeError):
-                start_br, end_br = start_iso, end_iso
-            is_single_day = start_iso and end_iso and start_iso == end_iso
-            total = data.get("total_vendido", 0) or 0
-            lucro = data.get("total_lucro", 0) or 0
-            margem = data.get("margem", 0) or 0
-            pecas = data.get("total_pecas", 0) or 0
-            num_v = data.get("num_vendas", 0) or 0
-            ticket = data.get("ticket_medio", 0) or 0
-            if is_single_day:
-                return (
-                    f"### Faturamento do dia ({start_br})\n\n"
-                    f"**Faturamento:** {format_currency(total)}\n\n"
-                    f"**Lucro:** {format_currency(lucro)}  \n"
-                    f"**Margem:** {margem:.1f}%\n\n"
-                    f"**Peças vendidas:** {pecas:.0f}  \n"
-                    f"**Número de vendas:** {num_v}  \n"
-                    f"**Ticket médio:** {format_currency(ticket)}"
-                )
-            return (
-                f"### Resumo do período ({start_br} a {end_br})\n\n"
-                f"**Faturamento:** {format_currency(total)}\n\n"
-                f"**Lucro:** {format_currency(lucro)}  \n"
-                f"**Margem:** {margem:.1f}%\n\n"
-                f"**Peças vendidas:** {pecas:.0f}  \n"
-                f"**Número de vendas:** {num_v}  \n"
-                f"**Ticket médio:** {format_currency(ticket)}"
-            )
-        if query_type == "produtos_mais_vendidos":
-            items = data.get("items", [])
-            lines = [
-                f"- {i.get('nome', '')} (cód. {i.get('codigo', '')}): {i.get('quantidade', 0):.0f} un., "
-                f"receita {format_currency(i.get('receita', 0))}, lucro {format_currency(i.get('lucro', 0))}"
-                for i in items[:10]
-            ]
-            period = f"{data.get('start_date', '')} a {data.get('end_date', '')}"
-            return f"**Produtos mais vendidos** ({period})\n\n" + "\n".join(lines or ["Nenhuma venda no período."])
-        if query_type == "valor_estoque":
-            return (
-                "**Valor do estoque (atual)**\n\n"
-                f"- **Estoque a custo:** {format_currency(data.get('valor_estoque_custo', 0))}\n"
-                f"- **Estoque a venda:** {format_currency(data.get('valor_estoque_venda', 0))}"
-            )
-        if query_type == "entradas_estoque":
-            entradas = data.get("entradas", [])
-            lines = [
-                f"- {e.get('data_entrada', '')} | {e.get('codigo', '')} {e.get('nome', '')} | {e.get('quantidade', 0):.0f} un."
-                for e in entradas[:20]
-            ]
-            return (
-                f"**Entradas de estoque** ({data.get('start_date', '')} a {data.get('end_date', '')})\n\n"
-                f"Total de unidades: {data.get('total_unidades', 0):.0f}\n\n"
-                + "\n".join(lines or ["Nenhuma entrada no período."])
-            )
-        if query_type == "sessoes_caixa":
-            sessoes = data.get("sessoes", [])
-            lines = [
-                f"- Sessão {s.get('id')}: abertura {s.get('data_abertura')}, "
-                f"total vendas {format_currency(s.get('total_vendas_sessao', 0))}"
-                for s in sessoes
-            ]
-            return (
-                f"**Sessões de caixa** ({data.get('start_date', '')} a {data.get('end_date', '')})\n\n"
-                + "\n".join(lines or ["Nenhuma sessão no período."])
-            )
-        if query_type == "contas_pagar":
-            contas = data.get("contas", [])
-            lines = [
-                f"- {c.get('fornecedor')}: venc. {c.get('data_vencimento')}, {format_currency(c.get('valor', 0))} ({c.get('status')})"
-                for c in contas
-            ]
-            return (
-                f"**Contas a pagar** ({data.get('start_date', '')} a {data.get('end_date', '')})\n\n"
-                f"Total em aberto: {format_currency(data.get('total_abertas', 0))} | "
-                f"Total pagas: {format_currency(data.get('total_pagas', 0))}\n\n"
-                + "\n".join(lines or ["Nenhuma conta no período."])
-            )
-        if query_type == "contas_receber":
-            contas = data.get("contas", [])
-            lines = [
-                f"- {c.get('cliente')}: venc. {c.get('data_vencimento')}, {format_currency(c.get('valor', 0))} ({c.get('status')})"
-                for c in contas
-            ]
-            return (
-                f"**Contas a receber (fiado)** ({data.get('start_date', '')} a {data.get('end_date', '')})\n\n"
-                f"Total em aberto: {format_currency(data.get('total_abertas', 0))} | "
-                f"Total recebidas: {format_currency(data.get('total_recebidas', 0))}\n\n"
-                + "\n".join(lines or ["Nenhuma conta no período."])
-            )
-        if query_type == "agenda":
-            compromissos = data.get("compromissos", [])
-            total = len(compromissos)
-            if total == 0:
-                return (
-                    "**Sua agenda**\n\n"
-                    "Você não tem nenhum compromisso agendado no período. "
-                    "Para cadastrar, use a página **Agenda** ou peça: *\"Agendar reunião amanhã às 14h\"*."
-                )
-            lines = []
-            for c in compromissos:
-                hora_txt = f" às {c.get('hora')}" if c.get("hora") else ""
-                desc = f" — {c.get('descricao')}" if c.get("descricao") else ""
-                lines.append(f"- **{c.get('titulo', '')}** — {c.get('data', '')}{hora_txt}{desc}")
-            return (
-                "**Sua agenda (compromissos no período)**\n\n"
-                + "\n".join(lines)
-            )
-        if query_type == "analise_avancada":
-            per = data.get("periodo_consulta", {})
-            start = per.get("start", "")
-            end = per.get("end", "")
-            hist = data.get("historico_mensal", [])
-            tend = data.get("tendencia_variacao_pct", 0)
-            prev = data.get("previsao_proximo_mes", 0)
-            saz_mercado = data.get("sazonalidade_mercado_periodo", "")
-            noticias = data.get("noticias_recentes", [])
-            lines_hist = [f"- {h.get('mes_ano', '')}: {format_currency(h.get('total_vendido', 0))} ({h.get('num_vendas', 0)} vendas)" for h in hist[-6:]]
-            lines_news = [f"- {n.get('title', '')}" for n in noticias[:3]]
-            return (
-                f"**Análise avançada** ({start} a {end})\n\n"
-                f"**Tendência (últimos 12 meses):** {tend:+.1f}%\n\n"
-                f"**Previsão próximo mês (média recente):** {format_currency(prev)}\n\n"
-                f"**Histórico mensal (últimos meses):**\n" + "\n".join(lines_hist or ["Sem dados."]) + "\n\n"
-                f"**Sazonalidade do mercado (período):** {saz_mercado}\n\n"
-                + ("**Notícias recentes (economia):**\n" + "\n".join(lines_news) + "\n" if lines_news else "")
+            prompt = safe_substitute_prompt(template, original_query=original_query, data=data_json)
+            partes, _ = self.ai_service.complete_stream(
+                prompt, temperature=0.7, max_tokens=None, cache=SITE_FORMAT_RESPONSE, depende_dados=True
             )
-        return f"**Resultado:** {query_type}\n\nDados disponíveis."
+            recebeu = False
+            for parte in partes or ():
+                recebeu = True
+                yield parte
+            if not recebeu:
+                yield self._format_response_simple(query_result, query_analysis, com_tabela)
+            return
+
+        yield self._format_response_simple(query_result, query_analysis, com_tabela)
+        if not narrar:
+            return
+        yield from self._leitura_stream(query_result, original_query)
+
+    def narracao_ativa(self, query_analysis: Dict[str, Any]) -> bool:
+        """
+        True quando a resposta ganha texto da IA: pedido na mensagem (campo "narrativa" do plano ou da análise),
+        tipo narrativo (análise avançada) ou configuração "sempre" em Admin > Prompts do Agente de Relatórios.
+        """
+        tipos = {query_analysis.get("data_type"), *(query_analysis.get("metricas") or ())}
+        if query_analysis.get("narrativa") or not turn_planner.TIPOS_NARRATIVOS.isdisjoint(tipos):
+            return True
+        return PromptConfigManager.get(self.db, KEY_NARRACAO) == NARRACAO_SEMPRE
+
+    def _leitura_stream(self, query_result: Dict, original_query: str) -> Iterator[str]:
+        """Parágrafo curto de leitura da IA sobre os agregados do resultado (nada sai se a IA falhar)."""
+        data_json, _ = token_budget.ajustar_ao_orcamento(
+            report_templates.agregados(query_result), token_budget.ORCAMENTO_DADOS
+        )
+        template = PromptConfigManager.get_or_default(
+            self.db, KEY_FORMAT_RESPONSE_INSIGHT, DEFAULTS[KEY_FORMAT_RESPONSE_INSIGHT]
+        )
+        prompt = safe_substitute_prompt(
+            template,
+            original_query=original_query,
+            query_type=query_result.get("type", ""),
+            data=data_json,
+        )
+        partes, _ = self.ai_service.complete_stream(
+            prompt, temperature=0.5, max_tokens=300, cache=SITE_FORMAT_RESPONSE, depende_dados=True
+        )
+        inicio = True
+        for parte in partes or ():
+            if inicio:
+                yield "\n\n**Leitura:** "
+                inicio = False
+            yield parte
+
+    def _format_response_simple(self, query_result: Dict, query_analysis: Dict, com_tabela: bool = True) -> str:
+        """Resposta sem IA: template do tipo de consulta (services.report_templates)."""
+        return report_templates.renderizar(query_result, com_tabela)
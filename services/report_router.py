@@ -0,0 +1,231 @@
+"""
+Roteador por regras (sem IA) para as perguntas mais frequentes do Agente de Relatórios:
+faturamento de hoje/semana/mês, mais vendidos, valor do estoque, contas a pagar/receber e agenda.
+Quando a pergunta casa com uma única intenção e no máximo um período, a resposta sai direto de
+execute_query + _format_response_simple; o restante (cauda longa) segue para a IA.
+Também registra, por mensagem, se a rota foi por regras ou IA e a latência.
+"""
+import re
+import threading
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from mcp.detector import KEYWORDS_CONTAS_PAGAR, KEYWORDS_CONTAS_RECEBER
+from services.period_parser import DIAS_SEMANA, cita_periodo, fora_do_periodo, interpretar_periodo
+
+CONFIANCA_MINIMA = 0.85
+
+# Pedidos de cadastro/baixa/exclusão: nem o atalho nem o cache de perguntas os respondem ("paguei a luz?" e
+# "paguei a luz" têm a mesma chave no cache, mas o segundo é uma baixa para o agente de contas)
+RE_COMANDO = re.compile(
+    r"\b(cadastr|registr|adicion|inser|lanc|lanç|agend[ae]r|marcar|paguei|pagou|quitei|quitou|recebi|recebeu|"
+    r"dar\s+baixa|exclu|apag|remov|edit|alter)",
+    re.IGNORECASE,
+)
+# Comandos e pedidos de análise narrativa não passam pelo atalho
+_RE_NAO_ROTEAR = re.compile(
+    RE_COMANDO.pattern + r"|por\s*qu[eê]|porque|como\s+(?:melhor|aument)|dica|sugest|an[aá]lis|previs|tend[eê]ncia|sazonal|compar|"
+    r"em\s+rela[cç][aã]o|versus|\bvs\b|a\s+mais|a\s+menos|curva|pareto|junt",
+    re.IGNORECASE,
+)
+
+# Intenções: (data_type, regex). A pergunta precisa casar com exatamente uma.
+_INTENCOES: List[Tuple[str, "re.Pattern[str]"]] = [
+    (
+        "resumo_periodo",
+        re.compile(
+            r"quanto\s+(?:eu\s+)?vendi|faturamento|faturei|total\s+(?:de\s+|das\s+)?vendas|"
+            r"vendas\s+(?:de\s+hoje|d[eo]\s+dia|da\s+semana|desta\s+semana|d[eo]\s+m[eê]s|deste\s+m[eê]s)|"
+            r"resumo\s+(?:de\s+|das\s+)?vendas|lucro\s+(?:de\s+hoje|da\s+semana|d[eo]\s+m[eê]s|deste\s+m[eê]s)|ticket\s+m[eé]dio",
+            re.IGNORECASE,
+        ),
+    ),
+    (
+        "produtos_mais_vendidos",
+        re.compile(r"mais\s+vendid|mais\s+vend(?:eu|eram)|top\s+(?:\d+\s+)?(?:vendas|produtos)", re.IGNORECASE),
+    ),
+    (
+        "valor_estoque",
+        re.compile(
+            r"valor\s+(?:do|de|em|no)?\s*estoque|quanto\s+(?:eu\s+)?tenho\s+(?:em|no|de)\s+estoque|estoque\s+(?:total|atual)",
+            re.IGNORECASE,
+        ),
+    ),
+    (
+        "contas_pagar",
+        re.compile(
+            KEYWORDS_CONTAS_PAGAR.pattern + r"|contas\s+a\s+pagar|o\s+que\s+vence|tenho\s+(?:que|pra|para)\s+pagar|contas?\s+pra\s+pagar",
+            re.IGNORECASE,
+        ),
+    ),
+    (
+        "contas_receber",
+        re.compile(KEYWORDS_CONTAS_RECEBER.pattern + r"|contas\s+a\s+receber|fiados", re.IGNORECASE),
+    ),
+    (
+        "agenda",
+        re.compile(
+            r"tenho\s+(?:algum\s+)?(?:agendamento|compromisso)|meus\s+compromissos|o\s+que\s+tenho\s+na\s+agenda|"
+            r"minha\s+agenda|o\s+que\s+est[aá]\s+agendado",
+            re.IGNORECASE,
+        ),
+    ),
+]
+
+# Contas: perguntas de consulta (não cadastro)
+_RE_CONSULTA_CONTAS = re.compile(
+    r"quais|quanto|lista|mostr|ver\b|tenho|vence|vencid|atrasad|pendente|em\s+aberto|"
+    r"contas?\s+a\s+(?:pagar|receber)\s*(?:d[eo]|dest[ea]|ess[ea]|n[oa]|hoje|\?|$)|fiados?\s*(?:d[eo]|dest[ea]|\?|$)",
+    re.IGNORECASE,
+)
+
+# Palavras que uma pergunta roteada pode ter além do período (normalizadas, sem acento). Qualquer outra ("camisa",
+# "joão", "vestido", "aluguel") é um filtro que o atalho não aplica (filters={}): a pergunta segue para a IA.
+_PALAVRAS_CONSULTA = frozenset({
+    # ligação, pergunta e verbos auxiliares
+    "a", "o", "as", "os", "de", "do", "da", "dos", "das", "no", "na", "nos", "nas", "em", "e", "para", "pra", "pro",
+    "que", "quanto", "quanta", "quantos", "quantas", "qual", "quais", "eu", "me", "meu", "minha", "meus", "minhas",
+    "tenho", "temos", "tem", "foi", "foram", "esta", "estao", "sao", "ja", "ate", "agora", "loja", "dia", "periodo",
+    "mostre", "mostra", "mostrar", "ver", "lista", "listar", "quero", "saber", "pode", "favor", "total", "geral",
+    "todo", "toda", "todos", "todas",
+    # vendas
+    "vendi", "vendemos", "vendeu", "venderam", "venda", "vendas", "faturamento", "faturei", "faturou", "faturamos",
+    "lucro", "ticket", "medio", "resumo", "produtos", "mais", "vendido", "vendidos", "vendida", "vendidas", "top",
+    # estoque
+    "valor", "estoque", "atual",
+    # contas
+    "conta", "contas", "pagar", "receber", "fiado", "fiados", "divida", "dividas", "deve", "devem", "devendo",
+    "quem", "cliente", "clientes", "aberto", "aberta", "abertos", "abertas", "pendente", "pendentes", "vence",
+    "vencem", "vencer", "vencido", "vencida", "vencidos", "vencidas", "atrasado", "atrasada", "atrasados", "atrasadas",
+    # agenda
+    "agenda", "algum", "alguma", "agendamento", "agendamentos", "compromisso", "compromissos", "agendado", "agendada",
+})
+# "por <dimensão>" (forma de pagamento, dia, vendedor...): quebra que o atalho não faz
+_RE_POR_DIMENSAO = re.compile(r"\bpor\s+(?!favor\b)\w", re.IGNORECASE)
+
+
+def _so_intencao_e_periodo(query: str, hoje: date) -> bool:
+    """True se, fora do período, a pergunta só tem palavras de _PALAVRAS_CONSULTA (nenhum filtro nem quebra)."""
+    if _RE_POR_DIMENSAO.search(query):
+        return False
+    resto = " ".join(fora_do_periodo(query, hoje))
+    resto = re.sub(r"\btop\s+\d+\b", " ", resto)
+    return all(p in _PALAVRAS_CONSULTA for p in resto.split())
+
+
+def _periodo_agenda(periodo: Dict[str, Any], hoje: date) -> Tuple[date, date]:
+    """
+    Período da agenda olhando para a frente: o interpretador fecha "esta semana"/"este mês" em hoje e leva
+    "sexta" à mais recente (pensado para vendas); na agenda a semana/mês vai até o fim e "sexta" é a próxima.
+    """
+    inicio, fim, tipo = periodo["start"], periodo["end"], periodo["type"]
+    if tipo == "semana_atual":
+        fim = inicio + timedelta(days=6)
+    elif tipo == "mes_atual":
+        fim = (inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    elif tipo == "dia" and inicio < hoje and "passad" not in periodo["trecho"] and any(
+        periodo["trecho"].startswith(d) for d in DIAS_SEMANA
+    ):
+        inicio = fim = inicio + timedelta(days=7)
+    return inicio, fim
+
+
+def classificar(query: str, hoje: Optional[date] = None) -> Optional[Dict[str, Any]]:
+    """
+    Classifica a pergunta só com regras. Retorna {"data_type", "period_info", "confianca"} ou None quando
+    a pergunta é ambígua, pede cadastro/análise, cita mais de um período, casa com mais de uma intenção ou traz
+    algo além da intenção e do período (produto, nome, "por forma de pagamento"): o atalho não aplica filtros.
+    O período vem do interpretador local (services.period_parser).
+    """
+    q = (query or "").strip()
+    if len(q) < 4 or _RE_NAO_ROTEAR.search(q):
+        return None
+    hoje = hoje or date.today()
+    tipos = [dt for dt, rx in _INTENCOES if rx.search(q)]
+    # "contas a pagar" também casa "conta de ..." do cadastro; fiado/cliente só vale se for consulta
+    if "contas_pagar" in tipos and "contas_receber" in tipos:
+        return None
+    if any(t in tipos for t in ("contas_pagar", "contas_receber")) and not _RE_CONSULTA_CONTAS.search(q):
+        tipos = [t for t in tipos if t not in ("contas_pagar", "contas_receber")]
+    if len(tipos) != 1 or not _so_intencao_e_periodo(q, hoje):
+        return None
+    data_type = tipos[0]
+
+    if data_type == "valor_estoque":
+        return {"data_type": data_type, "period_info": {"type": "hoje"}, "confianca": 0.95}
+
+    periodo = interpretar_periodo(q, hoje)
+    if data_type == "agenda":
+        if periodo is None:
+            if cita_periodo(q, hoje):
+                return None
+            # Sem período: os próximos 7 dias
+            return {
+                "data_type": data_type,
+                "period_info": {"start": hoje.isoformat(), "end": (hoje + timedelta(days=7)).isoformat()},
+                "confianca": 0.9,
+            }
+        inicio, fim = _periodo_agenda(periodo, hoje)
+        period_info = {"start": inicio.isoformat(), "end": fim.isoformat()}
+        return {"data_type": data_type, "period_info": period_info, "confianca": 0.95}
+
+    if periodo is None:
+        if cita_periodo(q, hoje):
+            # Mais de um período sem ligação ("hoje e ontem"): a IA decide
+            return None
+        # Sem período: mesmo padrão do prompt (este mês), com confiança menor para faturamento (a IA pode perguntar)
+        confianca = 0.8 if data_type == "resumo_periodo" else 0.9
+        return {"data_type": data_type, "period_info": {"type": "mes_atual"}, "confianca": confianca}
+    period_info = {"start": periodo["start"].isoformat(), "end": periodo["end"].isoformat()}
+    return {"data_type": data_type, "period_info": period_info, "confianca": 0.95}
+
+
+# --- Métricas por mensagem: rota por regras x IA e latência ---
+_lock = threading.Lock()
+_metricas: Dict[str, Dict[str, float]] = {
+    "regras": {"mensagens": 0, "ms_total": 0.0},
+    "cache": {"mensagens": 0, "ms_total": 0.0},
+    "planejador": {"mensagens": 0, "ms_total": 0.0},
+    "ia": {"mensagens": 0, "ms_total": 0.0},
+}
+
+
+class Cronometro:
+    """Mede a latência de uma mensagem: `with Cronometro() as c: ...; registrar_rota(fonte, c.ms)`."""
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        self.ms = 0.0
+        return self
+
+    def __exit__(self, *exc):
+        self.ms = (time.perf_counter() - self._t0) * 1000
+        return False
+
+
+def registrar_rota(fonte: str, ms: float) -> None:
+    """
+    Registra uma mensagem respondida por "regras", "cache" (cache de perguntas), "planejador" (uma chamada à IA)
+    ou "ia" e sua latência (ms).
+    """
+    with _lock:
+        m = _metricas.setdefault(fonte, {"mensagens": 0, "ms_total": 0.0})
+        m["mensagens"] += 1
+        m["ms_total"] += float(ms)
+
+
+def estatisticas_rotas() -> Dict[str, Any]:
+    """Mensagens, proporção e latência média por rota (desde o início do processo)."""
+    with _lock:
+        total = sum(int(m["mensagens"]) for m in _metricas.values())
+        rotas = [
+            {
+                "rota": fonte,
+                "mensagens": int(m["mensagens"]),
+                "proporcao_pct": round(m["mensagens"] / total * 100, 1) if total else 0.0,
+                "latencia_media_ms": round(m["ms_total"] / m["mensagens"], 1) if m["mensagens"] else 0.0,
+            }
+            for fonte, m in _metricas.items()
+        ]
+    return {"total": total, "rotas": rotas}
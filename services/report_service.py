@@ -0,0 +1,437 @@
+"""
+Consultas agregadas de relatórios compartilhadas pela página Relatórios e pelo agente de relatórios.
+Resumo do período com comparação (período anterior / mesmo período do ano anterior) em uma única consulta.
+Painel de métricas (resumo, top produtos e valor do estoque) numa única instrução com CTEs.
+Curva ABC (Pareto) por receita, lucro e unidades, com sell-through e estoque parado.
+"""
+import time
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import and_, case, func, or_, select, true
+from sqlalchemy.orm import Session
+
+from models.product import Product
+from models.sale import Sale, SaleItem
+from models.stock_entry import StockEntry
+
+COMPARACAO_PERIODO_ANTERIOR = "periodo_anterior"
+COMPARACAO_ANO_ANTERIOR = "ano_anterior"
+
+# Rótulos exibidos na interface (None = sem comparação)
+COMPARACOES: Dict[Optional[str], str] = {
+    None: "Sem comparação",
+    COMPARACAO_PERIODO_ANTERIOR: "Período anterior",
+    COMPARACAO_ANO_ANTERIOR: "Mesmo período do ano anterior",
+}
+
+METRICAS_RESUMO = ("total_vendido", "total_lucro", "total_pecas", "num_vendas", "margem", "ticket_medio")
+
+
+def normalizar_comparacao(valor: Any) -> Optional[str]:
+    """Normaliza o modo de comparação vindo da IA/interface; retorna None quando não houver comparação."""
+    if valor is None:
+        return None
+    s = str(valor).strip().lower().replace(" ", "_")
+    if s in (COMPARACAO_PERIODO_ANTERIOR, "anterior", "mes_anterior", "periodo_passado", "previous_period"):
+        return COMPARACAO_PERIODO_ANTERIOR
+    if s in (COMPARACAO_ANO_ANTERIOR, "ano_passado", "mesmo_periodo_ano_anterior", "same_period_last_year", "yoy"):
+        return COMPARACAO_ANO_ANTERIOR
+    return None
+
+
+def periodo_comparacao(start_date: date, end_date: date, modo: str) -> Tuple[date, date]:
+    """
+    Janela de comparação para o período informado.
+    periodo_anterior: mesmo número de dias imediatamente antes; ano_anterior: mesmas datas um ano antes.
+    """
+    if modo == COMPARACAO_ANO_ANTERIOR:
+        return start_date - relativedelta(years=1), end_date - relativedelta(years=1)
+    dias = (end_date - start_date).days + 1
+    fim = start_date - timedelta(days=1)
+    return fim - timedelta(days=dias - 1), fim
+
+
+def _metricas(total_vendido: float, total_lucro: float, total_pecas: int, num_vendas: int) -> Dict[str, Any]:
+    """Monta o dicionário de métricas do resumo (margem e ticket médio derivados)."""
+    return {
+        "total_vendido": total_vendido,
+        "total_lucro": total_lucro,
+        "total_pecas": total_pecas,
+        "num_vendas": num_vendas,
+        "margem": (total_lucro / total_vendido * 100) if total_vendido > 0 else 0.0,
+        "ticket_medio": (total_vendido / num_vendas) if num_vendas > 0 else 0.0,
+    }
+
+
+def calcular_deltas(atual: Dict[str, Any], anterior: Dict[str, Any]) -> Dict[str, Dict[str, Optional[float]]]:
+    """Variação absoluta e percentual de cada métrica (pct None quando o valor anterior é zero)."""
+    deltas: Dict[str, Dict[str, Optional[float]]] = {}
+    for m in METRICAS_RESUMO:
+        a = float(atual.get(m) or 0)
+        b = float(anterior.get(m) or 0)
+        diff = a - b
+        deltas[m] = {"abs": diff, "pct": (diff / b * 100) if b else None}
+    return deltas
+
+
+def _colunas_resumo(start_date: date, end_date: date, comparacao: Optional[str]):
+    """
+    Colunas agregadas do resumo (janela atual e, com comparacao, a outra janela via SUM(CASE WHEN ...)),
+    o filtro de datas que cobre as duas janelas e as datas da comparação (None sem comparação).
+    """
+    na_janela = and_(Sale.data_venda >= start_date, Sale.data_venda <= end_date)
+    colunas = [
+        func.coalesce(func.sum(case((na_janela, Sale.total_vendido), else_=0)), 0.0),
+        func.coalesce(func.sum(case((na_janela, Sale.total_lucro), else_=0)), 0.0),
+        func.coalesce(func.sum(case((na_janela, Sale.total_pecas), else_=0)), 0),
+        func.coalesce(func.sum(case((na_janela, 1), else_=0)), 0),
+    ]
+    filtro_datas = na_janela
+    comp_start = comp_end = None
+    if comparacao:
+        comp_start, comp_end = periodo_comparacao(start_date, end_date, comparacao)
+        na_comp = and_(Sale.data_venda >= comp_start, Sale.data_venda <= comp_end)
+        colunas += [
+            func.coalesce(func.sum(case((na_comp, Sale.total_vendido), else_=0)), 0.0),
+            func.coalesce(func.sum(case((na_comp, Sale.total_lucro), else_=0)), 0.0),
+            func.coalesce(func.sum(case((na_comp, Sale.total_pecas), else_=0)), 0),
+            func.coalesce(func.sum(case((na_comp, 1), else_=0)), 0),
+        ]
+        filtro_datas = or_(na_janela, na_comp)
+    return colunas, filtro_datas, comp_start, comp_end
+
+
+def _montar_resumo(
+    row: Sequence[Any],
+    start_date: date,
+    end_date: date,
+    comparacao: Optional[str],
+    comp_start: Optional[date],
+    comp_end: Optional[date],
+) -> Dict[str, Any]:
+    """Dicionário do resumo a partir dos valores das colunas de _colunas_resumo (mesma ordem)."""
+    data = _metricas(float(row[0] or 0), float(row[1] or 0), int(row[2] or 0), int(row[3] or 0))
+    data["start_date"] = start_date.isoformat()
+    data["end_date"] = end_date.isoformat()
+    if comparacao:
+        anterior = _metricas(float(row[4] or 0), float(row[5] or 0), int(row[6] or 0), int(row[7] or 0))
+        anterior["modo"] = comparacao
+        anterior["start_date"] = comp_start.isoformat()
+        anterior["end_date"] = comp_end.isoformat()
+        anterior["deltas"] = calcular_deltas(data, anterior)
+        data["comparacao"] = anterior
+    return data
+
+
+def resumo_periodo(
+    db: Session,
+    start_date: date,
+    end_date: date,
+    comparacao: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Totais de vendas no período (faturamento, lucro, peças, nº de vendas, margem, ticket médio).
+    Com comparacao, as duas janelas são agregadas na mesma consulta (SUM(CASE WHEN ...))
+    e o resultado traz a chave "comparacao" com os totais da outra janela e as variações.
+    """
+    comparacao = normalizar_comparacao(comparacao)
+    colunas, filtro_datas, comp_start, comp_end = _colunas_resumo(start_date, end_date, comparacao)
+    row = db.query(*colunas).filter(filtro_datas).filter(Sale.status != "cancelada").one()
+    return _montar_resumo(row, start_date, end_date, comparacao, comp_start, comp_end)
+
+
+# --- Painel de métricas (várias métricas numa instrução) ---
+
+BLOCO_RESUMO = "resumo"
+BLOCO_TOP_PRODUTOS = "top_produtos"
+BLOCO_ESTOQUE = "estoque"
+BLOCOS_PAINEL = (BLOCO_RESUMO, BLOCO_TOP_PRODUTOS, BLOCO_ESTOQUE)
+
+
+def painel_metricas(
+    db: Session,
+    start_date: date,
+    end_date: date,
+    blocos: Sequence[str] = BLOCOS_PAINEL,
+    comparacao: Optional[str] = None,
+    top_n: int = 10,
+) -> Dict[str, Any]:
+    """
+    Várias métricas do período numa única instrução SQL: cada bloco pedido vira uma CTE (resumo de vendas
+    com comparação, top produtos por quantidade e valor atual do estoque). As CTEs de uma linha são unidas
+    por produto cartesiano e o top produtos entra por LEFT JOIN, de modo que a resposta tem uma linha por
+    produto (ou uma só, sem vendas) com os totais repetidos.
+    Retorna {bloco: dados} no formato de resumo_periodo / produtos mais vendidos / valor do estoque.
+    """
+    blocos = [b for b in BLOCOS_PAINEL if b in set(blocos)]
+    if not blocos:
+        return {}
+    comparacao = normalizar_comparacao(comparacao)
+    colunas, filtro_datas, comp_start, comp_end = _colunas_resumo(start_date, end_date, comparacao)
+    nao_cancelada = Sale.status != "cancelada"
+    unicas = []  # CTEs de uma linha só
+    if BLOCO_RESUMO in blocos:
+        unicas.append(
+            select(*(c.label(f"r{i}") for i, c in enumerate(colunas)))
+            .where(filtro_datas, nao_cancelada)
+            .cte("resumo")
+        )
+    if BLOCO_ESTOQUE in blocos:
+        unicas.append(
+            select(
+                func.coalesce(func.sum(func.coalesce(Product.preco_custo, 0) * func.coalesce(Product.estoque_atual, 0)), 0.0).label("custo"),
+                func.coalesce(func.sum(func.coalesce(Product.preco_venda, 0) * func.coalesce(Product.estoque_atual, 0)), 0.0).label("venda"),
+            ).cte("estoque")
+        )
+    top = None
+    if BLOCO_TOP_PRODUTOS in blocos:
+        na_janela = and_(Sale.data_venda >= start_date, Sale.data_venda <= end_date)
+        qtd = func.sum(case((na_janela, SaleItem.quantidade), else_=0))
+        cols_top = [
+            Product.codigo.label("codigo"),
+            Product.nome.label("nome"),
+            qtd.label("qtd"),
+            func.sum(case((na_janela, SaleItem.quantidade * SaleItem.preco_unitario), else_=0)).label("receita"),
+            func.sum(case((na_janela, SaleItem.lucro_item), else_=0)).label("lucro"),
+        ]
+        if comparacao:
+            na_comp = and_(Sale.data_venda >= comp_start, Sale.data_venda <= comp_end)
+            cols_top += [
+                func.sum(case((na_comp, SaleItem.quantidade), else_=0)).label("qtd_ant"),
+                func.sum(case((na_comp, SaleItem.quantidade * SaleItem.preco_unitario), else_=0)).label("receita_ant"),
+            ]
+        top = (
+            select(*cols_top)
+            .join(Product, Product.id == SaleItem.product_id)
+            .join(Sale, Sale.id == SaleItem.sale_id)
+            .where(filtro_datas, nao_cancelada)
+            .group_by(Product.codigo, Product.nome)
+            .having(qtd > 0)
+            .order_by(qtd.desc())
+            .limit(top_n)
+            .cte("top_produtos")
+        )
+
+    origem = None
+    for cte in unicas:
+        origem = cte if origem is None else origem.join(cte, true())
+    if top is not None:
+        origem = top if origem is None else origem.outerjoin(top, true())
+    stmt = select(*(c for cte in unicas + ([top] if top is not None else []) for c in cte.c)).select_from(origem)
+    if top is not None:
+        stmt = stmt.order_by(top.c.qtd.desc())
+    rows = db.execute(stmt).mappings().all()
+
+    painel: Dict[str, Any] = {}
+    primeira = rows[0] if rows else {}
+    if BLOCO_RESUMO in blocos:
+        valores = [primeira.get(f"r{i}") for i in range(len(colunas))]
+        painel[BLOCO_RESUMO] = _montar_resumo(valores, start_date, end_date, comparacao, comp_start, comp_end)
+    if BLOCO_ESTOQUE in blocos:
+        painel[BLOCO_ESTOQUE] = {
+            "valor_estoque_custo": float(primeira.get("custo") or 0),
+            "valor_estoque_venda": float(primeira.get("venda") or 0),
+        }
+    if top is not None:
+        items = []
+        for r in rows:
+            if r.get("codigo") is None:
+                continue
+            item = {
+                "codigo": r["codigo"],
+                "nome": r["nome"],
+                "quantidade": float(r["qtd"] or 0),
+                "receita": float(r["receita"] or 0),
+                "lucro": float(r["lucro"] or 0),
+            }
+            if comparacao:
+                item["quantidade_anterior"] = float(r["qtd_ant"] or 0)
+                item["receita_anterior"] = float(r["receita_ant"] or 0)
+            items.append(item)
+        painel[BLOCO_TOP_PRODUTOS] = {
+            "items": items,
+            "start_date": start_date.isoformat(),
+            "end_date": end_date.isoformat(),
+        }
+    return painel
+
+
+# --- Curva ABC ---
+
+# Participação acumulada que fecha cada classe (A até 80%, B até 95%, C o restante)
+ABC_CORTE_A = 0.80
+ABC_CORTE_B = 0.95
+ABC_DIAS_SEM_VENDA = 90
+ABC_CRITERIOS = {"receita": "Receita", "lucro": "Lucro", "unidades": "Unidades"}
+
+_ABC_CACHE_TTL = 600
+_ABC_CACHE_MAX = 32
+_abc_cache: Dict[Tuple[Any, ...], Tuple[float, pd.DataFrame]] = {}
+
+
+def _abc_fingerprint(db: Session) -> Tuple[Any, ...]:
+    """Assinatura barata dos dados (últimos ids de venda/entrada e última alteração de produto)."""
+    row = db.query(
+        db.query(func.max(Sale.id)).scalar_subquery(),
+        db.query(func.count(Sale.id)).filter(Sale.status == "cancelada").scalar_subquery(),
+        db.query(func.max(StockEntry.id)).scalar_subquery(),
+        db.query(func.max(Product.updated_at)).scalar_subquery(),
+    ).one()
+    return tuple(row)
+
+
+def _classificar(valores: pd.Series) -> Tuple[pd.Series, pd.Series, pd.Series]:
+    """
+    Participação, participação acumulada e classe ABC de cada item (ordem decrescente de valor).
+    Um item é A enquanto a participação acumulada ANTES dele for menor que o corte (o item que cruza o corte entra na classe).
+    """
+    v = valores.clip(lower=0).astype(float)
+    total = float(v.sum())
+    ordem = v.sort_values(ascending=False, kind="mergesort")
+    if total <= 0:
+        zeros = pd.Series(0.0, index=v.index)
+        return zeros, zeros, pd.Series("C", index=v.index)
+    part = ordem / total
+    acum = part.cumsum()
+    antes = acum - part
+    classe = np.where(ordem <= 0, "C", np.where(antes < ABC_CORTE_A, "A", np.where(antes < ABC_CORTE_B, "B", "C")))
+    return part.reindex(v.index), acum.reindex(v.index), pd.Series(classe, index=ordem.index).reindex(v.index)
+
+
+def curva_abc(
+    db: Session,
+    start_date: date,
+    end_date: date,
+    dias_sem_venda: int = ABC_DIAS_SEM_VENDA,
+) -> pd.DataFrame:
+    """
+    Curva ABC de todos os produtos no período: uma consulta agrupada (vendas, entradas e última venda por produto)
+    e classificação vetorizada por receita, lucro e unidades.
+    Colunas: product_id, codigo, nome, categoria, preco_custo, estoque_atual, estoque_minimo, unidades, receita,
+    lucro, entradas, sell_through (% vendido sobre as entradas do período), ultima_venda, estoque_parado,
+    valor_estoque_custo,
+    part_<criterio>, acum_<criterio> e classe_<criterio>.
+    Resultado em cache por período (invalidado quando vendas, entradas ou produtos mudam).
+    """
+    chave = (start_date, end_date, int(dias_sem_venda), _abc_fingerprint(db))
+    agora = time.monotonic()
+    hit = _abc_cache.get(chave)
+    if hit and agora - hit[0] < _ABC_CACHE_TTL:
+        return hit[1].copy()
+
+    vendas_sq = (
+        db.query(
+            SaleItem.product_id.label("product_id"),
+            func.sum(SaleItem.quantidade).label("unidades"),
+            func.sum(SaleItem.quantidade * SaleItem.preco_unitario).label("receita"),
+            func.sum(SaleItem.lucro_item).label("lucro"),
+        )
+        .join(Sale, Sale.id == SaleItem.sale_id)
+        .filter(Sale.data_venda >= start_date)
+        .filter(Sale.data_venda <= end_date)
+        .filter(Sale.status != "cancelada")
+        .group_by(SaleItem.product_id)
+        .subquery()
+    )
+    entradas_sq = (
+        db.query(
+            StockEntry.product_id.label("product_id"),
+            func.sum(StockEntry.quantity).label("entradas"),
+        )
+        .filter(StockEntry.data_entrada >= start_date)
+        .filter(StockEntry.data_entrada <= end_date)
+        .group_by(StockEntry.product_id)
+        .subquery()
+    )
+    ultima_sq = (
+        db.query(
+            SaleItem.product_id.label("product_id"),
+            func.max(Sale.data_venda).label("ultima_venda"),
+        )
+        .join(Sale, Sale.id == SaleItem.sale_id)
+        .filter(Sale.status != "cancelada")
+        .group_by(SaleItem.product_id)
+        .subquery()
+    )
+    rows = (
+        db.query(
+            Product.id,
+            Product.codigo,
+            Product.nome,
+            Product.categoria,
+            Product.preco_custo,
+            Product.estoque_atual,
+            Product.estoque_minimo,
+            func.coalesce(vendas_sq.c.unidades, 0.0),
+            func.coalesce(vendas_sq.c.receita, 0.0),
+            func.coalesce(vendas_sq.c.lucro, 0.0),
+            func.coalesce(entradas_sq.c.entradas, 0.0),
+            ultima_sq.c.ultima_venda,
+        )
+        .outerjoin(vendas_sq, vendas_sq.c.product_id == Product.id)
+        .outerjoin(entradas_sq, entradas_sq.c.product_id == Product.id)
+        .outerjoin(ultima_sq, ultima_sq.c.product_id == Product.id)
+        .filter(or_(Product.ativo.is_(True), vendas_sq.c.product_id.isnot(None)))
+        .all()
+    )
+    df = pd.DataFrame(
+        rows,
+        columns=[
+            "product_id", "codigo", "nome", "categoria", "preco_custo", "estoque_atual", "estoque_minimo",
+            "unidades", "receita", "lucro", "entradas", "ultima_venda",
+        ],
+    )
+    for col in ("preco_custo", "estoque_atual", "unidades", "receita", "lucro", "entradas"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0.0)
+    df["estoque_minimo"] = pd.to_numeric(df["estoque_minimo"], errors="coerce")
+
+    for criterio in ABC_CRITERIOS:
+        part, acum, classe = _classificar(df[criterio])
+        df[f"part_{criterio}"] = part
+        df[f"acum_{criterio}"] = acum
+        df[f"classe_{criterio}"] = classe
+
+    entradas = df["entradas"].to_numpy()
+    df["sell_through"] = np.where(entradas > 0, df["unidades"].to_numpy() / np.where(entradas > 0, entradas, 1) * 100, np.nan)
+    ultima = pd.to_datetime(df["ultima_venda"], errors="coerce")
+    limite = pd.Timestamp(date.today() - timedelta(days=int(dias_sem_venda)))
+    df["ultima_venda"] = ultima.dt.date.astype(object).where(ultima.notna(), None)
+    df["estoque_parado"] = (df["estoque_atual"] > 0) & (ultima.isna() | (ultima < limite))
+    df["valor_estoque_custo"] = df["estoque_atual"].clip(lower=0) * df["preco_custo"]
+    df = df.sort_values("receita", ascending=False, kind="mergesort").reset_index(drop=True)
+
+    if len(_abc_cache) >= _ABC_CACHE_MAX:
+        _abc_cache.pop(min(_abc_cache, key=lambda k: _abc_cache[k][0]), None)
+    _abc_cache[chave] = (agora, df)
+    return df.copy()
+
+
+def resumo_abc(df: pd.DataFrame, criterio: str = "receita") -> List[Dict[str, Any]]:
+    """Totais por classe (itens, valor e participação) para o critério informado."""
+    if criterio not in ABC_CRITERIOS:
+        criterio = "receita"
+    total = float(df[criterio].clip(lower=0).sum()) if not df.empty else 0.0
+    agrupado = df.groupby(f"classe_{criterio}")[criterio].agg(["count", "sum"]) if not df.empty else None
+    resumo = []
+    for classe in ("A", "B", "C"):
+        n, valor = (0, 0.0)
+        if agrupado is not None and classe in agrupado.index:
+            n, valor = int(agrupado.loc[classe, "count"]), float(agrupado.loc[classe, "sum"])
+        resumo.append({
+            "classe": classe,
+            "itens": n,
+            "valor": valor,
+            "participacao": (valor / total * 100) if total > 0 else 0.0,
+        })
+    return resumo
+
+
+def classes_abc_por_produto(db: Session, dias: int = ABC_DIAS_SEM_VENDA, criterio: str = "receita") -> Dict[int, str]:
+    """Classe ABC de cada produto nos últimos `dias` (usado na priorização de reposição)."""
+    hoje = date.today()
+    df = curva_abc(db, hoje - timedelta(days=dias - 1), hoje, dias)
+    return dict(zip(df["product_id"].astype(int), df[f"classe_{criterio}"]))
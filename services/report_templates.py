@@ -0,0 +1,388 @@
+"""
+Templates das respostas do Agente de Relatórios: markdown por tipo de consulta (título com período, totais,
+tabela e valores/datas no padrão brasileiro), montado em Python, sem chamada à IA, em milissegundos.
+VERSAO muda sempre que o texto de algum template muda (aparece na legenda da resposta no chat).
+A narração da IA é opcional e recebe só agregados(...), nunca as linhas da consulta.
+"""
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from services import token_budget
+from services.report_service import ABC_CRITERIOS, ABC_DIAS_SEM_VENDA, COMPARACOES
+from utils.formatters import format_currency
+
+VERSAO = 2
+MAX_LINHAS_TABELA = 15
+# Itens por lista que a narração recebe (o resto vira total/omitidos/somas, ver token_budget.compactar)
+AGREGADOS_MAX_ITENS = 3
+
+
+def _data_br(valor: Any) -> str:
+    """Data ISO (YYYY-MM-DD), date ou datetime em DD/MM/AAAA; outros valores como texto."""
+    if isinstance(valor, datetime):
+        return valor.strftime("%d/%m/%Y")
+    if isinstance(valor, date):
+        return valor.strftime("%d/%m/%Y")
+    texto = str(valor or "")
+    try:
+        return date.fromisoformat(texto[:10]).strftime("%d/%m/%Y")
+    except ValueError:
+        return texto
+
+
+def _periodo(data: Dict[str, Any]) -> str:
+    """"DD/MM/AAAA a DD/MM/AAAA" (ou só a data, quando início e fim coincidem)."""
+    inicio, fim = data.get("start_date", ""), data.get("end_date", "")
+    if inicio and inicio == fim:
+        return _data_br(inicio)
+    return f"{_data_br(inicio)} a {_data_br(fim)}"
+
+
+def _numero(valor: Any, casas: int = 0) -> str:
+    """Número com separador de milhar "." e decimal "," (ex.: 1.234 ou 1.234,5)."""
+    try:
+        texto = f"{float(valor or 0):,.{casas}f}"
+    except (TypeError, ValueError):
+        return str(valor)
+    return texto.replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def _celula(valor: Any) -> str:
+    texto = "" if valor is None else str(valor)
+    return texto.replace("|", "\\|").replace("\n", " ")
+
+
+def _tabela(cabecalho: Sequence[str], linhas: Sequence[Sequence[Any]], com_tabela: bool = True) -> str:
+    """
+    Tabela markdown com até MAX_LINHAS_TABELA linhas e nota das omitidas. Com com_tabela=False (o chat já
+    exibe a tabela completa logo abaixo) devolve vazio.
+    """
+    if not com_tabela or not linhas:
+        return ""
+    partes = [
+        "| " + " | ".join(cabecalho) + " |",
+        "|" + "|".join("---" for _ in cabecalho) + "|",
+    ]
+    partes += ["| " + " | ".join(_celula(c) for c in linha) + " |" for linha in linhas[:MAX_LINHAS_TABELA]]
+    if len(linhas) > MAX_LINHAS_TABELA:
+        partes.append(f"\n*… e mais {len(linhas) - MAX_LINHAS_TABELA} linha(s).*")
+    return "\n\n" + "\n".join(partes)
+
+
+def _bloco_comparacao(comp: Optional[Dict[str, Any]]) -> str:
+    """Bloco markdown com a comparação do resumo (valores da outra janela e variações absoluta/%)."""
+    if not comp:
+        return ""
+    label = COMPARACOES.get(comp.get("modo"), "Comparação")
+    deltas = comp.get("deltas") or {}
+
+    def _pct(m: str) -> str:
+        pct = (deltas.get(m) or {}).get("pct")
+        return f" ({pct:+.1f}%)".replace(".", ",") if pct is not None else ""
+
+    def _moeda_delta(m: str) -> str:
+        v = (deltas.get(m) or {}).get("abs") or 0
+        return ("+" if v >= 0 else "-") + format_currency(abs(v))
+
+    d_pecas = (deltas.get("total_pecas") or {}).get("abs") or 0
+    d_vendas = (deltas.get("num_vendas") or {}).get("abs") or 0
+    d_margem = (deltas.get("margem") or {}).get("abs") or 0
+    return (
+        f"\n\n#### Comparação — {label} ({_periodo(comp)})\n\n"
+        f"**Faturamento:** {format_currency(comp.get('total_vendido', 0) or 0)} → "
+        f"{_moeda_delta('total_vendido')}{_pct('total_vendido')}  \n"
+        f"**Lucro:** {format_currency(comp.get('total_lucro', 0) or 0)} → "
+        f"{_moeda_delta('total_lucro')}{_pct('total_lucro')}  \n"
+        f"**Margem:** {_numero(comp.get('margem'), 1)}% → {'+' if d_margem >= 0 else '-'}{_numero(abs(d_margem), 1)} p.p.  \n"
+        f"**Peças vendidas:** {_numero(comp.get('total_pecas'))} → {d_pecas:+.0f}{_pct('total_pecas')}  \n"
+        f"**Número de vendas:** {comp.get('num_vendas', 0) or 0} → {d_vendas:+.0f}{_pct('num_vendas')}  \n"
+        f"**Ticket médio:** {format_currency(comp.get('ticket_medio', 0) or 0)} → "
+        f"{_moeda_delta('ticket_medio')}{_pct('ticket_medio')}"
+    )
+
+
+# --- Um template por tipo de consulta: (data, com_tabela) -> markdown ---
+
+def _resumo_periodo(data: Dict[str, Any], com_tabela: bool) -> str:
+    dia_unico = data.get("start_date") and data.get("start_date") == data.get("end_date")
+    titulo = "Faturamento do dia" if dia_unico else "Resumo do período"
+    return (
+        f"### {titulo} ({_periodo(data)})\n\n"
+        f"**Faturamento:** {format_currency(data.get('total_vendido', 0) or 0)}\n\n"
+        f"**Lucro:** {format_currency(data.get('total_lucro', 0) or 0)}  \n"
+        f"**Margem:** {_numero(data.get('margem'), 1)}%\n\n"
+        f"**Peças vendidas:** {_numero(data.get('total_pecas'))}  \n"
+        f"**Número de vendas:** {data.get('num_vendas', 0) or 0}  \n"
+        f"**Ticket médio:** {format_currency(data.get('ticket_medio', 0) or 0)}"
+        + _bloco_comparacao(data.get("comparacao"))
+    )
+
+
+def _produtos_mais_vendidos(data: Dict[str, Any], com_tabela: bool) -> str:
+    items = data.get("items") or []
+    titulo = f"**Produtos mais vendidos** ({_periodo(data)})"
+    if not items:
+        return titulo + "\n\nNenhuma venda no período."
+    comparado = any("quantidade_anterior" in i for i in items)
+    cabecalho = ["Produto", "Código", "Qtd.", "Receita", "Lucro"] + (["Qtd. comparação"] if comparado else [])
+    linhas = [
+        [i.get("nome", ""), i.get("codigo", ""), _numero(i.get("quantidade")), format_currency(i.get("receita", 0) or 0),
+         format_currency(i.get("lucro", 0) or 0)]
+        + ([_numero(i.get("quantidade_anterior"))] if comparado else [])
+        for i in items
+    ]
+    lider = items[0]
+    return (
+        f"{titulo}\n\n"
+        f"**{len(items)} produto{'s' if len(items) != 1 else ''}** somam {_numero(sum(i.get('quantidade', 0) or 0 for i in items))} un. e "
+        f"{format_currency(sum(i.get('receita', 0) or 0 for i in items))} de receita. "
+        f"Mais vendido: **{lider.get('nome', '')}** ({_numero(lider.get('quantidade'))} un.)."
+        + _tabela(cabecalho, linhas, com_tabela)
+    )
+
+
+def _produtos_juntos(data: Dict[str, Any], com_tabela: bool) -> str:
+    pares = data.get("pares") or []
+    titulo = f"**Produtos comprados juntos** (base: {_numero(data.get('total_cestas'))} vendas)"
+    if not pares:
+        return titulo + "\n\nAinda não há pares de produtos vendidos juntos com frequência."
+    linhas = [
+        [p.get("produto_a", ""), p.get("produto_b", ""), p.get("cestas", 0), _numero(p.get("lift"), 2),
+         f"{_numero(max(p.get('confianca_a_b', 0), p.get('confianca_b_a', 0)) * 100)}%"]
+        for p in pares
+    ]
+    p = pares[0]
+    return (
+        f"{titulo}\n\n"
+        f"Par mais forte: **{p.get('produto_a', '')}** + **{p.get('produto_b', '')}** "
+        f"({p.get('cestas', 0)} vendas juntos, lift {_numero(p.get('lift'), 2)})."
+        + _tabela(["Produto A", "Produto B", "Vendas juntos", "Lift", "Confiança"], linhas, com_tabela)
+        + "\n\n*Lift acima de 1 indica que os produtos saem juntos mais do que o acaso explicaria.*"
+    )
+
+
+def _curva_abc(data: Dict[str, Any], com_tabela: bool) -> str:
+    criterio = data.get("criterio", "receita")
+    rotulo = ABC_CRITERIOS.get(criterio, criterio).lower()
+    valor_fmt = (lambda v: f"{_numero(v)} un.") if criterio == "unidades" else format_currency
+    classes = [
+        f"- **Classe {c.get('classe')}:** {c.get('itens', 0)} produtos — {valor_fmt(c.get('valor', 0) or 0)} "
+        f"({_numero(c.get('participacao'), 1)}%)"
+        for c in data.get("classes", [])
+    ]
+    itens_a = [
+        [i.get("nome", ""), i.get("codigo", ""), f"{_numero(i.get('participacao_pct'), 1)}%"]
+        for i in data.get("itens_a", [])
+    ]
+    parados = [
+        f"- {p.get('nome', '')} (cód. {p.get('codigo', '')}): {_numero(p.get('estoque_atual'))} un. paradas, "
+        f"{format_currency(p.get('valor_parado', 0) or 0)} a custo"
+        for p in data.get("estoque_parado", [])[:10]
+    ]
+    return (
+        f"**Curva ABC por {rotulo}** ({_periodo(data)})\n\n"
+        + "\n".join(classes)
+        + ("\n\n**Principais itens A:**" + _tabela(["Produto", "Código", f"% da {rotulo}"], itens_a, com_tabela)
+           if itens_a else "\n\nNenhuma venda no período.")
+        + f"\n\n**Estoque parado** (sem venda há {data.get('dias_sem_venda', ABC_DIAS_SEM_VENDA)} dias): "
+        + f"{data.get('estoque_parado_total_itens', 0)} produtos, "
+        + f"{format_currency(data.get('estoque_parado_valor_custo', 0) or 0)} a custo"
+        + ("\n" + "\n".join(parados) if parados else "")
+    )
+
+
+def _valor_estoque(data: Dict[str, Any], com_tabela: bool) -> str:
+    custo = data.get("valor_estoque_custo", 0) or 0
+    venda = data.get("valor_estoque_venda", 0) or 0
+    return (
+        "**Valor do estoque (atual)**\n\n"
+        f"- **Estoque a custo:** {format_currency(custo)}\n"
+        f"- **Estoque a venda:** {format_currency(venda)}\n"
+        f"- **Margem potencial:** {format_currency(venda - custo)}"
+    )
+
+
+def _entradas_estoque(data: Dict[str, Any], com_tabela: bool) -> str:
+    entradas = data.get("entradas") or []
+    titulo = f"**Entradas de estoque** ({_periodo(data)})"
+    if not entradas:
+        return titulo + "\n\nNenhuma entrada no período."
+    linhas = [
+        [_data_br(e.get("data_entrada")), e.get("codigo", ""), e.get("nome", ""), _numero(e.get("quantidade")),
+         e.get("observacao", "")]
+        for e in entradas
+    ]
+    return (
+        f"{titulo}\n\n"
+        f"**{len(entradas)} entradas**, {_numero(data.get('total_unidades'))} unidades no total."
+        + _tabela(["Data", "Código", "Produto", "Qtd.", "Observação"], linhas, com_tabela)
+    )
+
+
+def _sessoes_caixa(data: Dict[str, Any], com_tabela: bool) -> str:
+    sessoes = data.get("sessoes") or []
+    titulo = f"**Sessões de caixa** ({_periodo(data)})"
+    if not sessoes:
+        return titulo + "\n\nNenhuma sessão no período."
+    linhas = [
+        [s.get("id"), s.get("data_abertura", ""), s.get("data_fechamento", ""), format_currency(s.get("valor_abertura", 0) or 0),
+         format_currency(s.get("total_vendas_sessao", 0) or 0), s.get("status", "")]
+        for s in sessoes
+    ]
+    abertas = sum(1 for s in sessoes if s.get("status") == "aberta")
+    return (
+        f"{titulo}\n\n"
+        f"**{len(sessoes)} sessões** ({abertas} aberta{'s' if abertas != 1 else ''}), "
+        f"{format_currency(sum(s.get('total_vendas_sessao', 0) or 0 for s in sessoes))} em vendas."
+        + _tabela(["Sessão", "Abertura", "Fechamento", "Valor abertura", "Total vendas", "Status"], linhas, com_tabela)
+    )
+
+
+def _contas(titulo: str, coluna_nome: str, chave_nome: str, chave_baixa: str, rotulo_baixa: str):
+    """Template de contas a pagar / a receber (mesmo layout, nomes de campos diferentes)."""
+
+    def _render(data: Dict[str, Any], com_tabela: bool) -> str:
+        contas = data.get("contas") or []
+        cabecalho = f"**{titulo}** ({_periodo(data)})"
+        if not contas:
+            return cabecalho + "\n\nNenhuma conta no período."
+        atrasadas = [c for c in contas if c.get("status") == "atrasada"]
+        linhas = [
+            [c.get(chave_nome, ""), _data_br(c.get("data_vencimento")), format_currency(c.get("valor", 0) or 0), c.get("status", "")]
+            for c in contas
+        ]
+        return (
+            f"{cabecalho}\n\n"
+            f"**Em aberto:** {format_currency(data.get('total_abertas', 0) or 0)} | "
+            f"**{rotulo_baixa}:** {format_currency(data.get(chave_baixa, 0) or 0)} | "
+            f"**{len(contas)} conta{'s' if len(contas) != 1 else ''}**"
+            + (f", {len(atrasadas)} atrasada{'s' if len(atrasadas) != 1 else ''} "
+               f"({format_currency(sum(c.get('valor', 0) or 0 for c in atrasadas))})" if atrasadas else "")
+            + _tabela([coluna_nome, "Vencimento", "Valor", "Status"], linhas, com_tabela)
+        )
+
+    return _render
+
+
+def _agenda(data: Dict[str, Any], com_tabela: bool) -> str:
+    compromissos = data.get("compromissos") or []
+    if not compromissos:
+        return (
+            "**Sua agenda**\n\n"
+            "Você não tem nenhum compromisso agendado no período. "
+            "Para cadastrar, use a página **Agenda** ou peça: *\"Agendar reunião amanhã às 14h\"*."
+        )
+    linhas = [[c.get("data", ""), c.get("hora", ""), c.get("titulo", ""), c.get("descricao", "")] for c in compromissos]
+    proximo = compromissos[0]
+    return (
+        f"**Sua agenda** ({_periodo(data)})\n\n"
+        f"**{len(compromissos)} compromisso{'s' if len(compromissos) != 1 else ''}**. Próximo: "
+        f"**{proximo.get('titulo', '')}** em {proximo.get('data', '')}"
+        + (f" às {proximo.get('hora')}" if proximo.get("hora") else "") + "."
+        + _tabela(["Data", "Hora", "Título", "Descrição"], linhas, com_tabela)
+    )
+
+
+def _analise_avancada(data: Dict[str, Any], com_tabela: bool) -> str:
+    per = data.get("periodo_consulta", {})
+    hist = data.get("historico_mensal", [])
+    prev_info = data.get("previsao") or {}
+    noticias = data.get("noticias_recentes", [])
+    lines_hist = [
+        f"- {h.get('mes_ano', '')}: {format_currency(h.get('total_vendido', 0) or 0)} ({h.get('num_vendas', 0)} vendas)"
+        for h in hist[-6:]
+    ]
+    lines_prev = [
+        f"- {p.get('mes_ano', '')}: {format_currency(p.get('previsto', 0))} "
+        f"(80%: {format_currency(p['intervalo_80'][0])} a {format_currency(p['intervalo_80'][1])})"
+        for p in prev_info.get("previsoes", [])
+    ]
+    backtest = prev_info.get("backtest") or []
+    erro_txt = ""
+    if backtest:
+        melhor = backtest[0]
+        mape = f", erro médio {_numero(melhor['mape'], 1)}%" if melhor.get("mape") is not None else ""
+        erro_txt = f" — backtest em {melhor['pontos']} meses: erro absoluto médio {format_currency(melhor['mae'])}{mape}"
+    perfil = ", ".join(f"{d.get('dia')} {_numero(d.get('indice', 1), 2)}" for d in data.get("sazonalidade_por_dia_semana", []))
+    lines_news = [f"- {n.get('title', '')}" for n in noticias[:3]]
+    return (
+        f"**Análise avançada** ({_data_br(per.get('start', ''))} a {_data_br(per.get('end', ''))})\n\n"
+        f"**Tendência (últimos 12 meses):** {'+' if (data.get('tendencia_variacao_pct') or 0) >= 0 else ''}"
+        f"{_numero(data.get('tendencia_variacao_pct'), 1)}%\n\n"
+        f"**Previsão de faturamento** ({prev_info.get('modelo', 'média recente')}{erro_txt}):\n"
+        + "\n".join(lines_prev or [f"- Próximo mês: {format_currency(data.get('previsao_proximo_mes', 0) or 0)}"]) + "\n\n"
+        + "**Histórico mensal (últimos meses):**\n" + "\n".join(lines_hist or ["Sem dados."]) + "\n\n"
+        + (f"**Perfil por dia da semana (1,00 = dia médio):** {perfil}\n\n" if perfil else "")
+        + f"**Sazonalidade do mercado (período):** {data.get('sazonalidade_mercado_periodo', '')}\n\n"
+        + ("**Notícias recentes (economia):**\n" + "\n".join(lines_news) + "\n" if lines_news else "")
+    )
+
+
+def _sql_result(data: Dict[str, Any], com_tabela: bool) -> str:
+    rows = data.get("rows") or []
+    n = len(rows)
+    texto = f"**Resultado da consulta** ({n} linha{'s' if n != 1 else ''})."
+    if not com_tabela:
+        texto += " Os dados são exibidos na tabela abaixo."
+    if data.get("truncado"):
+        texto += (
+            f" A leitura parou no limite de {'linhas' if data.get('motivo_corte') == 'linhas' else 'tamanho'} "
+            "do chat; use **Baixar resultado completo** para ver todas as linhas."
+        )
+    return texto + _tabela(data.get("columns") or [], rows, com_tabela)
+
+
+def _metricas(data: Dict[str, Any], com_tabela: bool) -> str:
+    """Pergunta composta: um bloco por métrica, na ordem pedida."""
+    partes = []
+    for r in data.get("resultados") or []:
+        if r.get("type") == "error":
+            partes.append(f"**Erro:** {r.get('error', 'Erro desconhecido')}")
+        else:
+            partes.append(renderizar(r, com_tabela))
+    return "\n\n---\n\n".join(partes)
+
+
+TEMPLATES: Dict[str, Callable[[Dict[str, Any], bool], str]] = {
+    "resumo_periodo": _resumo_periodo,
+    "produtos_mais_vendidos": _produtos_mais_vendidos,
+    "produtos_juntos": _produtos_juntos,
+    "curva_abc": _curva_abc,
+    "valor_estoque": _valor_estoque,
+    "entradas_estoque": _entradas_estoque,
+    "sessoes_caixa": _sessoes_caixa,
+    "contas_pagar": _contas("Contas a pagar", "Fornecedor", "fornecedor", "total_pagas", "Pagas"),
+    "contas_receber": _contas("Contas a receber (fiado)", "Cliente", "cliente", "total_recebidas", "Recebidas"),
+    "agenda": _agenda,
+    "analise_avancada": _analise_avancada,
+    "sql_result": _sql_result,
+    "metricas": _metricas,
+}
+
+
+def renderizar(query_result: Dict[str, Any], com_tabela: bool = True) -> str:
+    """
+    Resposta em markdown pelo template do tipo (query_result["type"]). com_tabela=False omite as tabelas
+    markdown quando quem exibe já mostra a tabela completa (chat da página Início).
+    """
+    query_type = query_result.get("type", "")
+    if query_type == "error":
+        return f"**Erro:** {query_result.get('error', 'Erro desconhecido')}"
+    template = TEMPLATES.get(query_type)
+    if template is None:
+        return f"**Resultado:** {query_type}\n\nDados disponíveis."
+    return template(query_result.get("data") or {}, com_tabela)
+
+
+def agregados(query_result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    O que a narração da IA recebe: totais do resultado e no máximo AGREGADOS_MAX_ITENS itens por lista
+    (as demais linhas viram total/omitidos/somas). Na pergunta composta, os agregados de cada métrica.
+    """
+    data = query_result.get("data") or {}
+    if query_result.get("type") == "metricas":
+        return {r.get("type", ""): agregados(r) for r in data.get("resultados") or []}
+    if query_result.get("type") == "sql_result":
+        rows: List[Any] = data.get("rows") or []
+        return {"colunas": data.get("columns"), "linhas": len(rows), "primeiras": rows[:AGREGADOS_MAX_ITENS]}
+    return token_budget.compactar(data, AGREGADOS_MAX_ITENS)
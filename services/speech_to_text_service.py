@@ -7,6 +7,7 @@ from typing import Optional, Tuple
 from sqlalchemy.orm import Session
 
 from config.ai_config import AIConfigManager
+from services.ai_providers import obter_adaptador
 
 
 # Formatos aceitos pelo Whisper
@@ -43,12 +44,11 @@ def transcribe_audio(
     if ext not in WHISPER_ACCEPT:
         return None, f"Formato de áudio não suportado. Use: {', '.join(WHISPER_ACCEPT)}."
 
-    try:
-        from openai import OpenAI
-    except ImportError:
-        return None, "Biblioteca 'openai' não instalada. Execute: pip install openai"
-
-    client = OpenAI(api_key=api_key)
+    # Mesmo cliente (e pool de conexões) usado pelo AIService quando o provedor é OpenAI
+    adaptador, err = obter_adaptador("openai", api_key)
+    if err:
+        return None, err
+    client = adaptador.client
     try:
         import io
         file_like = io.BytesIO(audio_bytes)
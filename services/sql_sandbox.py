@@ -0,0 +1,237 @@
+"""
+Sandbox do modo SQL do Agente de Relatórios (consultas escritas pela IA).
+1. Validação com parser SQL de verdade (sqlglot): uma única consulta (SELECT/UNION, com CTEs e subconsultas),
+   sem escrita, sem SELECT ... INTO / FOR UPDATE, sem funções perigosas e só com tabelas da lista permitida
+   (nomes de CTE não contam como tabela).
+2. Execução numa conexão própria, em transação somente leitura, com tempo máximo por consulta
+   (PostgreSQL: SET TRANSACTION READ ONLY + statement_timeout; SQLite: query_only + interrupção por prazo).
+3. No PostgreSQL, o custo estimado pelo EXPLAIN acima de MAX_CUSTO rejeita a consulta antes de rodar.
+4. Leitura em lotes (fetchmany) até o orçamento de linhas e de bytes, com indicação de corte; exportar_csv
+   devolve o resultado completo (com limite maior) para download.
+"""
+import csv
+import io
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+MAX_LINHAS = 500
+MAX_BYTES = 256 * 1024
+LOTE = 200
+PRAZO_MS = int(os.getenv("SQL_TIMEOUT_MS", "5000"))
+MAX_CUSTO = float(os.getenv("SQL_MAX_CUSTO", "500000"))  # unidades de custo do planner do PostgreSQL
+EXPORT_MAX_LINHAS = 100_000
+
+FUNCOES_PROIBIDAS = frozenset({
+    "pg_sleep", "pg_read_file", "pg_read_binary_file", "pg_ls_dir", "pg_stat_file", "lo_import", "lo_export",
+    "dblink", "dblink_exec", "pg_terminate_backend", "pg_cancel_backend", "set_config", "pg_reload_conf",
+    "current_setting", "load_extension", "randomblob", "zeroblob", "sleep", "benchmark",
+})
+
+
+def _dialeto(db: Session) -> str:
+    return "postgres" if db.get_bind().dialect.name.startswith("postgres") else "sqlite"
+
+
+def validar(sql: str, permitidas: Sequence[str], dialeto: str = "postgres") -> Tuple[Optional[str], Optional[str]]:
+    """
+    Confere a consulta com o parser (sqlglot). Retorna (sql, error): o texto sem ";" final quando válido,
+    ou None e a mensagem para o usuário.
+    """
+    try:
+        import sqlglot
+        from sqlglot import exp
+        from sqlglot.errors import ParseError
+    except ImportError:
+        return None, "Modo SQL indisponível: biblioteca 'sqlglot' não instalada. Execute: pip install sqlglot"
+    sql = (sql or "").strip().rstrip(";").strip()
+    if not sql:
+        return None, "Consulta SQL não fornecida."
+    try:
+        arvores = [a for a in sqlglot.parse(sql, read=dialeto) if a is not None]
+    except ParseError as e:
+        return None, f"Consulta SQL inválida: {str(e).splitlines()[0]}"
+    if len(arvores) != 1:
+        return None, "Use apenas uma instrução SELECT (sem ponto e vírgula)."
+    arvore = arvores[0]
+    if not isinstance(arvore, (exp.Select, exp.Union, exp.Intersect, exp.Except)):
+        return None, "Apenas consultas SELECT são permitidas."
+    proibidos = (exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter, exp.Command, exp.Into, exp.Lock)
+    if any(True for _ in arvore.find_all(*proibidos)):
+        return None, "A consulta só pode ler dados (sem INSERT/UPDATE/DELETE, SELECT INTO ou FOR UPDATE)."
+    for f in arvore.find_all(exp.Func):
+        nome = (f.name if isinstance(f, exp.Anonymous) else f.sql_name()).lower()
+        if nome in FUNCOES_PROIBIDAS:
+            return None, f"Função não permitida: {nome}."
+    ctes = {c.alias_or_name.lower() for c in arvore.find_all(exp.CTE)}
+    permitidas = {t.lower() for t in permitidas}
+    invalidas = []
+    for t in arvore.find_all(exp.Table):
+        nome = t.name.lower()
+        if not nome:
+            return None, "Funções que geram tabelas não são permitidas em FROM."
+        if t.db and t.db.lower() not in ("public", "main"):
+            invalidas.append(f"{t.db}.{nome}")
+        elif nome not in permitidas and not (nome in ctes and not t.db):
+            invalidas.append(nome)
+    if invalidas:
+        return None, f"Tabela(s) não permitida(s): {', '.join(sorted(set(invalidas)))}."
+    return sql, None
+
+
+def _custo_explain(conn, sql: str) -> Optional[float]:
+    """Custo total estimado pelo planner do PostgreSQL (None se o EXPLAIN não trouxer o valor)."""
+    plano = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + sql).scalar()
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+    try:
+        return float(plano[0]["Plan"]["Total Cost"])
+    except (TypeError, KeyError, IndexError, ValueError):
+        return None
+
+
+def _serializar(val: Any) -> Any:
+    """date/datetime -> ISO; Decimal -> float; demais valores como vieram."""
+    if val is None:
+        return None
+    if hasattr(val, "isoformat"):
+        return val.isoformat()
+    if hasattr(val, "as_tuple"):
+        return float(val)
+    return val
+
+
+class _Execucao:
+    """Conexão própria, somente leitura e com prazo, para uma consulta do sandbox (use com `with`)."""
+
+    def __init__(self, db: Session, sql: str, prazo_ms: int):
+        self.bind = db.get_bind()
+        self.sql = sql
+        self.prazo_ms = prazo_ms
+        self.dialeto = _dialeto(db)
+
+    def __enter__(self):
+        self.conn = self.bind.connect()
+        self.trans = self.conn.begin()
+        if self.dialeto == "postgres":
+            self.conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+            self.conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(self.prazo_ms)}")
+        else:
+            raw = self.conn.connection.driver_connection
+            self.conn.exec_driver_sql("PRAGMA query_only = ON")
+            fim = time.monotonic() + self.prazo_ms / 1000
+            # Devolver valor verdadeiro interrompe a consulta (sqlite3.OperationalError: interrupted)
+            raw.set_progress_handler(lambda: time.monotonic() > fim, 10_000)
+        return self
+
+    def custo(self) -> Optional[float]:
+        return _custo_explain(self.conn, self.sql) if self.dialeto == "postgres" else None
+
+    def linhas(self) -> Tuple[List[str], Iterator[Sequence[Any]]]:
+        result = self.conn.execution_options(stream_results=True).execute(text(self.sql))
+
+        def _lotes():
+            while True:
+                lote = result.fetchmany(LOTE)
+                if not lote:
+                    return
+                yield from lote
+
+        return list(result.keys()), _lotes()
+
+    def __exit__(self, *exc):
+        try:
+            self.trans.rollback()
+            if self.dialeto != "postgres":
+                self.conn.exec_driver_sql("PRAGMA query_only = OFF")
+                self.conn.connection.driver_connection.set_progress_handler(None, 0)
+        finally:
+            self.conn.close()
+        return False
+
+
+def _mensagem_erro(e: Exception, prazo_ms: int) -> str:
+    texto = (str(getattr(e, "orig", None) or e).splitlines() or [type(e).__name__])[0]
+    if "interrupted" in texto or "statement timeout" in texto or "canceling statement" in texto:
+        return f"A consulta passou do tempo máximo ({prazo_ms / 1000:.0f}s). Tente filtrar por período ou agregar os dados."
+    if "readonly" in texto or "read-only" in texto:
+        return "A consulta tentou alterar dados; apenas leitura é permitida."
+    return f"Erro ao executar consulta: {texto}"
+
+
+def executar(
+    db: Session,
+    sql: str,
+    permitidas: Sequence[str],
+    max_linhas: int = MAX_LINHAS,
+    max_bytes: int = MAX_BYTES,
+    prazo_ms: int = PRAZO_MS,
+) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Valida e executa a consulta no sandbox. Retorna (dados, error); dados = {"columns", "rows", "truncado",
+    "motivo_corte" ("linhas"|"bytes"|None), "sql"}. As linhas são lidas em lotes e a leitura para no orçamento.
+    """
+    sql, err = validar(sql, permitidas, _dialeto(db))
+    if err:
+        return None, err
+    try:
+        with _Execucao(db, sql, prazo_ms) as ex:
+            custo = ex.custo()
+            if custo is not None and custo > MAX_CUSTO:
+                return None, (
+                    f"Consulta pesada demais (custo estimado {custo:,.0f}; limite {MAX_CUSTO:,.0f}). "
+                    "Filtre por período ou agregue os dados."
+                ).replace(",", ".")
+            columns, linhas = ex.linhas()
+            rows: List[List[Any]] = []
+            usados = 0
+            motivo = None
+            for row in linhas:
+                if len(rows) >= max_linhas:
+                    motivo = "linhas"
+                    break
+                linha = [_serializar(c) for c in row]
+                usados += len(json.dumps(linha, default=str, ensure_ascii=False))
+                if usados > max_bytes and rows:
+                    motivo = "bytes"
+                    break
+                rows.append(linha)
+    except Exception as e:
+        return None, _mensagem_erro(e, prazo_ms)
+    return {"columns": columns, "rows": rows, "truncado": motivo is not None, "motivo_corte": motivo, "sql": sql}, None
+
+
+def exportar_csv(
+    db: Session,
+    sql: str,
+    permitidas: Sequence[str],
+    max_linhas: int = EXPORT_MAX_LINHAS,
+    prazo_ms: int = PRAZO_MS * 3,
+) -> Tuple[Optional[bytes], Optional[str]]:
+    """
+    Resultado completo (até max_linhas) em CSV (UTF-8 com BOM, separador ";", para abrir no Excel),
+    com as mesmas regras do sandbox e prazo maior. Retorna (bytes, error).
+    """
+    sql, err = validar(sql, permitidas, _dialeto(db))
+    if err:
+        return None, err
+    saida = io.StringIO()
+    escritor = csv.writer(saida, delimiter=";")
+    try:
+        with _Execucao(db, sql, prazo_ms) as ex:
+            custo = ex.custo()
+            if custo is not None and custo > MAX_CUSTO:
+                return None, "Consulta pesada demais para exportar. Filtre por período ou agregue os dados."
+            columns, linhas = ex.linhas()
+            escritor.writerow(columns)
+            for i, row in enumerate(linhas):
+                if i >= max_linhas:
+                    break
+                escritor.writerow([_serializar(c) for c in row])
+    except Exception as e:
+        return None, _mensagem_erro(e, prazo_ms)
+    return ("\ufeff" + saida.getvalue()).encode("utf-8"), None
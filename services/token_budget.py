@@ -0,0 +1,198 @@
+"""
+Orçamento de tokens dos prompts: estimativa de tokens por trecho, compactação dos dados enviados à IA
+(listas longas viram os primeiros N itens + totais agregados, JSON sem espaços, decimais arredondados),
+histórico da conversa limitado por orçamento e registro dos tokens de cada chamada para o Admin.
+A estimativa é heurística (~4 caracteres por token em português/JSON): serve para orçar e comparar,
+não para cobrança; nenhum tokenizador de provedor é exigido.
+"""
+import json
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+CARACTERES_POR_TOKEN = 4
+# Orçamentos padrão (tokens estimados) dos trechos variáveis dos prompts
+ORCAMENTO_HISTORICO = 800
+ORCAMENTO_DADOS = 2500
+ORCAMENTO_ANALISE_INICIAL = 3000
+ORCAMENTO_LOTE = 1200  # textos do usuário num único pedido em lote (detect_many / extract_many)
+MAX_ITENS_LOTE = 20
+# Tamanhos de lista tentados, do mais completo ao mais enxuto, até caber no orçamento
+NIVEIS_ITENS = (20, 12, 8, 5, 3)
+CASAS_DECIMAIS = 2
+MAX_CHAMADAS = 200
+
+
+def estimar_tokens(texto: Optional[str]) -> int:
+    """Tokens estimados de um texto (arredonda para cima)."""
+    if not texto:
+        return 0
+    return (len(texto) + CARACTERES_POR_TOKEN - 1) // CARACTERES_POR_TOKEN
+
+
+def json_compacto(obj: Any) -> str:
+    """JSON sem espaços entre separadores e sem escapar acentos (cada caractere escapado custa tokens)."""
+    return json.dumps(obj, default=str, ensure_ascii=False, separators=(",", ":"))
+
+
+def _somas(itens: Sequence[Any]) -> Dict[str, float]:
+    """Soma dos campos numéricos comuns aos itens (dicts) de uma lista."""
+    somas: Dict[str, float] = {}
+    for item in itens:
+        if not isinstance(item, dict):
+            return {}
+        for k, v in item.items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                somas[k] = somas.get(k, 0) + v
+    return {f"soma_{k}": round(v, CASAS_DECIMAIS) for k, v in somas.items()}
+
+
+def resumo_lista(itens: Sequence[Any], max_itens: int) -> Dict[str, Any]:
+    """Agregados de uma lista cortada em max_itens: total de itens, omitidos e somas dos campos numéricos."""
+    return {"total_itens": len(itens), "omitidos": max(0, len(itens) - max_itens), **_somas(itens)}
+
+
+def compactar(obj: Any, max_itens: int = NIVEIS_ITENS[0]) -> Any:
+    """
+    Cópia enxuta de um payload: listas com mais de max_itens ficam com os primeiros max_itens e, ao lado,
+    a chave "<nome>_resumo" com total, omitidos e somas (numa lista solta, {"itens": [...], "resumo": {...}});
+    floats arredondados e campos None/"" removidos. As listas já vêm ordenadas por relevância (vencimento,
+    valor, data), então os primeiros itens são os que importam.
+    """
+    if isinstance(obj, dict):
+        saida: Dict[str, Any] = {}
+        for k, v in obj.items():
+            if v is None or v == "":
+                continue
+            if isinstance(v, (list, tuple)) and len(v) > max_itens:
+                saida[k] = [compactar(x, max_itens) for x in v[:max_itens]]
+                saida[f"{k}_resumo"] = resumo_lista(v, max_itens)
+            else:
+                saida[k] = compactar(v, max_itens)
+        return saida
+    if isinstance(obj, (list, tuple)):
+        if len(obj) > max_itens:
+            return {"itens": [compactar(x, max_itens) for x in obj[:max_itens]], "resumo": resumo_lista(obj, max_itens)}
+        return [compactar(x, max_itens) for x in obj]
+    if isinstance(obj, float):
+        return round(obj, CASAS_DECIMAIS)
+    return obj
+
+
+def ajustar_ao_orcamento(obj: Any, orcamento: int = ORCAMENTO_DADOS) -> Tuple[str, int]:
+    """
+    JSON compacto do payload que caiba no orçamento de tokens, reduzindo o tamanho das listas nível a nível
+    (NIVEIS_ITENS). Se nem o nível mais enxuto couber, devolve esse mesmo (os agregados continuam inteiros).
+    Retorna (json, tokens_estimados).
+    """
+    texto = ""
+    for n in NIVEIS_ITENS:
+        texto = json_compacto(compactar(obj, n))
+        tokens = estimar_tokens(texto)
+        if tokens <= orcamento:
+            return texto, tokens
+    return texto, estimar_tokens(texto)
+
+
+def lotes(
+    textos: Sequence[str], orcamento: int = ORCAMENTO_LOTE, max_itens: int = MAX_ITENS_LOTE
+) -> List[List[int]]:
+    """
+    Divide os textos (na ordem) em lotes de índices que caibam no orçamento de tokens e em max_itens por lote.
+    Um texto sozinho acima do orçamento forma um lote próprio (a chamada individual trata o tamanho).
+    """
+    saida: List[List[int]] = []
+    atual: List[int] = []
+    usado = 0
+    for i, texto in enumerate(textos):
+        custo = estimar_tokens(texto) + 4  # numeração e separadores do item no prompt
+        if atual and (usado + custo > orcamento or len(atual) >= max_itens):
+            saida.append(atual)
+            atual, usado = [], 0
+        atual.append(i)
+        usado += custo
+    if atual:
+        saida.append(atual)
+    return saida
+
+
+def linhas_historico(
+    conversation_history: Optional[List[Dict[str, Any]]],
+    max_mensagens: int = 20,
+    orcamento: int = ORCAMENTO_HISTORICO,
+    max_caracteres: int = 500,
+) -> List[str]:
+    """
+    Linhas "Usuário: ..." / "Assistente: ..." das últimas mensagens, da mais recente para trás, até esgotar o
+    orçamento de tokens. Respostas do assistente (relatórios longos) são cortadas na metade de max_caracteres;
+    as do usuário, em max_caracteres. Retorna as linhas em ordem cronológica.
+    """
+    if not conversation_history:
+        return []
+    linhas: List[str] = []
+    usado = 0
+    for m in reversed(conversation_history[-max_mensagens:]):
+        content = (m.get("content") or "").strip()
+        if not content:
+            continue
+        usuario = (m.get("role") or "user").strip().lower() == "user"
+        limite = max_caracteres if usuario else max_caracteres // 2
+        linha = f"{'Usuário' if usuario else 'Assistente'}: {content[:limite]}{'...' if len(content) > limite else ''}"
+        custo = estimar_tokens(linha)
+        if linhas and usado + custo > orcamento:
+            break
+        linhas.append(linha)
+        usado += custo
+    return linhas[::-1]
+
+
+# --- Registro de tokens por chamada ---
+_lock = threading.Lock()
+_chamadas: Deque[Dict[str, Any]] = deque(maxlen=MAX_CHAMADAS)
+_totais: Dict[str, Dict[str, int]] = {}
+
+
+def registrar_chamada(ponto: Optional[str], provedor: str, tokens_prompt: int, tokens_resposta: int) -> None:
+    """Guarda os tokens estimados de uma chamada à IA (prompt e resposta) por ponto de chamada."""
+    ponto = ponto or "sem_ponto"
+    with _lock:
+        _chamadas.append({
+            "quando": datetime.now().strftime("%d/%m %H:%M:%S"),
+            "ponto": ponto,
+            "provedor": provedor,
+            "tokens_prompt": tokens_prompt,
+            "tokens_resposta": tokens_resposta,
+        })
+        t = _totais.setdefault(ponto, {"chamadas": 0, "tokens_prompt": 0, "tokens_resposta": 0, "maior_prompt": 0})
+        t["chamadas"] += 1
+        t["tokens_prompt"] += tokens_prompt
+        t["tokens_resposta"] += tokens_resposta
+        t["maior_prompt"] = max(t["maior_prompt"], tokens_prompt)
+
+
+def estatisticas() -> List[Dict[str, Any]]:
+    """Por ponto de chamada: chamadas, média de tokens do prompt e da resposta e maior prompt."""
+    with _lock:
+        return [
+            {
+                "ponto": p,
+                "chamadas": t["chamadas"],
+                "media_prompt": t["tokens_prompt"] // t["chamadas"],
+                "media_resposta": t["tokens_resposta"] // t["chamadas"],
+                "maior_prompt": t["maior_prompt"],
+            }
+            for p, t in sorted(_totais.items())
+        ]
+
+
+def chamadas_recentes(limite: int = 50) -> List[Dict[str, Any]]:
+    """Últimas chamadas registradas, da mais recente para a mais antiga."""
+    with _lock:
+        return list(_chamadas)[::-1][:limite]
+
+
+def limpar() -> None:
+    with _lock:
+        _chamadas.clear()
+        _totais.clear()
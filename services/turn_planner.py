@@ -0,0 +1,77 @@
+"""
+Planejador de turno: uma única chamada à IA por mensagem do chat (Início) devolve intenção, entidade, campos
+extraídos, período e SQL opcional (mcp.schemas.TurnPlan), no lugar da sequência detect → parse/analyze → format.
+A resposta é validada contra o schema e as listas do detector; se não validar, o chat segue o fluxo anterior.
+Consultas são formatadas por template (services.report_templates); a IA só comenta quando o usuário pede análise.
+"""
+import json
+import os
+import re
+from typing import Any, Dict, Optional, Tuple
+
+from pydantic import ValidationError
+
+from mcp.detector import VALID_ACTIONS, VALID_ENTITIES
+from mcp.schemas import DetectResponse, TurnPlan
+
+# AI_TURN_PLANNER=false volta ao fluxo detect → parse/analyze → format
+ATIVO = os.getenv("AI_TURN_PLANNER", "true").lower() == "true"
+CONFIANCA_MINIMA = 0.5
+INTENCOES = frozenset({"consulta", "lancamento", "esclarecer_periodo", "resposta_direta"})
+# Tipos cuja resposta só faz sentido como texto analítico da IA
+TIPOS_NARRATIVOS = frozenset({"analise_avancada"})
+
+_RE_CERCA = re.compile(r"^```(?:json)?\s*|```\s*$", re.MULTILINE)
+
+
+def validar_plano(texto: str) -> Tuple[Optional[TurnPlan], Optional[str]]:
+    """
+    Converte a resposta da IA em TurnPlan e confere a coerência (intenção, ação e entidade válidas;
+    lançamento com os campos da conta ou do compromisso). Retorna (plano, error).
+    """
+    try:
+        data = json.loads(_RE_CERCA.sub("", (texto or "").strip()))
+        plano = TurnPlan.model_validate(data)
+    except (json.JSONDecodeError, ValidationError, TypeError) as e:
+        return None, f"Plano inválido: {e}"
+    plano.intent = plano.intent.strip().lower()
+    plano.action = plano.action.strip().upper()
+    plano.entity = plano.entity.strip().lower()
+    plano.data_type = (plano.data_type or "").strip().lower() or None
+    plano.confidence = max(0.0, min(1.0, float(plano.confidence)))
+    if plano.intent not in INTENCOES or plano.action not in VALID_ACTIONS or plano.entity not in VALID_ENTITIES:
+        return None, f"Plano fora do esperado: {plano.intent}/{plano.action}/{plano.entity}"
+    if plano.confidence < CONFIANCA_MINIMA:
+        return None, "Plano com confiança baixa"
+    if plano.intent == "lancamento":
+        if plano.action != "INSERT":
+            return None, "Lançamento sem ação INSERT"
+        if plano.entity in ("contas_pagar", "contas_receber") and not isinstance(plano.conta, dict):
+            return None, "Lançamento de conta sem os campos da conta"
+        if plano.entity == "agenda" and not isinstance(plano.compromisso, dict):
+            return None, "Lançamento na agenda sem os campos do compromisso"
+        if plano.entity == "relatorio":
+            return None, "Lançamento sem entidade"
+    if plano.intent in ("esclarecer_periodo", "resposta_direta") and not (plano.mensagem or "").strip():
+        return None, "Plano sem a mensagem ao usuário"
+    return plano, None
+
+
+def deteccao(plano: TurnPlan) -> DetectResponse:
+    """Intenção do plano no formato do MCPDetector (para o roteamento do chat)."""
+    return DetectResponse(action=plano.action, entity=plano.entity, confidence=plano.confidence, extracted_info=None)
+
+
+def campos_conta(plano: TurnPlan) -> Dict[str, Any]:
+    """Campos da conta no formato do JSON do agente de contas; o tipo vem da entidade quando a IA não informou."""
+    conta = dict(plano.conta or {})
+    conta.setdefault("intent", "cadastrar")
+    if not conta.get("tipo"):
+        conta["tipo"] = "pagar" if plano.entity == "contas_pagar" else "receber"
+    return conta
+
+
+def precisa_narrativa(plano: TurnPlan, query_analysis: Dict[str, Any]) -> bool:
+    """True quando a resposta deve ser redigida pela IA (pedido de análise/explicação ou tipo narrativo)."""
+    tipos = {query_analysis.get("data_type"), *(query_analysis.get("metricas") or ())}
+    return bool(plano.narrativa) or not TIPOS_NARRATIVOS.isdisjoint(tipos)
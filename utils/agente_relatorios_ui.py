@@ -3,6 +3,9 @@ UI do Agente de Relatórios: conversa em linguagem natural, análise do dia, his
 Usado na página Início (app.py) para administradores.
 Permite também lançamentos (cadastro de contas a pagar/receber e agenda) via chat.
 """
+import time
+from typing import Any, Dict, Optional
+
 import pandas as pd
 import streamlit as st
 
@@ -11,10 +14,147 @@ from services.accounts_agent_service import AccountsAgentService
 from services.agenda_agent_service import AgendaAgentService
 from services.auth_service import AuthService
 from services.chat_memory import SCOPE_REPORT_AGENT, add_message, clear, get_messages
-from services.report_agent_service import ReportAgentService
+from services.report_agent_service import ALLOWED_SQL_TABLES, ReportAgentService
+from services.report_router import Cronometro, registrar_rota
+from services import daily_analysis_service, report_templates, sql_sandbox, turn_planner
 from services.speech_to_text_service import transcribe_audio
 from utils.formatters import format_currency
-from mcp import MCPDetector
+from mcp import Pipeline
+from mcp.detector import dividir_comandos
+
+# Nome de cada métrica na tabela da pergunta composta
+ROTULOS_METRICA = {
+    "produtos_mais_vendidos": "Mais vendidos",
+    "curva_abc": "Curva ABC",
+    "produtos_juntos": "Comprados juntos",
+    "entradas_estoque": "Entradas de estoque",
+    "sessoes_caixa": "Sessões de caixa",
+    "contas_pagar": "Contas a pagar",
+    "contas_receber": "Contas a receber",
+    "agenda": "Agenda",
+    "sql_result": "Consulta",
+}
+
+
+def _tabela_resultado(query_result: Dict[str, Any]) -> Optional[pd.DataFrame]:
+    """Tabela exibida abaixo da resposta, conforme o tipo de consulta (None quando não há linhas)."""
+    table_data = None
+    data = query_result.get("data", {})
+    qt = query_result.get("type", "")
+    if qt == "metricas":
+        # Pergunta composta: as tabelas de todas as métricas numa só, com a coluna "Métrica" na frente
+        tabelas = []
+        for parte in data.get("resultados") or []:
+            tabela = _tabela_resultado(parte)
+            if tabela is not None:
+                tabelas.append((parte.get("type", ""), tabela))
+        if len(tabelas) <= 1:
+            return tabelas[0][1] if tabelas else None
+        for tipo, tabela in tabelas:
+            tabela.insert(0, "Métrica", ROTULOS_METRICA.get(tipo, tipo))
+        return pd.concat([t.astype(object) for _, t in tabelas], ignore_index=True).fillna("")
+    if qt == "produtos_mais_vendidos" and data.get("items"):
+        rows = [
+            {
+                "Código": i["codigo"],
+                "Nome": i["nome"],
+                "Quantidade": i["quantidade"],
+                "Receita": format_currency(i["receita"]),
+                "Lucro": format_currency(i["lucro"]),
+                **({"Qtd. comparação": i["quantidade_anterior"]} if "quantidade_anterior" in i else {}),
+            }
+            for i in data["items"]
+        ]
+        table_data = pd.DataFrame(rows)
+    elif qt == "curva_abc" and data.get("itens_a"):
+        rows = [
+            {
+                "Código": i["codigo"],
+                "Nome": i["nome"],
+                "Unidades": i["unidades"],
+                "Receita": format_currency(i["receita"]),
+                "Lucro": format_currency(i["lucro"]),
+                "Participação (%)": round(i["participacao_pct"], 1),
+                "Sell-through (%)": round(i["sell_through_pct"], 1) if i["sell_through_pct"] is not None else None,
+            }
+            for i in data["itens_a"]
+        ]
+        table_data = pd.DataFrame(rows)
+    elif qt == "produtos_juntos" and data.get("pares"):
+        rows = [
+            {
+                "Produto A": p["produto_a"],
+                "Produto B": p["produto_b"],
+                "Vendas juntos": p["cestas"],
+                "Suporte (%)": round(p["suporte"] * 100, 2),
+                "Confiança A→B (%)": round(p["confianca_a_b"] * 100, 1),
+                "Confiança B→A (%)": round(p["confianca_b_a"] * 100, 1),
+                "Lift": round(p["lift"], 2),
+            }
+            for p in data["pares"]
+        ]
+        table_data = pd.DataFrame(rows)
+    elif qt == "entradas_estoque" and data.get("entradas"):
+        rows = [
+            {
+                "Data": e["data_entrada"],
+                "Código": e["codigo"],
+                "Produto": e["nome"],
+                "Quantidade": e["quantidade"],
+                "Observação": e.get("observacao", ""),
+            }
+            for e in data["entradas"]
+        ]
+        table_data = pd.DataFrame(rows)
+    elif qt == "sessoes_caixa" and data.get("sessoes"):
+        rows = [
+            {
+                "ID": s["id"],
+                "Abertura": s["data_abertura"],
+                "Fechamento": s["data_fechamento"],
+                "Valor abertura": format_currency(s["valor_abertura"]),
+                "Total vendas": format_currency(s["total_vendas_sessao"]),
+                "Status": s["status"],
+            }
+            for s in data["sessoes"]
+        ]
+        table_data = pd.DataFrame(rows)
+    elif qt == "contas_pagar" and data.get("contas"):
+        rows = [
+            {
+                "Fornecedor": c["fornecedor"],
+                "Vencimento": c["data_vencimento"],
+                "Valor": format_currency(c["valor"]),
+                "Status": c["status"],
+            }
+            for c in data["contas"]
+        ]
+        table_data = pd.DataFrame(rows)
+    elif qt == "contas_receber" and data.get("contas"):
+        rows = [
+            {
+                "Cliente": c["cliente"],
+                "Vencimento": c["data_vencimento"],
+                "Valor": format_currency(c["valor"]),
+                "Status": c["status"],
+            }
+            for c in data["contas"]
+        ]
+        table_data = pd.DataFrame(rows)
+    elif qt == "agenda" and data.get("compromissos"):
+        rows = [
+            {
+                "Título": c.get("titulo", ""),
+                "Data": c.get("data", ""),
+                "Hora": c.get("hora", ""),
+                "Descrição": c.get("descricao", ""),
+            }
+            for c in data["compromissos"]
+        ]
+        table_data = pd.DataFrame(rows)
+    elif qt == "sql_result" and data.get("columns") and data.get("rows") is not None:
+        table_data = pd.DataFrame(data["rows"], columns=data["columns"])
+    return table_data
 
 
 def render_agente_relatorios_ui() -> None:
@@ -40,6 +180,7 @@ def render_agente_relatorios_ui() -> None:
     if current_user_id is not None and len(st.session_state.chat_history) == 0:
         db_load = SessionLocal()
         try:
+            daily_analysis_service.iniciar_dia(db_load, current_user_id)
             loaded = get_messages(db_load, current_user_id, SCOPE_REPORT_AGENT)
             if loaded:
                 st.session_state.chat_history = loaded
@@ -47,7 +188,8 @@ def render_agente_relatorios_ui() -> None:
         finally:
             db_load.close()
 
-    # Primeira análise ao abrir: uma vez por usuário, só quando não há histórico no DB
+    # Primeira análise ao abrir: uma vez por usuário, só quando não há conversa de hoje no DB.
+    # Vem do cache do dia (mesma versão dos dados) ou, se estiver sendo gerada em segundo plano, aguarda a geração.
     deve_mostrar_inicial = (
         len(st.session_state.chat_history) == 0
         and current_user_id is not None
@@ -56,9 +198,14 @@ def render_agente_relatorios_ui() -> None:
     if deve_mostrar_inicial:
         db_init = SessionLocal()
         try:
-            agent_init = ReportAgentService(db_init)
-            with st.spinner("Preparando análise do dia..."):
-                initial_text = agent_init.get_initial_analysis(db_init, user_id=current_user_id)
+            if daily_analysis_service.em_andamento(current_user_id):
+                with st.spinner("Preparando a análise do dia..."):
+                    daily_analysis_service.aguardar(current_user_id)
+            initial_text = daily_analysis_service.obter(db_init, current_user_id)
+            if not initial_text:
+                # Exibe a análise à medida que a IA gera o texto; o texto completo vai para o histórico e o cache do dia
+                with st.chat_message("assistant"):
+                    initial_text = st.write_stream(daily_analysis_service.gerar_stream(db_init, current_user_id))
             st.session_state.chat_history.append({
                 "role": "assistant",
                 "content": initial_text,
@@ -86,6 +233,7 @@ def render_agente_relatorios_ui() -> None:
                 db_clear = SessionLocal()
                 try:
                     clear(db_clear, current_user_id, SCOPE_REPORT_AGENT)
+                    daily_analysis_service.invalidar(db_clear, current_user_id)
                     st.session_state.chat_history = []
                     st.session_state.agente_initial_analysis_user_id = None
                     st.session_state.inicio_pending_contas = []
@@ -166,7 +314,7 @@ def render_agente_relatorios_ui() -> None:
         st.markdown("---")
 
     first_assistant_done = False
-    for msg in st.session_state.chat_history:
+    for i, msg in enumerate(st.session_state.chat_history):
         role = msg["role"]
         content = msg.get("content", "")
         with st.chat_message(role):
@@ -175,11 +323,41 @@ def render_agente_relatorios_ui() -> None:
                 df = msg["table_data"]
                 if not df.empty:
                     st.dataframe(df, use_container_width=True, hide_index=True)
+            if role == "assistant" and msg.get("sql_export"):
+                # Resultado cortado no orçamento do chat: o CSV completo só é gerado quando o usuário pede
+                csv_key = f"sql_csv_{i}"
+                if csv_key not in st.session_state:
+                    if st.button("Preparar resultado completo (CSV)", key=f"btn_{csv_key}"):
+                        db_csv = SessionLocal()
+                        try:
+                            with st.spinner("Gerando arquivo..."):
+                                conteudo, err = sql_sandbox.exportar_csv(db_csv, msg["sql_export"], ALLOWED_SQL_TABLES)
+                        finally:
+                            db_csv.close()
+                        if err:
+                            st.error(err)
+                        else:
+                            st.session_state[csv_key] = conteudo
+                            st.rerun()
+                else:
+                    st.download_button(
+                        "Baixar resultado completo",
+                        data=st.session_state[csv_key],
+                        file_name="resultado_consulta.csv",
+                        mime="text/csv",
+                        key=f"dl_{csv_key}",
+                    )
+            if role == "assistant" and msg.get("meta"):
+                st.caption(msg["meta"])
             if role == "assistant" and not first_assistant_done:
                 first_assistant_done = True
 
     query = st.chat_input("Pergunte ou cadastre (ex.: quanto vendi? / cadastre conta de luz 100 reais dia 15)...")
     query = query or st.session_state.pop("pending_audio_query", None)
+    # Fala com vários pedidos: o próximo comando da fila só entra quando não há confirmação pendente
+    fila_audio = st.session_state.get("pending_audio_fila") or []
+    if not query and fila_audio and not pending_contas and not pending_agenda:
+        query = fila_audio.pop(0)
 
     with st.expander("Gravar pelo microfone"):
         st.caption("Grave um áudio e envie; será transcrito e enviado como pergunta (não é guardado no servidor).")
@@ -199,7 +377,16 @@ def render_agente_relatorios_ui() -> None:
                         if err:
                             st.error(err)
                         elif text:
-                            st.session_state["pending_audio_query"] = text
+                            comandos = dividir_comandos(text) or [text]
+                            if len(comandos) > 1:
+                                # Intenções de todos os comandos num único lote (classificador + um pedido à IA)
+                                with st.spinner("Interpretando pedidos..."):
+                                    deteccoes = Pipeline(db_audio).detect_many(comandos, {"pagina": "inicio"})
+                                st.session_state["audio_deteccoes"] = dict(zip(comandos, deteccoes))
+                            else:
+                                st.session_state["audio_deteccoes"] = {}
+                            st.session_state["pending_audio_query"] = comandos[0]
+                            st.session_state["pending_audio_fila"] = comandos[1:]
                             st.session_state["audio_relatorios_counter"] = st.session_state.get("audio_relatorios_counter", 0) + 1
                             st.success(f"Transcrito: \"{text[:80]}{'...' if len(text) > 80 else ''}\"")
                             st.rerun()
@@ -208,7 +395,11 @@ def render_agente_relatorios_ui() -> None:
 
     if query:
         st.session_state.chat_history.append({"role": "user", "content": query})
+        with st.chat_message("user"):
+            st.markdown(query)
         db = SessionLocal()
+        # Pipeline MCP do turno: uma IA/configuração e a detecção compartilhadas entre esta página e os agentes
+        pipeline = Pipeline(db)
         confirm_phrases = ("sim", "confirmar", "confirmo", "quero", "ok", "okay", "pode ser", "isso", "isso mesmo", "correto", "cadastrar")
         query_lower = (query or "").strip().lower()
 
@@ -218,7 +409,7 @@ def render_agente_relatorios_ui() -> None:
 
             # Confirmação por texto: lançamento pendente de contas
             if pending_contas and (query_lower in confirm_phrases or query_lower.startswith("sim ")):
-                agent_c = AccountsAgentService(db)
+                agent_c = AccountsAgentService(db, pipeline)
                 result = agent_c.execute_insert(db, pending_contas)
                 msg = f"✅ {result.get('message', 'Cadastro realizado.')}" if result.get("success") else f"❌ {result.get('message', 'Erro ao cadastrar.')}"
                 st.session_state.chat_history.append({"role": "assistant", "content": msg, "table_data": None})
@@ -230,7 +421,7 @@ def render_agente_relatorios_ui() -> None:
 
             # Confirmação por texto: lançamento pendente de agenda
             if pending_agenda and (query_lower in confirm_phrases or query_lower.startswith("sim ")):
-                agent_a = AgendaAgentService(db)
+                agent_a = AgendaAgentService(db, pipeline)
                 result = agent_a.execute_insert(db, pending_agenda, current_user_id)
                 msg = f"✅ {result.get('message', 'Compromisso registrado.')}" if result.get("success") else f"❌ {result.get('message', 'Erro ao cadastrar.')}"
                 st.session_state.chat_history.append({"role": "assistant", "content": msg, "table_data": None})
@@ -240,19 +431,61 @@ def render_agente_relatorios_ui() -> None:
                 db.close()
                 st.rerun()
 
-            # Detector: rotear INSERT contas/agenda para os agentes de lançamento
-            detector = MCPDetector(db)
-            det = detector.detect(query, {"pagina": "inicio"})
+            # Atalho por regras: perguntas frequentes com período claro respondem sem chamar a IA
+            agent = ReportAgentService(db, pipeline)
+            with Cronometro() as cron:
+                query_analysis = agent.analise_regras(query)
+                if query_analysis is not None:
+                    query_analysis["user_id"] = current_user_id
+                    query_result = agent.execute_query(db, query_analysis)
+            if query_analysis is not None and query_result.get("type") != "error":
+                response_text = agent._format_response_simple(query_result, query_analysis, com_tabela=False)
+                table_data = _tabela_resultado(query_result)
+                registrar_rota("regras", cron.ms)
+                st.session_state.chat_history.append({
+                    "role": "assistant",
+                    "content": response_text,
+                    "table_data": table_data,
+                    "meta": f"Resposta direta (sem IA) · {cron.ms:.0f} ms",
+                })
+                if current_user_id is not None:
+                    add_message(db, current_user_id, SCOPE_REPORT_AGENT, "assistant", response_text, table_data)
+                st.rerun()
+
+            inicio_ia = time.perf_counter()
             # Histórico para contexto: todas as mensagens anteriores (role + content)
             history = [
                 {"role": (m.get("role") or "user"), "content": (m.get("content") or "")}
                 for m in st.session_state.chat_history[:-1]
             ]
+            # Cache de perguntas: a mesma pergunta com outras palavras reaproveita a última análise validada, sem IA
+            query_analysis = agent.analise_cache(query, history)
+            # Planejador de turno: uma chamada à IA com intenção, campos, período e SQL; sem plano válido, fluxo detect → parse/analyze → format
+            plano = None
+            if query_analysis is None and turn_planner.ATIVO:
+                with st.spinner("Interpretando mensagem..."):
+                    plano, _ = agent.planejar_turno(query, history)
+            # Detector: rotear INSERT contas/agenda para os agentes de lançamento
+            if plano is not None:
+                det = turn_planner.deteccao(plano)
+                pipeline.definir_deteccao(query, {"pagina": "inicio"}, det, "planejador")
+            elif query_analysis is None:
+                det = (st.session_state.get("audio_deteccoes") or {}).pop(query, None)
+                if det is not None:
+                    pipeline.definir_deteccao(query, {"pagina": "inicio"}, det, "lote")
+                det = pipeline.detect(query, {"pagina": "inicio"})
+            else:
+                det = None
 
-            if det.action == "INSERT" and det.entity in ("contas_pagar", "contas_receber") and det.confidence >= 0.5:
-                agent_c = AccountsAgentService(db)
+            if det is not None and det.action == "INSERT" and det.entity in ("contas_pagar", "contas_receber") and det.confidence >= 0.5:
+                agent_c = AccountsAgentService(db, pipeline)
                 with st.spinner("Interpretando pedido de conta..."):
-                    out = agent_c.parse_request(query, conversation_history=history, context={"pagina": "inicio"})
+                    out = agent_c.parse_request(
+                        query,
+                        conversation_history=history,
+                        context={"pagina": "inicio"},
+                        plano=turn_planner.campos_conta(plano) if plano is not None else None,
+                    )
                 status = out.get("status", "error")
                 msg = out.get("message", "")
                 records = out.get("records", [])
@@ -275,10 +508,12 @@ def render_agente_relatorios_ui() -> None:
                 db.close()
                 st.rerun()
 
-            if det.action == "INSERT" and det.entity == "agenda" and det.confidence >= 0.5:
-                agent_a = AgendaAgentService(db)
+            if det is not None and det.action == "INSERT" and det.entity == "agenda" and det.confidence >= 0.5:
+                agent_a = AgendaAgentService(db, pipeline)
                 with st.spinner("Interpretando pedido de compromisso..."):
-                    out = agent_a.parse_request(query, conversation_history=history)
+                    out = agent_a.parse_request(
+                        query, conversation_history=history, plano=plano.compromisso if plano is not None else None
+                    )
                 status = out.get("status", "error")
                 msg = out.get("message", "")
                 record = out.get("record")
@@ -302,9 +537,14 @@ def render_agente_relatorios_ui() -> None:
                 st.rerun()
 
             # Fluxo padrão: relatórios e consultas
-            agent = ReportAgentService(db)
-            with st.spinner("Analisando pergunta..."):
-                query_analysis = agent.analyze_query(query, conversation_history=history)
+            do_cache = query_analysis is not None
+            if plano is not None:
+                query_analysis = agent.analise_do_plano(plano, query, history)
+            elif not do_cache:
+                with st.spinner("Analisando pergunta..."):
+                    query_analysis = agent.analyze_query(
+                        query, conversation_history=history, detection=det, usar_cache=False
+                    )
             if query_analysis.get("intent") == "error":
                 err_content = f"**Erro:** {query_analysis.get('error', 'Erro desconhecido')}."
                 st.session_state.chat_history.append({
@@ -350,87 +590,34 @@ def render_agente_relatorios_ui() -> None:
                 if current_user_id is not None:
                     add_message(db, current_user_id, SCOPE_REPORT_AGENT, "assistant", err_content, None)
                 st.rerun()
-            with st.spinner("Gerando resposta..."):
-                response_text = agent.format_response(query_result, query_analysis, query)
-            table_data = None
-            data = query_result.get("data", {})
-            qt = query_result.get("type", "")
-            if qt == "produtos_mais_vendidos" and data.get("items"):
-                rows = [
-                    {
-                        "Código": i["codigo"],
-                        "Nome": i["nome"],
-                        "Quantidade": i["quantidade"],
-                        "Receita": format_currency(i["receita"]),
-                        "Lucro": format_currency(i["lucro"]),
-                    }
-                    for i in data["items"]
-                ]
-                table_data = pd.DataFrame(rows)
-            elif qt == "entradas_estoque" and data.get("entradas"):
-                rows = [
-                    {
-                        "Data": e["data_entrada"],
-                        "Código": e["codigo"],
-                        "Produto": e["nome"],
-                        "Quantidade": e["quantidade"],
-                        "Observação": e.get("observacao", ""),
-                    }
-                    for e in data["entradas"]
-                ]
-                table_data = pd.DataFrame(rows)
-            elif qt == "sessoes_caixa" and data.get("sessoes"):
-                rows = [
-                    {
-                        "ID": s["id"],
-                        "Abertura": s["data_abertura"],
-                        "Fechamento": s["data_fechamento"],
-                        "Valor abertura": format_currency(s["valor_abertura"]),
-                        "Total vendas": format_currency(s["total_vendas_sessao"]),
-                        "Status": s["status"],
-                    }
-                    for s in data["sessoes"]
-                ]
-                table_data = pd.DataFrame(rows)
-            elif qt == "contas_pagar" and data.get("contas"):
-                rows = [
-                    {
-                        "Fornecedor": c["fornecedor"],
-                        "Vencimento": c["data_vencimento"],
-                        "Valor": format_currency(c["valor"]),
-                        "Status": c["status"],
-                    }
-                    for c in data["contas"]
-                ]
-                table_data = pd.DataFrame(rows)
-            elif qt == "contas_receber" and data.get("contas"):
-                rows = [
-                    {
-                        "Cliente": c["cliente"],
-                        "Vencimento": c["data_vencimento"],
-                        "Valor": format_currency(c["valor"]),
-                        "Status": c["status"],
-                    }
-                    for c in data["contas"]
-                ]
-                table_data = pd.DataFrame(rows)
-            elif qt == "agenda" and data.get("compromissos"):
-                rows = [
-                    {
-                        "Título": c.get("titulo", ""),
-                        "Data": c.get("data", ""),
-                        "Hora": c.get("hora", ""),
-                        "Descrição": c.get("descricao", ""),
-                    }
-                    for c in data["compromissos"]
-                ]
-                table_data = pd.DataFrame(rows)
-            elif qt == "sql_result" and data.get("columns") and data.get("rows") is not None:
-                table_data = pd.DataFrame(data["rows"], columns=data["columns"])
+            if not do_cache:
+                agent.lembrar_analise(query, query_analysis, history)
+            meta = None
+            if not agent.narracao_ativa(query_analysis):
+                # Resposta por template, sem outra chamada à IA (a tabela completa é exibida abaixo)
+                response_text = agent._format_response_simple(query_result, query_analysis, com_tabela=False)
+                ms = (time.perf_counter() - inicio_ia) * 1000
+                if do_cache:
+                    origem = "Cache de perguntas (sem IA)"
+                else:
+                    origem = "Planejada em uma chamada à IA" if plano is not None else "Analisada pela IA"
+                meta = f"{origem} · template v{report_templates.VERSAO} · {ms:.0f} ms"
+            else:
+                # Template na hora e, em seguida, o parágrafo de leitura da IA; o texto completo é gravado no histórico
+                with st.chat_message("assistant"):
+                    response_text = st.write_stream(
+                        agent.format_response_stream(query_result, query_analysis, query, com_tabela=False)
+                    )
+                ms = (time.perf_counter() - inicio_ia) * 1000
+            table_data = _tabela_resultado(query_result)
+            registrar_rota("cache" if do_cache else "planejador" if plano is not None else "ia", ms)
+            sql_data = (query_result.get("data") or {}) if query_result.get("type") == "sql_result" else {}
             st.session_state.chat_history.append({
                 "role": "assistant",
                 "content": response_text,
                 "table_data": table_data,
+                "meta": meta,
+                "sql_export": sql_data.get("sql") if sql_data.get("truncado") else None,
             })
             if current_user_id is not None:
                 add_message(db, current_user_id, SCOPE_REPORT_AGENT, "assistant", response_text, table_data)
@@ -459,4 +646,6 @@ def render_agente_relatorios_ui() -> None:
         st.session_state.chat_history = []
         st.session_state.inicio_pending_contas = []
         st.session_state.inicio_pending_agenda = None
+        st.session_state["pending_audio_fila"] = []
+        st.session_state["audio_deteccoes"] = {}
         st.rerun()